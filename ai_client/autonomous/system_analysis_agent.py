@@ -37,7 +37,7 @@ class SystemAnalysisAgent:
                     "Сгенерируй краткий живой анализ системы на основе контекста. "
                     f"Контекст: {str(context)[:12000]}"
                 )
-                response = self.ai_client.chat(
+                response = await self.ai_client.chat_async(
                     message=message,
                     additional_prompt=additional_prompt,
                 )
@@ -21,6 +21,7 @@ from ..tools.vision_tools import VisionTools
 from ..utils.config import Config
 from ..utils.logger import Logger
 from ..utils.error_handler import ErrorHandler
+from ..utils.single_flight import SingleFlight, make_key
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -44,6 +45,9 @@ class AIClient:
         self.system_tools = SystemTools()
         self.vision_tools = VisionTools()
         
+        # Одинаковые одновременные запросы к LLM выполняются один раз
+        self.single_flight = SingleFlight("llm")
+        
         # Загружаем основной промпт
         # Load the system prompt directly from file
         with open("prompts/guardian_prompt.py", "r", encoding="utf-8") as f:
@@ -63,9 +67,40 @@ class AIClient:
     
     def get_model_status(self) -> Dict[str, Any]:
         """Получить статус моделей"""
-        return self.gemini_client.get_model_status()
+        status = self.gemini_client.get_model_status()
+        status['single_flight'] = self.single_flight.get_stats()
+        return status
+    
+    def get_router_status(self) -> Dict[str, Any]:
+        """Живое состояние квот и circuit breaker'ов моделей"""
+        return self.gemini_client.get_router_status()
     
     # Методы генерации ответов
+    def _compose_system_prompt(self, additional_prompt: Optional[str] = None) -> str:
+        """Собираем системный промпт: базовый + дополнительный (мемоизировано в кэше префиксов)"""
+        return self.gemini_client.prompt_cache.assemble(self.base_prompt, additional_prompt).text
+    
+    def _request_key(
+        self,
+        kind: str,
+        message: str,
+        user_profile: Optional[Dict[str, Any]],
+        context: Optional[str],
+        additional_prompt: Optional[str],
+        image_path: Optional[str]
+    ) -> str:
+        """Нормализованный ключ запроса: модель + хэш системного промпта + сообщение, контекст, профиль"""
+        prefix_digest = self.gemini_client.prompt_cache.assemble(self.base_prompt, additional_prompt).digest
+        return make_key(
+            kind,
+            self.get_current_model(),
+            prefix_digest,
+            message or "",
+            context or "",
+            user_profile or {},
+            image_path or "",
+        )
+    
     async def generate_streaming_response(
         self, 
         user_message: str, 
@@ -75,16 +110,33 @@ class AIClient:
         image_path: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
         """Генерация streaming ответа с единым промптом и поддержкой изображений"""
-        # Собираем полный промпт
-        full_prompt = self.base_prompt
-        if additional_prompt:
-            full_prompt += f"\n\n{additional_prompt}"
+        full_prompt = self._compose_system_prompt(additional_prompt)
         
         async for chunk in self.gemini_client.generate_streaming_response(
             full_prompt, user_message, context, user_profile, image_path
         ):
             yield chunk
     
+    async def generate_response_async(
+        self, 
+        user_message: str, 
+        context: Optional[str] = None,
+        user_profile: Optional[Dict[str, Any]] = None,
+        additional_prompt: Optional[str] = None,
+        image_path: Optional[str] = None
+    ) -> str:
+        """Awaitable вариант streaming генерации - возвращает весь ответ целиком"""
+        async def _generate() -> str:
+            chunks = []
+            async for chunk in self.generate_streaming_response(
+                user_message, context, user_profile, additional_prompt, image_path
+            ):
+                chunks.append(chunk)
+            return "".join(chunks)
+        
+        key = self._request_key("stream", user_message, user_profile, context, additional_prompt, image_path)
+        return await self.single_flight.do(key, _generate)
+    
     def chat(
         self, 
         message: str, 
@@ -94,13 +146,25 @@ class AIClient:
         image_path: Optional[str] = None
     ) -> str:
         """Основной метод чата с единым промптом и поддержкой изображений"""
-        # Собираем полный промпт
-        full_prompt = self.base_prompt
-        if additional_prompt:
-            full_prompt += f"\n\n{additional_prompt}"
-        
+        full_prompt = self._compose_system_prompt(additional_prompt)
         return self.gemini_client.chat(message, user_profile, conversation_context, full_prompt, image_path)
     
+    async def chat_async(
+        self, 
+        message: str, 
+        user_profile: Optional[Dict[str, Any]] = None,
+        conversation_context: Optional[str] = None,
+        additional_prompt: Optional[str] = None,
+        image_path: Optional[str] = None
+    ) -> str:
+        """Awaitable вариант chat - не блокирует event loop, одинаковые одновременные запросы схлопываются"""
+        full_prompt = self._compose_system_prompt(additional_prompt)
+        key = self._request_key("chat", message, user_profile, conversation_context, additional_prompt, image_path)
+        return await self.single_flight.do(
+            key,
+            lambda: self.gemini_client.chat_async(message, user_profile, conversation_context, full_prompt, image_path)
+        )
+    
     # Прямой доступ к модулям для инструментов
     @property
     def files(self):
@@ -8,8 +8,29 @@ import logging
 from typing import List, Dict, Any
 from dataclasses import dataclass
 
+from ..utils.executors import run_blocking
+
 logger = logging.getLogger(__name__)
 
+# Функции зрения, которые должны исполняться через VisionTools
+VISION_FUNCTIONS = {
+    'list_cameras',
+    'capture_image',
+    'detect_motion',
+    'get_camera_status',
+}
+# Инструменты, которые обращаются к модели; остальные - файловые (пул fs)
+LLM_FUNCTIONS = {'analyze_image'}
+
+
+def tool_pool(function_name: str) -> str:
+    """Пул run_blocking для инструмента: vision, llm или fs"""
+    if function_name in VISION_FUNCTIONS:
+        return 'vision'
+    if function_name in LLM_FUNCTIONS:
+        return 'llm'
+    return 'fs'
+
 @dataclass
 class ToolCall:
     """Структура для tool call"""
@@ -123,16 +144,8 @@ class ToolExecutor:
             # По умолчанию используем системные инструменты
             tool_instance = getattr(self.ai_client, 'system_tools', self.ai_client)
 
-            # Функции зрения, которые должны исполняться через VisionTools
-            vision_functions = {
-                'list_cameras',
-                'capture_image',
-                'detect_motion',
-                'get_camera_status',
-            }
-
             # Если обнаружили вызов функции зрения — маршрутизируем в VisionTools
-            if function_name in vision_functions and hasattr(self.ai_client, 'vision_tools'):
+            if function_name in VISION_FUNCTIONS and hasattr(self.ai_client, 'vision_tools'):
                 tool_instance = self.ai_client.vision_tools
             
             if hasattr(tool_instance, function_name):
@@ -319,8 +332,10 @@ class ResponseProcessor:
         
         # Выполняем tool calls
         tool_results = []
+        # Инструменты блокируют (файлы, камера, модель) - выполняются в пулах потоков
         for tool_call in tool_calls:
-            result = self.tool_executor.execute_tool_call(tool_call, context)
+            result = await run_blocking(tool_pool(tool_call.function_name),
+                                        self.tool_executor.execute_tool_call, tool_call, context)
             tool_results.append(result)
         
         # Форматируем ответ
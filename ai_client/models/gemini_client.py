@@ -15,6 +15,9 @@ from google.cloud import vision
 from ..utils.config import Config
 from ..utils.logger import Logger
 from ..utils.error_handler import ErrorHandler
+from .transport import gemini_transport
+from .prompt_cache import prompt_cache
+from .router import model_router
 
 logger = Logger()
 
@@ -43,17 +46,25 @@ class GeminiClient:
             logger.warning(f"⚠️ Google Cloud Vision API not available: {e}")
         
         # Определяем доступные модели - приоритет быстрым и дешёвым по умолчанию
+        # quota - запросов в день, rpm - запросов в минуту, cost - $ за 1M входных токенов
         self.models = [
-            {'name': 'gemini-2.0-flash', 'quota': 200},         # DEFAULT
-            {'name': 'gemini-2.5-flash', 'quota': 250},
-            {'name': 'gemini-1.5-flash', 'quota': 500},
-            {'name': 'gemini-2.0-flash-lite', 'quota': 1000},
-            {'name': 'gemini-2.5-flash-lite', 'quota': 1000},
-            {'name': 'gemini-2.5-pro', 'quota': 100},
-            {'name': 'gemini-1.5-pro', 'quota': 150}
+            {'name': 'gemini-2.0-flash', 'quota': 200, 'rpm': 15, 'cost': 0.10},         # DEFAULT
+            {'name': 'gemini-2.5-flash', 'quota': 250, 'rpm': 10, 'cost': 0.30},
+            {'name': 'gemini-1.5-flash', 'quota': 500, 'rpm': 15, 'cost': 0.075},
+            {'name': 'gemini-2.0-flash-lite', 'quota': 1000, 'rpm': 30, 'cost': 0.075},
+            {'name': 'gemini-2.5-flash-lite', 'quota': 1000, 'rpm': 15, 'cost': 0.10},
+            {'name': 'gemini-2.5-pro', 'quota': 100, 'rpm': 5, 'cost': 1.25},
+            {'name': 'gemini-1.5-pro', 'quota': 150, 'rpm': 2, 'cost': 1.25}
         ]
 
         self.current_model_index = 0  # gemini-2.0-flash
+        
+        # Кэш системного префикса промпта (серверный CachedContent + локальная мемоизация)
+        self.prompt_cache = prompt_cache
+        
+        # Квоты и circuit breaker'ы моделей (общие для всех экземпляров)
+        self.router = model_router
+        self.router.register_models(self.models)
     
     def _parse_gemini_response(self, response) -> str:
         """УНИВЕРСАЛЬНЫЙ ПАРСЕР - обрабатывает любой формат ответа Gemini"""
@@ -111,29 +122,6 @@ class GeminiClient:
         """Получить текущую модель"""
         return self.models[self.current_model_index]['name']
     
-    def _switch_to_next_model(self):
-        """Переключиться на следующую модель"""
-        # Пропускаем модели с низким качеством если есть лучшие альтернативы
-        current_quota = self.models[self.current_model_index]['quota']
-        
-        # Ищем следующую модель с похожим или лучшим качеством
-        for i in range(1, len(self.models)):
-            next_index = (self.current_model_index + i) % len(self.models)
-            next_quota = self.models[next_index]['quota']
-            
-            # Если следующая модель имеет похожий или лучший лимит, используем её
-            if next_quota >= current_quota * 0.5:  # Не падаем слишком сильно
-                self.current_model_index = next_index
-                model_name = self.models[self.current_model_index]['name']
-                logger.info(f"🚀 Switched to model: {model_name} (quota: {next_quota})")
-                return model_name
-        
-        # Если не нашли подходящую, просто переходим к следующей
-        self.current_model_index = (self.current_model_index + 1) % len(self.models)
-        model_name = self.models[self.current_model_index]['name']
-        logger.info(f"🚀 Using model: {model_name}")
-        return model_name
-    
     def switch_to_model(self, model_name: str) -> bool:
         """Переключиться на конкретную модель"""
         for i, model in enumerate(self.models):
@@ -145,37 +133,62 @@ class GeminiClient:
         return False
     
     def get_model_status(self) -> Dict[str, Any]:
-        """Получить статус моделей"""
+        """Получить статус моделей (с живым состоянием квот и circuit breaker'ов)"""
         current_model = self._get_current_model()
+        router_status = self.router.get_status()
         
         available_models = []
         for i, model in enumerate(self.models):
+            route = router_status.get(model['name'], {})
             model_info = {
                 'name': model['name'],
                 'quota': model.get('quota', 'undefined'),
-                'has_error': False
+                'has_error': not route.get('healthy', True),
+                'router': route
             }
             available_models.append(model_info)
         
+        current_route = router_status.get(current_model, {})
         return {
             'current_model': current_model,
-            'current_quota': "undefined",
+            'current_quota': current_route.get('day_bucket', {}).get('remaining', "undefined"),
             'model_index': self.current_model_index,
             'total_models': len(self.models),
             'available_models': available_models,
-            'model_errors': 0
+            'model_errors': sum(r['breaker']['total_failures'] for r in router_status.values()),
+            'prompt_cache': self.prompt_cache.get_stats()
         }
     
+    def get_router_status(self) -> Dict[str, Any]:
+        """Живое состояние роутера моделей"""
+        return self.router.get_status()
+    
+    def _no_model_available(self, last_error: Optional[str] = None) -> str:
+        """Сообщение, когда все модели исчерпаны или их circuit открыт"""
+        retry_after = self.router.retry_after()
+        logger.warning(f"⛔ All models throttled, retry in {retry_after:.0f}s")
+        details = f" Last error: {last_error}" if last_error else ""
+        return f"❌ Error: 429 all models throttled, retry in {retry_after:.0f}s.{details}"
+    
+    @staticmethod
+    def _short_error(error: Exception) -> str:
+        """Сокращаем длинные ошибки"""
+        error_msg = str(error)
+        if len(error_msg) > 200:
+            error_msg = error_msg[:200] + "..."
+        return error_msg
+    
     def get_current_model(self) -> str:
         """Получить имя текущей модели"""
         return self._get_current_model()
     
-    def _build_prompt(self, system_prompt: str, user_message: str, context: Optional[str] = None, user_profile: Optional[Dict[str, Any]] = None) -> str:
-        """Строим промпт с reasoning и chain of thoughts"""
+    def _build_prompt(self, system_prompt: Optional[str], user_message: str, context: Optional[str] = None, user_profile: Optional[Dict[str, Any]] = None) -> str:
+        """Строим промпт с reasoning и chain of thoughts (system_prompt=None - префикс уже в серверном кэше)"""
         prompt_parts = []
         
         # System prompt
-        prompt_parts.append(system_prompt)
+        if system_prompt:
+            prompt_parts.append(system_prompt)
         
         # Context if provided
         if context:
@@ -188,127 +201,140 @@ class GeminiClient:
         # User message
         prompt_parts.append(f"\n**USER MESSAGE:**\n{user_message}")
         
-
-        
         return "\n".join(prompt_parts)
     
-    async def generate_streaming_response(self, system_prompt: str, user_message: str, context: Optional[str] = None, user_profile: Optional[Dict[str, Any]] = None, image_path: Optional[str] = None) -> AsyncGenerator[str, None]:
-        """Streaming ответ - УПРОЩЕННАЯ ВЕРСИЯ с поддержкой изображений"""
+    def _prepare_request(self, model_name: str, system_prompt: str, user_message: str, context: Optional[str] = None, user_profile: Optional[Dict[str, Any]] = None):
+        """
+        Готовим модель и промпт. Если системный префикс есть в серверном кэше,
+        отправляем только динамический суффикс. Возвращает (model, full_prompt, prefix, cached).
+        """
+        prefix = self.prompt_cache.prefix(system_prompt)
+        model = self.prompt_cache.remote_model(model_name, prefix)
+        if model is not None:
+            return model, self._build_prompt(None, user_message, context, user_profile), prefix, True
+        
+        model = genai.GenerativeModel(model_name)
+        return model, self._build_prompt(prefix.text, user_message, context, user_profile), prefix, False
+    
+    def _guess_mime_type(self, image_path: str) -> str:
+        """Определяем MIME тип изображения по расширению"""
+        lp = image_path.lower()
+        if lp.endswith('.png'):
+            return "image/png"
+        elif lp.endswith('.gif'):
+            return "image/gif"
+        elif lp.endswith('.webp'):
+            return "image/webp"
+        return "image/jpeg"  # По умолчанию
+    
+    def _generate_content(self, model, full_prompt: str, image_path: Optional[str] = None, stream: bool = False):
+        """Синхронный вызов generate_content (текст или текст + изображение) - выполняется в I/O потоке"""
+        # Если есть изображение, добавляем его к промпту
+        if image_path and os.path.exists(image_path):
+            try:
+                with open(image_path, 'rb') as img_file:
+                    image_data = img_file.read()
+                
+                # Создаем parts с изображением и текстом
+                parts = [
+                    {"mime_type": self._guess_mime_type(image_path), "data": image_data},
+                    {"text": full_prompt}
+                ]
+                
+                return model.generate_content(parts, stream=stream)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to load image {image_path}: {e}")
+                # Fallback к текстовому режиму
+        
+        return model.generate_content(full_prompt, stream=stream)
+    
+    def _iter_stream_text(self, model_name: str, system_prompt: str, user_message: str, context: Optional[str] = None, user_profile: Optional[Dict[str, Any]] = None, image_path: Optional[str] = None):
+        """Синхронный генератор текста из streaming ответа - итерируется в I/O потоке"""
+        model, full_prompt, prefix, cached = self._prepare_request(model_name, system_prompt, user_message, context, user_profile)
         try:
-            model_name = self._get_current_model()
-            model = genai.GenerativeModel(model_name)
-            
-            full_prompt = self._build_prompt(system_prompt, user_message, context, user_profile)
-            
-            # Если есть изображение, добавляем его к промпту
-            if image_path and os.path.exists(image_path):
-                try:
-                    with open(image_path, 'rb') as img_file:
-                        image_data = img_file.read()
-                    
-                    # Определяем MIME тип
-                    mime_type = "image/jpeg"  # По умолчанию
-                    if image_path.lower().endswith('.png'):
-                        mime_type = "image/png"
-                    elif image_path.lower().endswith('.gif'):
-                        mime_type = "image/gif"
-                    elif image_path.lower().endswith('.webp'):
-                        mime_type = "image/webp"
-                    
-                    # Создаем parts с изображением и текстом
-                    parts = [
-                        {"mime_type": mime_type, "data": image_data},
-                        {"text": full_prompt}
-                    ]
-                    
-                    response = model.generate_content(parts, stream=True)
-                except Exception as e:
-                    logger.warning(f"⚠️ Failed to load image {image_path}: {e}")
-                    # Fallback к текстовому режиму
-                    response = model.generate_content(full_prompt, stream=True)
-            else:
-                response = model.generate_content(full_prompt, stream=True)
+            response = self._generate_content(model, full_prompt, image_path, stream=True)
+        except Exception as e:
+            if cached and "cache" in str(e).lower():
+                self.prompt_cache.invalidate(model_name, prefix)
+            raise
+        
+        # Обрабатываем streaming ответ через универсальный парсер
+        for chunk in response:
+            chunk_text = self._parse_gemini_response(chunk)
+            if chunk_text and not chunk_text.startswith("❌"):
+                yield chunk_text
+    
+    async def generate_streaming_response(self, system_prompt: str, user_message: str, context: Optional[str] = None, user_profile: Optional[Dict[str, Any]] = None, image_path: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """Streaming ответ - SDK итерируется в I/O потоке, модель выбирает роутер до вызова"""
+        last_error = None
+        for _ in range(len(self.models)):
+            model_name = self.router.select(self._get_current_model())
+            if model_name is None:
+                break
             
-            # Обрабатываем streaming ответ через универсальный парсер
-            for chunk in response:
-                # Используем универсальный парсер для каждого chunk
-                chunk_text = self._parse_gemini_response(chunk)
-                if chunk_text and not chunk_text.startswith("❌"):
+            yielded = False
+            try:
+                async for chunk_text in gemini_transport.stream(
+                    lambda: self._iter_stream_text(model_name, system_prompt, user_message, context, user_profile, image_path)
+                ):
+                    yielded = True
                     yield chunk_text
+                self.router.record_success(model_name)
+                return
                     
-        except Exception as e:
-            error_msg = str(e)
-            # Сокращаем длинные ошибки
-            if len(error_msg) > 200:
-                error_msg = error_msg[:200] + "..."
-            logger.error(f"❌ Gemini streaming error: {error_msg}")
-            
-            # Простой fallback - переключаем модель и пробуем еще раз
-            if "429" in error_msg or "quota" in error_msg.lower():
-                logger.warning("⚠️ Quota exceeded, switching model...")
-                self._switch_to_next_model()
-                # Рекурсивно пробуем с новой моделью
-                async for chunk in self.generate_streaming_response(system_prompt, user_message, context, user_profile):
-                    yield chunk
-            else:
+            except Exception as e:
+                error_msg = self._short_error(e)
+                logger.error(f"❌ Gemini streaming error ({model_name}): {error_msg}")
+                
+                # Ошибка квоты до первого чанка - пробуем следующую здоровую модель
+                if self.router.record_failure(model_name, error_msg) and not yielded:
+                    logger.warning(f"⚠️ Quota exceeded on {model_name}, routing to next healthy model...")
+                    last_error = error_msg
+                    continue
                 yield f"❌ Error: {error_msg}"
+                return
+        
+        yield self._no_model_available(last_error)
     
     def chat(self, message: str, user_profile: Optional[Dict[str, Any]] = None, conversation_context: Optional[str] = None, system_prompt: Optional[str] = None, image_path: Optional[str] = None) -> str:
-        """Основной метод чата - УПРОЩЕННАЯ ВЕРСИЯ с поддержкой изображений"""
-        try:
-            if not system_prompt:
-                system_prompt = "You are a helpful AI assistant."
-            
-            model_name = self._get_current_model()
-            model = genai.GenerativeModel(model_name)
-            
-            full_prompt = self._build_prompt(system_prompt, message, conversation_context, user_profile)
+        """Основной метод чата - модель выбирает роутер до вызова, с поддержкой изображений"""
+        if not system_prompt:
+            system_prompt = "You are a helpful AI assistant."
+        
+        last_error = None
+        for _ in range(len(self.models)):
+            model_name = self.router.select(self._get_current_model())
+            if model_name is None:
+                break
             
-            # Если есть изображение, добавляем его к промпту
-            if image_path and os.path.exists(image_path):
+            try:
+                model, full_prompt, prefix, cached = self._prepare_request(model_name, system_prompt, message, conversation_context, user_profile)
                 try:
-                    with open(image_path, 'rb') as img_file:
-                        image_data = img_file.read()
-                    
-                    # Определяем MIME тип
-                    mime_type = "image/jpeg"  # По умолчанию
-                    if image_path.lower().endswith('.png'):
-                        mime_type = "image/png"
-                    elif image_path.lower().endswith('.gif'):
-                        mime_type = "image/gif"
-                    elif image_path.lower().endswith('.webp'):
-                        mime_type = "image/webp"
-                    
-                    # Создаем parts с изображением и текстом
-                    parts = [
-                        {"mime_type": mime_type, "data": image_data},
-                        {"text": full_prompt}
-                    ]
-                    
-                    response = model.generate_content(parts)
+                    response = self._generate_content(model, full_prompt, image_path)
                 except Exception as e:
-                    logger.warning(f"⚠️ Failed to load image {image_path}: {e}")
-                    # Fallback к текстовому режиму
-                    response = model.generate_content(full_prompt)
-            else:
-                response = model.generate_content(full_prompt)
-            
-            return self._parse_gemini_response(response)
-            
-        except Exception as e:
-            error_msg = str(e)
-            # Сокращаем длинные ошибки
-            if len(error_msg) > 200:
-                error_msg = error_msg[:200] + "..."
-            logger.error(f"❌ Chat error: {error_msg}")
-            
-            # Простой fallback
-            if "429" in error_msg or "quota" in error_msg.lower():
-                logger.warning("⚠️ Quota exceeded, switching model...")
-                self._switch_to_next_model()
-                return self.chat(message, user_profile, conversation_context, system_prompt)
-            else:
+                    if cached and "cache" in str(e).lower():
+                        # Серверный кэш мог истечь раньше срока - следующий запрос создаст его заново
+                        self.prompt_cache.invalidate(model_name, prefix)
+                    raise
+                
+                self.router.record_success(model_name)
+                return self._parse_gemini_response(response)
+                
+            except Exception as e:
+                error_msg = self._short_error(e)
+                logger.error(f"❌ Chat error ({model_name}): {error_msg}")
+                
+                if self.router.record_failure(model_name, error_msg):
+                    logger.warning(f"⚠️ Quota exceeded on {model_name}, routing to next healthy model...")
+                    last_error = error_msg
+                    continue
                 return f"❌ Error: {error_msg}"
+        
+        return self._no_model_available(last_error)
+    
+    async def chat_async(self, message: str, user_profile: Optional[Dict[str, Any]] = None, conversation_context: Optional[str] = None, system_prompt: Optional[str] = None, image_path: Optional[str] = None) -> str:
+        """Асинхронный chat - блокирующий вызов SDK выполняется в I/O потоке"""
+        return await gemini_transport.call(self.chat, message, user_profile, conversation_context, system_prompt, image_path)
 
     def analyze_image_with_files_api(
         self,
@@ -0,0 +1,226 @@
+"""
+Кэш префикса промпта для Gemini
+- Статический системный промпт (+ вариант additional_prompt) регистрируется как
+  серверный CachedContent, ключ - sha256 содержимого, с TTL
+- Запрос тогда отправляет только динамический суффикс (контекст, профиль, сообщение)
+- Локальный fallback: мемоизация собранного префикса и его сериализованной формы
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import google.generativeai as genai
+
+from ..utils.logger import Logger
+
+logger = Logger()
+
+# Ошибки, после которых повторять создание кэша бессмысленно до конца TTL
+_UNSUPPORTED_MARKERS = (
+    "too small",
+    "min_total_token_count",
+    "minimum",
+    "not supported",
+    "does not support",
+    "unsupported",
+)
+
+
+def _is_unsupported_error(error: Exception) -> bool:
+    """Префикс короче минимума модели или модель без поддержки кэша (а не сеть/5xx/таймаут)"""
+    message = str(error).lower()
+    return any(marker in message for marker in _UNSUPPORTED_MARKERS)
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    """Собранный системный префикс и его сериализованная форма"""
+    text: str
+    digest: str
+    encoded: bytes
+
+
+@dataclass
+class _RemoteEntry:
+    cached_content: Any
+    model: Any
+    expires_at: float
+
+
+class PromptPrefixCache:
+    """Серверный кэш системного промпта с локальной мемоизацией"""
+
+    def __init__(self, ttl_seconds: Optional[int] = None, enable_remote: Optional[bool] = None, max_prefixes: int = 64):
+        self.ttl_seconds = ttl_seconds or int(os.getenv("GEMINI_PROMPT_CACHE_TTL", "3600"))
+        if enable_remote is None:
+            enable_remote = os.getenv("GEMINI_PROMPT_CACHE", "1").lower() not in ("0", "false", "no")
+        self.enable_remote = enable_remote
+        self.max_prefixes = max_prefixes
+        # Обновляем серверный кэш заранее, чтобы запрос не попал на истёкший
+        self.refresh_margin = min(60, self.ttl_seconds // 10)
+        # Повтор после временной ошибки: base * 2^(n-1), не больше max
+        self.retry_base_seconds = float(os.getenv("GEMINI_PROMPT_CACHE_RETRY_BASE", "5"))
+        self.retry_max_seconds = min(float(os.getenv("GEMINI_PROMPT_CACHE_RETRY_MAX", "300")), self.ttl_seconds)
+
+        self._lock = threading.Lock()
+        self._prefixes: "OrderedDict[str, PromptPrefix]" = OrderedDict()
+        self._assembled: "OrderedDict[Tuple[str, str], PromptPrefix]" = OrderedDict()
+        self._remote: Dict[Tuple[str, str], _RemoteEntry] = {}
+        self._unsupported: Dict[Tuple[str, str], float] = {}
+        self._failures: Dict[Tuple[str, str], int] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self.stats = {
+            "local_hits": 0,
+            "local_misses": 0,
+            "remote_hits": 0,
+            "remote_created": 0,
+            "remote_failures": 0,
+            "bytes_saved": 0,
+        }
+
+    # ===== Локальная мемоизация =====
+
+    def assemble(self, base_prompt: str, additional_prompt: Optional[str] = None) -> PromptPrefix:
+        """Собрать базовый + дополнительный промпт (мемоизировано по паре строк)"""
+        key = (base_prompt, additional_prompt or "")
+        with self._lock:
+            prefix = self._assembled.get(key)
+            if prefix is not None:
+                self._assembled.move_to_end(key)
+                self.stats["local_hits"] += 1
+                return prefix
+
+        text = base_prompt
+        if additional_prompt:
+            text += f"\n\n{additional_prompt}"
+        prefix = self.prefix(text)
+
+        with self._lock:
+            self._assembled[key] = prefix
+            if len(self._assembled) > self.max_prefixes:
+                self._assembled.popitem(last=False)
+        return prefix
+
+    def prefix(self, text: str) -> PromptPrefix:
+        """Получить мемоизированный префикс (хэш и UTF-8 форма считаются один раз)"""
+        with self._lock:
+            prefix = self._prefixes.get(text)
+            if prefix is not None:
+                self._prefixes.move_to_end(text)
+                self.stats["local_hits"] += 1
+                return prefix
+
+        encoded = text.encode("utf-8")
+        prefix = PromptPrefix(text=text, digest=hashlib.sha256(encoded).hexdigest(), encoded=encoded)
+
+        with self._lock:
+            self.stats["local_misses"] += 1
+            self._prefixes[text] = prefix
+            if len(self._prefixes) > self.max_prefixes:
+                self._prefixes.popitem(last=False)
+        return prefix
+
+    # ===== Серверный кэш (Gemini CachedContent) =====
+
+    def remote_model(self, model_name: str, prefix: PromptPrefix):
+        """
+        Вернуть GenerativeModel, привязанную к серверному кэшу префикса, или None.
+        Вызывается из I/O потока - создание кэша делает сетевой запрос.
+        """
+        if not self.enable_remote:
+            return None
+
+        key = (model_name, prefix.digest)
+        model = self._lookup_remote(key, len(prefix.encoded))
+        if model is not None:
+            return model
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Один запрос на создание кэша на ключ; остальные потоки ждут его результата
+        with key_lock:
+            model = self._lookup_remote(key, len(prefix.encoded))
+            if model is not None:
+                return model
+            with self._lock:
+                retry_at = self._unsupported.get(key)
+            if retry_at and retry_at > time.time():
+                return None
+            return self._create_remote(key, model_name, prefix)
+
+    def _lookup_remote(self, key: Tuple[str, str], size: int):
+        now = time.time()
+        with self._lock:
+            entry = self._remote.get(key)
+            if entry and entry.expires_at - self.refresh_margin > now:
+                self.stats["remote_hits"] += 1
+                self.stats["bytes_saved"] += size
+                return entry.model
+        return None
+
+    def _create_remote(self, key: Tuple[str, str], model_name: str, prefix: PromptPrefix):
+        try:
+            cached_content = genai.caching.CachedContent.create(
+                model=f"models/{model_name}",
+                display_name=f"guardian_prefix_{prefix.digest[:16]}",
+                system_instruction=prefix.text,
+                ttl=timedelta(seconds=self.ttl_seconds),
+            )
+            model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+        except Exception as e:
+            error_msg = str(e)
+            if len(error_msg) > 200:
+                error_msg = error_msg[:200] + "..."
+            unsupported = _is_unsupported_error(e)
+            with self._lock:
+                if unsupported:
+                    # Не пытаемся снова до истечения TTL (префикс меньше минимума модели, модель без кэша)
+                    delay = float(self.ttl_seconds)
+                else:
+                    # Таймаут, 5xx и т.п.: короткий экспоненциальный backoff
+                    failures = self._failures.get(key, 0) + 1
+                    self._failures[key] = failures
+                    delay = min(self.retry_base_seconds * 2 ** (failures - 1), self.retry_max_seconds)
+                self._unsupported[key] = time.time() + delay
+                self.stats["remote_failures"] += 1
+            logger.warning(f"⚠️ Prompt cache unavailable for {model_name}, sending full prompt "
+                           f"(retry in {delay:.0f}s): {error_msg}")
+            return None
+
+        with self._lock:
+            self._unsupported.pop(key, None)
+            self._failures.pop(key, None)
+            self._remote[key] = _RemoteEntry(cached_content, model, time.time() + self.ttl_seconds)
+            self.stats["remote_created"] += 1
+        logger.info(f"💾 Prompt prefix cached for {model_name} ({len(prefix.encoded)} bytes, TTL {self.ttl_seconds}s)")
+        return model
+
+    def invalidate(self, model_name: str, prefix: PromptPrefix) -> None:
+        """Забыть серверный кэш (например, он удалён или истёк на стороне API)"""
+        with self._lock:
+            self._remote.pop((model_name, prefix.digest), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша префиксов"""
+        now = time.time()
+        with self._lock:
+            return {
+                **self.stats,
+                "remote_enabled": self.enable_remote,
+                "ttl_seconds": self.ttl_seconds,
+                "local_prefixes": len(self._prefixes),
+                "remote_entries": sum(1 for e in self._remote.values() if e.expires_at > now),
+            }
+
+
+# Глобальный кэш префиксов, общий для всех экземпляров GeminiClient
+prompt_cache = PromptPrefixCache()
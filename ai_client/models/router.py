@@ -0,0 +1,270 @@
+"""
+Маршрутизатор моделей Gemini с учётом квот
+- Token bucket на минуту и на день для каждой модели
+- Circuit breaker на модель: closed -> open -> half-open (пробный запрос)
+- Выбор модели ДО вызова: предпочтительная, если здорова, иначе самая дешёвая здоровая
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from ..utils.logger import Logger
+from ..utils.error_handler import ErrorHandler
+
+logger = Logger()
+
+
+class TokenBucket:
+    """Классический token bucket: capacity токенов, пополнение refill_per_second"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def available(self, now: Optional[float] = None) -> float:
+        self._refill(now if now is not None else time.monotonic())
+        return self.tokens
+
+    def try_consume(self, amount: float = 1.0, now: Optional[float] = None) -> bool:
+        self._refill(now if now is not None else time.monotonic())
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def drain(self) -> None:
+        """Сервер сказал 429 - считаем, что бюджет окна исчерпан"""
+        self._refill(time.monotonic())
+        self.tokens = 0.0
+
+    def seconds_until(self, amount: float = 1.0) -> float:
+        missing = amount - self.available()
+        if missing <= 0:
+            return 0.0
+        return missing / self.refill_per_second if self.refill_per_second > 0 else float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "remaining": round(self.available(), 2),
+            "capacity": self.capacity,
+        }
+
+
+class CircuitBreaker:
+    """Circuit breaker с экспоненциальным cooldown и half-open пробой"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, base_cooldown: float = 30.0, max_cooldown: float = 900.0, probe_timeout: float = 120.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_count = 0
+        self.opened_until = 0.0
+        self.probe_started_at: Optional[float] = None
+        self.total_failures = 0
+        self.last_error: Optional[str] = None
+
+    def allow(self, now: float) -> bool:
+        """Можно ли сейчас отправить запрос (в half-open - только один пробный)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if now < self.opened_until:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_started_at = None
+        # HALF_OPEN: один пробный запрос; зависший пробник освобождается по таймауту
+        if self.probe_started_at is None or now - self.probe_started_at > self.probe_timeout:
+            return True
+        return False
+
+    def on_dispatch(self, now: float) -> None:
+        if self.state == self.HALF_OPEN:
+            self.probe_started_at = now
+
+    def on_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("✅ Circuit closed after successful probe")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_count = 0
+        self.probe_started_at = None
+
+    def on_failure(self, now: float, error: str, trip_immediately: bool = False) -> None:
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        if trip_immediately or self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** self.open_count))
+            self.open_count += 1
+            self.state = self.OPEN
+            self.opened_until = now + cooldown
+            self.probe_started_at = None
+
+    def retry_in(self, now: float) -> float:
+        if self.state == self.OPEN:
+            return max(0.0, self.opened_until - now)
+        return 0.0
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "retry_in_seconds": round(self.retry_in(now), 1),
+            "last_error": self.last_error,
+        }
+
+
+@dataclass
+class _ModelState:
+    name: str
+    cost: float
+    minute_bucket: TokenBucket
+    day_bucket: TokenBucket
+    breaker: CircuitBreaker
+    requests: int = 0
+    successes: int = 0
+    quota_errors: int = 0
+
+
+class ModelRouter:
+    """Выбирает здоровую модель до вызова и запоминает, какие модели исчерпаны"""
+
+    def __init__(self, quota_scale: Optional[float] = None):
+        self.quota_scale = quota_scale if quota_scale is not None else float(os.getenv("GEMINI_QUOTA_SCALE", "1.0"))
+        self.error_handler = ErrorHandler()
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelState] = {}
+
+    def register_models(self, models: List[Dict[str, Any]]) -> None:
+        """Зарегистрировать модели (повторная регистрация сохраняет состояние)"""
+        with self._lock:
+            for model in models:
+                name = model['name']
+                if name in self._models:
+                    continue
+                rpd = max(1.0, float(model.get('quota', 100)) * self.quota_scale)
+                rpm = max(1.0, float(model.get('rpm', 10)) * self.quota_scale)
+                self._models[name] = _ModelState(
+                    name=name,
+                    cost=float(model.get('cost', 1.0)),
+                    minute_bucket=TokenBucket(rpm, rpm / 60.0),
+                    day_bucket=TokenBucket(rpd, rpd / 86400.0),
+                    breaker=CircuitBreaker(),
+                )
+
+    def _is_available(self, state: _ModelState, now: float) -> bool:
+        return (
+            state.breaker.allow(now)
+            and state.minute_bucket.available(now) >= 1
+            and state.day_bucket.available(now) >= 1
+        )
+
+    def select(self, preferred: Optional[str] = None) -> Optional[str]:
+        """
+        Выбрать модель и занять под неё токены.
+        Предпочтительная модель используется, пока она здорова; иначе - самая дешёвая здоровая.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = sorted(self._models.values(), key=lambda s: s.cost)
+            if preferred in self._models:
+                candidates.remove(self._models[preferred])
+                candidates.insert(0, self._models[preferred])
+
+            for state in candidates:
+                if not self._is_available(state, now):
+                    continue
+                state.minute_bucket.try_consume(1, now)
+                state.day_bucket.try_consume(1, now)
+                state.breaker.on_dispatch(now)
+                state.requests += 1
+                if preferred and state.name != preferred:
+                    logger.info(f"🔀 ROUTER: {preferred} unavailable, routed to {state.name}")
+                return state.name
+        return None
+
+    def record_success(self, model_name: str) -> None:
+        with self._lock:
+            state = self._models.get(model_name)
+            if state:
+                state.successes += 1
+                state.breaker.on_success()
+
+    def record_failure(self, model_name: str, error_msg: str) -> bool:
+        """Учесть ошибку. Возвращает True, если это ошибка квоты (имеет смысл другая модель)"""
+        is_quota = self.error_handler.is_quota_error(error_msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._models.get(model_name)
+            if not state:
+                return is_quota
+            if is_quota:
+                state.quota_errors += 1
+                state.minute_bucket.drain()
+                if "day" in error_msg.lower():
+                    state.day_bucket.drain()
+            state.breaker.on_failure(now, error_msg[:200], trip_immediately=is_quota)
+            if state.breaker.state == CircuitBreaker.OPEN:
+                logger.warning(
+                    f"⛔ ROUTER: circuit open for {model_name} "
+                    f"({state.breaker.retry_in(now):.0f}s, quota={is_quota})"
+                )
+        return is_quota
+
+    def retry_after(self) -> float:
+        """Через сколько секунд освободится хоть одна модель"""
+        now = time.monotonic()
+        with self._lock:
+            waits = [
+                max(
+                    state.breaker.retry_in(now),
+                    state.minute_bucket.seconds_until(1),
+                    state.day_bucket.seconds_until(1),
+                )
+                for state in self._models.values()
+            ]
+        return min(waits) if waits else 0.0
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        """Живое состояние бакетов и breaker'ов по каждой модели"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "healthy": self._is_available(state, now),
+                    "cost": state.cost,
+                    "requests": state.requests,
+                    "successes": state.successes,
+                    "quota_errors": state.quota_errors,
+                    "minute_bucket": state.minute_bucket.snapshot(),
+                    "day_bucket": state.day_bucket.snapshot(),
+                    "breaker": state.breaker.snapshot(now),
+                }
+                for name, state in self._models.items()
+            }
+
+
+# Глобальный роутер: состояние квот общее для всех экземпляров GeminiClient
+model_router = ModelRouter()
@@ -0,0 +1,84 @@
+"""
+Асинхронный транспорт для Gemini SDK
+- Блокирующие вызовы SDK выполняются в выделенном пуле I/O потоков
+- Чанки стрима передаются в event loop через asyncio.Queue
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Callable, Iterable, Optional
+
+from ..utils.logger import Logger
+
+logger = Logger()
+
+# Маркер конца стрима
+_END = object()
+
+
+class ThreadedTransport:
+    """Мост между синхронным SDK и asyncio: вызовы и стримы уходят в I/O потоки"""
+
+    def __init__(self, max_workers: Optional[int] = None, thread_name_prefix: str = "gemini_io"):
+        self.max_workers = max_workers or int(os.getenv("GEMINI_IO_THREADS", "16"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=thread_name_prefix)
+
+    async def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Выполнить блокирующую функцию в I/O потоке и дождаться результата"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def stream(self, factory: Callable[[], Iterable[Any]]) -> AsyncGenerator[Any, None]:
+        """
+        Итерировать синхронный генератор в I/O потоке.
+        factory() вызывается уже внутри потока, поэтому открытие соединения тоже не блокирует loop.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def _push(item: Any, error: Optional[BaseException] = None) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # Event loop уже закрыт - потребителя больше нет
+                cancelled.set()
+
+        def _produce() -> None:
+            try:
+                for item in factory():
+                    if cancelled.is_set():
+                        break
+                    _push(item)
+            except BaseException as e:
+                _push(_END, e)
+                return
+            _push(_END)
+
+        loop.run_in_executor(self._executor, _produce)
+
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is _END:
+                    if error is not None:
+                        raise error
+                    break
+                yield item
+        finally:
+            # Потребитель ушёл (ответ получен, клиент отключился или задача отменена)
+            cancelled.set()
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Остановить пул потоков"""
+        self._executor.shutdown(wait=wait)
+        logger.info("🛑 Gemini transport stopped")
+
+
+# Глобальный транспорт, общий для всех экземпляров GeminiClient
+gemini_transport = ThreadedTransport()
@@ -283,10 +283,11 @@ class SmartHomeController:
     
     async def _cache_sensor_data(self, sensor_data: SensorData):
         """Кэширование данных сенсора"""
-        cache_key = f"sensor_{sensor_data.sensor_id}"
-        await self.cache.set(
+        payload = asdict(sensor_data)
+        payload["timestamp"] = sensor_data.timestamp.isoformat()
+        await self.cache.aset(
             "smart_home_sensor",
-            asdict(sensor_data),
+            payload,
             {"sensor_id": sensor_data.sensor_id},
             ttl_seconds=3600
         )
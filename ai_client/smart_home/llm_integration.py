@@ -96,10 +96,9 @@ class LLMHomeAssistant:
             full_prompt = self._build_prompt(user_input)
             
             # Запрос к LLM
-            response = await self.ai_client.chat(
-                messages=[{"role": "system", "content": self.system_prompt},
-                         {"role": "user", "content": full_prompt}],
-                temperature=0.1
+            response = await self.ai_client.chat_async(
+                message=full_prompt,
+                additional_prompt=self.system_prompt
             )
             
             # Парсинг ответа
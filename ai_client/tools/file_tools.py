@@ -11,6 +11,7 @@ from datetime import datetime
 from ..utils.config import Config
 from ..utils.logger import Logger
 from ..utils.error_handler import ErrorHandler
+from ..utils.uploads import upload_store
 
 logger = Logger()
 
@@ -40,6 +41,11 @@ class FileTools:
                 logger.error(f"Access denied: File {path} is outside project directory")
                 return "❌ Access denied: File is outside project directory"
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return "❌ Access denied: internal upload storage"
+            
             if not os.path.exists(full_path):
                 # Пробуем найти похожие файлы
                 similar_files = self._find_similar_files(path)
@@ -82,11 +88,16 @@ class FileTools:
                 logger.error(f"Access denied: Path {path} is outside project directory")
                 return False
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return False
+            
             # Создаем директорию если не существует
             os.makedirs(os.path.dirname(full_path), exist_ok=True)
             
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            # Загрузки - жёсткие ссылки на общий blob: запись заменяет файл, а не переписывает его
+            upload_store.write_text(full_path, content)
             
             logger.info(f"📝 Wrote file: {path} ({len(content)} chars)")
             return True
@@ -106,6 +117,11 @@ class FileTools:
                 logger.error(f"Access denied: Path {path} is outside project directory")
                 return False
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return False
+            
             # Проверяем существует ли файл
             if os.path.exists(full_path):
                 logger.warning(f"File already exists: {path}")
@@ -135,12 +151,16 @@ class FileTools:
                 logger.error(f"Access denied: Path {path} is outside project directory")
                 return False
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return False
+            
             # Создаем директорию если не существует
             os.makedirs(os.path.dirname(full_path), exist_ok=True)
             
             # Добавляем содержимое в конец файла
-            with open(full_path, 'a', encoding='utf-8') as f:
-                f.write(content)
+            upload_store.write_text(full_path, content, append=True)
             
             logger.info(f"📝 Appended to file: {path} (+{len(content)} chars)")
             return True
@@ -160,6 +180,11 @@ class FileTools:
                 logger.error(f"Access denied: Path {path} is outside project directory")
                 return False
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return False
+            
             # Проверяем существует ли файл
             if os.path.exists(full_path):
                 logger.warning(f"File already exists: {path}")
@@ -248,13 +273,17 @@ To combine all chunks, use: cat {path}.part* > {path}
                 logger.error(f"Access denied: Path {path} is outside project directory")
                 return False
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return False
+            
             # Проверяем существует ли файл
             if not os.path.exists(full_path):
                 logger.error(f"File not found: {path}")
                 return False
             
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            upload_store.write_text(full_path, content)
             
             logger.info(f"✏️ Edited file: {path} ({len(content)} chars)")
             return True
@@ -285,12 +314,19 @@ To combine all chunks, use: cat {path}.part* > {path}
                 logger.error(f"Access denied: Directory {directory} is outside project directory")
                 return "❌ Access denied: Directory is outside project"
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {directory} is internal upload storage")
+                return "❌ Access denied: internal upload storage"
+            
             if not os.path.exists(full_path):
                 return f"❌ Directory not found: {directory}"
             
             files = []
             for item in os.listdir(full_path):
                 item_path = os.path.join(full_path, item)
+                if upload_store.is_internal(item_path):
+                    continue
                 if os.path.isfile(item_path):
                     size = os.path.getsize(item_path)
                     files.append(f"📄 {item} ({size} bytes)")
@@ -324,6 +360,7 @@ To combine all chunks, use: cat {path}.part* > {path}
             for search_dir in search_dirs:
                 if os.path.exists(search_dir):
                     for root, dirs, files in os.walk(search_dir):
+                        dirs[:] = [d for d in dirs if not upload_store.is_internal(os.path.join(root, d))]
                         for file in files:
                             if query.lower() in file.lower():
                                 rel_path = os.path.relpath(os.path.join(root, file), self.project_root)
@@ -347,6 +384,11 @@ To combine all chunks, use: cat {path}.part* > {path}
             if not full_path.startswith(self.project_root):
                 return "❌ Access denied: File is outside project directory"
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return "❌ Access denied: internal upload storage"
+            
             if not os.path.exists(full_path):
                 return f"❌ File not found: {path}"
             
@@ -383,11 +425,17 @@ To combine all chunks, use: cat {path}.part* > {path}
                 logger.error(f"Access denied: Path {path} is outside project directory")
                 return False
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return False
+            
             if not os.path.exists(full_path):
                 logger.error(f"File not found: {path}")
                 return False
             
-            os.remove(full_path)
+            # Загрузка - жёсткая ссылка: blob удаляется вместе с последней ссылкой
+            upload_store.release(full_path)
             logger.info(f"🗑️ Deleted file: {path}")
             return True
             
@@ -405,6 +453,11 @@ To combine all chunks, use: cat {path}.part* > {path}
                 logger.error(f"Access denied: Path {path} is outside project directory")
                 return False
             
+            # Безопасность: служебное хранилище blob загрузок недоступно
+            if upload_store.is_internal(full_path):
+                logger.error(f"Access denied: {path} is internal upload storage")
+                return False
+            
             if os.path.exists(full_path):
                 logger.warning(f"Directory already exists: {path}")
                 return False
@@ -438,6 +491,7 @@ To combine all chunks, use: cat {path}.part* > {path}
             for search_dir in search_dirs:
                 if os.path.exists(search_dir):
                     for root, dirs, files in os.walk(search_dir):
+                        dirs[:] = [d for d in dirs if not upload_store.is_internal(os.path.join(root, d))]
                         for file in files:
                             if target_name.lower() in file.lower() or file.lower() in target_name.lower():
                                 rel_path = os.path.relpath(os.path.join(root, file), self.project_root)
@@ -29,19 +29,14 @@ class MemoryTools:
     def update_user_profile(self, username: str, new_profile_text: str) -> bool:
         """Обновление профиля пользователя"""
         try:
-            profile_path = os.path.join(self.project_root, 'memory', 'user_profiles', f'{username}.json')
-            
-            if os.path.exists(profile_path):
-                with open(profile_path, 'r', encoding='utf-8') as f:
-                    profile = json.load(f)
-            else:
-                profile = {'username': username}
+            repository = self._profile_repository()
+            profile = repository.get(username) or {'username': username}
             
             profile['profile'] = new_profile_text
             profile['last_updated'] = datetime.now().isoformat()
             
-            with open(profile_path, 'w', encoding='utf-8') as f:
-                json.dump(profile, f, indent=2, ensure_ascii=False)
+            # Запись через репозиторий обновляет кеш профилей и поисковый индекс
+            repository.save(username, profile)
             
             logger.info(f"👤 Updated profile for {username}")
             return True
@@ -86,14 +81,11 @@ class MemoryTools:
     def read_user_profile(self, username: str) -> str:
         """Чтение профиля пользователя"""
         try:
-            profile_path = os.path.join(self.project_root, 'memory', 'user_profiles', f'{username}.json')
+            profile = self._profile_repository().get(username)
             
-            if not os.path.exists(profile_path):
+            if not profile:
                 return f"❌ Profile not found for {username}"
             
-            with open(profile_path, 'r', encoding='utf-8') as f:
-                profile = json.load(f)
-            
             return json.dumps(profile, indent=2, ensure_ascii=False)
             
         except Exception as e:
@@ -120,9 +112,23 @@ class MemoryTools:
             logger.error(f"Error writing insight for {username}: {e}")
             return False
     
+    def search_memory(self, query: str, username: Optional[str] = None, limit: int = 10) -> str:
+        """Полнотекстовый поиск по истории, архиву и профилям (FTS5 индекс)"""
+        try:
+            from memory.search_index import search_index
+            return search_index.format_results(query, user=username, limit=limit)
+        except Exception as e:
+            logger.error(f"Error searching memory for '{query}': {e}")
+            return f"❌ Error searching memory: {str(e)}"
+    
     def search_user_data(self, username: str, query: str) -> str:
-        """Поиск данных пользователя"""
+        """Поиск данных пользователя: сначала по индексу, затем по файлу профиля"""
         try:
+            from memory.search_index import search_index
+            found = search_index.search(query, user=username)
+            if found["results"]:
+                return search_index.format_results(query, user=username)
+            
             profile_path = os.path.join(self.project_root, 'memory', 'user_profiles', f'{username}.json')
             
             if not os.path.exists(profile_path):
@@ -154,51 +160,45 @@ class MemoryTools:
             logger.error(f"Error searching user data for {username}: {e}")
             return f"❌ Error searching user data: {str(e)}"
     
+    def _profile_repository(self):
+        """Общий кеш профилей (memory/user_profiles.py)"""
+        from memory.user_profiles import get_profile_repository
+        return get_profile_repository(os.path.join(self.project_root, 'memory', 'user_profiles'))
+    
     def _get_multi_user_context(self) -> str:
-        """Получение контекста нескольких пользователей"""
+        """Получение контекста нескольких пользователей (предвычисленная строка из кеша профилей)"""
         try:
-            profiles_dir = os.path.join(self.project_root, 'memory', 'user_profiles')
-            
-            if not os.path.exists(profiles_dir):
-                return "No user profiles found"
-            
-            context_parts = []
-            
-            for filename in os.listdir(profiles_dir):
-                if filename.endswith('.json'):
-                    username = filename[:-5]  # Убираем .json
-                    profile_path = os.path.join(profiles_dir, filename)
-                    
-                    with open(profile_path, 'r', encoding='utf-8') as f:
-                        profile = json.load(f)
-                    
-                    # Извлекаем ключевую информацию
-                    name = profile.get('full_name', username)
-        
-                    last_updated = profile.get('last_updated', 'unknown')
-                    
-                    context_parts.append(f"👤 {name} ({username}): updated {last_updated}")
-            
-            if context_parts:
-                return "Multi-user context:\n" + "\n".join(context_parts)
-            else:
-                return "No user profiles found"
-            
+            return self._profile_repository().multi_user_context()
         except Exception as e:
             logger.error(f"Error getting multi-user context: {e}")
             return f"❌ Error getting multi-user context: {str(e)}"
     
-    # Vector memory методы (заглушки)
+    # Vector memory методы (memory/vector_memory.py)
     def store_embedding_memory(self, text: str, label: str = "general") -> bool:
         """Сохранение в векторную память"""
-        # TODO: Реализовать векторную память
-        logger.info(f"🧠 Stored embedding: {text[:50]}... [{label}]")
-        return True
+        try:
+            from memory.vector_memory import vector_memory
+            vector_memory.add(text, label=label)
+            logger.info(f"🧠 Stored embedding: {text[:50]}... [{label}]")
+            return True
+        except Exception as e:
+            logger.error(f"Error storing embedding: {e}")
+            return False
     
     def search_embedding_memory(self, query: str, top_k: int = 5) -> str:
         """Поиск в векторной памяти"""
-        # TODO: Реализовать векторную память
-        return f"🔍 Vector memory search for '{query}' (not implemented)"
+        try:
+            from memory.vector_memory import vector_memory
+            results = vector_memory.search(query, top_k=top_k)
+            if not results:
+                return f"🔍 No similar memories found for '{query}'"
+            lines = [f"🔍 Vector memory search for '{query}':"]
+            for r in results:
+                lines.append(f"- ({r['score']:.2f}) [{r['label']}] {r['text'][:300]}")
+            return "\n".join(lines)
+        except Exception as e:
+            logger.error(f"Error searching vector memory: {e}")
+            return f"❌ Error searching vector memory: {str(e)}"
     
     def summarize_conversation(self, conversation_history: List[str]) -> str:
         """Суммаризация разговора"""
@@ -207,11 +207,24 @@ class MemoryTools:
     
     def get_memory_stats(self) -> str:
         """Получение статистики памяти"""
-        # TODO: Реализовать статистику
-        return "📊 Memory statistics (not implemented)"
+        try:
+            from memory.vector_memory import vector_memory
+            stats = vector_memory.get_stats()
+            labels = ", ".join(f"{label}: {count}" for label, count in stats["labels"].items()) or "empty"
+            return (f"📊 Vector memory: {stats['vectors']} vectors ({labels}), "
+                    f"{stats['embedder']} embedder, dim {stats['dim']}, {stats['index']} index, "
+                    f"{stats['file_bytes'] / 1024 / 1024:.1f} MB on disk")
+        except Exception as e:
+            logger.error(f"Error getting memory stats: {e}")
+            return f"❌ Error getting memory stats: {str(e)}"
     
     def clear_vector_memory(self) -> bool:
         """Очистка векторной памяти"""
-        # TODO: Реализовать очистку
-        logger.info("🧹 Cleared vector memory (not implemented)")
-        return True 
\ No newline at end of file
+        try:
+            from memory.vector_memory import vector_memory
+            vector_memory.clear()
+            logger.info("🧹 Cleared vector memory")
+            return True
+        except Exception as e:
+            logger.error(f"Error clearing vector memory: {e}")
+            return False
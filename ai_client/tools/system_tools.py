@@ -264,7 +264,7 @@ class SystemTools:
             health_report.append("\n=== File System Health ===")
             critical_files = [
                 "memory/model_notes.json",
-                "memory/conversation_history.json", 
+                "memory/conversation_history.jsonl",
                 "memory/user_profiles/meranda.json",
                 "memory/user_profiles/stepan.json",
             ]
@@ -842,7 +842,7 @@ Be detailed and specific in your analysis."""
                 'list_files', 'search_files', 'append_to_file', 'safe_create_file',
                 
                 # User Profile Tools
-                'read_user_profile', 'search_user_data',
+                'read_user_profile', 'search_user_data', 'search_memory',
         
                 
                 # System Tools
@@ -970,7 +970,7 @@ Be detailed and specific in your analysis."""
                 'list_files', 'search_files',
                 'get_system_logs', 'get_error_summary', 'analyze_image', 'web_search',
                 'switch_model', 'force_model_execution', 'read_user_profile',
-                'search_user_data', 'get_recent_file_changes',
+                'search_user_data', 'search_memory', 'get_recent_file_changes',
                 'append_to_file', 'safe_create_file'
             ]
             
@@ -1083,7 +1083,7 @@ Be detailed and specific in your analysis."""
                 from ..tools.file_tools import FileTools
                 file_tools = FileTools()
                 result = file_tools.read_file(path)
-                logger.info(f"✅ read_file result: {result[:200]}..." if len(result) > 200 else result)
+                logger.debug(f"✅ read_file result: {result[:200]}..." if len(result) > 200 else result)
                 return result
             
             elif func_name == "list_files":
@@ -1186,7 +1186,7 @@ Be detailed and specific in your analysis."""
                 from ..tools.memory_tools import MemoryTools
                 memory_tools = MemoryTools()
                 result = memory_tools.read_user_profile(username)
-                logger.info(f"✅ read_user_profile result: {result[:200]}..." if len(result) > 200 else result)
+                logger.debug(f"✅ read_user_profile result: {result[:200]}..." if len(result) > 200 else result)
                 return result
             
 
@@ -1203,6 +1203,18 @@ Be detailed and specific in your analysis."""
                 logger.info(f"✅ search_user_data result: {result[:200]}..." if len(result) > 200 else result)
                 return result
             
+            elif func_name == "search_memory":
+                args = self._parse_arguments(args_str, ["query", "username"])
+                query = str(args.get("query", "")).strip('"\'')
+                username = str(args.get("username", "")).strip('"\'')
+                logger.info(f"🔧 search_memory: query={query}, username={username}")
+                # Делегируем в MemoryTools
+                from ..tools.memory_tools import MemoryTools
+                memory_tools = MemoryTools()
+                result = memory_tools.search_memory(query, username or None)
+                logger.info(f"✅ search_memory result: {result[:200]}..." if len(result) > 200 else result)
+                return result
+            
 
             
 
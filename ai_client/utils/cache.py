@@ -5,21 +5,690 @@
 import time
 import json
 import os
-from typing import Optional, Dict, Any
+import sys
+import asyncio
+import heapq
+import atexit
+import hashlib
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
 from datetime import datetime, timedelta
 import logging
 
+from .cache_metrics import CacheMetrics
+
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """Приблизительный размер объекта в байтах (рекурсивно по контейнерам)"""
+    size = sys.getsizeof(value)
+    if _depth > 6:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += approx_size(item, _depth + 1)
+    return size
+
+
+class BoundedMemoryCache:
+    """
+    Ограниченный по числу записей и байтам LRU-кэш в памяти.
+    Просроченные записи удаляются фоновым таймером, а не только при чтении.
+    Совместим с dict-интерфейсом, который использовал SystemCache.memory_cache.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 sweep_interval: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+        self.max_bytes = max_bytes or int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.sweep_interval = sweep_interval or float(os.getenv("CACHE_SWEEP_SECONDS", "30"))
+
+        self._lock = threading.RLock()
+        # key -> (cache_data, size, expires_at); порядок = LRU (свежие в конце)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        # (expires_at, key) - ленивая очередь сроков, устаревшие элементы пропускаются
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._bytes = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions_lru": 0,
+            "evictions_size": 0,
+            "expirations": 0,
+            "rejected_oversize": 0,
+        }
+
+        # on_evict(reason, cache_data): reason - evictions_lru / evictions_size / expirations
+        self.on_evict: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        self.start()
+
+    # ===== dict-совместимый интерфейс =====
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            cache_data, _, _ = self._entries[key]
+            self._entries.move_to_end(key)
+            return cache_data
+
+    def __setitem__(self, key: str, cache_data: Dict[str, Any]) -> None:
+        self.put(key, cache_data)
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            _, size, _ = self._entries.pop(key)
+            self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._entries.pop(key, None)
+            if item is None:
+                return default
+            self._bytes -= item[1]
+            return item[0]
+
+    def expire(self, key: str) -> None:
+        """Удалить запись, признанную устаревшей при чтении (TTL вызова или инвалидированный тег)"""
+        with self._lock:
+            item = self._entries.pop(key, None)
+            if item is None:
+                return
+            self._bytes -= item[1]
+            self.stats["expirations"] += 1
+            if self.on_evict:
+                self.on_evict("expirations", item[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._expiry_heap.clear()
+            self._bytes = 0
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    # ===== Операции кэша =====
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Запись кэша или None; учитывает hit/miss"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[2] <= time.time():
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return item[0]
+
+    def put(self, key: str, cache_data: Dict[str, Any]) -> None:
+        size = approx_size(key) + approx_size(cache_data)
+        expires_at = cache_data.get("timestamp", time.time()) + cache_data.get("ttl_seconds", 600)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                self.stats["rejected_oversize"] += 1
+                return
+            self._entries[key] = (cache_data, size, expires_at)
+            self._bytes += size
+            self.stats["sets"] += 1
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest("evictions_lru")
+            while self._bytes > self.max_bytes and self._entries:
+                self._evict_oldest("evictions_size")
+            # Перезаписанные ключи оставляют мусор в куче - иногда перестраиваем
+            if len(self._expiry_heap) > 2 * len(self._entries) + 1024:
+                self._expiry_heap = [(item[2], k) for k, item in self._entries.items()]
+                heapq.heapify(self._expiry_heap)
+
+    def _evict_oldest(self, counter: str) -> None:
+        _, (cache_data, size, _) = self._entries.popitem(last=False)
+        self._bytes -= size
+        self.stats[counter] += 1
+        if self.on_evict:
+            self.on_evict(counter, cache_data)
+
+    # ===== Фоновая очистка по TTL =====
+
+    def sweep(self) -> int:
+        """Удалить все просроченные записи; возвращает их число"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, key = heapq.heappop(self._expiry_heap)
+                item = self._entries.get(key)
+                # Ключ мог быть перезаписан с новым сроком
+                if item is not None and item[2] == expires_at:
+                    del self._entries[key]
+                    self._bytes -= item[1]
+                    removed += 1
+                    if self.on_evict:
+                        self.on_evict("expirations", item[0])
+            self.stats["expirations"] += removed
+        if removed:
+            logger.debug(f"🧹 Cache sweep: {removed} expired entries removed")
+        return removed
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Cache sweep error: {e}")
+
+    def start(self) -> None:
+        if self._sweeper and self._sweeper.is_alive():
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="cache_sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def usage_by(self, field: str) -> Dict[str, Tuple[int, int]]:
+        """(записей, байт) с группировкой по полю записи, например по operation"""
+        with self._lock:
+            items = [(item[0].get(field), item[1]) for item in self._entries.values()]
+        usage: Dict[str, Tuple[int, int]] = {}
+        for name, size in items:
+            entries, total = usage.get(name, (0, 0))
+            usage[name] = (entries + 1, total + size)
+        return usage
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class DiskCacheTier:
+    """
+    Дисковый уровень кэша.
+    - Ключ хэшируется (sha1) и раскладывается по 256 подкаталогам: cache/ab/abcdef....bin
+    - Бинарный формат: заголовок фиксированной длины (timestamp, ttl, длины) + ключ + компактный JSON
+      (zlib для больших значений); срок проверяется по заголовку без разбора данных
+    - Запись атомарная (временный файл + rename), по умолчанию в фоновом потоке
+    - Индекс (index.json) для статистики, очистки и удаления просроченных файлов без обхода каталога;
+      при нескольких воркерах у каждого свой файл index.worker-<slot>.json, при загрузке
+      индексы всех воркеров объединяются (записи соседей тоже удаляются по сроку и при очистке)
+    - Теги записей (conversation, user:<name>, ...) хранятся в файле и в индексе;
+      tag -> keys держится в памяти для инвалидации за O(число помеченных записей)
+    - Время инвалидации тега - mtime файла tags/<hash>: записи старше него устарели
+      и в других процессах (воркерах), которые делят каталог кэша
+    """
+
+    MAGIC = b"LVC1"
+    VERSION = 2
+    FLAG_ZLIB = 1
+    # magic, version, flags, key_len, timestamp, ttl, payload_len, tags_len
+    HEADER = struct.Struct("<4sBBHddIH")
+    COMPRESS_MIN_BYTES = 1024
+    INDEX_FILE = "index.json"
+    TAGS_DIR = "tags"
+
+    def __init__(self, cache_dir: str, async_writes: Optional[bool] = None,
+                 retention_seconds: Optional[float] = None, flush_interval: float = 2.0,
+                 batch_delay: Optional[float] = None, index_file: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.index_file = index_file or self._default_index_file()
+        if async_writes is None:
+            async_writes = os.getenv("CACHE_ASYNC_WRITES", "1").lower() not in ("0", "false", "no")
+        self.async_writes = async_writes
+        # Файл живёт не меньше retention: читатели иногда берут запись с большим TTL (fallback)
+        self.retention_seconds = retention_seconds if retention_seconds is not None else float(
+            os.getenv("CACHE_DISK_RETENTION_SECONDS", "3600"))
+        self.flush_interval = flush_interval
+        # Пауза после первой записи: частые обновления одного ключа (сенсоры) склеиваются в одну запись
+        self.batch_delay = batch_delay if batch_delay is not None else int(
+            os.getenv("CACHE_WRITE_BATCH_MS", "50")) / 1000.0
+
+        self._lock = threading.RLock()
+        # hash -> [key, timestamp, ttl, size, tags]
+        self._index: Dict[str, List[Any]] = {}
+        # tag -> keys и key -> tags (только помеченные записи, включая ожидающие записи)
+        self._tag_keys: Dict[str, set] = {}
+        self._key_tags: Dict[str, Tuple[str, ...]] = {}
+        # tag -> (время последней инвалидации, когда проверяли файл); чужие инвалидации видны
+        # не позже чем через tag_sync_seconds
+        self._tag_epochs: Dict[str, Tuple[float, float]] = {}
+        self.tag_sync_seconds = float(os.getenv("CACHE_TAG_SYNC_SECONDS", "1.0"))
+        self._index_dirty = False
+        # key -> cache_data (None = ожидающее удаление); читатели видят свои же записи до сброса на диск
+        self._pending: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self.stats = {"reads": 0, "writes": 0, "deletes": 0, "expired_removed": 0, "corrupted": 0,
+                      "coalesced": 0, "batches": 0}
+        # Метрики по операциям (время сериализации, записанные байты); задаёт SystemCache
+        self.metrics: Optional[CacheMetrics] = None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+        self._worker = threading.Thread(target=self._worker_loop, name="cache_disk_writer", daemon=True)
+        self._worker.start()
+        atexit.register(self.flush)
+
+    # ===== Пути и кодирование =====
+
+    @staticmethod
+    def key_hash(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _path(self, key_hash: str) -> str:
+        return os.path.join(self.cache_dir, key_hash[:2], f"{key_hash}.bin")
+
+    def _encode(self, key: str, cache_data: Dict[str, Any]) -> bytes:
+        payload = json.dumps(cache_data.get("data"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        flags = 0
+        if len(payload) >= self.COMPRESS_MIN_BYTES:
+            payload = zlib.compress(payload, 6)
+            flags |= self.FLAG_ZLIB
+        key_bytes = key.encode("utf-8")
+        tags_bytes = "\n".join(cache_data.get("tags") or ()).encode("utf-8")
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, flags, len(key_bytes),
+                                  float(cache_data.get("timestamp", time.time())),
+                                  float(cache_data.get("ttl_seconds", 600)), len(payload), len(tags_bytes))
+        return header + key_bytes + tags_bytes + payload
+
+    @staticmethod
+    def _decode_tags(tags_bytes: bytes) -> List[str]:
+        return tags_bytes.decode("utf-8").split("\n") if tags_bytes else []
+
+    # ===== Теги =====
+
+    def _tag(self, key: str, tags: Optional[List[str]]) -> None:
+        """Привязать ключ к тегам (старые теги ключа снимаются); вызывать под self._lock"""
+        self._untag(key)
+        if tags:
+            self._key_tags[key] = tuple(tags)
+            for tag in tags:
+                self._tag_keys.setdefault(tag, set()).add(key)
+
+    def _untag(self, key: str) -> None:
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+    def _tag_path(self, tag: str) -> str:
+        return os.path.join(self.cache_dir, self.TAGS_DIR, self.key_hash(tag))
+
+    def bump_tag(self, tag: str) -> None:
+        """Отметить инвалидацию тега (видна всем процессам с этим каталогом)"""
+        now = time.time()
+        path = self._tag_path(tag)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a'):
+                pass
+            os.utime(path, (now, now))
+        except OSError as e:
+            logger.error(f"❌ Cache tag epoch write error: {e}")
+        with self._lock:
+            self._tag_epochs[tag] = (now, time.monotonic())
+
+    def tag_epoch(self, tag: str) -> float:
+        checked = self._tag_epochs.get(tag)
+        if checked is not None and time.monotonic() - checked[1] < self.tag_sync_seconds:
+            return checked[0]
+        try:
+            epoch = os.stat(self._tag_path(tag)).st_mtime
+        except FileNotFoundError:
+            epoch = 0.0
+        if checked is not None:
+            epoch = max(epoch, checked[0])
+        with self._lock:
+            self._tag_epochs[tag] = (epoch, time.monotonic())
+        return epoch
+
+    def invalidated(self, cache_data: Dict[str, Any]) -> bool:
+        """Запись устарела из-за инвалидации одного из её тегов (в любом процессе)"""
+        tags = cache_data.get("tags")
+        if not tags:
+            return False
+        timestamp = cache_data.get("timestamp", 0)
+        return any(self.tag_epoch(tag) >= timestamp for tag in tags)
+
+    def keys_for_tag(self, tag: str) -> List[str]:
+        with self._lock:
+            return list(self._tag_keys.get(tag, ()))
+
+    def tag_count(self) -> int:
+        with self._lock:
+            return len(self._tag_keys)
+
+    # ===== Индекс =====
+
+    @classmethod
+    def _default_index_file(cls) -> str:
+        """Свой файл индекса у каждого воркера: иначе последний записавший затирает записи остальных"""
+        from .workers import is_multi_worker, worker_slot
+        if not is_multi_worker():
+            return cls.INDEX_FILE
+        return f"index.worker-{worker_slot()}.json"
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, self.index_file)
+
+    def _index_paths(self) -> List[str]:
+        """Файлы индекса всех воркеров в каталоге кэша"""
+        names = sorted(name for name in os.listdir(self.cache_dir)
+                       if name.startswith("index") and name.endswith(".json") and name != self.index_file)
+        paths = [os.path.join(self.cache_dir, name) for name in names]
+        if os.path.exists(self._index_path()):
+            paths.append(self._index_path())
+        return paths
+
+    def _load_index(self) -> None:
+        try:
+            paths = self._index_paths()
+            if paths:
+                merged: Dict[str, List[Any]] = {}
+                for path in paths:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        for key_hash, item in json.load(f).items():
+                            current = merged.get(key_hash)
+                            if current is None or item[1] >= current[1]:
+                                merged[key_hash] = item
+                self._index = merged
+                for key, _, _, _, tags in self._index.values():
+                    self._tag(key, tags)
+                return
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"⚠️ Cache index corrupted, rebuilding: {e}")
+        except (ValueError, TypeError) as e:
+            # Индекс старого формата (без тегов) - перестраиваем
+            logger.warning(f"⚠️ Cache index outdated, rebuilding: {e}")
+            self._tag_keys, self._key_tags = {}, {}
+        # Индекса нет (первый запуск или сбой) - один раз восстанавливаем по заголовкам файлов
+        self._index = {}
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(".bin"):
+                    continue
+                try:
+                    with open(entry.path, 'rb') as f:
+                        header = self.HEADER.unpack(f.read(self.HEADER.size))
+                        if header[0] != self.MAGIC or header[1] != self.VERSION:
+                            raise ValueError("bad header")
+                        key = f.read(header[3]).decode("utf-8")
+                        tags = self._decode_tags(f.read(header[7]))
+                    self._index[entry.name[:-4]] = [key, header[4], header[5], entry.stat().st_size, tags]
+                    self._tag(key, tags)
+                except Exception:
+                    # Файл старого формата или повреждённый - без индекса его не инвалидировать
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        self._index_dirty = True
+        if self._index:
+            logger.info(f"🗂️ Cache index rebuilt: {len(self._index)} entries")
+
+    def _write_index(self) -> None:
+        with self._lock:
+            if not self._index_dirty:
+                return
+            snapshot = json.dumps(self._index, ensure_ascii=False, separators=(",", ":"))
+            self._index_dirty = False
+        tmp_path = f"{self._index_path()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self._index_path())
+
+    # ===== Операции =====
+
+    def read(self, key: str, ttl_seconds: float, operation: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Запись кэша, если она моложе ttl_seconds; иначе None"""
+        with self._lock:
+            if key in self._pending:
+                cache_data = self._pending[key]
+                if cache_data is None or time.time() - cache_data["timestamp"] >= ttl_seconds:
+                    return None
+                return None if self.invalidated(cache_data) else cache_data
+        key_hash = self.key_hash(key)
+        path = self._path(key_hash)
+        try:
+            with open(path, 'rb') as f:
+                magic, version, flags, key_len, timestamp, ttl, payload_len, tags_len = self.HEADER.unpack(
+                    f.read(self.HEADER.size))
+                if magic != self.MAGIC or version != self.VERSION:
+                    raise ValueError("bad header")
+                # Срок - по заголовку, данные не читаем
+                if time.time() - timestamp >= ttl_seconds:
+                    return None
+                if f.read(key_len).decode("utf-8") != key:
+                    return None  # коллизия хэша
+                tags = self._decode_tags(f.read(tags_len))
+                if tags and any(self.tag_epoch(tag) >= timestamp for tag in tags):
+                    return None  # тег инвалидирован (возможно, другим воркером)
+                payload = f.read(payload_len)
+            started = time.perf_counter()
+            if flags & self.FLAG_ZLIB:
+                payload = zlib.decompress(payload)
+            data = json.loads(payload)
+            if self.metrics:
+                self.metrics.inc(operation, "deserialize_seconds", time.perf_counter() - started)
+            self.stats["reads"] += 1
+            return {
+                "data": data,
+                "timestamp": timestamp,
+                "ttl_seconds": ttl,
+                "created_at": datetime.fromtimestamp(timestamp).isoformat(),
+                "tags": tags,
+            }
+        except FileNotFoundError:
+            self._remove(key_hash)
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Corrupted cache file {path}: {e}")
+            self.stats["corrupted"] += 1
+            self._remove(key_hash)
+            return None
+
+    def write(self, key: str, cache_data: Dict[str, Any]) -> None:
+        with self._lock:
+            # Теги видны сразу, до сброса на диск: invalidate_tag сразу после set находит запись
+            self._tag(key, cache_data.get("tags"))
+        if self.async_writes:
+            with self._lock:
+                if self._pending.pop(key, _MISSING) is not _MISSING:
+                    self.stats["coalesced"] += 1
+                self._pending[key] = cache_data
+            self._wakeup.set()
+        else:
+            self._write_now(key, cache_data)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._untag(key)
+        if self.async_writes:
+            with self._lock:
+                self._pending.pop(key, None)
+                self._pending[key] = None
+            self._wakeup.set()
+        else:
+            self._remove(self.key_hash(key))
+
+    def _write_now(self, key: str, cache_data: Dict[str, Any]) -> None:
+        key_hash = self.key_hash(key)
+        path = self._path(key_hash)
+        started = time.perf_counter()
+        blob = self._encode(key, cache_data)
+        if self.metrics:
+            operation = cache_data.get("operation")
+            self.metrics.inc(operation, "serialize_seconds", time.perf_counter() - started)
+            self.metrics.inc(operation, "bytes_written", len(blob))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._index[key_hash] = [key, cache_data.get("timestamp", time.time()),
+                                     cache_data.get("ttl_seconds", 600), len(blob),
+                                     list(cache_data.get("tags") or ())]
+            self._index_dirty = True
+        self.stats["writes"] += 1
+
+    def _remove(self, key_hash: str) -> None:
+        try:
+            os.remove(self._path(key_hash))
+            self.stats["deletes"] += 1
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            item = self._index.pop(key_hash, None)
+            if item is not None:
+                self._index_dirty = True
+                # Ключ мог быть перезаписан и ждать записи - его теги уже новые
+                if item[0] not in self._pending:
+                    self._untag(item[0])
+
+    def invalidate_tag(self, tag: str) -> List[str]:
+        """Удалить все записи с тегом; возвращает их ключи"""
+        self.bump_tag(tag)
+        with self._lock:
+            keys = list(self._tag_keys.get(tag, ()))
+        for key in keys:
+            self.delete(key)
+        return keys
+
+    def flush(self) -> None:
+        """Сбросить ожидающие записи и индекс на диск"""
+        if self._pending:
+            self.stats["batches"] += 1
+        while True:
+            with self._lock:
+                if not self._pending:
+                    break
+                # Значение остаётся в очереди до конца записи - читатели продолжают его видеть
+                key, cache_data = next(iter(self._pending.items()))
+            try:
+                if cache_data is None:
+                    self._remove(self.key_hash(key))
+                else:
+                    self._write_now(key, cache_data)
+            except Exception as e:
+                logger.error(f"❌ Cache disk write error: {e}")
+            with self._lock:
+                # Если ключ перезаписали во время записи, новое значение остаётся в очереди
+                if self._pending.get(key, _MISSING) is cache_data:
+                    del self._pending[key]
+        try:
+            self._write_index()
+        except Exception as e:
+            logger.error(f"❌ Cache index write error: {e}")
+
+    def sweep(self) -> int:
+        """Удалить файлы старше max(ttl, retention) по индексу"""
+        now = time.time()
+        with self._lock:
+            expired = [h for h, (_, timestamp, ttl, _, _) in self._index.items()
+                       if now - timestamp > max(ttl, self.retention_seconds)]
+        for key_hash in expired:
+            self._remove(key_hash)
+        self.stats["expired_removed"] += len(expired)
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self._tag_keys, self._key_tags = {}, {}
+            hashes = list(self._index.keys())
+        for key_hash in hashes:
+            self._remove(key_hash)
+        self._write_index()
+
+    def _worker_loop(self) -> None:
+        last_sweep = time.monotonic()
+        while not self._stop.is_set():
+            if self._wakeup.wait(self.flush_interval) and self.batch_delay:
+                time.sleep(self.batch_delay)
+            self._wakeup.clear()
+            self.flush()
+            if time.monotonic() - last_sweep > 60:
+                last_sweep = time.monotonic()
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"❌ Cache disk sweep error: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        self.flush()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._index),
+                "bytes": sum(item[3] for item in self._index.values()),
+                "pending_writes": len(self._pending),
+                "tags": len(self._tag_keys),
+                "async_writes": self.async_writes,
+            }
+
+
 class SystemCache:
-    """Кэш для системных операций"""
+    """Кэш для системных операций: память (LRU) + диск (хэшированные шарды)"""
     
-    def __init__(self):
-        self.cache_dir = "cache"
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 cache_dir: str = "cache", async_writes: Optional[bool] = None):
+        self.cache_dir = cache_dir
         self.ensure_cache_dir()
         
-        # Кэш в памяти для быстрого доступа
-        self.memory_cache = {}
+        # Ограниченный LRU-кэш в памяти для быстрого доступа
+        self.memory_cache = BoundedMemoryCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.disk_cache = DiskCacheTier(self.cache_dir, async_writes=async_writes)
+        
+        # Метрики по операциям: попадания по уровням, задержки, вытеснения, байты
+        self.metrics = CacheMetrics()
+        self.memory_cache.on_evict = lambda reason, cache_data: self.metrics.inc(cache_data.get("operation"), reason)
+        self.disk_cache.metrics = self.metrics
+        
+        # Stale-while-revalidate: одна фоновая/первичная загрузка на ключ
+        self.refresh_ahead = float(os.getenv("CACHE_REFRESH_AHEAD", "0.8"))
+        self._loads: Dict[str, "asyncio.Task"] = {}
+        self._load_tags: Dict[str, Tuple[str, ...]] = {}
+        self.swr_stats = {"fresh": 0, "refresh_ahead": 0, "stale": 0, "miss": 0,
+                          "refreshes": 0, "refresh_errors": 0, "deduplicated": 0}
         
     def ensure_cache_dir(self):
         """Создаем директорию кэша если не существует"""
@@ -28,77 +697,87 @@ class SystemCache:
             logger.info(f"✅ Created cache directory: {self.cache_dir}")
     
     def get_cache_key(self, operation: str, params: Dict[str, Any] = None) -> str:
-        """Генерируем ключ кэша"""
+        """Генерируем ключ кэша (логический; на диске он хэшируется)"""
         key_parts = [operation]
         if params:
             for k, v in sorted(params.items()):
                 key_parts.append(f"{k}={v}")
         return "_".join(key_parts)
     
+    def _memory_get(self, cache_key: str, operation: str, ttl_seconds: float) -> Any:
+        """Значение из памяти или _MISSING (без I/O)"""
+        cached_data = self.memory_cache.lookup(cache_key)
+        if cached_data is not None:
+            if time.time() - cached_data["timestamp"] < ttl_seconds and not self.disk_cache.invalidated(cached_data):
+                self.metrics.inc(operation, "hits_memory")
+                logger.debug(f"✅ Cache HIT (memory): {operation}")
+                return cached_data["data"]
+            self.memory_cache.expire(cache_key)
+        return _MISSING
+    
+    def _disk_result(self, cache_key: str, operation: str, cached_data: Optional[Dict[str, Any]]) -> Optional[Any]:
+        if cached_data is not None:
+            # Загружаем в память
+            cached_data["operation"] = operation
+            self.memory_cache[cache_key] = cached_data
+            self.metrics.inc(operation, "hits_disk")
+            logger.debug(f"✅ Cache HIT (file): {operation}")
+            return cached_data["data"]
+        self.metrics.inc(operation, "misses")
+        logger.debug(f"❌ Cache MISS: {operation}")
+        return None
+    
+    @staticmethod
+    def _entry(data: Any, ttl_seconds: float, tags: Optional[List[str]] = None,
+               operation: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "data": data,
+            "timestamp": time.time(),
+            "ttl_seconds": ttl_seconds,
+            "created_at": datetime.now().isoformat(),
+            "tags": list(tags) if tags else [],
+            "operation": operation
+        }
+    
     def get(self, operation: str, params: Dict[str, Any] = None, ttl_seconds: int = 600) -> Optional[Dict[str, Any]]:
         """Получить данные из кэша"""
+        started = time.perf_counter()
         try:
             cache_key = self.get_cache_key(operation, params)
             
             # Проверяем память
-            if cache_key in self.memory_cache:
-                cached_data = self.memory_cache[cache_key]
-                if time.time() - cached_data["timestamp"] < ttl_seconds:
-                    logger.info(f"✅ Cache HIT (memory): {operation}")
-                    return cached_data["data"]
-                else:
-                    del self.memory_cache[cache_key]
+            data = self._memory_get(cache_key, operation, ttl_seconds)
+            if data is not _MISSING:
+                return data
             
-            # Проверяем файл
-            cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-            if os.path.exists(cache_file):
-                try:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        cached_data = json.load(f)
-                    
-                    if time.time() - cached_data["timestamp"] < ttl_seconds:
-                        # Загружаем в память
-                        self.memory_cache[cache_key] = cached_data
-                        logger.info(f"✅ Cache HIT (file): {operation}")
-                        return cached_data["data"]
-                    else:
-                        # Удаляем устаревший файл
-                        os.remove(cache_file)
-                        logger.info(f"🗑️ Removed expired cache: {operation}")
-                except (json.JSONDecodeError, IOError) as e:
-                    logger.warning(f"⚠️ Corrupted cache file {cache_file}: {e}")
-                    try:
-                        os.remove(cache_file)
-                    except:
-                        pass
-            
-            logger.info(f"❌ Cache MISS: {operation}")
-            return None
+            # Проверяем диск
+            return self._disk_result(cache_key, operation, self.disk_cache.read(cache_key, ttl_seconds, operation))
             
         except Exception as e:
             logger.error(f"❌ Cache get error: {e}")
             return None
+        finally:
+            self.metrics.observe(operation, "get", time.perf_counter() - started)
     
-    def set(self, operation: str, data: Dict[str, Any], params: Dict[str, Any] = None, ttl_seconds: int = 600):
-        """Сохранить данные в кэш"""
+    def set(self, operation: str, data: Dict[str, Any], params: Dict[str, Any] = None, ttl_seconds: int = 600,
+            tags: Optional[List[str]] = None):
+        """
+        Сохранить данные в кэш.
+        tags - от чего зависит запись ("conversation", "user:<name>", "profile:<name>"):
+        invalidate_tag(tag) удаляет все зависимые записи в обоих уровнях
+        """
         try:
             cache_key = self.get_cache_key(operation, params)
-            cache_data = {
-                "data": data,
-                "timestamp": time.time(),
-                "ttl_seconds": ttl_seconds,
-                "created_at": datetime.now().isoformat()
-            }
+            cache_data = self._entry(data, ttl_seconds, tags, operation)
             
             # Сохраняем в память
             self.memory_cache[cache_key] = cache_data
             
-            # Сохраняем в файл
-            cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2, ensure_ascii=False)
+            # Сохраняем на диск (атомарно, по умолчанию в фоне)
+            self.disk_cache.write(cache_key, cache_data)
             
-            logger.info(f"💾 Cache SET: {operation} (TTL: {ttl_seconds}s)")
+            self.metrics.inc(operation, "sets")
+            logger.debug(f"💾 Cache SET: {operation} (TTL: {ttl_seconds}s)")
             
         except Exception as e:
             logger.error(f"❌ Cache set error: {e}")
@@ -108,32 +787,207 @@ class SystemCache:
         try:
             cache_key = self.get_cache_key(operation, params)
             
-            # Удаляем из памяти
-            if cache_key in self.memory_cache:
-                del self.memory_cache[cache_key]
-            
-            # Удаляем файл
-            cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-            if os.path.exists(cache_file):
-                os.remove(cache_file)
+            self.memory_cache.pop(cache_key)
+            self.disk_cache.delete(cache_key)
+            self._loads.pop(cache_key, None)
             
+            self.metrics.inc(operation, "invalidations")
             logger.info(f"🗑️ Cache INVALIDATED: {operation}")
             
         except Exception as e:
             logger.error(f"❌ Cache invalidate error: {e}")
     
+    def invalidate_tag(self, tag: str) -> int:
+        """Удалить все записи, зависящие от тега (память + диск); возвращает их число"""
+        try:
+            keys = self.disk_cache.invalidate_tag(tag)
+            for cache_key in keys:
+                cache_data = self.memory_cache.pop(cache_key)
+                # Операция известна только для записей в памяти
+                self.metrics.inc(cache_data.get("operation") if cache_data else None, "invalidations")
+            # Идущие загрузки с этим тегом уже не сохранят устаревший результат
+            for cache_key in [k for k, load_tags in self._load_tags.items() if tag in load_tags]:
+                self._loads.pop(cache_key, None)
+            if keys:
+                logger.info(f"🗑️ Cache INVALIDATED tag {tag}: {len(keys)} entries")
+            return len(keys)
+        except Exception as e:
+            logger.error(f"❌ Cache invalidate_tag error: {e}")
+            return 0
+    
+    # ===== asyncio API (для корутин: smart home, стриминг) =====
+    # Память проверяется прямо в цикле событий, файловые операции уходят в поток.
+    # Состояние общее с синхронным API: ожидающие записи видны обоим.
+    
+    async def aget(self, operation: str, params: Dict[str, Any] = None, ttl_seconds: int = 600) -> Optional[Any]:
+        """Асинхронно получить данные из кэша"""
+        started = time.perf_counter()
+        try:
+            cache_key = self.get_cache_key(operation, params)
+            data = self._memory_get(cache_key, operation, ttl_seconds)
+            if data is not _MISSING:
+                return data
+            cached_data = await asyncio.to_thread(self.disk_cache.read, cache_key, ttl_seconds, operation)
+            return self._disk_result(cache_key, operation, cached_data)
+        except Exception as e:
+            logger.error(f"❌ Cache aget error: {e}")
+            return None
+        finally:
+            self.metrics.observe(operation, "get", time.perf_counter() - started)
+    
+    async def aset(self, operation: str, data: Any, params: Dict[str, Any] = None, ttl_seconds: int = 600,
+                   tags: Optional[List[str]] = None):
+        """Асинхронно сохранить данные в кэш (запись на диск пакетами в фоне)"""
+        try:
+            cache_key = self.get_cache_key(operation, params)
+            cache_data = self._entry(data, ttl_seconds, tags, operation)
+            self.memory_cache[cache_key] = cache_data
+            if self.disk_cache.async_writes:
+                # Только постановка в очередь - цикл событий не блокируется
+                self.disk_cache.write(cache_key, cache_data)
+            else:
+                await asyncio.to_thread(self.disk_cache.write, cache_key, cache_data)
+            self.metrics.inc(operation, "sets")
+            logger.debug(f"💾 Cache ASET: {operation} (TTL: {ttl_seconds}s)")
+        except Exception as e:
+            logger.error(f"❌ Cache aset error: {e}")
+    
+    async def get_or_refresh(
+        self,
+        operation: str,
+        loader: Callable[[], Awaitable[Any]],
+        params: Dict[str, Any] = None,
+        ttl_seconds: float = 600,
+        stale_ttl_seconds: Optional[float] = None,
+        refresh_ahead: Optional[float] = None,
+        cache_if: Optional[Callable[[Any], bool]] = None,
+        tags: Optional[List[str]] = None,
+    ) -> Tuple[Any, str]:
+        """
+        Stale-while-revalidate. Возвращает (значение, состояние):
+        - fresh: моложе refresh_ahead * ttl
+        - refresh_ahead: ещё свежее, но в фоне уже запущено обновление
+        - stale: старше ttl (но моложе stale_ttl) - отдаём сразу, обновляем в фоне
+        - miss: ничего нет - ждём загрузку (одну на ключ для всех ожидающих)
+        cache_if(value) == False - результат не кэшируется (например, ответ LLM с ошибкой)
+        tags - как в set(); инвалидация во время загрузки отменяет сохранение её результата
+        """
+        started = time.perf_counter()
+        cache_key = self.get_cache_key(operation, params)
+        stale_ttl_seconds = max(stale_ttl_seconds or ttl_seconds * 6, ttl_seconds)
+        refresh_ahead = self.refresh_ahead if refresh_ahead is None else refresh_ahead
+        
+        tier = "hits_memory"
+        cached_data = self.memory_cache.lookup(cache_key)
+        if cached_data is not None and self.disk_cache.invalidated(cached_data):
+            self.memory_cache.expire(cache_key)
+            cached_data = None
+        if cached_data is None:
+            tier = "hits_disk"
+            cached_data = await asyncio.to_thread(self.disk_cache.read, cache_key, stale_ttl_seconds, operation)
+            if cached_data is not None:
+                cached_data["operation"] = operation
+                self.memory_cache[cache_key] = cached_data
+        
+        if cached_data is not None:
+            age = time.time() - cached_data["timestamp"]
+            if age < ttl_seconds * refresh_ahead:
+                state = "fresh"
+            elif age < ttl_seconds:
+                state = "refresh_ahead"
+            elif age < stale_ttl_seconds:
+                state = "stale"
+            else:
+                state = None
+                self.memory_cache.expire(cache_key)
+            if state:
+                self.swr_stats[state] += 1
+                self.metrics.inc(operation, "hits_stale" if state == "stale" else tier)
+                if state != "fresh":
+                    self._start_load(cache_key, operation, loader, stale_ttl_seconds, cache_if, tags)
+                self.metrics.observe(operation, "get", time.perf_counter() - started)
+                logger.debug(f"✅ Cache HIT ({state}): {operation}")
+                return cached_data["data"], state
+        
+        self.swr_stats["miss"] += 1
+        self.metrics.inc(operation, "misses")
+        self.metrics.observe(operation, "get", time.perf_counter() - started)
+        logger.debug(f"❌ Cache MISS: {operation} - loading")
+        task = self._start_load(cache_key, operation, loader, stale_ttl_seconds, cache_if, tags)
+        # shield: отмена одного запроса не должна отменять общую загрузку
+        return await asyncio.shield(task), "miss"
+    
+    def _start_load(self, cache_key: str, operation: str, loader: Callable[[], Awaitable[Any]],
+                    store_ttl: float, cache_if: Optional[Callable[[Any], bool]],
+                    tags: Optional[List[str]] = None) -> "asyncio.Task":
+        task = self._loads.get(cache_key)
+        if task is not None and not task.done():
+            self.swr_stats["deduplicated"] += 1
+            return task
+        
+        async def load():
+            started = time.perf_counter()
+            try:
+                value = await loader()
+                self.metrics.observe(operation, "load", time.perf_counter() - started)
+                # Загрузку сняли инвалидацией - результат мог устареть, не сохраняем
+                current = self._loads.get(cache_key) is asyncio.current_task()
+                if current and value is not None and (cache_if is None or cache_if(value)):
+                    # В памяти/на диске храним до конца окна stale; свежесть считается по ttl
+                    cache_data = self._entry(value, store_ttl, tags, operation)
+                    self.memory_cache[cache_key] = cache_data
+                    self.disk_cache.write(cache_key, cache_data)
+                    self.metrics.inc(operation, "sets")
+                self.swr_stats["refreshes"] += 1
+                return value
+            except Exception as e:
+                self.swr_stats["refresh_errors"] += 1
+                logger.error(f"❌ Cache refresh error ({operation}): {e}")
+                raise
+        
+        task = asyncio.get_running_loop().create_task(load())
+        self._loads[cache_key] = task
+        if tags:
+            self._load_tags[cache_key] = tuple(tags)
+        
+        def done(finished: "asyncio.Task") -> None:
+            if self._loads.get(cache_key) is finished:
+                del self._loads[cache_key]
+            if cache_key not in self._loads:
+                self._load_tags.pop(cache_key, None)
+            if not finished.cancelled():
+                finished.exception()  # помечаем исключение как полученное
+        
+        task.add_done_callback(done)
+        return task
+    
+    async def ainvalidate(self, operation: str, params: Dict[str, Any] = None):
+        """Асинхронно инвалидировать кэш"""
+        try:
+            cache_key = self.get_cache_key(operation, params)
+            self.memory_cache.pop(cache_key)
+            self._loads.pop(cache_key, None)
+            self.metrics.inc(operation, "invalidations")
+            if self.disk_cache.async_writes:
+                self.disk_cache.delete(cache_key)
+            else:
+                await asyncio.to_thread(self.disk_cache.delete, cache_key)
+            logger.info(f"🗑️ Cache INVALIDATED: {operation}")
+        except Exception as e:
+            logger.error(f"❌ Cache ainvalidate error: {e}")
+    
+    async def ainvalidate_tag(self, tag: str) -> int:
+        """Асинхронная invalidate_tag (синхронные удаления файлов - в потоке)"""
+        if self.disk_cache.async_writes:
+            return self.invalidate_tag(tag)
+        return await asyncio.to_thread(self.invalidate_tag, tag)
+    
     def delete(self, cache_key: str):
         """Удалить кэш по ключу (для совместимости)"""
         try:
-            # Удаляем из памяти
-            if cache_key in self.memory_cache:
-                del self.memory_cache[cache_key]
-            
-            # Удаляем файл
-            cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-            if os.path.exists(cache_file):
-                os.remove(cache_file)
-                logger.info(f"🗑️ Deleted cache: {cache_key}")
+            self.memory_cache.pop(cache_key)
+            self.disk_cache.delete(cache_key)
+            logger.info(f"🗑️ Deleted cache: {cache_key}")
             
         except Exception as e:
             logger.error(f"❌ Cache delete error: {e}")
@@ -141,29 +995,50 @@ class SystemCache:
     def clear_all(self):
         """Очистить весь кэш"""
         try:
-            # Очищаем память
             self.memory_cache.clear()
-            
-            # Очищаем файлы
-            for file in os.listdir(self.cache_dir):
-                if file.endswith('.json'):
-                    os.remove(os.path.join(self.cache_dir, file))
+            # По индексу, без обхода каталога
+            self.disk_cache.clear()
             
             logger.info("🗑️ Cache CLEARED: All data removed")
             
         except Exception as e:
             logger.error(f"❌ Cache clear error: {e}")
     
+    def flush(self):
+        """Дождаться записи всех отложенных значений на диск"""
+        self.disk_cache.flush()
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Метрики по операциям (JSON): попадания по уровням, hit ratio, задержки, байты"""
+        return {
+            "operations": self.metrics.snapshot(self.memory_cache.usage_by("operation")),
+            "tiers": self.get_stats(),
+        }
+    
+    def prometheus_metrics(self) -> str:
+        """Те же метрики в текстовом формате Prometheus"""
+        memory = self.memory_cache.get_stats()
+        disk = self.disk_cache.get_stats()
+        return self.metrics.to_prometheus(self.memory_cache.usage_by("operation"), extra=[
+            ("memory_tier_entries", "Entries in the memory tier", memory["entries"]),
+            ("memory_tier_bytes", "Approximate bytes in the memory tier", memory["bytes"]),
+            ("memory_tier_max_bytes", "Memory tier byte limit", memory["max_bytes"]),
+            ("disk_tier_entries", "Entries in the disk tier", disk["entries"]),
+            ("disk_tier_bytes", "Bytes in the disk tier", disk["bytes"]),
+            ("disk_tier_pending_writes", "Disk writes waiting for the background writer", disk["pending_writes"]),
+            ("swr_loads_in_flight", "Stale-while-revalidate loads in progress", len(self._loads)),
+        ])
+    
     def get_stats(self) -> Dict[str, Any]:
         """Получить статистику кэша"""
         try:
-            memory_count = len(self.memory_cache)
-            file_count = len([f for f in os.listdir(self.cache_dir) if f.endswith('.json')])
-            
             return {
-                "memory_entries": memory_count,
-                "file_entries": file_count,
-                "cache_dir": self.cache_dir
+                "memory_entries": len(self.memory_cache),
+                "file_entries": len(self.disk_cache),
+                "cache_dir": self.cache_dir,
+                "memory": self.memory_cache.get_stats(),
+                "disk": self.disk_cache.get_stats(),
+                "swr": {**self.swr_stats, "loads_in_flight": len(self._loads)}
             }
             
         except Exception as e:
@@ -171,4 +1046,4 @@ class SystemCache:
             return {"error": str(e)}
 
 # Глобальный экземпляр кэша
-system_cache = SystemCache() 
\ No newline at end of file
+system_cache = SystemCache()
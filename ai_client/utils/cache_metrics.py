@@ -0,0 +1,192 @@
+"""
+Метрики кэша по операциям (model_status, system_analysis, smart_home_sensor, ...):
+счётчики попаданий по уровням, промахи, вытеснения, сроки, байты, время сериализации
+и гистограммы задержек. Экспорт в JSON и в текстовый формат Prometheus.
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Секунды; последний бакет +Inf добавляется при экспорте
+LATENCY_BUCKETS: Tuple[float, ...] = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                                      0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+COUNTERS: Tuple[str, ...] = (
+    "hits_memory",
+    "hits_disk",
+    "hits_stale",
+    "misses",
+    "sets",
+    "invalidations",
+    "evictions_lru",
+    "evictions_size",
+    "expirations",
+    "bytes_written",
+    "serialize_seconds",
+    "deserialize_seconds",
+)
+
+UNKNOWN_OPERATION = "unknown"
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе бакета"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.total, 6),
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else None,
+            "p50_le_ms": _ms(self.quantile(0.5)),
+            "p99_le_ms": _ms(self.quantile(0.99)),
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    if seconds is None or seconds == float("inf"):
+        return seconds
+    return round(seconds * 1000, 3)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class CacheMetrics:
+    """Счётчики и гистограммы по имени операции; дешёвые инкременты под одной блокировкой"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = {}
+        # (operation, kind) -> histogram; kind: get (поиск в кэше), load (загрузка при промахе)
+        self._latency: Dict[Tuple[str, str], _Histogram] = {}
+
+    def inc(self, operation: Optional[str], counter: str, value: float = 1) -> None:
+        operation = operation or UNKNOWN_OPERATION
+        with self._lock:
+            counters = self._counters.get(operation)
+            if counters is None:
+                counters = self._counters[operation] = dict.fromkeys(COUNTERS, 0)
+            counters[counter] += value
+
+    def observe(self, operation: Optional[str], kind: str, seconds: float) -> None:
+        key = (operation or UNKNOWN_OPERATION, kind)
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._latency.clear()
+
+    def snapshot(self, usage: Optional[Dict[str, Tuple[int, int]]] = None) -> Dict[str, Any]:
+        """
+        JSON-снимок по операциям. usage - текущие (записей, байт) в памяти по операциям
+        (считается кэшем в момент запроса метрик, а не на каждом set)
+        """
+        usage = usage or {}
+        with self._lock:
+            counters = {op: dict(values) for op, values in self._counters.items()}
+            latency = {key: histogram.to_dict() for key, histogram in self._latency.items()}
+        operations = sorted(set(counters) | set(usage) | {op for op, _ in latency})
+        result = {}
+        for op in operations:
+            values = counters.get(op) or dict.fromkeys(COUNTERS, 0)
+            hits = values["hits_memory"] + values["hits_disk"] + values["hits_stale"]
+            lookups = hits + values["misses"]
+            entries, size = usage.get(op, (0, 0))
+            result[op] = {
+                **{k: round(v, 6) if isinstance(v, float) else v for k, v in values.items()},
+                "hit_ratio": round(hits / lookups, 4) if lookups else None,
+                "memory_entries": entries,
+                "memory_bytes": size,
+                "latency": {kind: data for (name, kind), data in latency.items() if name == op},
+            }
+        return result
+
+    def to_prometheus(self, usage: Optional[Dict[str, Tuple[int, int]]] = None,
+                      extra: Iterable[Tuple[str, str, float]] = (), prefix: str = "guardian_cache") -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)"""
+        usage = usage or {}
+        with self._lock:
+            counters = {op: dict(values) for op, values in self._counters.items()}
+            latency = {key: (list(h.counts), h.total, h.count) for key, h in self._latency.items()}
+
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str, samples: List[Tuple[str, float]]) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{prefix}_{name}{labels} {value:g}" if isinstance(value, float)
+                             else f"{prefix}_{name}{labels} {value}")
+
+        def labels(**kv: Any) -> str:
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in kv.items()) + "}"
+
+        ops = sorted(counters)
+        family("hits_total", "counter", "Cache hits by tier",
+               [(labels(operation=op, tier=tier), counters[op][f"hits_{tier}"])
+                for op in ops for tier in ("memory", "disk", "stale")])
+        family("misses_total", "counter", "Cache misses",
+               [(labels(operation=op), counters[op]["misses"]) for op in ops])
+        family("sets_total", "counter", "Cache writes",
+               [(labels(operation=op), counters[op]["sets"]) for op in ops])
+        family("invalidations_total", "counter", "Explicit invalidations",
+               [(labels(operation=op), counters[op]["invalidations"]) for op in ops])
+        family("evictions_total", "counter", "Memory tier evictions by reason",
+               [(labels(operation=op, reason=reason), counters[op][counter]) for op in ops
+                for reason, counter in (("lru", "evictions_lru"), ("size", "evictions_size"),
+                                        ("expired", "expirations"))])
+        family("bytes_written_total", "counter", "Serialized bytes written to the disk tier",
+               [(labels(operation=op), counters[op]["bytes_written"]) for op in ops])
+        family("serialization_seconds_total", "counter", "Time spent encoding/decoding disk entries",
+               [(labels(operation=op, direction=direction), float(counters[op][counter])) for op in ops
+                for direction, counter in (("encode", "serialize_seconds"), ("decode", "deserialize_seconds"))])
+        family("memory_entries", "gauge", "Entries in the memory tier",
+               [(labels(operation=op), entries) for op, (entries, _) in sorted(usage.items())])
+        family("memory_bytes", "gauge", "Approximate bytes in the memory tier",
+               [(labels(operation=op), size) for op, (_, size) in sorted(usage.items())])
+
+        lines.append(f"# HELP {prefix}_latency_seconds Cache lookup (get) and miss load (load) latency")
+        lines.append(f"# TYPE {prefix}_latency_seconds histogram")
+        for (op, kind), (counts, total, count) in sorted(latency.items()):
+            cumulative = 0
+            for bound, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], counts):
+                cumulative += n
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                lines.append(f"{prefix}_latency_seconds_bucket{labels(operation=op, kind=kind, le=le)} {cumulative}")
+            lines.append(f"{prefix}_latency_seconds_sum{labels(operation=op, kind=kind)} {total:g}")
+            lines.append(f"{prefix}_latency_seconds_count{labels(operation=op, kind=kind)} {count}")
+
+        for name, help_text, value in extra:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value:g}" if isinstance(value, float) else f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,165 @@
+"""
+Пулы потоков для блокирующей работы внутри async-эндпоинтов
+- Именованные пулы по классу работы: llm (сеть, модели), fs (файлы, SQLite), vision (камеры, OpenCV);
+  у каждого свой предел параллелизма, поэтому зависший опрос камеры или медленный вызов модели
+  занимает только свой пул, а не event loop и не соседние пулы
+- await run_blocking(kind, fn, *args, **kwargs) - единая точка выноса блокирующих вызовов
+- Метрики по пулам: ожидание в очереди, время выполнения, в работе/в очереди, ошибки
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cache_metrics import LATENCY_BUCKETS, _Histogram, _escape
+
+# kind -> (переменная окружения, потоков по умолчанию)
+DEFAULT_POOLS: Dict[str, Tuple[str, int]] = {
+    "llm": ("EXEC_LLM_THREADS", 16),
+    "fs": ("EXEC_FS_THREADS", 8),
+    "vision": ("EXEC_VISION_THREADS", 2),
+}
+
+
+class BlockingPool:
+    """Пул потоков одного класса работы со счётчиками и гистограммами ожидания/выполнения"""
+
+    def __init__(self, kind: str, max_workers: int):
+        self.kind = kind
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"exec_{kind}")
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self._wait = _Histogram()
+        self._run = _Histogram()
+
+    @property
+    def queued(self) -> int:
+        return self.submitted - self.completed - self.failed - self.running
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        # Как asyncio.to_thread: контекст (contextvars) вызывающей корутины переходит в поток
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        submitted_at = time.perf_counter()
+
+        def _timed() -> Any:
+            started = time.perf_counter()
+            with self._lock:
+                self.running += 1
+                self._wait.observe(started - submitted_at)
+            ok = False
+            try:
+                result = call()
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self._run.observe(time.perf_counter() - started)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+        with self._lock:
+            self.submitted += 1
+        return await loop.run_in_executor(self._executor, _timed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "running": self.running,
+                "queued": self.queued,
+                "queue_wait": self._wait.to_dict(),
+                "run": self._run.to_dict(),
+            }
+
+    def histograms(self) -> List[Tuple[str, List[int], float, int]]:
+        with self._lock:
+            return [(name, list(h.counts), h.total, h.count) for name, h in (("wait", self._wait), ("run", self._run))]
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+class BlockingExecutors:
+    """Реестр пулов; неизвестный kind получает пул по умолчанию (EXEC_<KIND>_THREADS или 4 потока)"""
+
+    def __init__(self, pools: Optional[Dict[str, int]] = None):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, BlockingPool] = {}
+        sizes = pools if pools is not None else {
+            kind: int(os.getenv(env, str(default))) for kind, (env, default) in DEFAULT_POOLS.items()
+        }
+        for kind, size in sizes.items():
+            self._pools[kind] = BlockingPool(kind, size)
+
+    def pool(self, kind: str) -> BlockingPool:
+        pool = self._pools.get(kind)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(kind)
+                if pool is None:
+                    size = int(os.getenv(f"EXEC_{kind.upper()}_THREADS", "4"))
+                    pool = self._pools[kind] = BlockingPool(kind, size)
+        return pool
+
+    async def run(self, kind: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return await self.pool(kind).run(fn, *args, **kwargs)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {kind: pool.snapshot() for kind, pool in sorted(self._pools.items())}
+
+    def to_prometheus(self, prefix: str = "guardian_executor") -> str:
+        """Текстовый формат Prometheus: очередь, работа, ошибки и гистограммы ожидания/выполнения"""
+        lines: List[str] = []
+        pools = sorted(self._pools.items())
+        snapshots = {kind: pool.snapshot() for kind, pool in pools}
+        for name, kind, help_text, key in (
+                ("tasks_total", "counter", "Blocking calls completed", "completed"),
+                ("failures_total", "counter", "Blocking calls that raised", "failed"),
+                ("running", "gauge", "Calls running in the pool", "running"),
+                ("queued", "gauge", "Calls waiting for a free thread", "queued"),
+                ("max_workers", "gauge", "Pool concurrency limit", "max_workers")):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            lines += [f'{prefix}_{name}{{pool="{_escape(k)}"}} {snapshots[k][key]}' for k, _ in pools]
+
+        lines.append(f"# HELP {prefix}_seconds Queue wait (phase=wait) and run time (phase=run)")
+        lines.append(f"# TYPE {prefix}_seconds histogram")
+        for kind, pool in pools:
+            for phase, counts, total, count in pool.histograms():
+                labels = f'pool="{_escape(kind)}",phase="{phase}"'
+                cumulative = 0
+                for bound, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], counts):
+                    cumulative += n
+                    le = bound if isinstance(bound, str) else f"{bound:g}"
+                    lines.append(f'{prefix}_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{prefix}_seconds_sum{{{labels}}} {total:g}")
+                lines.append(f"{prefix}_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def shutdown(self, wait: bool = False) -> None:
+        for pool in list(self._pools.values()):
+            pool.shutdown(wait=wait)
+
+
+executors = BlockingExecutors()
+
+
+async def run_blocking(kind: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Выполнить блокирующую функцию в пуле kind (llm, fs, vision) и дождаться результата"""
+    return await executors.run(kind, fn, *args, **kwargs)
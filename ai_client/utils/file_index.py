@@ -0,0 +1,393 @@
+"""
+Индекс недавних изменений файлов
+- inotify (Linux, через ctypes) с fallback на периодический опрос
+- Ограниченная, упорядоченная по времени структура: чтение последних изменений за O(k)
+- Правила игнорирования (.git, __pycache__, memory/captures, логи и т.п.)
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .logger import Logger
+
+logger = Logger()
+
+DEFAULT_IGNORE_DIRS = {".git", "__pycache__", ".pytest_cache", "node_modules", ".venv", "venv", "cache", ".blobs", ".thumbs"}
+DEFAULT_IGNORE_PATHS = {"memory/captures"}
+DEFAULT_IGNORE_PATTERNS = {"*.pyc", "*.swp", "*.tmp", "*.log", "*~", ".DS_Store"}
+
+# inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Минимальная обёртка над inotify через libc"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read_events(self, timeout: float) -> List[Tuple[int, int, str]]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class FileChangeIndex:
+    """Упорядоченный по времени индекс недавно изменённых и созданных файлов"""
+
+    def __init__(
+        self,
+        root: str = ".",
+        max_entries: int = 5000,
+        poll_interval: Optional[float] = None,
+        ignore_dirs: Optional[Iterable[str]] = None,
+        ignore_paths: Optional[Iterable[str]] = None,
+        ignore_patterns: Optional[Iterable[str]] = None,
+        use_inotify: Optional[bool] = None,
+    ):
+        self.root = os.path.abspath(root)
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval or float(os.getenv("FILE_INDEX_POLL_SECONDS", "30"))
+        self.ignore_dirs: Set[str] = set(ignore_dirs if ignore_dirs is not None else DEFAULT_IGNORE_DIRS)
+        self.ignore_paths: Set[str] = set(ignore_paths if ignore_paths is not None else DEFAULT_IGNORE_PATHS)
+        self.ignore_patterns: Set[str] = set(ignore_patterns if ignore_patterns is not None else DEFAULT_IGNORE_PATTERNS)
+        extra = os.getenv("FILE_INDEX_IGNORE", "")
+        self.ignore_patterns.update(p.strip() for p in extra.split(",") if p.strip())
+        if use_inotify is None:
+            use_inotify = os.getenv("FILE_INDEX_INOTIFY", "1").lower() not in ("0", "false", "no")
+        self.use_inotify = use_inotify
+
+        self._lock = threading.Lock()
+        # rel_path -> (mtime, seen_at); порядок вставки = порядок событий (новые в конце)
+        self._modified: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._created: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        # Снимок mtime всех файлов - нужен только режиму опроса
+        self._snapshot: Dict[str, float] = {}
+
+        self._inotify: Optional[_Inotify] = None
+        self._watches: Dict[int, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.mode = "stopped"
+        self.ready = threading.Event()
+
+    # ===== Правила игнорирования =====
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        rel_path = rel_path.replace(os.sep, "/")
+        parts = rel_path.split("/")
+        if any(part in self.ignore_dirs for part in (parts if is_dir else parts[:-1])):
+            return True
+        for ignored in self.ignore_paths:
+            if rel_path == ignored or rel_path.startswith(ignored + "/"):
+                return True
+        if not is_dir:
+            name = parts[-1]
+            for pattern in self.ignore_patterns:
+                if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel_path, pattern):
+                    return True
+        return False
+
+    # ===== Запись в индекс =====
+
+    def _record(self, rel_path: str, mtime: float, created: bool = False, seen_at: Optional[float] = None,
+                created_at: Optional[float] = None) -> None:
+        """
+        Добавить изменение в конец индекса. seen_at - время события (упорядочивает индекс);
+        created_at - время создания файла (событие inotify / обнаружение при опросе / ctime при сканировании)
+        """
+        item = (mtime, seen_at if seen_at is not None else max(mtime, time.time()))
+        with self._lock:
+            self._modified.pop(rel_path, None)
+            self._modified[rel_path] = item
+            if len(self._modified) > self.max_entries:
+                self._modified.popitem(last=False)
+            if created:
+                self._created.pop(rel_path, None)
+                self._created[rel_path] = (created_at if created_at is not None else time.time(), item[1])
+                if len(self._created) > self.max_entries:
+                    self._created.popitem(last=False)
+
+    def _forget(self, rel_path: str) -> None:
+        with self._lock:
+            self._modified.pop(rel_path, None)
+            self._created.pop(rel_path, None)
+            self._snapshot.pop(rel_path, None)
+
+    def _rel(self, path: str) -> str:
+        if path.startswith(self.root + os.sep):
+            return path[len(self.root) + 1:].replace(os.sep, "/")
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _scan(self, top: str, since: float) -> List[Tuple[float, str, float]]:
+        """Обход дерева: (mtime, rel_path, ctime) для файлов, а также заполнение снимка"""
+        found = []
+        stack = [top]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                rel_path = self._rel(entry.path)
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if self.is_ignored(rel_path, is_dir):
+                    continue
+                if is_dir:
+                    stack.append(entry.path)
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if self.mode == "polling":
+                    self._snapshot[rel_path] = stat.st_mtime
+                if stat.st_mtime >= since or stat.st_ctime >= since:
+                    found.append((stat.st_mtime, rel_path, stat.st_ctime))
+        return found
+
+    def _initial_scan(self, window_seconds: float = 86400) -> None:
+        since = time.time() - window_seconds
+        found = self._scan(self.root, since)
+        found.sort()
+        for mtime, rel_path, ctime in found:
+            self._record(rel_path, mtime, created=ctime >= since, seen_at=mtime, created_at=ctime)
+
+    # ===== Жизненный цикл =====
+
+    def start(self) -> None:
+        """Запустить индексатор в фоновом потоке (первичный обход тоже в нём)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="file_index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+        self.mode = "stopped"
+
+    def _run(self) -> None:
+        try:
+            if self.use_inotify and self._start_inotify():
+                self.mode = "inotify"
+                self._initial_scan()
+                self.ready.set()
+                logger.info(f"👁️ FILE INDEX: inotify watching {len(self._watches)} directories")
+                self._inotify_loop()
+                return
+        except Exception as e:
+            logger.warning(f"⚠️ FILE INDEX: inotify unavailable, falling back to polling: {e}")
+            if self._inotify:
+                self._inotify.close()
+                self._inotify = None
+            self._watches.clear()
+
+        self.mode = "polling"
+        self._initial_scan()
+        self.ready.set()
+        logger.info(f"🔁 FILE INDEX: polling every {self.poll_interval:.0f}s ({len(self._snapshot)} files)")
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self._poll_once()
+            except Exception as e:
+                logger.error(f"❌ FILE INDEX: polling error: {e}")
+
+    # ===== inotify =====
+
+    def _start_inotify(self) -> bool:
+        if not hasattr(select, "select") or os.name != "posix":
+            return False
+        self._inotify = _Inotify()
+        self._watch_tree(self.root)
+        return True
+
+    def _watch_tree(self, top: str) -> None:
+        stack = [top]
+        while stack:
+            current = stack.pop()
+            wd = self._inotify.add_watch(current)
+            self._watches[wd] = current
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False) and not self.is_ignored(self._rel(entry.path), True):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def _inotify_loop(self) -> None:
+        while not self._stop.is_set():
+            for wd, mask, name in self._inotify.read_events(timeout=1.0):
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning("⚠️ FILE INDEX: inotify queue overflow, rescanning")
+                    self._initial_scan()
+                    continue
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                directory = self._watches.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                rel_path = self._rel(path)
+                is_dir = bool(mask & IN_ISDIR)
+                if self.is_ignored(rel_path, is_dir):
+                    continue
+                if is_dir:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self._watch_tree(path)
+                        except OSError as e:
+                            logger.warning(f"⚠️ FILE INDEX: cannot watch {rel_path}: {e}")
+                        for mtime, found_path, ctime in sorted(self._scan(path, 0)):
+                            self._record(found_path, mtime, created=True, created_at=ctime)
+                    continue
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._forget(rel_path)
+                    continue
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+                self._record(rel_path, mtime, created=bool(mask & (IN_CREATE | IN_MOVED_TO)))
+
+    # ===== Опрос =====
+
+    def _poll_once(self) -> None:
+        previous = self._snapshot
+        self._snapshot = {}
+        since = time.time() - 86400
+        changed = []
+        for mtime, rel_path, ctime in self._scan(self.root, since):
+            old = previous.get(rel_path)
+            if old is None or old != mtime:
+                changed.append((mtime, rel_path, old is None, ctime))
+        for mtime, rel_path, is_new, ctime in sorted(changed):
+            self._record(rel_path, mtime, created=is_new, created_at=ctime)
+        for rel_path in previous.keys() - self._snapshot.keys():
+            self._forget(rel_path)
+
+    # ===== Чтение =====
+
+    def recent(self, window_seconds: float = 86400, limit: int = 10, created: bool = False,
+               prefix: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Последние изменения за окно, новые первыми. O(k): идём с конца до границы окна.
+        Время в результате - mtime, для created=True - время создания
+        """
+        cutoff = time.time() - window_seconds
+        result = []
+        with self._lock:
+            source = self._created if created else self._modified
+            for rel_path in reversed(source):
+                when, seen_at = source[rel_path]
+                if seen_at < cutoff:
+                    break
+                # mtime может быть старше события (копирование с сохранением времени)
+                if when < cutoff:
+                    continue
+                if prefix and not rel_path.startswith(prefix):
+                    continue
+                result.append((rel_path, when))
+                if len(result) >= limit:
+                    break
+        return result
+
+    def render(self, limit: int = 10, sandbox_limit: int = 5, sandbox: str = "guardian_sandbox") -> str:
+        """Текстовое представление для системного контекста (формат прежнего get_recent_file_changes)"""
+        changes = ["## RECENT FILE CHANGES"]
+        recent_files = self.recent(limit=limit)
+        if recent_files:
+            changes.append("Recently modified files (last 24 hours):")
+            for rel_path, mtime in recent_files:
+                changes.append(f"- {rel_path} (modified: {datetime.fromtimestamp(mtime).strftime('%H:%M:%S')})")
+        else:
+            changes.append("No recent file changes detected.")
+
+        sandbox_files = self.recent(limit=sandbox_limit, created=True, prefix=sandbox.rstrip("/") + "/")
+        if sandbox_files:
+            changes.append("\nNew files in sandbox (last 24 hours):")
+            for rel_path, ctime in sandbox_files:
+                changes.append(f"- {rel_path} (created: {datetime.fromtimestamp(ctime).strftime('%H:%M:%S')})")
+        return "\n".join(changes)
+
+    def get_stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "ready": self.ready.is_set(),
+                "watched_dirs": len(self._watches),
+                "indexed_changes": len(self._modified),
+                "indexed_created": len(self._created),
+            }
+
+
+# Глобальный индекс по корню проекта
+file_change_index = FileChangeIndex(os.getenv("FILE_INDEX_ROOT", "."))
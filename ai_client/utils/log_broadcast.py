@@ -0,0 +1,120 @@
+"""
+Трансляция логов в WebSocket-клиенты (/ws/logs)
+- LogBroadcastHub.publish() потокобезопасен: его вызывает поток QueueListener, а не event loop
+- У каждого клиента свой ограниченный буфер: при переполнении выбрасываются самые старые строки,
+  число выброшенных считается и сообщается клиенту
+- Одна корутина-отправитель на сокет забирает из буфера пачку строк и шлёт одним кадром
+- Новый клиент сначала получает последние replay_size строк
+- В режиме нескольких воркеров каждый воркер транслирует логи своего процесса
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+
+import logging
+
+
+class LogSubscriber:
+    """Буфер одного клиента; читается только из его event loop"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, buffer_size: int):
+        self._loop = loop
+        self._lines: Deque[str] = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._event = asyncio.Event()
+        self._wake_pending = False
+        self.dropped = 0
+        self._dropped_reported = 0
+
+    def push(self, line: str) -> None:
+        """Из любого потока"""
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self.dropped += 1
+            self._lines.append(line)
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # цикл клиента уже закрыт
+
+    def _wake(self) -> None:
+        with self._lock:
+            self._wake_pending = False
+        self._event.set()
+
+    async def next_batch(self, max_lines: int = 100, linger: float = 0.05) -> Tuple[List[str], int]:
+        """
+        Дождаться строк и забрать до max_lines; linger - короткая пауза, чтобы в кадр
+        попали строки, пришедшие сразу следом. Возвращает (строки, выброшено с прошлой пачки).
+        """
+        while True:
+            with self._lock:
+                if self._lines:
+                    break
+                self._event.clear()
+            await self._event.wait()
+        if linger and len(self._lines) < max_lines:
+            await asyncio.sleep(linger)
+        with self._lock:
+            count = min(max_lines, len(self._lines))
+            lines = [self._lines.popleft() for _ in range(count)]
+            dropped, self._dropped_reported = self.dropped - self._dropped_reported, self.dropped
+        return lines, dropped
+
+
+class LogBroadcastHub:
+    """Рассылка строк логов всем подписчикам с историей последних replay_size строк"""
+
+    def __init__(self, buffer_size: Optional[int] = None, replay_size: Optional[int] = None):
+        self.buffer_size = buffer_size or int(os.getenv("LOG_STREAM_BUFFER", "1000"))
+        self.replay_size = replay_size if replay_size is not None else int(os.getenv("LOG_STREAM_REPLAY", "200"))
+        self._replay: Deque[str] = deque(maxlen=self.replay_size or None)
+        self._subscribers: Set[LogSubscriber] = set()
+        self._lock = threading.Lock()
+
+    def publish(self, line: str) -> None:
+        with self._lock:
+            if self.replay_size:
+                self._replay.append(line)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(line)
+
+    def subscribe(self) -> LogSubscriber:
+        """Из корутины клиента; буфер сразу заполняется последними строками"""
+        subscriber = LogSubscriber(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            for line in list(self._replay)[-self.buffer_size:]:
+                subscriber.push(line)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: LogSubscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+
+class BroadcastLogHandler(logging.Handler):
+    """Handler для QueueListener: отформатированные записи уходят в hub"""
+
+    def __init__(self, hub: LogBroadcastHub):
+        super().__init__()
+        self.hub = hub
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.hub.publish(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+log_hub = LogBroadcastHub()
@@ -0,0 +1,287 @@
+"""
+Неблокирующее логирование
+- QueueHandler на корневом логгере: вызывающий поток (event loop) только кладёт запись
+  в ограниченную очередь; при переполнении запись отбрасывается и считается, а не ждёт диска
+- QueueListener в фоновом потоке пишет в файл и в консоль
+- RotatingCompressedFileHandler: ротация по размеру и по времени, старые файлы сжимаются в .gz,
+  хранится не больше backup_count архивов
+- JsonLinesFormatter: формат JSON lines (LOG_FORMAT=json) для сборщиков логов
+- NoisyLogFilter: частые INFO-строки с эмодзи (кэш, извлечение инструментов, превью результатов)
+  ограничиваются по месту вызова; WARNING и выше проходят всегда
+"""
+
+import atexit
+import glob
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_plain_formatter = logging.Formatter()
+
+
+class RotatingCompressedFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    Файл ротируется, когда превышает max_bytes или прошло rotate_seconds с открытия.
+    Ротированный файл получает метку времени (app.log.20261016-120000.gz) и сжимается
+    в потоке QueueListener. Если файл уже ротировал другой воркер, handler просто
+    переоткрывает новый файл.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 10 * 1024 * 1024, rotate_seconds: float = 0,
+                 backup_count: int = 10, compress: bool = True, encoding: str = 'utf-8'):
+        super().__init__(filename, 'a', encoding=encoding, delay=True)
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.compress = compress
+        self._rollover_at = self._next_rollover()
+
+    def _next_rollover(self) -> float:
+        return time.time() + self.rotate_seconds if self.rotate_seconds > 0 else float('inf')
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            return True
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        if time.time() >= self._rollover_at:
+            return True
+        if self.max_bytes <= 0:
+            return False
+        # Без форматирования записи ещё раз: файл может превысить max_bytes на одну строку
+        if self.stream.tell() < self.max_bytes:
+            return False
+        if self._rotated_elsewhere():
+            self.stream.close()
+            self.stream = self._open()
+            return self.stream.tell() >= self.max_bytes
+        return True
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self._rollover_at = self._next_rollover()
+        if not os.path.exists(self.baseFilename) or os.path.getsize(self.baseFilename) == 0:
+            return
+
+        dest = f"{self.baseFilename}.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        suffix = 1
+        while os.path.exists(dest) or os.path.exists(dest + '.gz'):
+            dest = f"{self.baseFilename}.{datetime.now().strftime('%Y%m%d-%H%M%S')}-{suffix}"
+            suffix += 1
+        try:
+            os.rename(self.baseFilename, dest)
+            if self.compress:
+                with open(dest, 'rb') as src, gzip.open(dest + '.gz', 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(dest)
+        except OSError:
+            pass  # файл ротировал другой процесс
+        self._remove_old_backups()
+
+    def backups(self) -> List[str]:
+        """Ротированные файлы, от старых к новым"""
+        return sorted(glob.glob(glob.escape(self.baseFilename) + '.*'), key=os.path.getmtime)
+
+    def _remove_old_backups(self) -> None:
+        backups = self.backups()
+        for path in backups[:max(0, len(backups) - self.backup_count)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: ts, level, logger, message (+ exc, process)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class NoisyLogFilter(logging.Filter):
+    """
+    Ограничение частоты для INFO/DEBUG строк, начинающихся с эмодзи: не больше limit записей
+    за window секунд с одного места вызова (logger + строка). Следующая пропущенная запись
+    после окна сообщает, сколько было подавлено.
+    """
+
+    def __init__(self, limit: int = 10, window: float = 60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.suppressed_total = 0
+        self._lock = threading.Lock()
+        # (name, lineno) -> [начало окна, записано в окне, подавлено в окне]
+        self._sites: Dict[Tuple[str, int], list] = {}
+
+    @staticmethod
+    def is_noisy(record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not isinstance(record.msg, str) or not record.msg:
+            return False
+        return ord(record.msg[0]) >= 0x2000  # эмодзи и пиктограммы
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or not self.is_noisy(record):
+            return True
+        now = time.monotonic()
+        key = (record.name, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} (+{suppressed} similar suppressed)"
+                return True
+            if site[1] < self.limit:
+                site[1] += 1
+                return True
+            site[2] += 1
+            self.suppressed_total += 1
+            return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который никогда не блокирует: при полной очереди запись отбрасывается"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Как QueueHandler.prepare, но без копирования записи: это последний обработчик в цепочке
+        message = record.getMessage()
+        if record.exc_info:
+            message = f"{message}\n{_plain_formatter.formatException(record.exc_info)}"
+        if record.stack_info:
+            message = f"{message}\n{record.stack_info}"
+        record.message = record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Установленный конвейер: очередь, обработчики и фоновый слушатель"""
+
+    def __init__(self, queue_handler: DroppingQueueHandler, listener: logging.handlers.QueueListener,
+                 handlers: List[logging.Handler], noisy_filter: NoisyLogFilter):
+        self.queue_handler = queue_handler
+        self.listener = listener
+        self.handlers = handlers
+        self.noisy_filter = noisy_filter
+        self._stopped = False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self.queue_handler.queue.qsize(),
+            'dropped': self.queue_handler.dropped,
+            'suppressed': self.noisy_filter.suppressed_total,
+        }
+
+    def stop(self) -> None:
+        """Дописать очередь и закрыть файлы"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+
+_pipeline: Optional[LogPipeline] = None
+
+
+def setup_logging(log_file: Optional[str] = 'app.log', level: Optional[str] = None,
+                  fmt: Optional[str] = None, console: bool = True,
+                  extra_handlers: Optional[List[logging.Handler]] = None) -> LogPipeline:
+    """
+    Настроить корневой логгер. Переменные окружения:
+    LOG_LEVEL (INFO), LOG_FORMAT (text | json), LOG_MAX_BYTES (10 MB), LOG_ROTATE_SECONDS (86400, 0 - выкл.),
+    LOG_BACKUP_COUNT (10), LOG_QUEUE_SIZE (10000), LOG_NOISY_LIMIT (10, 0 - выкл.), LOG_NOISY_WINDOW (60),
+    LOG_ENABLED (1; 0 - только WARNING и выше, для замеров задержек без логирования)
+    """
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop()
+
+    enabled = os.getenv('LOG_ENABLED', '1') != '0'
+    level_name = (level or os.getenv('LOG_LEVEL', 'INFO')).upper() if enabled else 'WARNING'
+    formatter = (JsonLinesFormatter() if (fmt or os.getenv('LOG_FORMAT', 'text')).lower() == 'json'
+                 else logging.Formatter(DEFAULT_FORMAT))
+
+    handlers: List[logging.Handler] = []
+    if log_file:
+        file_handler = RotatingCompressedFileHandler(
+            log_file,
+            max_bytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            rotate_seconds=float(os.getenv('LOG_ROTATE_SECONDS', '86400')),
+            backup_count=int(os.getenv('LOG_BACKUP_COUNT', '10')),
+        )
+        handlers.append(file_handler)
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    # Дополнительные обработчики (трансляция в WebSocket) тоже работают в потоке слушателя
+    for handler in extra_handlers or ():
+        if handler.formatter is None:
+            handler.setFormatter(formatter)
+        handlers.append(handler)
+
+    noisy_filter = NoisyLogFilter(limit=int(os.getenv('LOG_NOISY_LIMIT', '10')),
+                                  window=float(os.getenv('LOG_NOISY_WINDOW', '60')))
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000'))))
+    queue_handler.addFilter(noisy_filter)
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level_name)
+
+    listener.start()
+    _pipeline = LogPipeline(queue_handler, listener, handlers, noisy_filter)
+    return _pipeline
+
+
+def shutdown_logging() -> None:
+    if _pipeline is not None:
+        _pipeline.stop()
+
+
+atexit.register(shutdown_logging)
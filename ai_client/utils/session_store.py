@@ -0,0 +1,291 @@
+"""
+Хранилище сессий веб-интерфейса
+- SqliteSessionStore: SQLite в режиме WAL, общий для нескольких процессов uvicorn;
+  создание и поиск сессии - одна строка по первичному ключу (O(1) вместо перезаписи sessions.json)
+- Read-through кэш в памяти процесса с коротким сроком ревалидации; выход из системы или удаление
+  пользователя в другом воркере сбрасывает кэш сразу (счётчик отзывов + PRAGMA data_version)
+- Фоновый поток удаляет просроченные сессии пачкой, без записи на пути авторизации
+- Однократный импорт старого sessions.json
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_TTL_SECONDS = 30 * 24 * 3600  # 30 дней
+
+
+class SessionStore(ABC):
+    """Интерфейс хранилища сессий"""
+
+    @abstractmethod
+    def create(self, username: str, ttl_seconds: Optional[float] = None) -> str:
+        """Создать сессию пользователя; возвращает её идентификатор"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """{"username", "created_at", "expires_at"} (datetime) или None, если сессии нет или она истекла"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Завершить сессию (выход из системы)"""
+
+    @abstractmethod
+    def delete_user(self, username: str) -> int:
+        """Завершить все сессии пользователя; возвращает их число"""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Удалить просроченные сессии; возвращает их число"""
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Сессии в SQLite. Каждый процесс открывает своё соединение; WAL + busy_timeout
+    позволяют читать и писать из нескольких воркеров одновременно.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+        CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions (username);
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path: str, legacy_path: Optional[str] = None,
+                 ttl_seconds: Optional[float] = None, cache_seconds: Optional[float] = None,
+                 cache_size: int = 10000, sweep_interval: Optional[float] = None):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds or float(os.getenv("SESSION_TTL_SECONDS", str(DEFAULT_SESSION_TTL_SECONDS)))
+        self.cache_seconds = cache_seconds if cache_seconds is not None else float(
+            os.getenv("SESSION_CACHE_SECONDS", "30"))
+        self.cache_size = cache_size
+        self.sweep_interval = sweep_interval or float(os.getenv("SESSION_SWEEP_SECONDS", "300"))
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.executescript(self.SCHEMA)
+
+        # session_id -> (username, created_at, expires_at, cached_at); только найденные сессии
+        self._cache: "OrderedDict[str, Tuple[str, float, float, float]]" = OrderedDict()
+        # Кэш верен, пока не менялся счётчик отзывов (delete / delete_user в любом процессе);
+        # data_version соединения меняется при любой чужой записи - только тогда читаем счётчик
+        self._seen_data_version: Optional[int] = None
+        self._revocations = 0
+        self.stats = {"created": 0, "cache_hits": 0, "db_reads": 0, "expired": 0, "deleted": 0, "swept": 0}
+
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+        if legacy_path:
+            self._migrate_legacy(legacy_path)
+
+    # ===== Миграция =====
+
+    def _migrate_legacy(self, legacy_path: str) -> None:
+        """Однократный импорт непросроченных сессий из sessions.json (PRAGMA user_version - флаг)"""
+        with self._lock:
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] >= self.SCHEMA_VERSION:
+                return
+            rows = []
+            if os.path.exists(legacy_path):
+                try:
+                    with open(legacy_path, 'r', encoding='utf-8') as f:
+                        legacy = json.load(f)
+                    now = time.time()
+                    for session_id, session in legacy.items():
+                        expires_at = datetime.fromisoformat(session["expires_at"]).timestamp()
+                        if expires_at > now:
+                            rows.append((session_id, session["username"],
+                                         datetime.fromisoformat(session["created_at"]).timestamp(), expires_at))
+                except Exception as e:
+                    logger.error(f"❌ Cannot migrate sessions from {legacy_path}: {e}")
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Повторная проверка под блокировкой записи: другой воркер мог успеть мигрировать
+                if self._conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                    self._conn.executemany("INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?)", rows)
+                    self._conn.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+                    if rows:
+                        logger.info(f"📦 Migrated {len(rows)} sessions from {legacy_path} to {self.db_path}")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ===== Операции =====
+
+    def create(self, username: str, ttl_seconds: Optional[float] = None) -> str:
+        session_id = secrets.token_urlsafe(32)
+        created_at = time.time()
+        expires_at = created_at + (ttl_seconds or self.ttl_seconds)
+        with self._lock:
+            self._conn.execute("INSERT INTO sessions (id, username, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                               (session_id, username, created_at, expires_at))
+            self._remember(session_id, username, created_at, expires_at)
+        self.stats["created"] += 1
+        return session_id
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        if not session_id:
+            return None
+        now = time.time()
+        with self._lock:
+            self._revalidate_cache()
+            cached = self._cache.get(session_id)
+            if cached is not None and now - cached[3] < self.cache_seconds:
+                self._cache.move_to_end(session_id)
+                self.stats["cache_hits"] += 1
+                username, created_at, expires_at, _ = cached
+            else:
+                self.stats["db_reads"] += 1
+                row = self._conn.execute("SELECT username, created_at, expires_at FROM sessions WHERE id = ?",
+                                         (session_id,)).fetchone()
+                if row is None:
+                    self._cache.pop(session_id, None)
+                    return None
+                username, created_at, expires_at = row
+                self._remember(session_id, username, created_at, expires_at)
+            if now > expires_at:
+                # Просроченная сессия не пишется на диск здесь - её удалит фоновый sweep
+                self._cache.pop(session_id, None)
+                self.stats["expired"] += 1
+                return None
+        return {
+            "username": username,
+            "created_at": datetime.fromtimestamp(created_at),
+            "expires_at": datetime.fromtimestamp(expires_at),
+        }
+
+    def _read_revocations(self) -> int:
+        row = self._conn.execute("SELECT value FROM counters WHERE name = 'revocations'").fetchone()
+        return row[0] if row else 0
+
+    def _revalidate_cache(self) -> None:
+        """Сбросить кэш, если другой процесс завершал сессии; под self._lock"""
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._seen_data_version:
+            return
+        self._seen_data_version = data_version
+        revocations = self._read_revocations()
+        if revocations != self._revocations:
+            self._revocations = revocations
+            self._cache.clear()
+
+    def _revoke(self, sql: str, params: Tuple) -> int:
+        """Удаление сессий и увеличение счётчика отзывов одной транзакцией; под self._lock"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = self._conn.execute(sql, params).rowcount
+            self._conn.execute("INSERT INTO counters (name, value) VALUES ('revocations', 1) "
+                               "ON CONFLICT (name) DO UPDATE SET value = value + 1")
+            self._revocations = self._read_revocations()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def _remember(self, session_id: str, username: str, created_at: float, expires_at: float) -> None:
+        self._cache[session_id] = (username, created_at, expires_at, time.time())
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._cache.pop(session_id, None)
+            self._revoke("DELETE FROM sessions WHERE id = ?", (session_id,))
+        self.stats["deleted"] += 1
+
+    def delete_user(self, username: str) -> int:
+        """Завершить все сессии пользователя (удаление аккаунта)"""
+        with self._lock:
+            for session_id in [sid for sid, item in self._cache.items() if item[0] == username]:
+                del self._cache[session_id]
+            removed = self._revoke("DELETE FROM sessions WHERE username = ?", (username,))
+        self.stats["deleted"] += removed
+        return removed
+
+    def sweep(self) -> int:
+        now = time.time()
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+            for session_id in [sid for sid, item in self._cache.items() if item[2] < now]:
+                del self._cache[session_id]
+        self.stats["swept"] += removed
+        if removed:
+            logger.info(f"🧹 Sessions sweep: {removed} expired sessions removed")
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    # ===== Фоновая очистка =====
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Sessions sweep error: {e}")
+
+    def start(self) -> None:
+        if self._sweeper and self._sweeper.is_alive():
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="session_sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "sessions": len(self), "cached": len(self._cache), "db_path": self.db_path}
+
+    def close(self) -> None:
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store(base_dir: str = ".") -> SessionStore:
+    """
+    Хранилище по переменным окружения:
+    SESSION_DB - путь к базе (по умолчанию <base_dir>/sessions.db), sessions.json импортируется один раз
+    """
+    db_path = os.getenv("SESSION_DB") or os.path.join(base_dir, "sessions.db")
+    return SqliteSessionStore(db_path, legacy_path=os.path.join(base_dir, "sessions.json"))
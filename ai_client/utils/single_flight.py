@@ -0,0 +1,68 @@
+"""
+Single-flight: одновременные одинаковые запросы разделяют один in-flight вызов
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+from .logger import Logger
+
+logger = Logger()
+
+
+def make_key(*parts: Any) -> str:
+    """Нормализованный ключ запроса: sha256 от канонического JSON частей"""
+    normalized = []
+    for part in parts:
+        if isinstance(part, str):
+            part = part.strip()
+        normalized.append(part)
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Схлопывание одновременных одинаковых async вызовов в один"""
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "executed": 0,
+            "coalesced": 0,
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнить fn() один раз для всех одновременных вызовов с этим ключом.
+        Работа идёт в отдельной задаче: отмена одного из ожидающих не отменяет её для остальных.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(key)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            self.stats["coalesced"] += 1
+            logger.debug(f"🔗 {self.name}: coalesced request {key[:12]}")
+            return await asyncio.shield(task)
+
+        task = loop.create_task(fn())
+        self._inflight[key] = task
+        self.stats["executed"] += 1
+
+        def _cleanup(finished: asyncio.Task) -> None:
+            if self._inflight.get(key) is finished:
+                del self._inflight[key]
+            # Забираем исключение, если никто из ожидающих его не получил
+            if not finished.cancelled():
+                finished.exception()
+
+        task.add_done_callback(_cleanup)
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики: выполнено, схлопнуто, сейчас в полёте"""
+        return {
+            **self.stats,
+            "in_flight": len(self._inflight),
+        }
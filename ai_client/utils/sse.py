@@ -0,0 +1,387 @@
+"""
+Server-Sent Events для стриминга ответов
+- Генерация идёт в фоновой задаче, независимо от соединения: обрыв связи не отменяет вызов модели
+- События буферизуются на сервере (SSE_RETAIN_SECONDS после завершения); клиент, переподключившийся
+  с Last-Event-ID, получает только пропущенные события без повторной генерации
+- id события: <stream_id>:<номер>
+- Мелкие чанки склеиваются: окно SSE_COALESCE_MS миллисекунд или SSE_COALESCE_BYTES байт
+- Пока новых событий нет, раз в SSE_HEARTBEAT_SECONDS отправляется комментарий-heartbeat
+- С db_path (несколько воркеров) события пишутся ещё и в общую SQLite (WAL): переподключение,
+  попавшее в другой воркер, читает их оттуда опросом раз в SSE_POLL_MS
+- Не больше max_streams (SSE_MAX_STREAMS) потоков одновременно: сверх лимита start() бросает
+  TooManyStreams
+"""
+
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+def format_event(event_id: Optional[str], data: str) -> str:
+    """Один кадр SSE (data в одну строку - JSON)"""
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}data: {data}\n\n"
+
+
+def parse_last_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """'<stream_id>:<seq>' -> (stream_id, seq); (None, 0) для пустого или чужого формата"""
+    if not value:
+        return None, 0
+    stream_id, _, seq = value.strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None, 0
+    return stream_id, int(seq)
+
+
+class TooManyStreams(Exception):
+    """Одновременно уже идёт max_streams генераций"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Too many active streams (limit {limit})")
+        self.limit = limit
+
+
+class SqliteStreamLog:
+    """
+    События потоков в общей SQLite (WAL): любой воркер может отдать пропущенные события.
+    Признак завершения пишется после последнего события потока
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS streams (
+            id TEXT PRIMARY KEY,
+            owner TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS events (
+            stream_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (stream_id, seq)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.executescript(self.SCHEMA)
+
+    def create(self, stream_id: str, owner: Optional[str], created_at: float) -> None:
+        with self._lock:
+            self._conn.execute("INSERT INTO streams (id, owner, created_at) VALUES (?, ?, ?)",
+                               (stream_id, owner, created_at))
+
+    def append(self, stream_id: str, seq: int, data: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO events (stream_id, seq, data) VALUES (?, ?, ?)",
+                               (stream_id, seq, data))
+
+    def finish(self, stream_id: str, finished_at: float) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE streams SET finished_at = ? WHERE id = ?", (finished_at, stream_id))
+
+    def get(self, stream_id: str) -> Optional[Tuple[Optional[str], float, Optional[float]]]:
+        """(owner, created_at, finished_at) или None"""
+        with self._lock:
+            return self._conn.execute("SELECT owner, created_at, finished_at FROM streams WHERE id = ?",
+                                      (stream_id,)).fetchone()
+
+    def events_after(self, stream_id: str, seq: int) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._conn.execute("SELECT seq, data FROM events WHERE stream_id = ? AND seq > ? ORDER BY seq",
+                                      (stream_id, seq)).fetchall()
+
+    def sweep(self, finished_before: float, started_before: float) -> int:
+        """Удалить завершённые до finished_before и незавершённые (воркер умер), начатые до started_before"""
+        condition = "(finished_at IS NOT NULL AND finished_at < ?) OR (finished_at IS NULL AND created_at < ?)"
+        params = (finished_before, started_before)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(f"DELETE FROM events WHERE stream_id IN (SELECT id FROM streams WHERE {condition})",
+                                   params)
+                removed = self._conn.execute(f"DELETE FROM streams WHERE {condition}", params).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SSEStream:
+    """Буфер событий одного ответа"""
+
+    # Локальный поток будит подписчиков сам, опрос не нужен
+    poll_seconds: Optional[float] = None
+
+    def __init__(self, stream_id: str, owner: Optional[str] = None, log: Optional[SqliteStreamLog] = None):
+        self.id = stream_id
+        self.owner = owner
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        # events[i] - событие с номером i + 1
+        self._events: List[str] = []
+        self._wakeup = asyncio.Event()
+        self._log = log
+        self._persist("create", stream_id, owner, self.created_at)
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def last_seq(self) -> int:
+        return len(self._events)
+
+    def append(self, event: Dict[str, Any]) -> int:
+        data = json.dumps(event, ensure_ascii=False)
+        self._events.append(data)
+        self._persist("append", self.id, len(self._events), data)
+        self._notify()
+        return len(self._events)
+
+    def finish(self) -> None:
+        if self.finished_at is None:
+            self.finished_at = time.time()
+            self._persist("finish", self.id, self.finished_at)
+            self._notify()
+
+    def _persist(self, method: str, *args: Any) -> None:
+        """Копия в общую базу; её сбой не мешает клиентам этого воркера"""
+        if self._log is None:
+            return
+        try:
+            getattr(self._log, method)(*args)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ SSE stream {self.id}: shared log {method} failed: {e}")
+
+    def events_after(self, seq: int) -> List[Tuple[int, str]]:
+        return [(i + 1, data) for i, data in enumerate(self._events[seq:], start=seq)]
+
+    def changed(self) -> asyncio.Event:
+        """Событие, которое будет установлено при следующем изменении буфера"""
+        return self._wakeup
+
+    def _notify(self) -> None:
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+
+class SharedSSEStream:
+    """Поток, который генерирует другой воркер: события читаются из общей базы опросом"""
+
+    def __init__(self, log: SqliteStreamLog, stream_id: str, owner: Optional[str], created_at: float,
+                 finished_at: Optional[float], poll_seconds: float):
+        self.id = stream_id
+        self.owner = owner
+        self.created_at = created_at
+        self.finished_at = finished_at
+        self.task: Optional[asyncio.Task] = None
+        self.poll_seconds = poll_seconds
+        self._log = log
+        self._last_seq = 0
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def events_after(self, seq: int) -> List[Tuple[int, str]]:
+        # Сначала признак завершения, потом события: тогда после done ничего не будет пропущено
+        row = self._log.get(self.id)
+        if row is None:
+            self.finished_at = self.finished_at or time.time()  # удалён при очистке
+        else:
+            self.finished_at = row[2]
+        events = self._log.events_after(self.id, seq)
+        if events:
+            self._last_seq = max(self._last_seq, events[-1][0])
+        return events
+
+    def changed(self) -> asyncio.Event:
+        """Изменения другого процесса не приходят уведомлением - подписчик опрашивает базу"""
+        return asyncio.Event()
+
+
+class SSEStreamRegistry:
+    """Запуск генераций в фоне и подписка на их события (с возобновлением)"""
+
+    # Как часто удалять старые потоки из общей базы
+    LOG_SWEEP_SECONDS = 30
+
+    def __init__(self, retain_seconds: Optional[float] = None, heartbeat_seconds: Optional[float] = None,
+                 coalesce_ms: Optional[float] = None, coalesce_bytes: Optional[int] = None,
+                 max_streams: Optional[int] = None, db_path: Optional[str] = None,
+                 poll_ms: Optional[float] = None, stale_seconds: Optional[float] = None):
+        self.retain_seconds = retain_seconds if retain_seconds is not None else float(
+            os.getenv("SSE_RETAIN_SECONDS", "120"))
+        self.heartbeat_seconds = heartbeat_seconds or float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+        self.coalesce_seconds = (coalesce_ms if coalesce_ms is not None
+                                 else float(os.getenv("SSE_COALESCE_MS", "50"))) / 1000
+        self.coalesce_bytes = coalesce_bytes or int(os.getenv("SSE_COALESCE_BYTES", "512"))
+        self.max_streams = max_streams or int(os.getenv("SSE_MAX_STREAMS", "1000"))
+        self.poll_seconds = (poll_ms if poll_ms is not None else float(os.getenv("SSE_POLL_MS", "200"))) / 1000
+        # Незавершённый поток в общей базе старше этого срока - его воркер умер
+        self.stale_seconds = stale_seconds or float(os.getenv("SSE_STALE_SECONDS", "3600"))
+        self._streams: "OrderedDict[str, SSEStream]" = OrderedDict()
+        self._log = SqliteStreamLog(db_path) if db_path else None
+        self._log_swept_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    def get(self, stream_id: Optional[str]) -> Optional[SSEStream]:
+        """Поток этого воркера или, с общей базой, поток любого другого"""
+        self.sweep()
+        if not stream_id:
+            return None
+        stream = self._streams.get(stream_id)
+        if stream is not None or self._log is None:
+            return stream
+        row = self._log.get(stream_id)
+        if row is None:
+            return None
+        owner, created_at, finished_at = row
+        if finished_at is not None and time.time() - finished_at >= self.retain_seconds:
+            return None
+        return SharedSSEStream(self._log, stream_id, owner, created_at, finished_at, self.poll_seconds)
+
+    def start(self, events: AsyncIterator[Dict[str, Any]], owner: Optional[str] = None) -> SSEStream:
+        """
+        Запустить генерацию (events - асинхронный итератор словарей с полем type;
+        type=chunk с полем content склеиваются). Первое событие - {"type": "stream", "stream_id"}.
+        TooManyStreams, если max_streams генераций ещё не завершены
+        """
+        self.sweep(reserve=1)
+        if len(self._streams) >= self.max_streams:
+            raise TooManyStreams(self.max_streams)
+        stream = SSEStream(secrets.token_urlsafe(12), owner, self._log)
+        stream.append({"type": "stream", "stream_id": stream.id})
+        self._streams[stream.id] = stream
+        stream.task = asyncio.create_task(self._produce(stream, events))
+        return stream
+
+    def sweep(self, reserve: int = 0) -> None:
+        """
+        Удалить завершённые потоки старше retain_seconds, а также самые старые завершённые,
+        пока вместе с reserve новыми потоков больше max_streams
+        """
+        now = time.time()
+        expired = [sid for sid, s in self._streams.items()
+                   if s.done and now - s.finished_at >= self.retain_seconds]
+        for sid in expired:
+            del self._streams[sid]
+        excess = len(self._streams) + reserve - self.max_streams
+        if excess > 0:
+            for sid in [sid for sid, s in self._streams.items() if s.done][:excess]:
+                del self._streams[sid]
+        if self._log is not None and now - self._log_swept_at >= self.LOG_SWEEP_SECONDS:
+            self._log_swept_at = now
+            try:
+                self._log.sweep(now - self.retain_seconds, now - self.stale_seconds)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ SSE shared log sweep failed: {e}")
+
+    async def _produce(self, stream: SSEStream, events: AsyncIterator[Dict[str, Any]]) -> None:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump() -> None:
+            try:
+                async for event in events:
+                    await queue.put(event)
+            except Exception as e:
+                logger.error(f"❌ SSE stream {stream.id} failed: {e}")
+                await queue.put({"type": "error", "message": str(e)})
+            finally:
+                await queue.put(_END)
+
+        pump_task = asyncio.create_task(pump())
+        pending: List[str] = []
+        pending_bytes = 0
+        flush_at = 0.0
+
+        def flush() -> None:
+            nonlocal pending, pending_bytes
+            if pending:
+                stream.append({"type": "chunk", "content": "".join(pending)})
+                pending, pending_bytes = [], 0
+
+        try:
+            while True:
+                timeout = max(0.0, flush_at - loop.time()) if pending else None
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    flush()
+                    continue
+                if item is _END:
+                    break
+                if item.get("type") == "chunk":
+                    content = item.get("content") or ""
+                    if not pending:
+                        flush_at = loop.time() + self.coalesce_seconds
+                    pending.append(content)
+                    pending_bytes += len(content.encode("utf-8"))
+                    if pending_bytes >= self.coalesce_bytes or self.coalesce_seconds <= 0:
+                        flush()
+                else:
+                    flush()
+                    stream.append(item)
+        finally:
+            flush()
+            stream.finish()
+            if not pump_task.done():
+                pump_task.cancel()
+
+    async def subscribe(self, stream: SSEStream, after_seq: int = 0) -> AsyncIterator[str]:
+        """
+        Кадры SSE начиная с события after_seq + 1; heartbeat, пока ждём; конец - когда поток завершён.
+        Поток другого воркера (SharedSSEStream) опрашивается раз в poll_seconds
+        """
+        loop = asyncio.get_running_loop()
+        seq = after_seq
+        quiet_since = loop.time()
+        while True:
+            wakeup = stream.changed()
+            for event_seq, data in stream.events_after(seq):
+                yield format_event(f"{stream.id}:{event_seq}", data)
+                seq = event_seq
+                quiet_since = loop.time()
+            if stream.done and seq >= stream.last_seq:
+                return
+            timeout = max(0.0, quiet_since + self.heartbeat_seconds - loop.time())
+            if stream.poll_seconds is not None:
+                timeout = min(timeout, stream.poll_seconds)
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                if loop.time() - quiet_since >= self.heartbeat_seconds:
+                    yield ": heartbeat\n\n"
+                    quiet_since = loop.time()
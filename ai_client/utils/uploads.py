@@ -0,0 +1,279 @@
+"""
+Загрузка файлов
+- Тело копируется из UploadFile кусками в потоке пула fs во временный файл, SHA-256 считается на лету
+- Лимит размера: по Content-Length до разбора формы и по факту во время копирования
+- Контентно-адресуемое хранилище: blobs/<sha[:2]>/<sha>; видимые пути (static/images/<имя>,
+  guardian_sandbox/uploads/<имя>) - жёсткие ссылки на blob, одинаковые загрузки не занимают место
+  повторно. Счётчик ссылок - st_nlink: когда остаётся одна ссылка (сам blob), он удаляется
+- Ссылки общие с blob и другими загрузками, поэтому на месте их не переписывают: blob только для
+  чтения, а write_text() заменяет ссылку новым файлом (copy-on-write). Перед дедупликацией
+  содержимое blob сверяется с хэшем - blob, изменённый в обход write_text(), не переиспользуется
+- Каталог blob закрыт для файловых инструментов (is_internal), удаление ссылки - через release()
+- Хуки постобработки (миниатюры изображений и т.п.) запускаются в фоне и не задерживают ответ
+"""
+
+import asyncio
+import hashlib
+import inspect
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, List, Optional, Tuple
+
+from .executors import run_blocking
+from .logger import Logger
+
+logger = Logger()
+
+
+class UploadTooLarge(Exception):
+    """Загрузка превышает лимит размера"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"File exceeds the {limit} byte upload limit")
+        self.limit = limit
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    sha256: str
+    size: int
+    content_type: Optional[str]
+    deduplicated: bool
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Имя файла без каталогов (клиентское имя не может выйти за каталог загрузок)"""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        raise ValueError("Invalid file name")
+    return name
+
+
+class UploadStore:
+    """Дедуплицирующее хранилище загрузок на жёстких ссылках"""
+
+    def __init__(self, blob_dir: Optional[str] = None, max_bytes: Optional[int] = None,
+                 chunk_bytes: Optional[int] = None):
+        self.blob_dir = blob_dir or os.getenv("UPLOAD_BLOB_DIR", "guardian_sandbox/.blobs")
+        self.max_bytes = max_bytes or int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.chunk_bytes = chunk_bytes or int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+        # (content_type prefix, hook); hook(StoredUpload) - корутина или обычная функция
+        self._hooks: List[Tuple[str, Callable[[StoredUpload], Any]]] = []
+        self._tasks: set = set()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def check_length(self, content_length: Optional[str]) -> None:
+        """Отказ до приёма тела, если клиент заявил размер больше лимита"""
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+
+    # ===== Hooks =====
+
+    def add_hook(self, hook: Callable[[StoredUpload], Any], content_type_prefix: str = "") -> None:
+        self._hooks.append((content_type_prefix, hook))
+
+    def _run_hooks(self, stored: StoredUpload) -> None:
+        for prefix, hook in self._hooks:
+            if prefix and not (stored.content_type or "").startswith(prefix):
+                continue
+            task = asyncio.create_task(self._run_hook(hook, stored))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_hook(self, hook: Callable[[StoredUpload], Any], stored: StoredUpload) -> None:
+        try:
+            if inspect.iscoroutinefunction(hook):
+                await hook(stored)
+            else:
+                await run_blocking("fs", hook, stored)
+        except Exception as e:
+            logger.error(f"❌ Upload hook {getattr(hook, '__name__', hook)} failed for {stored.path}: {e}")
+
+    async def drain_hooks(self) -> None:
+        """Дождаться запущенных хуков (тесты, остановка)"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    # ===== Storing =====
+
+    async def save(self, source: BinaryIO, dest_dir: str, filename: str,
+                   content_type: Optional[str] = None) -> StoredUpload:
+        """Сохранить поток source как dest_dir/filename; хуки запускаются после ответа"""
+        stored = await run_blocking("fs", self.store_stream, source, dest_dir, filename, content_type)
+        self._run_hooks(stored)
+        return stored
+
+    def store_stream(self, source: BinaryIO, dest_dir: str, filename: str,
+                     content_type: Optional[str] = None) -> StoredUpload:
+        """Блокирующая часть: копирование с хэшем и лимитом, дедупликация, ссылка на blob"""
+        os.makedirs(self.blob_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, prefix=".upload-")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = source.read(self.chunk_bytes)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(self.max_bytes)
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            sha256 = digest.hexdigest()
+            blob = self.blob_path(sha256)
+            deduplicated = os.path.exists(blob) and self._blob_intact(blob, sha256, size)
+            if deduplicated:
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, blob)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        path = os.path.join(dest_dir, safe_filename(filename))
+        self._link(blob, path)
+        logger.info(f"📎 Stored upload {path} ({size} bytes, sha256 {sha256[:12]}{', duplicate' if deduplicated else ''})")
+        return StoredUpload(path=path, sha256=sha256, size=size, content_type=content_type,
+                            deduplicated=deduplicated)
+
+    def _blob_intact(self, blob: str, sha256: str, size: int) -> bool:
+        """
+        Blob всё ещё совпадает со своим хэшем. Если кто-то переписал одну из ссылок на месте,
+        имя blob освобождается: изменённые ссылки сохраняют свой inode, новая загрузка получает новый blob
+        """
+        try:
+            intact = os.path.getsize(blob) == size and self._file_sha256(blob) == sha256
+        except FileNotFoundError:
+            return False
+        if not intact:
+            logger.warning(f"⚠️ Upload blob {blob} was modified in place, storing a fresh copy")
+            os.remove(blob)
+        return intact
+
+    def _file_sha256(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_bytes), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def write_text(self, path: str, content: str, append: bool = False) -> None:
+        """
+        Запись текстового файла. Жёсткая ссылка (загрузка) заменяется атомарно новым файлом -
+        одинаковые загрузки других пользователей и сам blob не меняются; blob без ссылок удаляется
+        """
+        try:
+            shared = os.stat(path).st_nlink > 1
+        except FileNotFoundError:
+            shared = False
+        if not shared:
+            with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+                f.write(content)
+            return
+
+        blob = self._blob_of(path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".write-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                if append:
+                    with open(path, "rb") as current:
+                        shutil.copyfileobj(current, tmp)
+                tmp.write(content.encode("utf-8"))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if blob:
+            self._collect(blob)
+
+    def _link(self, blob: str, path: str) -> None:
+        """path -> blob атомарно; прежний файл под этим именем освобождается"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            if os.path.samefile(blob, path):
+                return
+        except OSError:
+            pass
+        previous = self._blob_of(path)
+        tmp_link = f"{path}.link-{os.getpid()}"
+        try:
+            os.link(blob, tmp_link)
+        except OSError:
+            # Файловая система без жёстких ссылок (или другой том): обычная копия
+            shutil.copyfile(blob, tmp_link)
+        os.replace(tmp_link, path)
+        if previous:
+            self._collect(previous)
+
+    def _blob_of(self, path: str) -> Optional[str]:
+        """Blob, на который ссылается path (по inode), или None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_nlink < 2:
+            return None
+        # Имя blob неизвестно без хэша: читаем файл (только при перезаписи существующего имени)
+        blob = self.blob_path(self._file_sha256(path))
+        return blob if os.path.exists(blob) and os.path.samefile(blob, path) else None
+
+    def _collect(self, blob: str) -> None:
+        """Удалить blob, если на него не осталось видимых ссылок"""
+        try:
+            if os.stat(blob).st_nlink <= 1:
+                os.remove(blob)
+        except FileNotFoundError:
+            pass
+
+    def is_internal(self, path: str) -> bool:
+        """path внутри каталога blob - служебные файлы хранилища, не для инструментов"""
+        blob_dir = os.path.realpath(self.blob_dir)
+        return os.path.commonpath([os.path.realpath(path), blob_dir]) == blob_dir
+
+    def release(self, path: str) -> None:
+        """Удалить видимый файл; blob удаляется вместе с последней ссылкой"""
+        blob = self._blob_of(path)
+        os.remove(path)
+        if blob:
+            self._collect(blob)
+
+
+def make_thumbnail_hook(thumb_dir_name: str = ".thumbs", max_side: int = 256) -> Callable[[StoredUpload], None]:
+    """Хук: миниатюра изображения <каталог>/.thumbs/<sha256>.jpg (нужен OpenCV; без него - пропуск)"""
+
+    def thumbnail(stored: StoredUpload) -> None:
+        try:
+            import cv2
+        except ImportError:
+            return
+        thumb_path = os.path.join(os.path.dirname(stored.path), thumb_dir_name, f"{stored.sha256}.jpg")
+        if os.path.exists(thumb_path):
+            return
+        image = cv2.imread(stored.path)
+        if image is None:
+            return
+        height, width = image.shape[:2]
+        scale = min(1.0, max_side / max(height, width))
+        if scale < 1.0:
+            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        cv2.imwrite(thumb_path, image)
+
+    return thumbnail
+
+
+upload_store = UploadStore()
+upload_store.add_hook(make_thumbnail_hook(), "image/")
@@ -0,0 +1,134 @@
+"""
+Координация нескольких воркеров (uvicorn --workers N / gunicorn)
+- worker_count(): число воркеров из WEB_CONCURRENCY (его читают и uvicorn, и gunicorn)
+- FileLease: эксклюзивная блокировка файла (flock); освобождается ОС при смерти процесса
+- LeaderElection: ровно один воркер держит lease и запускает фоновые подсистемы;
+  остальные периодически пробуют его перехватить
+- worker_slot()/worker_path(): стабильный номер воркера (0..N-1) для его личных файлов
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (Windows: один процесс, блокировки не нужны)
+    fcntl = None
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    except ValueError:
+        return 1
+
+
+def is_multi_worker() -> bool:
+    return worker_count() > 1
+
+
+class FileLease:
+    """Неблокирующая эксклюзивная блокировка файла"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        # Для диагностики: кто держит lease
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class LeaderElection:
+    """
+    Выбор лидера через lease на файле. Лидер держит блокировку до остановки;
+    если процесс лидера умирает, ОС снимает блокировку и её забирает следующий воркер
+    при очередной попытке (каждые retry_seconds).
+    """
+
+    def __init__(self, lock_path: str, retry_seconds: Optional[float] = None):
+        self.lease = FileLease(lock_path)
+        self.retry_seconds = retry_seconds or float(os.getenv("LEADER_RETRY_SECONDS", "5"))
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lease.held
+
+    def try_acquire(self) -> bool:
+        was_leader = self.lease.held
+        try:
+            acquired = self.lease.acquire()
+        except OSError as e:
+            logger.error(f"❌ Leader lease error: {e}")
+            return False
+        if acquired and not was_leader:
+            logger.info(f"👑 Worker {os.getpid()} elected leader")
+        return acquired
+
+    def release(self) -> None:
+        if self.lease.held:
+            self.lease.release()
+            logger.info(f"👑 Worker {os.getpid()} released leadership")
+
+
+_slot_lock = threading.Lock()
+_slots: Dict[str, tuple] = {}
+
+
+def worker_slot(lock_dir: str = "memory/workers") -> int:
+    """
+    Наименьший свободный номер воркера в lock_dir (держится до конца процесса).
+    После перезапуска воркер получает тот же номер - его личные каталоги переиспользуются.
+    """
+    key = os.path.abspath(lock_dir)
+    with _slot_lock:
+        if key in _slots:
+            return _slots[key][0]
+        slot = 0
+        while True:
+            lease = FileLease(os.path.join(lock_dir, f"slot-{slot}.lock"))
+            if lease.acquire():
+                _slots[key] = (slot, lease)
+                return slot
+            slot += 1
+
+
+def worker_path(base: str) -> str:
+    """base для одного воркера, base/worker-<slot> при нескольких (данные, которые нельзя делить)"""
+    if not is_multi_worker():
+        return base
+    return os.path.join(base, f"worker-{worker_slot()}")
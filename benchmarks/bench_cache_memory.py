@@ -0,0 +1,75 @@
+"""
+Benchmark: memory tier of SystemCache under millions of distinct keys.
+
+Writes N distinct keys (sensor-like payloads with a short TTL) and samples the
+process RSS along the way, for a plain dict (the old memory tier) and for
+BoundedMemoryCache. The bounded tier should stay flat.
+
+    python benchmarks/bench_cache_memory.py --keys 2000000 --max-entries 10000
+
+Linux only (RSS is read from /proc/self/statm).
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from ai_client.utils.cache import BoundedMemoryCache  # noqa: E402
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / 1024 / 1024
+
+
+def payload(i: int) -> dict:
+    return {
+        "data": {"sensor": f"sensor_{i}", "value": i * 0.5, "unit": "C", "room": "kitchen"},
+        "timestamp": time.time(),
+        "ttl_seconds": 300,
+        "created_at": "2025-08-01T10:00:00",
+    }
+
+
+def run(name: str, store, keys: int, samples: int) -> None:
+    gc.collect()
+    baseline = rss_mb()
+    step = max(1, keys // samples)
+    points = []
+    started = time.perf_counter()
+    for i in range(keys):
+        store[f"sensor_data_{i}"] = payload(i)
+        if (i + 1) % step == 0:
+            points.append(rss_mb() - baseline)
+    elapsed = time.perf_counter() - started
+    trend = " ".join(f"{p:7.1f}" for p in points)
+    print(f"{name:8} {keys / elapsed / 1000:7.0f}k sets/s, entries {len(store):>9}, RSS growth MB: {trend}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=2_000_000)
+    parser.add_argument("--max-entries", type=int, default=10_000)
+    parser.add_argument("--max-mb", type=int, default=64)
+    parser.add_argument("--samples", type=int, default=8)
+    parser.add_argument("--skip-dict", action="store_true", help="do not run the unbounded dict baseline")
+    args = parser.parse_args()
+
+    bounded = BoundedMemoryCache(max_entries=args.max_entries, max_bytes=args.max_mb * 1024 * 1024)
+    run("bounded", bounded, args.keys, args.samples)
+    print(f"         {bounded.get_stats()}")
+    bounded.stop()
+    bounded.clear()
+
+    if not args.skip_dict:
+        run("dict", {}, args.keys, args.samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: N concurrent Gemini streams without head-of-line blocking.
+
+The Gemini SDK is replaced by a fake model whose stream sleeps between chunks
+(simulating network latency), so the benchmark runs offline.
+
+    python benchmarks/bench_concurrent_streams.py --streams 32 --chunks 10 --delay 0.05
+
+With the threaded transport the wall time stays close to a single stream
+(chunks * delay) and the event loop lag stays near zero; the "blocking" mode
+reproduces the old behaviour (SDK iterated on the loop) for comparison.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("GEMINI_PROMPT_CACHE", "0")
+
+from ai_client.models import gemini_client as gemini_module  # noqa: E402
+from ai_client.models.gemini_client import GeminiClient  # noqa: E402
+
+
+class _FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeModel:
+    chunks = 10
+    delay = 0.05
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream: bool = False):
+        def _iter():
+            for i in range(self.chunks):
+                time.sleep(self.delay)
+                yield _FakeChunk(f"chunk{i} ")
+        return _iter() if stream else _FakeChunk("done")
+
+
+async def _loop_lag_probe(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Максимальная задержка event loop за время бенчмарка"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def _consume_threaded(client: GeminiClient) -> float:
+    start = time.perf_counter()
+    async for _ in client.generate_streaming_response("system", "hello"):
+        pass
+    return time.perf_counter() - start
+
+
+async def _consume_blocking(client: GeminiClient) -> float:
+    start = time.perf_counter()
+    for _ in client._iter_stream_text(client.get_current_model(), "system", "hello"):
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+async def run(streams: int, mode: str) -> None:
+    client = GeminiClient()
+    consume = _consume_threaded if mode == "threaded" else _consume_blocking
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_loop_lag_probe(stop))
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(consume(client) for _ in range(streams)))
+    wall = time.perf_counter() - start
+    stop.set()
+    lag = await probe
+
+    single = _FakeModel.chunks * _FakeModel.delay
+    print(f"mode={mode} streams={streams} single_stream={single:.2f}s")
+    print(f"  wall={wall:.2f}s  max_stream={max(latencies):.2f}s  "
+          f"speedup_vs_serial={streams * single / wall:.1f}x  max_loop_lag={lag * 1000:.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=16)
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--mode", choices=["threaded", "blocking", "both"], default="both")
+    args = parser.parse_args()
+
+    _FakeModel.chunks = args.chunks
+    _FakeModel.delay = args.delay
+    gemini_module.genai.GenerativeModel = _FakeModel
+
+    modes = ["threaded", "blocking"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        asyncio.run(run(args.streams, mode))
+
+
+if __name__ == "__main__":
+    main()
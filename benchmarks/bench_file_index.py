@@ -0,0 +1,108 @@
+"""
+Benchmark: recent-file-changes lookup on a large tree (default 100k files).
+
+Compares the old per-request os.walk + stat scan with the event-driven
+FileChangeIndex (one background scan at startup, O(k) reads afterwards).
+
+    python benchmarks/bench_file_index.py --files 100000 --per-dir 100 --requests 200
+
+The tree is generated in a temporary directory and removed afterwards.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from ai_client.utils.file_index import FileChangeIndex  # noqa: E402
+
+
+def legacy_recent_file_changes(root: str) -> str:
+    """The old web_app.get_recent_file_changes: full walk + stat of every file per call"""
+    current_time = datetime.now()
+    recent_files = []
+    for dirpath, _dirs, files in os.walk(root):
+        for file in files:
+            file_path = os.path.join(dirpath, file)
+            try:
+                mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
+                if current_time - mtime < timedelta(hours=24):
+                    recent_files.append((file_path, mtime))
+            except OSError:
+                continue
+    recent_files.sort(key=lambda x: x[1], reverse=True)
+    return "\n".join(f"- {path} (modified: {mtime.strftime('%H:%M:%S')})" for path, mtime in recent_files[:10])
+
+
+def build_tree(root: str, files: int, per_dir: int) -> None:
+    old = time.time() - 7 * 86400
+    for i in range(files):
+        directory = os.path.join(root, f"dir_{i // per_dir:05d}")
+        if i % per_dir == 0:
+            os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"file_{i:06d}.txt")
+        with open(path, "w") as f:
+            f.write("x")
+        # Only ~1% of the tree was touched within the last day
+        if i % 100:
+            os.utime(path, (old, old))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--per-dir", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--legacy-requests", type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="file_index_bench_")
+    try:
+        started = time.perf_counter()
+        build_tree(root, args.files, args.per_dir)
+        print(f"tree: {args.files} files in {args.files // args.per_dir} dirs ({time.perf_counter() - started:.1f}s to build)")
+
+        started = time.perf_counter()
+        for _ in range(args.legacy_requests):
+            legacy_recent_file_changes(root)
+        legacy = (time.perf_counter() - started) / args.legacy_requests
+        print(f"legacy os.walk per request:  {legacy * 1000:10.2f} ms")
+
+        for use_inotify in (True, False):
+            index = FileChangeIndex(root, use_inotify=use_inotify, poll_interval=3600)
+            started = time.perf_counter()
+            index.start()
+            index.ready.wait()
+            startup = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                index.render()
+            per_request = (time.perf_counter() - started) / args.requests
+
+            latency = ""
+            if index.mode == "inotify":
+                target = os.path.join(root, "dir_00000", "file_000001.txt")
+                started = time.perf_counter()
+                with open(target, "a") as f:
+                    f.write("y")
+                while not index.recent(limit=1) or index.recent(limit=1)[0][0] != "dir_00000/file_000001.txt":
+                    time.sleep(0.0005)
+                latency = f", change visible after {(time.perf_counter() - started) * 1000:.1f} ms"
+
+            print(
+                f"index[{index.mode:8}] startup scan: {startup:6.2f} s, per request: "
+                f"{per_request * 1000:8.3f} ms ({legacy / per_request:,.0f}x faster){latency}"
+            )
+            index.stop()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: cost of a log call on the calling (event loop) thread.
+
+Emits N INFO lines shaped like the web app's per-request logs from one thread and
+reports p50/p99/max latency of the logger call for:
+- off:      LOG_ENABLED=0 (root at WARNING, INFO is dropped by the level check)
+- direct:   the old setup - FileHandler + StreamHandler written synchronously
+- pipeline: setup_logging() - QueueHandler, writes on a background thread, rotation
+- json:     setup_logging() with LOG_FORMAT=json
+
+Console output goes to /dev/null so the numbers reflect the file path only.
+
+    python benchmarks/bench_logging.py --lines 200000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from ai_client.utils.log_pipeline import DEFAULT_FORMAT, setup_logging, shutdown_logging  # noqa: E402
+
+
+def _reset_root() -> None:
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def _measure(lines: int) -> list:
+    logger = logging.getLogger("web_app")
+    latencies = []
+    for i in range(lines):
+        started = time.perf_counter()
+        logger.info(f"Added message to history: stepan -> message {i} with some text...")
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run(mode: str, lines: int, directory: str) -> None:
+    _reset_root()
+    log_file = os.path.join(directory, f"{mode}.log")
+    os.environ["LOG_ENABLED"] = "0" if mode == "off" else "1"
+    os.environ["LOG_FORMAT"] = "json" if mode == "json" else "text"
+    if mode == "direct":
+        logging.basicConfig(level=logging.INFO, format=DEFAULT_FORMAT, force=True,
+                            handlers=[logging.FileHandler(log_file), logging.StreamHandler()])
+    else:
+        setup_logging(log_file)
+
+    started = time.perf_counter()
+    latencies = sorted(_measure(lines))
+    caller = time.perf_counter() - started
+    shutdown_logging()  # wait until the background thread has written everything
+    total = time.perf_counter() - started
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e6
+
+    print(f"{mode:9} p50={pct(0.5):6.1f}us  p99={pct(0.99):7.1f}us  max={latencies[-1] * 1e6:8.0f}us  "
+          f"caller={caller:6.2f}s  until written={total:6.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--modes", nargs="+", default=["off", "direct", "pipeline", "json"])
+    args = parser.parse_args()
+
+    os.environ["LOG_QUEUE_SIZE"] = str(args.lines + 1)  # measure cost, not drops
+    stderr = sys.stderr
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        sys.stderr = devnull
+        try:
+            for mode in args.modes:
+                run(mode, args.lines, directory)
+                stderr.flush()
+        finally:
+            sys.stderr = stderr
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: memory search on a large history (default 300k messages).
+
+Compares the old substring scan (what search_user_data did over profile files,
+applied to the whole history) with the FTS5 SearchIndex.
+
+    python benchmarks/bench_search_index.py --messages 300000 --queries 200
+
+The index is built in a temporary directory and removed afterwards.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from memory.search_index import SearchIndex  # noqa: E402
+
+WORDS = [f"word{i}" for i in range(20000)]
+USERS = ["stepan", "meranda", "guest"]
+
+
+def make_messages(count: int):
+    rnd = random.Random(42)
+    for i in range(count):
+        yield {
+            "id": f"msg_{i}",
+            "timestamp": f"2025-08-01T{i % 24:02d}:{i % 60:02d}:{i % 60:02d}",
+            "user": USERS[i % len(USERS)],
+            "message": " ".join(rnd.choice(WORDS) for _ in range(12)),
+            "ai_response": " ".join(rnd.choice(WORDS) for _ in range(30)),
+        }
+
+
+def legacy_search(messages, query: str, user: str, limit: int = 10):
+    """Substring scan of every message, most mentions first"""
+    query = query.lower()
+    found = []
+    for entry in messages:
+        if entry["user"] != user:
+            continue
+        hits = entry["message"].lower().count(query) + entry["ai_response"].lower().count(query)
+        if hits:
+            found.append((hits, entry))
+    found.sort(key=lambda item: item[0], reverse=True)
+    return [entry for _, entry in found[:limit]]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=300_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--legacy-queries", type=int, default=20)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="search_index_bench_")
+    try:
+        messages = list(make_messages(args.messages))
+        index = SearchIndex(os.path.join(root, "search.db"))
+        started = time.perf_counter()
+        index.index_messages(messages)
+        print(f"indexed {args.messages} messages in {time.perf_counter() - started:.1f}s")
+
+        rnd = random.Random(7)
+        queries = [(rnd.choice(WORDS), rnd.choice(USERS)) for _ in range(args.queries)]
+
+        started = time.perf_counter()
+        for word, user in queries[:args.legacy_queries]:
+            legacy_search(messages, word, user)
+        legacy = (time.perf_counter() - started) / args.legacy_queries
+        print(f"legacy substring scan per query: {legacy * 1000:10.2f} ms")
+
+        timings = []
+        for word, user in queries:
+            started = time.perf_counter()
+            index.search(word, user=user, limit=10)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f"fts5 index per query: p50 {p50 * 1000:8.3f} ms, p99 {p99 * 1000:8.3f} ms "
+              f"({legacy / p50:,.0f}x faster)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
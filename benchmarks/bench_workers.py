@@ -0,0 +1,119 @@
+"""
+Benchmark: web_app throughput with 1..N uvicorn worker processes.
+
+Starts `uvicorn web_app:app --workers N` (WEB_CONCURRENCY=N, shared SQLite stores in a
+temporary directory), logs in once - the session must be valid in every worker - and
+loads read endpoints with concurrent clients.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --clients 64 --seconds 10
+
+Requests per second should grow close to linearly with the worker count up to the number
+of CPU cores (one worker is bound to one core by the GIL); the "errors" column must stay 0.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+ENDPOINTS = ("/api/search?q=guardian", "/api/conversation-history?limit=20", "/api/model-status")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(workers: int, port: int, data_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "CONVERSATION_STORAGE": "sqlite",
+        "CONVERSATION_DB": os.path.join(data_dir, "conversation.db"),
+        "SESSION_DB": os.path.join(data_dir, "sessions.db"),
+        "SEARCH_INDEX_DB": os.path.join(data_dir, "search_index.db"),
+        "VECTOR_MEMORY_DIR": os.path.join(data_dir, "vector_memory"),
+        "USER_CREDENTIALS": "bench:bench",
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "benchmark"),
+        "MQTT_HOST": "127.0.0.1",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "web_app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def _wait_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/sim/health")).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError("server did not start")
+
+
+async def _client(base_url: str, cookies: httpx.Cookies, stop_at: float, results: list) -> None:
+    async with httpx.AsyncClient(base_url=base_url, cookies=cookies, timeout=30) as client:
+        i = 0
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                ok = (await client.get(ENDPOINTS[i % len(ENDPOINTS)])).status_code == 200
+            except httpx.TransportError:
+                ok = False
+            results.append((ok, time.perf_counter() - started))
+            i += 1
+
+
+async def run(workers: int, clients: int, seconds: float) -> None:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = _start_server(workers, port, data_dir)
+        try:
+            await _wait_ready(base_url)
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                await client.post("/login", data={"username": "bench", "password": "bench"})
+                cookies = client.cookies
+            results: list = []
+            stop_at = time.monotonic() + seconds
+            await asyncio.gather(*(_client(base_url, cookies, stop_at, results) for _ in range(clients)))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for ok, _ in results if not ok)
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0.0
+    print(f"workers={workers} clients={clients}  rps={len(results) / seconds:.0f}  "
+          f"p50={latencies[len(latencies) // 2] * 1000 if latencies else 0:.1f}ms  "
+          f"p99={p99 * 1000:.1f}ms  errors={errors}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"cpu_count={os.cpu_count()}")
+    for workers in args.workers:
+        asyncio.run(run(workers, args.clients, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
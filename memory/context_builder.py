@@ -0,0 +1,248 @@
+"""
+Context Builder
+Token-budgeted, incrementally updated conversation context for the LLM
+"""
+
+import os
+import threading
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from memory.conversation_history import ConversationHistory, conversation_history
+from memory.vector_memory import vector_memory
+
+logger = logging.getLogger(__name__)
+
+RECENT_HEADER = "Recent conversation:\n"
+ARCHIVE_HEADER = "Earlier conversation (archived summaries):\n"
+RELEVANT_HEADER = "Relevant earlier context:\n"
+SYSTEM_HEADER = "\n**SYSTEM CONTEXT:**\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 chars per token for mixed RU/EN text)"""
+    if not text:
+        return 0
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text so that it fits into max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, max_tokens * 4 - 3)] + "..."
+
+
+@dataclass
+class BuiltContext:
+    """Rendered context plus per-section token accounting"""
+    text: str
+    sections: Dict[str, int] = field(default_factory=dict)
+    total_tokens: int = 0
+    budget_tokens: int = 0
+    turns_included: int = 0
+    archives_included: int = 0
+    relevant_included: int = 0
+
+
+@dataclass
+class _TurnWindow:
+    """Rendered recent turns of one user (or of everyone for user=None)"""
+    turns: Deque[Tuple[Optional[str], str, int]] = field(default_factory=deque)  # (message id, text, tokens)
+    tokens: int = 0
+    overflowed: bool = False
+    rendered: Optional[str] = None
+
+
+class ContextBuilder:
+    """
+    Keeps a running rendering of the recent turns within a token budget.
+    Windows are kept per user, so a prompt only carries the requesting user's turns.
+    A new turn is rendered once and appended (O(1)); the oldest turns fall out
+    of the window when the budget is exceeded and archive summaries take their place.
+    With a retriever (vector memory), older turns similar to the current query are recalled too.
+    """
+
+    def __init__(self, history: ConversationHistory, budget_tokens: Optional[int] = None,
+                 archive_share: float = 0.15, system_share: float = 0.15,
+                 retriever: Optional[Any] = None, relevant_share: float = 0.1,
+                 relevant_min_score: float = 0.25):
+        self.history = history
+        self.retriever = retriever
+        self.relevant_min_score = relevant_min_score
+        self.budget_tokens = budget_tokens or int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+        self.archive_budget = int(self.budget_tokens * archive_share)
+        self.system_budget = int(self.budget_tokens * system_share)
+        self.relevant_budget = int(self.budget_tokens * relevant_share) if retriever is not None else 0
+        self.history_budget = self.budget_tokens - self.archive_budget - self.system_budget - self.relevant_budget
+
+        self._lock = threading.Lock()
+        # user -> window, built lazily on the first request of that user; None = all users
+        self._windows: Dict[Optional[str], _TurnWindow] = {}
+        self._rendered_archive: Optional[Tuple[str, int, int]] = None
+
+        self._rebuild()
+        history.add_listener(self._on_history_event)
+
+    # ===== Incremental window =====
+
+    def _render_turn(self, entry: Dict[str, Any]) -> Tuple[str, int]:
+        text = f"- User: {entry.get('message', '')}\n- AI: {entry.get('ai_response', '')}\n"
+        text = truncate_to_tokens(text, self.history_budget)
+        return text, estimate_tokens(text)
+
+    def _append(self, window: _TurnWindow, entry: Dict[str, Any]) -> None:
+        text, tokens = self._render_turn(entry)
+        window.turns.append((entry.get('id'), text, tokens))
+        window.tokens += tokens
+        while window.tokens > self.history_budget and len(window.turns) > 1:
+            _, _, dropped = window.turns.popleft()
+            window.tokens -= dropped
+            window.overflowed = True
+        window.rendered = None
+
+    def _entries(self, user: Optional[str]) -> List[Dict[str, Any]]:
+        if user is None:
+            return self.history.get_full_history()
+        return self.history.get_full_user_history(user)
+
+    def _build_window(self, user: Optional[str]) -> _TurnWindow:
+        """Render a window from history; under self._lock"""
+        window = _TurnWindow()
+        # Render newest first and stop at the budget - older turns would be dropped anyway
+        selected: List[Dict[str, Any]] = []
+        tokens = 0
+        for entry in reversed(self._entries(user)):
+            _, entry_tokens = self._render_turn(entry)
+            if selected and tokens + entry_tokens > self.history_budget:
+                window.overflowed = True
+                break
+            selected.append(entry)
+            tokens += entry_tokens
+        for entry in reversed(selected):
+            self._append(window, entry)
+        self._windows[user] = window
+        return window
+
+    def _window(self, user: Optional[str]) -> _TurnWindow:
+        window = self._windows.get(user)
+        return window if window is not None else self._build_window(user)
+
+    def _rebuild(self) -> None:
+        """Full rebuild from history (startup, edits, deletions, clear); user windows are re-rendered on demand"""
+        with self._lock:
+            self._windows.clear()
+            self._rendered_archive = None
+            self._build_window(None)
+
+    def _on_history_event(self, event: str, entry: Optional[Dict[str, Any]] = None) -> None:
+        if event == "message" and entry is not None:
+            with self._lock:
+                for user in (None, entry.get('user')):
+                    window = self._windows.get(user)
+                    if window is not None:
+                        self._append(window, entry)
+        elif event in ("archive", "archive_delete"):
+            with self._lock:
+                self._rendered_archive = None
+        else:
+            self._rebuild()
+
+    # ===== Sections =====
+
+    def _recent_section(self, window: _TurnWindow) -> str:
+        if window.rendered is None:
+            window.rendered = RECENT_HEADER + "".join(text for _, text, _ in window.turns) if window.turns else ""
+        return window.rendered
+
+    def _archive_section(self) -> Tuple[str, int, int]:
+        """Newest archive summaries that fit into the archive budget, in chronological order"""
+        if self._rendered_archive is not None:
+            return self._rendered_archive
+        lines: List[str] = []
+        tokens = estimate_tokens(ARCHIVE_HEADER)
+        for archive in reversed(self.history.get_archive_entries(limit=self.history.max_archive_entries)):
+            summary = archive.get('summary', '')
+            if not summary:
+                continue
+            period = f"{str(archive.get('period_start', ''))[:10]}..{str(archive.get('period_end', ''))[:10]}"
+            line = f"- [{period}] {summary}\n"
+            line_tokens = estimate_tokens(line)
+            if tokens + line_tokens > self.archive_budget:
+                break
+            lines.append(line)
+            tokens += line_tokens
+        text = ARCHIVE_HEADER + "".join(reversed(lines)) if lines else ""
+        self._rendered_archive = (text, estimate_tokens(text), len(lines))
+        return self._rendered_archive
+
+    def _relevant_section(self, query: str, recent_ids: List[Optional[str]],
+                          user: Optional[str] = None) -> Tuple[str, int]:
+        """Past turns / summaries (of the user, if given) most similar to the query that are not in the recent window"""
+        try:
+            hits = self.retriever.search(query, top_k=8, min_score=self.relevant_min_score,
+                                         exclude_ids=recent_ids, user=user)
+        except Exception as e:
+            logger.warning(f"⚠️ Relevant context lookup failed: {e}")
+            return "", 0
+        lines: List[str] = []
+        tokens = estimate_tokens(RELEVANT_HEADER)
+        for hit in hits:
+            when = str(hit.get('timestamp') or '')[:10]
+            line = truncate_to_tokens(f"- [{when}] {hit['text']}", self.relevant_budget // 2) + "\n"
+            line_tokens = estimate_tokens(line)
+            if tokens + line_tokens > self.relevant_budget:
+                break
+            lines.append(line)
+            tokens += line_tokens
+        return (RELEVANT_HEADER + "".join(lines), len(lines)) if lines else ("", 0)
+
+    def build(self, system_context: Optional[str] = None, query: Optional[str] = None,
+              user: Optional[str] = None) -> BuiltContext:
+        """
+        Assemble the context for one request and report token counts per section.
+        With user, the recent turns are that user's only; otherwise everyone's.
+        """
+        with self._lock:
+            window = self._window(user)
+            recent = self._recent_section(window)
+            recent_tokens = window.tokens + (estimate_tokens(RECENT_HEADER) if recent else 0)
+            turns_included = len(window.turns)
+            recent_ids = [message_id for message_id, _, _ in window.turns]
+            total_turns = len(self._entries(user)) if user is not None else len(self.history.history)
+            # Older turns did not fit - summarize them via archive entries
+            if window.overflowed or total_turns > turns_included:
+                archive, archive_tokens, archives_included = self._archive_section()
+            else:
+                archive, archive_tokens, archives_included = "", 0, 0
+
+        relevant, relevant_included = "", 0
+        if self.retriever is not None and query:
+            relevant, relevant_included = self._relevant_section(query, recent_ids, user)
+
+        system = ""
+        if system_context:
+            system = SYSTEM_HEADER + truncate_to_tokens(system_context, self.system_budget) + "\n"
+
+        sections = {
+            "archive": archive_tokens,
+            "recent": recent_tokens,
+            "system": estimate_tokens(system),
+        }
+        if self.retriever is not None:
+            sections["relevant"] = estimate_tokens(relevant)
+        return BuiltContext(
+            text=archive + relevant + recent + system,
+            sections=sections,
+            total_tokens=sum(sections.values()),
+            budget_tokens=self.budget_tokens,
+            turns_included=turns_included,
+            archives_included=archives_included,
+            relevant_included=relevant_included,
+        )
+
+
+# Global instance
+context_builder = ContextBuilder(conversation_history, retriever=vector_memory)
@@ -5,10 +5,16 @@ Handles chat history, archiving, and context management
 
 import json
 import os
+import queue
+import threading
+import time
+from bisect import bisect_left
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
 import logging
 
+from memory.history_storage import RecordStore, create_store, decode_cursor, encode_cursor
+
 logger = logging.getLogger(__name__)
 
 # Import AI client for generating summaries
@@ -53,88 +59,177 @@ def _load_ai_client():
         logger.error(f"❌ AI client initialization failed - summaries will not work. Error: {e}")
         raise
 
+def _is_dead(job: Dict[str, Any]) -> bool:
+    """Archive job that ran out of attempts and waits for an operator to re-queue it"""
+    return job.get('status') == 'dead'
+
 class ConversationHistory:
     """Manages conversation history with archiving capabilities"""
     
     def __init__(self, history_file: str = "memory/conversation_history.json", 
-                 archive_file: str = "memory/conversation_archive.json"):
+                 archive_file: str = "memory/conversation_archive.json",
+                 storage: Optional[str] = None):
         self.history_file = history_file
         self.archive_file = archive_file
         self.max_history_entries = 50  # Archive when exceeded
         self.max_archive_entries = 1000  # Keep last 1000 archived entries
         
+        # Subscribers notified on changes: callback(event, entry)
+        # events: 'message' (new entry appended), 'edit' / 'delete' (one message changed),
+        # 'archive' / 'archive_delete' (one archive entry changed), 'reset' (history rewritten)
+        self._listeners: List[Callable[[str, Optional[Dict[str, Any]]], None]] = []
+        
         # Ensure directories exist
         os.makedirs(os.path.dirname(history_file), exist_ok=True)
         os.makedirs(os.path.dirname(archive_file), exist_ok=True)
         
+        # Storage backend (append-only JSONL by default, CONVERSATION_STORAGE=json for the legacy format)
+        self._history_store = create_store(history_file, storage)
+        self._archive_store = create_store(archive_file, storage)
+        
+        # In-memory indexes: message id -> entry, user -> entries (chronological)
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[str, List[Dict[str, Any]]] = {}
+        self._archive_by_id: Dict[str, Dict[str, Any]] = {}
+        
         # Load existing data - optimized for empty history
         self.history = self._load_history()
         self.archive = self._load_archive()
         
+        # Durable archive job queue: summarization runs in a background worker
+        self._lock = threading.RLock()
+        base, _ = os.path.splitext(archive_file)
+        self._jobs_store = create_store(f"{base}_jobs.json", storage)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._pending_ids: set = set()
+        self._job_queue: "queue.Queue[str]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        # With several web workers only the elected leader summarizes (see enable_archiving);
+        # the others still queue jobs in the shared store
+        self.archiving_enabled = int(os.getenv("WEB_CONCURRENCY", "1") or 1) <= 1
+        # Failed jobs are retried with a growing delay; after the last attempt the job is
+        # dead-lettered (kept in the store, its messages stay in history) until requeue_dead_jobs()
+        self.archive_max_attempts = int(os.getenv("ARCHIVE_MAX_ATTEMPTS", "3"))
+        self.archive_retry_seconds = float(os.getenv("ARCHIVE_RETRY_SECONDS", "30"))
+        self.archive_stats = {
+            'jobs_enqueued': 0,
+            'jobs_processed': 0,
+            'jobs_failed': 0,
+            'last_latency_seconds': None,
+            'total_latency_seconds': 0.0,
+        }
+        self._load_jobs()
+        
         # Log initialization status
-        logger.info(f"📚 ConversationHistory initialized: {len(self.history)} messages, {len(self.archive)} archives")
+        logger.info(f"📚 ConversationHistory initialized: {len(self.history)} messages, {len(self.archive)} archives, {len(self._jobs)} pending archive jobs")
+    
+    # ===== Indexes =====
+    
+    @property
+    def history(self) -> List[Dict[str, Any]]:
+        return self._history
+    
+    @history.setter
+    def history(self, entries: List[Dict[str, Any]]) -> None:
+        self._history = entries
+        self._by_id = {}
+        self._by_user = {}
+        for entry in entries:
+            self._index_add(entry)
+    
+    @property
+    def archive(self) -> List[Dict[str, Any]]:
+        return self._archive
+    
+    @archive.setter
+    def archive(self, entries: List[Dict[str, Any]]) -> None:
+        self._archive = entries
+        self._archive_by_id = {e['id']: e for e in entries if isinstance(e, dict) and e.get('id')} if isinstance(entries, list) else {}
+    
+    def _index_add(self, entry: Dict[str, Any]) -> None:
+        if entry.get('id'):
+            self._by_id[entry['id']] = entry
+        self._by_user.setdefault(entry.get('user'), []).append(entry)
+    
+    def _index_remove(self, entry: Dict[str, Any]) -> None:
+        self._by_id.pop(entry.get('id'), None)
+        user_entries = self._by_user.get(entry.get('user'), [])
+        for i in range(len(user_entries) - 1, -1, -1):
+            if user_entries[i] is entry:
+                del user_entries[i]
+                break
+    
+    def add_listener(self, callback: Callable[[str, Optional[Dict[str, Any]]], None]) -> None:
+        """Subscribe to history changes (used by incremental context builders)"""
+        self._listeners.append(callback)
+    
+    def _notify(self, event: str, entry: Optional[Dict[str, Any]] = None) -> None:
+        """Notify subscribers about a change"""
+        for callback in self._listeners:
+            try:
+                callback(event, entry)
+            except Exception as e:
+                logger.error(f"Error in conversation history listener: {e}")
     
     def _load_history(self) -> List[Dict[str, Any]]:
-        """Load conversation history from file - optimized for empty files"""
+        """Load conversation history from the storage backend"""
         try:
-            if os.path.exists(self.history_file):
-                file_size = os.path.getsize(self.history_file)
-                if file_size == 0:
-                    logger.info("📭 Empty history file detected - fast return")
-                    return []
-                
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    logger.info(f"📖 Loaded {len(data)} messages from history")
-                    return data
+            data = self._history_store.load()
+            if data:
+                logger.info(f"📖 Loaded {len(data)} messages from history")
             else:
-                logger.info("📭 History file not found - creating empty history")
-                return []
+                logger.info("📭 Empty history - fast return")
+            return data
         except Exception as e:
             logger.error(f"Error loading conversation history: {e}")
             return []
     
     def _load_archive(self) -> List[Dict[str, Any]]:
-        """Load conversation archive from file - optimized for empty files"""
+        """Load conversation archive from the storage backend"""
         try:
-            if os.path.exists(self.archive_file):
-                file_size = os.path.getsize(self.archive_file)
-                if file_size == 0:
-                    logger.info("📭 Empty archive file detected - fast return")
-                    return []
-                
-                with open(self.archive_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Проверяем, что data это список
-                    if isinstance(data, list):
-                        logger.info(f"📖 Loaded {len(data)} archives")
-                        return data
-                    else:
-                        logger.warning("⚠️ Archive file contains non-list data - resetting to empty list")
-                        return []
+            data = self._archive_store.load()
+            if data:
+                logger.info(f"📖 Loaded {len(data)} archives")
             else:
-                logger.info("📭 Archive file not found - creating empty archive")
-                return []
+                logger.info("📭 Empty archive - fast return")
+            return data
         except Exception as e:
             logger.error(f"Error loading conversation archive: {e}")
             return []
     
     def _save_history(self):
-        """Save conversation history to file"""
+        """Rewrite the whole conversation history (archiving, clear)"""
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.history, f, ensure_ascii=False, indent=2)
+            self._history_store.replace(self.history)
         except Exception as e:
             logger.error(f"Error saving conversation history: {e}")
     
     def _save_archive(self):
-        """Save conversation archive to file"""
+        """Rewrite the whole conversation archive (trimming)"""
         try:
-            with open(self.archive_file, 'w', encoding='utf-8') as f:
-                json.dump(self.archive, f, ensure_ascii=False, indent=2)
+            self._archive_store.replace(self.archive)
         except Exception as e:
             logger.error(f"Error saving conversation archive: {e}")
     
+    def _store_put(self, store: RecordStore, entry: Dict[str, Any]) -> None:
+        """Append one new or edited record"""
+        try:
+            store.put(entry)
+        except Exception as e:
+            logger.error(f"Error writing conversation record {entry.get('id')}: {e}")
+    
+    def _store_delete(self, store: RecordStore, record_id: str) -> None:
+        """Append a deletion record"""
+        try:
+            store.delete(record_id)
+        except Exception as e:
+            logger.error(f"Error deleting conversation record {record_id}: {e}")
+    
+    def flush(self) -> None:
+        """Force pending writes to disk (group commit)"""
+        self._history_store.flush()
+        self._archive_store.flush()
+    
     def add_message(self, user: str, message: str, ai_response: str, 
                    context: Optional[str] = None) -> None:
         """Add a new message to conversation history"""
@@ -148,70 +243,276 @@ class ConversationHistory:
             'type': 'conversation'
         }
         
-        self.history.append(entry)
-        logger.info(f"Added message to history: {user} -> {message[:50]}...")
-        
-        # Check if we need to archive
-        if len(self.history) > self.max_history_entries:
-            self._archive_old_messages()
+        with self._lock:
+            self.history.append(entry)
+            self._index_add(entry)
+            self._store_put(self._history_store, entry)
+            logger.info(f"Added message to history: {user} -> {message[:50]}...")
+            
+            # Check if we need to archive (summarization happens in the background)
+            if self.archiving_enabled and len(self.history) - len(self._pending_ids) > self.max_history_entries:
+                self._archive_old_messages()
         
-        self._save_history()
+        self._notify('message', entry)
     
-    def _archive_old_messages(self) -> None:
-        """Archive old messages when history gets too long"""
-        if len(self.history) <= self.max_history_entries:
+    # ===== Background archiving =====
+    
+    def _load_jobs(self) -> None:
+        """Restore unfinished archive jobs (backlog after downtime, or jobs queued by other workers)"""
+        try:
+            jobs = self._jobs_store.load()
+        except Exception as e:
+            logger.error(f"Error loading archive jobs: {e}")
             return
+        with self._lock:
+            # Jobs this process is already working on keep their in-memory state; new jobs and
+            # dead jobs another worker re-queued are picked up (dead jobs wait for an operator)
+            known = {job_id: job for job_id, job in self._jobs.items() if not _is_dead(job)}
+            new_jobs = [job for job in jobs if job['id'] not in known and not _is_dead(job)]
+            self._jobs = {job['id']: known.get(job['id'], job) for job in jobs}
+            self._pending_ids = {m.get('id') for job in jobs for m in job.get('messages', [])}
+        if new_jobs and self.archiving_enabled:
+            for job in new_jobs:
+                self._job_queue.put(job['id'])
+            logger.info(f"📦 Resuming {len(new_jobs)} pending archive jobs")
+            self._ensure_worker()
+    
+    def enable_archiving(self) -> None:
+        """Start summarizing in this process (the elected leader in multi-worker mode)"""
+        if self.archiving_enabled:
+            return
+        self.sync()
+        with self._lock:
+            self.archiving_enabled = True
+            queued = [job_id for job_id, job in self._jobs.items() if not _is_dead(job)]
+        for job_id in queued:
+            self._job_queue.put(job_id)
+        if queued:
+            logger.info(f"📦 Resuming {len(queued)} pending archive jobs")
+            self._ensure_worker()
+        if len(self.history) - len(self._pending_ids) > self.max_history_entries:
+            self._archive_old_messages()
+    
+    # ===== Multi-worker sync =====
+    
+    @property
+    def shared_storage(self) -> bool:
+        """History lives in a store several worker processes can share"""
+        return self._history_store.shared
+    
+    def sync(self) -> bool:
+        """
+        Pick up changes other worker processes wrote to a shared (SQLite) store and notify
+        listeners with the same events a local change would produce. Cheap when nothing changed.
+        """
+        history_changed = self._history_store.changed_externally()
+        archive_changed = self._archive_store.changed_externally()
+        jobs_changed = self._jobs_store.changed_externally()
+        if not (history_changed or archive_changed or jobs_changed):
+            return False
         
-        # Calculate how many to archive (keep last 20 entries)
-        entries_to_archive = len(self.history) - 20
-        
-        # Create archive entry with summarized content
-        archive_entry = {
-            'id': f"archive_{datetime.now().timestamp()}",
-            'timestamp': datetime.now().isoformat(),
-            'type': 'archive',
-            'original_count': entries_to_archive,
-            'period_start': self.history[0]['timestamp'],
-            'period_end': self.history[entries_to_archive - 1]['timestamp'],
-            'summary': self._generate_archive_summary(self.history[:entries_to_archive]),
-            'key_topics': self._extract_key_topics(self.history[:entries_to_archive]),
-            'user_activity': self._analyze_user_activity(self.history[:entries_to_archive])
-        }
+        events: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+        if jobs_changed:
+            self._load_jobs()
+        with self._lock:
+            if archive_changed:
+                old_archive = self._archive_by_id
+                self.archive = self._archive_store.load()
+                events += [('archive', e) for e in self.archive if old_archive.get(e.get('id')) != e]
+                events += [('archive_delete', e) for archive_id, e in old_archive.items()
+                           if archive_id not in self._archive_by_id]
+            if history_changed:
+                old_history = self._by_id
+                self.history = self._history_store.load()
+                if old_history and not self.history:
+                    events.append(('reset', None))
+                else:
+                    events += [('message' if e.get('id') not in old_history else 'edit', e)
+                               for e in self.history if old_history.get(e.get('id')) != e]
+                    # Messages that left history because an archive was merged are not deletions
+                    if not archive_changed:
+                        events += [('delete', e) for message_id, e in old_history.items()
+                                   if message_id not in self._by_id]
         
-        # Add to archive
-        if isinstance(self.archive, list):
-            self.archive.append(archive_entry)
-        else:
-            logger.error(f"❌ Archive is not a list: {type(self.archive)} - resetting to empty list")
-            self.archive = [archive_entry]
+        for event, entry in events:
+            self._notify(event, entry)
+        if self.archiving_enabled and len(self.history) - len(self._pending_ids) > self.max_history_entries:
+            self._archive_old_messages()
+        return True
+    
+    def _archive_old_messages(self) -> Optional[str]:
+        """Queue old messages for archiving; they stay in history until the summary is merged"""
+        with self._lock:
+            candidates = [m for m in self.history if m.get('id') not in self._pending_ids]
+            if len(candidates) <= self.max_history_entries:
+                return None
+            
+            # Archive everything except the last 20 entries
+            batch = candidates[:-20]
+            job = {
+                'id': f"job_{datetime.now().timestamp()}",
+                'created_at': time.time(),
+                'attempts': 0,
+                'messages': [dict(m) for m in batch]
+            }
+            self._jobs[job['id']] = job
+            self._pending_ids.update(m.get('id') for m in batch)
+            self._store_put(self._jobs_store, job)
+            self.archive_stats['jobs_enqueued'] += 1
         
-        # Remove archived entries from history
-        self.history = self.history[entries_to_archive:]
+        if self.archiving_enabled:
+            self._job_queue.put(job['id'])
+            self._ensure_worker()
+        logger.info(f"📦 Queued {len(batch)} messages for archiving ({job['id']})")
+        return job['id']
+    
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._archive_worker, name="archive_worker", daemon=True)
+            self._worker.start()
+    
+    def _archive_worker(self) -> None:
+        """Summarize queued batches off the request path"""
+        while True:
+            job_id = self._job_queue.get()
+            try:
+                job = self._jobs.get(job_id)
+                if job is not None and not _is_dead(job):
+                    self._process_archive_job(job)
+            finally:
+                self._job_queue.task_done()
+    
+    def _process_archive_job(self, job: Dict[str, Any]) -> None:
+        messages = job.get('messages', [])
+        started = time.monotonic()
+        try:
+            archive_entry = {
+                # Derived from the job id - re-running a job after a crash overwrites, not duplicates
+                'id': f"archive_{job['id'][len('job_'):]}",
+                'timestamp': datetime.now().isoformat(),
+                'type': 'archive',
+                'original_count': len(messages),
+                'period_start': messages[0]['timestamp'] if messages else None,
+                'period_end': messages[-1]['timestamp'] if messages else None,
+                'summary': self._generate_archive_summary(messages),
+                'key_topics': self._extract_key_topics(messages),
+                'user_activity': self._analyze_user_activity(messages)
+            }
+            self._merge_archive_job(job, archive_entry)
+        except Exception as e:
+            job['attempts'] = job.get('attempts', 0) + 1
+            job['last_error'] = str(e)[:500]
+            if job['attempts'] >= self.archive_max_attempts:
+                job['status'] = 'dead'
+            self._store_put(self._jobs_store, job)
+            self.archive_stats['jobs_failed'] += 1
+            if _is_dead(job):
+                logger.error(f"❌ Archive job {job['id']} failed {job['attempts']} times, moved to dead letters "
+                             f"(requeue via /api/conversation/archive-queue/requeue): {e}")
+            else:
+                # Retry later with a growing delay; the job stays in the durable queue in any case
+                logger.error(f"❌ Archive job {job['id']} failed (attempt {job['attempts']}): {e}")
+                retry = threading.Timer(self.archive_retry_seconds * job['attempts'], self._job_queue.put,
+                                        args=(job['id'],))
+                retry.daemon = True
+                retry.start()
+            return
         
-        # Limit archive size
-        if len(self.archive) > self.max_archive_entries:
-            self.archive = self.archive[-self.max_archive_entries:]
+        latency = time.monotonic() - started
+        self.archive_stats['jobs_processed'] += 1
+        self.archive_stats['last_latency_seconds'] = round(latency, 3)
+        self.archive_stats['total_latency_seconds'] += latency
+        logger.info(f"✅ Archived {len(messages)} messages in {latency:.1f}s ({job['id']})")
+    
+    def _merge_archive_job(self, job: Dict[str, Any], archive_entry: Dict[str, Any]) -> None:
+        """Atomically add the summary to the archive and drop the batch from history"""
+        archived_ids = {m.get('id') for m in job.get('messages', [])}
+        # Other workers may have appended messages meanwhile (shared store)
+        self.sync()
+        with self._lock:
+            if not isinstance(self.archive, list):
+                logger.error(f"❌ Archive is not a list: {type(self.archive)} - resetting to empty list")
+                self.archive = []
+            self.archive = [a for a in self.archive if a.get('id') != archive_entry['id']] + [archive_entry]
+            
+            # Limit archive size
+            if len(self.archive) > self.max_archive_entries:
+                self.archive = self.archive[-self.max_archive_entries:]
+                self._save_archive()
+            else:
+                self._store_put(self._archive_store, archive_entry)
+            
+            # Remove archived entries from history (per record: messages other workers
+            # appended in the meantime are never overwritten)
+            removed = [m for m in self.history if m.get('id') in archived_ids]
+            if removed:
+                self.history = [m for m in self.history if m.get('id') not in archived_ids]
+                for message in removed:
+                    self._store_delete(self._history_store, message['id'])
+            
+            self._jobs.pop(job['id'], None)
+            self._pending_ids.difference_update(archived_ids)
+            self._store_delete(self._jobs_store, job['id'])
         
-        logger.info(f"Archived {entries_to_archive} messages, created summary")
-        self._save_archive()
+        self._notify('archive', archive_entry)
+    
+    def requeue_dead_jobs(self) -> int:
+        """Give dead-lettered archive jobs a fresh set of attempts; returns how many were re-queued"""
+        with self._lock:
+            dead = [job for job in self._jobs.values() if _is_dead(job)]
+            for job in dead:
+                job['status'] = 'pending'
+                job['attempts'] = 0
+                self._store_put(self._jobs_store, job)
+        if dead and self.archiving_enabled:
+            for job in dead:
+                self._job_queue.put(job['id'])
+            self._ensure_worker()
+        if dead:
+            logger.info(f"📦 Re-queued {len(dead)} dead archive jobs")
+        return len(dead)
+    
+    def _active_jobs(self) -> List[Dict[str, Any]]:
+        return [job for job in self._jobs.values() if not _is_dead(job)]
+    
+    def wait_for_archiving(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the archive queue is drained (tests, shutdown); dead-lettered jobs are not waited for"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._active_jobs():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+    
+    def get_archive_queue_stats(self) -> Dict[str, Any]:
+        """Archive queue depth and summarization latency"""
+        with self._lock:
+            active = self._active_jobs()
+            dead = [job for job in self._jobs.values() if _is_dead(job)]
+            oldest = min((job.get('created_at', time.time()) for job in active), default=None)
+            processed = self.archive_stats['jobs_processed']
+            return {
+                'queue_depth': len(active),
+                'pending_messages': sum(len(job.get('messages', [])) for job in active),
+                'oldest_job_age_seconds': round(time.time() - oldest, 1) if oldest else 0,
+                'dead_jobs': len(dead),
+                'dead_messages': sum(len(job.get('messages', [])) for job in dead),
+                'jobs_enqueued': self.archive_stats['jobs_enqueued'],
+                'jobs_processed': processed,
+                'jobs_failed': self.archive_stats['jobs_failed'],
+                'last_latency_seconds': self.archive_stats['last_latency_seconds'],
+                'avg_latency_seconds': round(self.archive_stats['total_latency_seconds'] / processed, 3) if processed else None,
+            }
     
     def _generate_archive_summary(self, messages: List[Dict[str, Any]]) -> str:
-        """Generate a summary of archived messages using AI model"""
+        """Generate a summary of archived messages using AI model.
+        
+        Raises on any failure so the job is retried (or dead-lettered) instead of
+        replacing the raw messages with an error text.
+        """
         if not messages:
             return "No messages to summarize"
-        
-        try:
-            # Check if AI client can be loaded
-            _load_ai_client()
-        except Exception as e:
-            logger.error(f"❌ AI client not available - cannot generate summaries: {e}")
-            return "AI summary generation unavailable"
-        
-        try:
-            return self._generate_ai_summary(messages)
-        except Exception as e:
-            logger.error(f"❌ Error generating AI summary: {e}")
-            return f"Summary generation failed: {str(e)}"
+        return self._generate_ai_summary(messages)
     
     def _generate_ai_summary(self, messages: List[Dict[str, Any]]) -> str:
         """Generate summary using AI model"""
@@ -254,8 +555,13 @@ Focus on meaningful insights rather than just listing topics.
                 conversation_context=""
             )
             
+            # The client reports API errors (429, blocked response...) as a "❌ ..." reply
+            summary = (summary or "").strip()
+            if not summary or summary.startswith("❌"):
+                raise RuntimeError(summary or "empty summary")
+            
             logger.info("✅ Generated AI summary for conversation archive")
-            return summary.strip()
+            return summary
             
         except Exception as e:
             logger.error(f"❌ Error in AI summary generation: {e}")
@@ -315,14 +621,38 @@ Focus on meaningful insights rather than just listing topics.
         return self.history[-limit:] if len(self.history) >= limit else self.history
     
     def get_user_history(self, username: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get conversation history for specific user"""
-        user_messages = [msg for msg in self.history if msg.get('user') == username]
-        return user_messages[-limit:] if len(user_messages) >= limit else user_messages
+        """Get conversation history for specific user (per-user index, no scan)"""
+        user_messages = self._by_user.get(username, [])
+        return user_messages[-limit:] if len(user_messages) >= limit else list(user_messages)
+    
+    def get_history_page(self, username: Optional[str] = None, limit: int = 20,
+                         cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Cursor-based pagination, newest page first; entries inside a page are chronological.
+        Pass the returned cursor to get the previous (older) page; None means no more pages.
+        """
+        if hasattr(self._history_store, 'page'):
+            return self._history_store.page(username, limit, cursor)
+        
+        with self._lock:
+            entries = self.history if username is None else self._by_user.get(username, [])
+            end = len(entries)
+            if cursor:
+                end = bisect_left(entries, decode_cursor(cursor),
+                                  key=lambda e: (e.get('timestamp', ''), e.get('id', '')))
+            start = max(0, end - limit)
+            page = entries[start:end]
+        next_cursor = encode_cursor(page[0]) if start > 0 and page else None
+        return page, next_cursor
     
     def get_full_history(self) -> List[Dict[str, Any]]:
         """Get full conversation history"""
         return self.history.copy()
     
+    def get_full_user_history(self, username: str) -> List[Dict[str, Any]]:
+        """Get full conversation history of one user (per-user index, no scan)"""
+        return list(self._by_user.get(username, []))
+    
     def get_archive_summary(self) -> str:
         """Get summary of archived conversations"""
         if not self.archive:
@@ -361,14 +691,16 @@ Focus on meaningful insights rather than just listing topics.
     
     def edit_archive_entry(self, archive_id: str, new_summary: str) -> bool:
         """Edit an archive entry (AI can modify summaries)"""
-        for entry in self.archive:
-            if entry['id'] == archive_id:
-                entry['summary'] = new_summary
-                entry['last_edited'] = datetime.now().isoformat()
-                self._save_archive()
-                logger.info(f"Edited archive entry: {archive_id}")
-                return True
-        return False
+        with self._lock:
+            for entry in self.archive:
+                if entry['id'] == archive_id:
+                    entry['summary'] = new_summary
+                    entry['last_edited'] = datetime.now().isoformat()
+                    self._store_put(self._archive_store, entry)
+                    self._notify('archive', entry)
+                    logger.info(f"Edited archive entry: {archive_id}")
+                    return True
+            return False
     
     def get_archive_entries(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent archive entries"""
@@ -376,10 +708,12 @@ Focus on meaningful insights rather than just listing topics.
     
     def clear_history(self) -> None:
         """Clear current history (archive first)"""
-        if self.history:
-            self._archive_old_messages()
-        self.history = []
-        self._save_history()
+        with self._lock:
+            if self.history:
+                self._archive_old_messages()
+            self.history = []
+            self._save_history()
+        self._notify('reset')
         logger.info("Conversation history cleared")
     
     def get_statistics(self) -> Dict[str, Any]:
@@ -389,78 +723,76 @@ Focus on meaningful insights rather than just listing topics.
             'archived_periods': len(self.archive),
             'total_archived_messages': sum(arch.get('original_count', 0) for arch in self.archive),
             'last_activity': self.history[-1]['timestamp'] if self.history else None,
-            'users': list(set(msg['user'] for msg in self.history))
+            'users': list(set(msg['user'] for msg in self.history)),
+            'archive_queue': self.get_archive_queue_stats()
         }
     
     def edit_message(self, message_id: str, new_content: str) -> bool:
         """Edit a message in conversation history"""
-        try:
-            for entry in self.history:
-                if entry.get('id') == message_id:
+        with self._lock:
+            try:
+                entry = self._by_id.get(message_id)
+                if entry is not None:
                     entry['message'] = new_content
                     entry['edited'] = True
                     entry['edit_timestamp'] = datetime.now().isoformat()
-                    self._save_history()
+                    self._store_put(self._history_store, entry)
+                    self._notify('edit', entry)
                     logger.info(f"✅ Edited message {message_id}")
                     return True
             
-            # Also check archive
-            for entry in self.archive:
-                if entry.get('id') == message_id:
+                # Also check archive
+                entry = self._archive_by_id.get(message_id)
+                if entry is not None:
                     entry['message'] = new_content
                     entry['edited'] = True
                     entry['edit_timestamp'] = datetime.now().isoformat()
-                    self._save_archive()
+                    self._store_put(self._archive_store, entry)
+                    self._notify('archive', entry)
                     logger.info(f"✅ Edited archived message {message_id}")
                     return True
             
-            logger.warning(f"❌ Message {message_id} not found for editing")
-            return False
+                logger.warning(f"❌ Message {message_id} not found for editing")
+                return False
             
-        except Exception as e:
-            logger.error(f"Error editing message {message_id}: {e}")
-            return False
+            except Exception as e:
+                logger.error(f"Error editing message {message_id}: {e}")
+                return False
     
     def delete_message(self, message_id: str) -> bool:
         """Delete a message from conversation history"""
-        try:
-            # Check current history
-            for i, entry in enumerate(self.history):
-                if entry.get('id') == message_id:
-                    del self.history[i]
-                    self._save_history()
+        with self._lock:
+            try:
+                # Check current history
+                entry = self._by_id.get(message_id)
+                if entry is not None:
+                    self.history.remove(entry)
+                    self._index_remove(entry)
+                    self._store_delete(self._history_store, message_id)
+                    self._notify('delete', entry)
                     logger.info(f"✅ Deleted message {message_id}")
                     return True
             
-            # Check archive
-            for i, entry in enumerate(self.archive):
-                if entry.get('id') == message_id:
-                    del self.archive[i]
-                    self._save_archive()
+                # Check archive
+                entry = self._archive_by_id.pop(message_id, None)
+                if entry is not None:
+                    self.archive.remove(entry)
+                    self._store_delete(self._archive_store, message_id)
+                    self._notify('archive_delete', entry)
                     logger.info(f"✅ Deleted archived message {message_id}")
                     return True
             
-            logger.warning(f"❌ Message {message_id} not found for deletion")
-            return False
+                logger.warning(f"❌ Message {message_id} not found for deletion")
+                return False
             
-        except Exception as e:
-            logger.error(f"Error deleting message {message_id}: {e}")
-            return False
+            except Exception as e:
+                logger.error(f"Error deleting message {message_id}: {e}")
+                return False
     
     def get_message_by_id(self, message_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific message by ID"""
         try:
-            # Check current history
-            for entry in self.history:
-                if entry.get('id') == message_id:
-                    return entry
-            
-            # Check archive
-            for entry in self.archive:
-                if entry.get('id') == message_id:
-                    return entry
-            
-            return None
+            return self._by_id.get(message_id) or self._archive_by_id.get(message_id)
             
         except Exception as e:
             logger.error(f"Error getting message {message_id}: {e}")
@@ -0,0 +1,599 @@
+"""
+Conversation History Storage
+Pluggable record stores for ConversationHistory:
+- JsonFileStore: legacy behaviour, the whole list is rewritten as one JSON document
+- JsonlStore: append-only JSON lines (one record per add/edit/delete),
+  background compaction with atomic rename, optional group-commit fsync
+- SqliteStore: SQLite in WAL mode, partitioned by user, indexed by (user, timestamp)
+  and message id, with cursor pagination
+"""
+
+import json
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ("always", "batch", "never")
+
+
+def _fsync_dir(path: str) -> None:
+    """Persist a rename on POSIX filesystems"""
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+class RecordStore(ABC):
+    """Interface of a record store: an ordered collection of dicts keyed by 'id'"""
+
+    # True if several processes may use the store at once (see changed_externally)
+    shared = False
+
+    @abstractmethod
+    def load(self) -> List[Dict[str, Any]]:
+        """All records in collection order"""
+
+    @abstractmethod
+    def put(self, entry: Dict[str, Any]) -> None:
+        """Insert or update one record"""
+
+    @abstractmethod
+    def delete(self, record_id: str) -> None:
+        """Remove one record (unknown ids are ignored)"""
+
+    @abstractmethod
+    def replace(self, entries: List[Dict[str, Any]]) -> None:
+        """Replace the whole collection (archiving, trimming, clear)"""
+
+    def flush(self) -> None:
+        pass
+
+    def changed_externally(self) -> bool:
+        """True if another process modified the collection since the last load (shared stores only)"""
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+class JsonFileStore(RecordStore):
+    """Legacy store: every change rewrites the whole JSON file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def load(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            logger.warning(f"⚠️ {self.path} contains non-list data - resetting to empty list")
+            data = []
+        self._entries = OrderedDict((_record_id(e, i), e) for i, e in enumerate(data))
+        return data
+
+    def _write(self) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(list(self._entries.values()), f, ensure_ascii=False, indent=2)
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        self._entries[_record_id(entry, len(self._entries))] = entry
+        self._write()
+
+    def delete(self, record_id: str) -> None:
+        self._entries.pop(record_id, None)
+        self._write()
+
+    def replace(self, entries: List[Dict[str, Any]]) -> None:
+        self._entries = OrderedDict((_record_id(e, i), e) for i, e in enumerate(entries))
+        self._write()
+
+
+def _record_id(entry: Dict[str, Any], position: int) -> str:
+    return str(entry.get('id') or f"_pos_{position}")
+
+
+class JsonlStore(RecordStore):
+    """
+    Append-only JSON lines store.
+    Records: {"op": "put", "id": ..., "entry": {...}} and {"op": "del", "id": ...}.
+    The log is compacted in the background once dead records outnumber live ones.
+    """
+
+    def __init__(self, path: str, legacy_json_path: Optional[str] = None,
+                 fsync: Optional[str] = None, group_commit_ms: Optional[int] = None,
+                 compact_min_records: int = 1000):
+        self.path = path
+        self.legacy_json_path = legacy_json_path
+        self.fsync = (fsync or os.getenv("CONVERSATION_FSYNC", "batch")).lower()
+        if self.fsync not in FSYNC_POLICIES:
+            logger.warning(f"⚠️ Unknown fsync policy '{self.fsync}', using 'batch'")
+            self.fsync = "batch"
+        self.group_commit_seconds = (group_commit_ms or int(os.getenv("CONVERSATION_GROUP_COMMIT_MS", "200"))) / 1000.0
+        self.compact_min_records = compact_min_records
+
+        self._lock = threading.RLock()
+        # id -> serialized entry (serialized once, compaction just copies lines)
+        self._lines: "OrderedDict[str, str]" = OrderedDict()
+        self._records = 0
+        self._file = None
+        self._dirty = False
+        self._compacting = False
+        self._generation = 0
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+        self.stats = {"appends": 0, "compactions": 0, "fsyncs": 0}
+
+    # ===== Loading and migration =====
+
+    def load(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            if not os.path.exists(self.path) and self.legacy_json_path and os.path.exists(self.legacy_json_path):
+                self._migrate_legacy()
+
+            entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+            self._records = 0
+            if os.path.exists(self.path):
+                # Byte offset just past the last valid record: anything after it is a torn tail
+                good_end = 0
+                size = 0
+                with open(self.path, 'rb') as f:
+                    for line_no, raw in enumerate(f, 1):
+                        size += len(raw)
+                        line = raw.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line.decode('utf-8'))
+                        except (UnicodeDecodeError, json.JSONDecodeError):
+                            # Torn write at the tail after a crash - drop it
+                            logger.warning(f"⚠️ Skipping corrupt record {self.path}:{line_no}")
+                            continue
+                        good_end = size
+                        self._records += 1
+                        if record.get('op') == 'del':
+                            entries.pop(record.get('id'), None)
+                        elif record.get('op') == 'put':
+                            entries[record['id']] = record['entry']
+                self._repair_tail(good_end, size)
+
+            self._lines = OrderedDict(
+                (record_id, self._encode_put(record_id, entry)) for record_id, entry in entries.items()
+            )
+            self._open()
+            if self._needs_compaction():
+                self._compact_now()
+            return list(entries.values())
+
+    def _repair_tail(self, good_end: int, size: int) -> None:
+        """
+        Cut a torn tail off and make sure the log ends with a newline,
+        otherwise the next append would be glued onto the fragment and lost on reload
+        """
+        with open(self.path, 'r+b') as f:
+            if good_end < size:
+                logger.warning(f"⚠️ Truncating torn tail of {self.path} ({size - good_end} bytes)")
+                f.truncate(good_end)
+            if good_end > 0:
+                f.seek(good_end - 1)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _migrate_legacy(self) -> None:
+        """One-time migration from the legacy JSON document (left in place as a backup)"""
+        try:
+            legacy = JsonFileStore(self.legacy_json_path).load()
+        except Exception as e:
+            logger.error(f"❌ Cannot migrate {self.legacy_json_path}: {e}")
+            return
+        lines = [self._encode_put(_record_id(e, i), e) for i, e in enumerate(legacy)]
+        self._write_atomic(lines)
+        logger.info(f"📦 Migrated {len(legacy)} records from {self.legacy_json_path} to {self.path}")
+
+    # ===== Writing =====
+
+    @staticmethod
+    def _encode_put(record_id: str, entry: Dict[str, Any]) -> str:
+        return json.dumps({"op": "put", "id": record_id, "entry": entry}, ensure_ascii=False) + "\n"
+
+    def _open(self) -> None:
+        if self._file:
+            self._file.close()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _append(self, line: str) -> None:
+        self._file.write(line)
+        self._file.flush()
+        self._records += 1
+        self.stats["appends"] += 1
+        if self.fsync == "always":
+            os.fsync(self._file.fileno())
+            self.stats["fsyncs"] += 1
+        elif self.fsync == "batch":
+            self._dirty = True
+            self._ensure_flusher()
+        if self._needs_compaction():
+            self._schedule_compaction()
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            record_id = _record_id(entry, len(self._lines))
+            line = self._encode_put(record_id, entry)
+            self._lines[record_id] = line
+            self._append(line)
+
+    def delete(self, record_id: str) -> None:
+        with self._lock:
+            if self._lines.pop(record_id, None) is not None:
+                self._append(json.dumps({"op": "del", "id": record_id}, ensure_ascii=False) + "\n")
+
+    def replace(self, entries: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._lines = OrderedDict()
+            for i, entry in enumerate(entries):
+                record_id = _record_id(entry, i)
+                self._lines[record_id] = self._encode_put(record_id, entry)
+            self._compact_now()
+
+    # ===== Group commit =====
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name="history_fsync", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            time.sleep(self.group_commit_seconds)
+            self.flush()
+
+    def flush(self) -> None:
+        """fsync everything appended since the last commit (one fsync per batch)"""
+        with self._lock:
+            if not self._dirty or not self._file:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            self.stats["fsyncs"] += 1
+
+    # ===== Compaction =====
+
+    def _needs_compaction(self) -> bool:
+        return self._records > max(self.compact_min_records, 2 * len(self._lines))
+
+    def _write_atomic(self, lines: List[str], tail: str = "") -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+            if tail:
+                f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+
+    def _compact_now(self) -> None:
+        """Synchronous compaction (caller holds the lock)"""
+        lines = list(self._lines.values())
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._write_atomic(lines)
+        self._records = len(lines)
+        self._dirty = False
+        self._generation += 1
+        self.stats["compactions"] += 1
+        self._open()
+
+    def _schedule_compaction(self) -> None:
+        if self._compacting:
+            return
+        self._compacting = True
+        threading.Thread(target=self._compact_background, name="history_compact", daemon=True).start()
+
+    def _compact_background(self) -> None:
+        """
+        Write a snapshot of the live records without blocking writers, then
+        copy whatever was appended meanwhile and atomically swap the files.
+        """
+        try:
+            with self._lock:
+                lines = list(self._lines.values())
+                self._file.flush()
+                offset = os.path.getsize(self.path)
+                appended_before = self._records
+                generation = self._generation
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+
+            with self._lock:
+                if generation != self._generation or self._file is None:
+                    # The log was rewritten meanwhile (replace/close) - snapshot is stale
+                    os.remove(tmp_path)
+                    return
+                self._file.flush()
+                with open(self.path, 'r', encoding='utf-8') as old:
+                    old.seek(offset)
+                    tail = old.read()
+                with open(tmp_path, 'a', encoding='utf-8') as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._file.close()
+                os.replace(tmp_path, self.path)
+                _fsync_dir(self.path)
+                self._records = len(lines) + (self._records - appended_before)
+                self._dirty = False
+                self._generation += 1
+                self.stats["compactions"] += 1
+                self._open()
+            logger.info(f"🗜️ Compacted {self.path}: {len(lines)} live records")
+        except Exception as e:
+            logger.error(f"❌ Compaction of {self.path} failed: {e}")
+        finally:
+            self._compacting = False
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._closed = True
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def encode_cursor(entry: Dict[str, Any]) -> str:
+    """Opaque pagination cursor: (timestamp, id) of the oldest returned record"""
+    return f"{entry.get('timestamp', '')}|{entry.get('id', '')}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    timestamp, _, record_id = cursor.partition("|")
+    return timestamp, record_id
+
+
+class SqliteStore(RecordStore):
+    """
+    SQLite store in WAL mode. All collections (history, archive, jobs) share one
+    database file; the user column is the partition key of the (collection, user, ts, id) index.
+    Safe to share between worker processes: positions are allocated inside the write
+    transaction, and a per-collection version tells a process when someone else wrote.
+    """
+
+    shared = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            collection TEXT NOT NULL,
+            id TEXT NOT NULL,
+            user TEXT,
+            ts TEXT,
+            position INTEGER NOT NULL,
+            entry TEXT NOT NULL,
+            PRIMARY KEY (collection, id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_records_user_ts ON records (collection, user, ts, id);
+        CREATE INDEX IF NOT EXISTS idx_records_ts ON records (collection, ts, id);
+        CREATE INDEX IF NOT EXISTS idx_records_id ON records (id);
+        CREATE INDEX IF NOT EXISTS idx_records_position ON records (collection, position);
+        CREATE TABLE IF NOT EXISTS versions (
+            collection TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str, collection: str, legacy_paths: Optional[List[str]] = None,
+                 fsync: Optional[str] = None):
+        self.db_path = db_path
+        self.collection = collection
+        self.legacy_paths = legacy_paths or []
+        fsync = (fsync or os.getenv("CONVERSATION_FSYNC", "batch")).lower()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a commit is durable once the WAL is checkpointed; FULL fsyncs every commit
+        self._conn.execute(f"PRAGMA synchronous={'FULL' if fsync == 'always' else 'NORMAL'}")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.executescript(self.SCHEMA)
+        # Last collection version written or loaded by this process, and the connection's data_version
+        self._version = 0
+        self._seen_data_version = None
+
+    # ===== Loading and migration =====
+
+    def load(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM records WHERE collection = ?", (self.collection,)
+            ).fetchone()[0]
+            never_written = self._read_version() == 0
+        # Only a collection that was never written: an emptied one must not re-import the legacy file
+        if count == 0 and never_written:
+            self._migrate_legacy()
+
+        with self._lock:
+            self._seen_data_version = self._data_version()
+            self._version = self._read_version()
+            rows = self._conn.execute(
+                "SELECT entry FROM records WHERE collection = ? ORDER BY position", (self.collection,)
+            ).fetchall()
+        return [json.loads(entry) for (entry,) in rows]
+
+    def _migrate_legacy(self) -> None:
+        """One-time import from the JSONL log or the legacy JSON document"""
+        for path in self.legacy_paths:
+            if not os.path.exists(path):
+                continue
+            try:
+                if path.endswith(".jsonl"):
+                    legacy = JsonlStore(path, fsync="never").load()
+                else:
+                    legacy = JsonFileStore(path).load()
+            except Exception as e:
+                logger.error(f"❌ Cannot migrate {path}: {e}")
+                continue
+            if legacy:
+                self.replace(legacy)
+                logger.info(f"📦 Migrated {len(legacy)} records from {path} to {self.db_path}:{self.collection}")
+            return
+
+    # ===== Change detection between processes =====
+
+    def _data_version(self) -> int:
+        # Changes when any other connection commits to the database file
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_version(self) -> int:
+        row = self._conn.execute("SELECT version FROM versions WHERE collection = ?", (self.collection,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self) -> None:
+        """Inside a write transaction"""
+        self._conn.execute(
+            "INSERT INTO versions (collection, version) VALUES (?, 1) "
+            "ON CONFLICT (collection) DO UPDATE SET version = version + 1", (self.collection,))
+        self._version = self._read_version()
+
+    def changed_externally(self) -> bool:
+        with self._lock:
+            data_version = self._data_version()
+            if data_version == self._seen_data_version:
+                return False
+            self._seen_data_version = data_version
+            # Other collections (or our own sibling connections) may have written - compare versions
+            return self._read_version() != self._version
+
+    # ===== Writing =====
+
+    def _row(self, entry: Dict[str, Any], position: int) -> Tuple:
+        return (
+            self.collection,
+            _record_id(entry, position),
+            entry.get('user'),
+            entry.get('timestamp'),
+            position,
+            json.dumps(entry, ensure_ascii=False),
+        )
+
+    def _write(self, *statements: Tuple[str, Any]) -> None:
+        """Run statements in one IMMEDIATE transaction and bump the collection version"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                if callable(params):
+                    params = params()
+                if isinstance(params, list):
+                    self._conn.executemany(sql, params)
+                else:
+                    self._conn.execute(sql, params)
+            self._bump_version()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _next_position(self) -> int:
+        # Allocated inside the write transaction - unique across worker processes
+        return self._conn.execute(
+            "SELECT COALESCE(MAX(position), -1) + 1 FROM records WHERE collection = ?", (self.collection,)
+        ).fetchone()[0]
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._write((
+                "INSERT INTO records (collection, id, user, ts, position, entry) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (collection, id) DO UPDATE SET user = excluded.user, ts = excluded.ts, entry = excluded.entry",
+                lambda: self._row(entry, self._next_position()),
+            ))
+
+    def delete(self, record_id: str) -> None:
+        with self._lock:
+            self._write(("DELETE FROM records WHERE collection = ? AND id = ?", (self.collection, record_id)))
+
+    def replace(self, entries: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._write(
+                ("DELETE FROM records WHERE collection = ?", (self.collection,)),
+                ("INSERT OR REPLACE INTO records (collection, id, user, ts, position, entry) VALUES (?, ?, ?, ?, ?, ?)",
+                 [self._row(entry, i) for i, entry in enumerate(entries)]),
+            )
+
+    # ===== Indexed reads =====
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entry FROM records WHERE collection = ? AND id = ?", (self.collection, record_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def page(self, user: Optional[str] = None, limit: int = 20,
+             cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Newest records older than the cursor, returned oldest first, plus the next cursor"""
+        query = "SELECT entry FROM records WHERE collection = ?"
+        params: List[Any] = [self.collection]
+        if user is not None:
+            query += " AND user = ?"
+            params.append(user)
+        if cursor:
+            query += " AND (ts, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        query += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        entries = [json.loads(entry) for (entry,) in rows[:limit]]
+        entries.reverse()
+        next_cursor = encode_cursor(entries[0]) if len(rows) > limit and entries else None
+        return entries, next_cursor
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_store(json_path: str, backend: Optional[str] = None) -> RecordStore:
+    """
+    Store for a legacy JSON path.
+    CONVERSATION_STORAGE: jsonl (default), sqlite, or json (the old format).
+    With several web workers (WEB_CONCURRENCY > 1) the default is sqlite - the only shared backend.
+    """
+    default = "sqlite" if int(os.getenv("WEB_CONCURRENCY", "1") or 1) > 1 else "jsonl"
+    backend = (backend or os.getenv("CONVERSATION_STORAGE", default)).lower()
+    base, _ = os.path.splitext(json_path)
+    if backend == "json":
+        return JsonFileStore(json_path)
+    if backend == "sqlite":
+        db_path = os.getenv("CONVERSATION_DB") or os.path.join(os.path.dirname(json_path), "conversation.db")
+        collection = os.path.basename(base)
+        return SqliteStore(db_path, collection, legacy_paths=[f"{base}.jsonl", json_path])
+    return JsonlStore(f"{base}.jsonl", legacy_json_path=json_path)
@@ -0,0 +1,299 @@
+"""
+Search Index
+Full-text index (SQLite FTS5) over conversation history, archive summaries and user profiles.
+Updated incrementally by ConversationHistory listeners and profile writers.
+Every document stores a digest (content hash, or mtime:size for profile files), so the
+startup reindex (attach / index_profile_dir) only rewrites what changed since the last run.
+The database is opened on first use; the web app attaches the index at startup.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("message", "archive", "profile")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(query: str) -> str:
+    """User text -> safe FTS5 query: every word must match, words of 3+ chars match as prefixes"""
+    terms = []
+    for token in _TOKEN_RE.findall(query.lower()):
+        token = token.replace('"', '')
+        terms.append(f'"{token}"*' if len(token) >= 3 else f'"{token}"')
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """Persistent FTS5 index with BM25 ranking, snippets and per-user filtering"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS doc_keys (
+            rowid INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            digest TEXT
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+            kind UNINDEXED,
+            doc_id UNINDEXED,
+            user UNINDEXED,
+            ts UNINDEXED,
+            title,
+            body,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("SEARCH_INDEX_DB", "memory/search_index.db")
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._available: Optional[bool] = None
+
+    @property
+    def available(self) -> bool:
+        """False if the index cannot be used; opens the database on first access"""
+        if self._available is None:
+            with self._lock:
+                if self._available is None:
+                    self._open()
+        return self._available
+
+    def _open(self) -> None:
+        try:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(doc_keys)")}
+            if "digest" not in columns:
+                # Index built before digests: every document is rewritten once on the next attach
+                self._conn.execute("ALTER TABLE doc_keys ADD COLUMN digest TEXT")
+            self._available = True
+        except sqlite3.Error as e:
+            # Например, SQLite собран без FTS5
+            logger.error(f"❌ Search index unavailable: {e}")
+            self._available = False
+
+    # ===== Writing =====
+
+    @staticmethod
+    def _digest(doc: tuple) -> str:
+        return hashlib.sha1(json.dumps(doc, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _upsert(self, doc: tuple, digest: Optional[str]) -> None:
+        kind, doc_id, user, ts, title, body = doc
+        key = f"{kind}:{doc_id}"
+        self._conn.execute(
+            "INSERT INTO doc_keys (key, digest) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET digest = excluded.digest",
+            (key, digest),
+        )
+        rowid = self._conn.execute("SELECT rowid FROM doc_keys WHERE key = ?", (key,)).fetchone()[0]
+        self._conn.execute("DELETE FROM docs WHERE rowid = ?", (rowid,))
+        self._conn.execute(
+            "INSERT INTO docs (rowid, kind, doc_id, user, ts, title, body) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (rowid, kind, doc_id, user, ts, title, body),
+        )
+
+    def _stored_digests(self, kind: str) -> Dict[str, Optional[str]]:
+        """doc_id -> digest of every indexed document of one kind"""
+        prefix = f"{kind}:"
+        with self._lock:
+            rows = self._conn.execute("SELECT key, digest FROM doc_keys WHERE key >= ? AND key < ?",
+                                      (prefix, f"{kind};")).fetchall()
+        return {key[len(prefix):]: digest for key, digest in rows}
+
+    def _write(self, docs: Iterable[tuple], only_changed: bool = False) -> int:
+        """Upsert docs (with their digests); only_changed skips documents whose digest is unchanged"""
+        if not self.available:
+            return 0
+        pending = [(doc, self._digest(doc)) for doc in docs]
+        if only_changed and pending:
+            stored = self._stored_digests(pending[0][0][0])
+            pending = [(doc, digest) for doc, digest in pending if stored.get(doc[1]) != digest]
+        return self._write_digested(pending)
+
+    def _write_digested(self, pending: List[tuple]) -> int:
+        if not pending:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for doc, digest in pending:
+                    self._upsert(doc, digest)
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                logger.error(f"❌ Search index write failed: {e}")
+                return 0
+        return len(pending)
+
+    @staticmethod
+    def _message_doc(entry: Dict[str, Any]) -> tuple:
+        body = f"{entry.get('message', '')}\n{entry.get('ai_response', '')}"
+        return ("message", entry.get('id'), entry.get('user'), entry.get('timestamp'), entry.get('user') or "", body)
+
+    @staticmethod
+    def _archive_doc(entry: Dict[str, Any]) -> tuple:
+        topics = " ".join(entry.get('key_topics') or [])
+        return ("archive", entry.get('id'), None, entry.get('timestamp'), topics, entry.get('summary', ''))
+
+    @staticmethod
+    def _profile_doc(username: str, profile: Dict[str, Any]) -> tuple:
+        parts = []
+        for key, value in profile.items():
+            if key in ("created_at", "last_updated"):
+                continue
+            if isinstance(value, str):
+                parts.append(value)
+            elif isinstance(value, (list, dict)):
+                parts.append(json.dumps(value, ensure_ascii=False))
+        title = profile.get('full_name') or username
+        return ("profile", username, username, profile.get('last_updated'), title, "\n".join(parts))
+
+    def index_messages(self, entries: Iterable[Dict[str, Any]], only_changed: bool = False) -> int:
+        return self._write((self._message_doc(e) for e in entries if e.get('id')), only_changed)
+
+    def index_archives(self, entries: Iterable[Dict[str, Any]], only_changed: bool = False) -> int:
+        return self._write((self._archive_doc(e) for e in entries if e.get('id')), only_changed)
+
+    def index_profile(self, username: str, profile: Dict[str, Any], checkpoint: Optional[str] = None) -> None:
+        """checkpoint - 'mtime_ns:size' of the profile file, lets index_profile_dir skip it next time"""
+        if self.available:
+            self._write_digested([(self._profile_doc(username, profile), checkpoint)])
+
+    def remove(self, kind: str, doc_id: str) -> None:
+        if not self.available:
+            return
+        key = f"{kind}:{doc_id}"
+        with self._lock:
+            row = self._conn.execute("SELECT rowid FROM doc_keys WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM docs WHERE rowid = ?", (row[0],))
+                self._conn.execute("DELETE FROM doc_keys WHERE rowid = ?", (row[0],))
+
+    # ===== Incremental updates =====
+
+    def attach(self, history) -> None:
+        """Index history/archive records changed since the last run and follow ConversationHistory changes"""
+        started = time.perf_counter()
+        written = self.index_messages(history.get_full_history(), only_changed=True)
+        written += self.index_archives(history.archive, only_changed=True)
+        history.add_listener(self._on_history_event)
+        if written:
+            logger.info(f"🔍 Search index: reindexed {written} changed records in "
+                        f"{time.perf_counter() - started:.1f}s")
+
+    def _on_history_event(self, event: str, entry: Optional[Dict[str, Any]] = None) -> None:
+        if entry is None:
+            return
+        if event in ("message", "edit"):
+            self.index_messages([entry])
+        elif event == "delete":
+            self.remove("message", entry.get('id'))
+        elif event == "archive":
+            self.index_archives([entry])
+        elif event == "archive_delete":
+            self.remove("archive", entry.get('id'))
+
+    def index_profile_dir(self, profile_dir: str = "memory/user_profiles") -> int:
+        """(Re)index profile files modified since they were last indexed"""
+        if not os.path.isdir(profile_dir) or not self.available:
+            return 0
+        stored = self._stored_digests("profile")
+        written = 0
+        for filename in os.listdir(profile_dir):
+            if not filename.endswith(".json") or filename.endswith("_insights.json"):
+                continue
+            path = os.path.join(profile_dir, filename)
+            try:
+                stat = os.stat(path)
+                checkpoint = f"{stat.st_mtime_ns}:{stat.st_size}"
+                if stored.get(filename[:-5]) == checkpoint:
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    profile = json.load(f)
+                if isinstance(profile, dict):
+                    self.index_profile(filename[:-5], profile, checkpoint)
+                    written += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Cannot index profile {filename}: {e}")
+        return written
+
+    # ===== Search =====
+
+    def search(self, query: str, user: Optional[str] = None, kinds: Optional[Iterable[str]] = None,
+               limit: int = 10) -> Dict[str, Any]:
+        """Ranked (BM25) search with highlighted snippets"""
+        started = time.perf_counter()
+        match = build_match_query(query)
+        if not self.available or not match:
+            return {"query": query, "results": [], "took_ms": 0.0}
+
+        sql = (
+            "SELECT kind, doc_id, user, ts, title, "
+            "snippet(docs, 5, '[', ']', '…', 16) AS snip, bm25(docs, 2.0, 1.0) AS score "
+            "FROM docs WHERE docs MATCH ?"
+        )
+        params: List[Any] = [match]
+        if user:
+            sql += " AND user = ?"
+            params.append(user)
+        kinds = [k for k in (kinds or []) if k in KINDS]
+        if kinds:
+            sql += f" AND kind IN ({','.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(int(limit))
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = [
+            {
+                "kind": kind,
+                "id": doc_id,
+                "user": doc_user,
+                "timestamp": ts,
+                "title": title,
+                "snippet": snip,
+                "score": round(-score, 4),
+            }
+            for kind, doc_id, doc_user, ts, title, snip, score in rows
+        ]
+        return {"query": query, "results": results, "took_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def format_results(self, query: str, user: Optional[str] = None, limit: int = 10) -> str:
+        """Human/LLM readable search results"""
+        found = self.search(query, user=user, limit=limit)
+        if not found["results"]:
+            scope = f" in {user}'s data" if user else ""
+            return f"🔍 No matches found for '{query}'{scope}"
+        lines = [f"🔍 Search results for '{query}' ({len(found['results'])}, {found['took_ms']} ms):"]
+        for r in found["results"]:
+            who = f" {r['user']}" if r["user"] else ""
+            when = f" {str(r['timestamp'])[:16]}" if r["timestamp"] else ""
+            lines.append(f"- [{r['kind']}{who}{when}] {r['snippet']}")
+        return "\n".join(lines)
+
+    def get_stats(self) -> Dict[str, Any]:
+        if not self.available:
+            return {"available": False}
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT kind, COUNT(*) FROM docs GROUP BY kind").fetchall())
+        return {"available": True, "documents": counts}
+
+
+# Global instance; the web app attaches it to the global conversation history at startup
+search_index = SearchIndex()
@@ -1,23 +1,224 @@
+import copy
 import json
 import os
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _index_profile(username: str, profile_data: Dict[str, Any], checkpoint: Optional[str] = None) -> None:
+    """Keep the full-text search index in sync with profile files (checkpoint - 'mtime_ns:size')"""
+    try:
+        from memory.search_index import search_index
+        search_index.index_profile(username, profile_data, checkpoint)
+    except Exception as e:
+        logger.warning(f"Search index update failed for {username}: {e}")
+
+
+def _is_profile_file(filename: str) -> bool:
+    """Main profile files only (skip insights, relationships, temp files)"""
+    return (filename.endswith(".json") and not filename.endswith("_insights.json")
+            and not filename.startswith("relationship_"))
+
+
+@dataclass
+class _CachedProfile:
+    profile: Dict[str, Any]
+    mtime_ns: int
+    size: int
+    checked_at: float
+
+
+class ProfileRepository:
+    """
+    Process-wide profile cache for one profile directory.
+    Entries are validated by (mtime, size) at most once per revalidate interval,
+    so hot-path lookups do no I/O; writes through save() update the cache directly.
+    """
+
+    def __init__(self, profile_dir: str, revalidate_seconds: Optional[float] = None):
+        self.profile_dir = str(profile_dir)
+        self.revalidate_seconds = (revalidate_seconds if revalidate_seconds is not None
+                                   else float(os.getenv("PROFILE_CACHE_REVALIDATE_SECONDS", "1.0")))
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._entries: Dict[str, _CachedProfile] = {}
+        self._usernames: Optional[List[str]] = None
+        self._dir_mtime_ns = 0
+        self._dir_checked_at = 0.0
+        self._context: Optional[str] = None
+        self._context_signature: Optional[Tuple] = None
+        self._context_checked_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "revalidations": 0, "writes": 0}
+        self._listeners: List[Callable[[str, str], None]] = []
+
+    def add_listener(self, callback: Callable[[str, str], None]) -> None:
+        """Subscribe to profile writes: callback(event, username), event is 'save' or 'delete'"""
+        self._listeners.append(callback)
+
+    def _notify(self, event: str, username: str) -> None:
+        for callback in self._listeners:
+            try:
+                callback(event, username)
+            except Exception as e:
+                logger.error(f"Error in profile repository listener: {e}")
+
+    def _path(self, username: str) -> str:
+        return os.path.join(self.profile_dir, f"{username}.json")
+
+    def _read(self, username: str) -> Optional[_CachedProfile]:
+        path = self._path(username)
+        try:
+            stat = os.stat(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+        except FileNotFoundError:
+            self._entries.pop(username, None)
+            return None
+        entry = _CachedProfile(profile, stat.st_mtime_ns, stat.st_size, time.monotonic())
+        self._entries[username] = entry
+        return entry
+
+    def _lookup(self, username: str) -> Optional[_CachedProfile]:
+        with self._lock:
+            entry = self._entries.get(username)
+            now = time.monotonic()
+            if entry is not None:
+                if now - entry.checked_at < self.revalidate_seconds:
+                    self.stats["hits"] += 1
+                    return entry
+                try:
+                    stat = os.stat(self._path(username))
+                except FileNotFoundError:
+                    self._entries.pop(username, None)
+                    return None
+                if (stat.st_mtime_ns, stat.st_size) == (entry.mtime_ns, entry.size):
+                    entry.checked_at = now
+                    self.stats["revalidations"] += 1
+                    return entry
+            # Not cached yet or changed on disk by someone else
+            self.stats["misses"] += 1
+            return self._read(username)
+
+    def exists(self, username: str) -> bool:
+        return self._lookup(username) is not None
+
+    def get(self, username: str) -> Dict[str, Any]:
+        """Profile dict (a copy - callers are free to mutate it), {} if missing"""
+        entry = self._lookup(username)
+        return copy.deepcopy(entry.profile) if entry else {}
+
+    def save(self, username: str, profile: Dict[str, Any]) -> None:
+        """Atomically write the profile and update the cache"""
+        path = self._path(username)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(profile, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            stat = os.stat(path)
+            self._entries[username] = _CachedProfile(copy.deepcopy(profile), stat.st_mtime_ns, stat.st_size,
+                                                     time.monotonic())
+            if self._usernames is not None and username not in self._usernames:
+                self._usernames.append(username)
+            self._context = None
+            self.stats["writes"] += 1
+        _index_profile(username, profile, f"{stat.st_mtime_ns}:{stat.st_size}")
+        self._notify("save", username)
+
+    def delete(self, username: str) -> None:
+        with self._lock:
+            try:
+                os.remove(self._path(username))
+            except FileNotFoundError:
+                pass
+            self.invalidate(username)
+        self._notify("delete", username)
+
+    def invalidate(self, username: Optional[str] = None) -> None:
+        """Drop cached entries (all of them if username is None)"""
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(username, None)
+            self._usernames = None
+            self._context = None
+
+    def list_usernames(self) -> List[str]:
+        """Usernames with a profile file; the listing is redone only when the directory changes"""
+        with self._lock:
+            now = time.monotonic()
+            if self._usernames is not None and now - self._dir_checked_at < self.revalidate_seconds:
+                return list(self._usernames)
+            try:
+                dir_mtime_ns = os.stat(self.profile_dir).st_mtime_ns
+            except FileNotFoundError:
+                return []
+            if self._usernames is None or dir_mtime_ns != self._dir_mtime_ns:
+                self._usernames = sorted(f[:-5] for f in os.listdir(self.profile_dir) if _is_profile_file(f))
+                self._dir_mtime_ns = dir_mtime_ns
+            self._dir_checked_at = now
+            return list(self._usernames)
+
+    def multi_user_context(self) -> str:
+        """Precomputed one-line-per-user summary, rebuilt only when a profile changes"""
+        with self._lock:
+            now = time.monotonic()
+            if self._context is not None and now - self._context_checked_at < self.revalidate_seconds:
+                return self._context
+            entries = [(username, self._lookup(username)) for username in self.list_usernames()]
+            entries = [(username, entry) for username, entry in entries if entry is not None]
+            signature = tuple((username, entry.mtime_ns, entry.size) for username, entry in entries)
+            if self._context is None or signature != self._context_signature:
+                lines = []
+                for username, entry in entries:
+                    name = entry.profile.get('full_name', username)
+                    last_updated = entry.profile.get('last_updated', 'unknown')
+                    lines.append(f"👤 {name} ({username}): updated {last_updated}")
+                self._context = "Multi-user context:\n" + "\n".join(lines) if lines else "No user profiles found"
+                self._context_signature = signature
+            self._context_checked_at = now
+            return self._context
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "cached_profiles": len(self._entries)}
+
+
+_repositories: Dict[str, ProfileRepository] = {}
+_repositories_lock = threading.Lock()
+
+
+def get_profile_repository(profile_dir: Any = "memory/user_profiles") -> ProfileRepository:
+    """Shared repository per profile directory (relative and absolute paths map to the same one)"""
+    key = os.path.abspath(str(profile_dir))
+    repository = _repositories.get(key)
+    if repository is None:
+        with _repositories_lock:
+            repository = _repositories.get(key)
+            if repository is None:
+                repository = _repositories[key] = ProfileRepository(str(profile_dir))
+    return repository
+
+
 class SimpleUserProfile:
     """Simple user profile - one file per user"""
     
     def __init__(self, username: str, profile_dir: Path = None):
         self.username = username
         self.profile_dir = profile_dir or Path("memory/user_profiles")
-        self.profile_dir.mkdir(parents=True, exist_ok=True)
         self.profile_file = self.profile_dir / f"{username}.json"
+        self._repository = get_profile_repository(self.profile_dir)
         
         # Initialize profile if doesn't exist
-        if not self.profile_file.exists():
+        if not self._repository.exists(username):
             self._create_default_profile()
     
     def _create_default_profile(self):
@@ -34,10 +235,9 @@ class SimpleUserProfile:
         self._save_profile(default_profile)
     
     def _load_profile(self) -> Dict[str, Any]:
-        """Load profile from file"""
+        """Load profile (cached)"""
         try:
-            with open(self.profile_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self._repository.get(self.username)
         except Exception as e:
             print(f"Error loading profile for {self.username}: {e}")
             return {}
@@ -46,8 +246,7 @@ class SimpleUserProfile:
         """Save profile to file"""
         try:
             profile_data["last_updated"] = datetime.now().isoformat()
-            with open(self.profile_file, 'w', encoding='utf-8') as f:
-                json.dump(profile_data, f, indent=2, ensure_ascii=False)
+            self._repository.save(self.username, profile_data)
         except Exception as e:
             print(f"Error saving profile for {self.username}: {e}")
     
@@ -79,16 +278,13 @@ class UserProfile:
     
     def __init__(self, username: str):
         self.username = username
+        self._repository = get_profile_repository()
         self._ensure_files_exist()
     
     def _ensure_files_exist(self):
         """Ensure all necessary files exist"""
-        # Create directory if it doesn't exist
-        os.makedirs("memory/user_profiles", exist_ok=True)
-        
-        # Initialize profile file
-        profile_file = f"memory/user_profiles/{self.username}.json"
-        if not os.path.exists(profile_file):
+        # Initialize profile file (the repository creates the directory)
+        if not self._repository.exists(self.username):
             default_profile = {
                 "username": self.username,
                 "created_at": datetime.now().isoformat(),
@@ -105,18 +301,16 @@ class UserProfile:
         """Save profile to file"""
         try:
             profile_data["last_updated"] = datetime.now().isoformat()
-            with open(f"memory/user_profiles/{self.username}.json", 'w', encoding='utf-8') as f:
-                json.dump(profile_data, f, indent=2, ensure_ascii=False)
+            self._repository.save(self.username, profile_data)
         except Exception as e:
             logger.error(f"Error saving profile for {self.username}: {e}")
     
 
     
     def _load_profile(self) -> Dict[str, Any]:
-        """Load profile from file"""
+        """Load profile (cached)"""
         try:
-            with open(f"memory/user_profiles/{self.username}.json", 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self._repository.get(self.username)
         except Exception as e:
             logger.error(f"Error loading profile for {self.username}: {e}")
             return {}
@@ -201,8 +395,7 @@ class UserProfileManager:
     def get_user_profile(self, username: str) -> Optional[SimpleUserProfile]:
         """Get user profile by username"""
         try:
-            profile_file = self.profile_dir / f"{username}.json"
-            if profile_file.exists():
+            if get_profile_repository(self.profile_dir).exists(username):
                 return SimpleUserProfile(username, self.profile_dir)
             return None
         except Exception as e:
@@ -213,14 +406,12 @@ class UserProfileManager:
         """Get all user profiles"""
         profiles = {}
         try:
-            for profile_file in self.profile_dir.glob("*.json"):
-                # Only process main profile files, skip emotions, insights, etc.
-                if (not profile_file.name.endswith(("_insights.json")) and 
-                    not profile_file.name.startswith("relationship_")):
-                    username = profile_file.stem
-                    profile = self.get_user_profile(username)
-                    if profile:
-                        profiles[username] = profile.get_profile()
+            repository = get_profile_repository(self.profile_dir)
+            # Only main profile files, skip emotions, insights, etc.
+            for username in repository.list_usernames():
+                profile = repository.get(username)
+                if profile:
+                    profiles[username] = profile
         except Exception as e:
             print(f"Error getting all profiles: {e}")
         return profiles
@@ -242,9 +433,7 @@ class UserProfileManager:
         """Delete user profile and all associated files"""
         try:
             # Delete main profile
-            profile_file = self.profile_dir / f"{username}.json"
-            if profile_file.exists():
-                profile_file.unlink()
+            get_profile_repository(self.profile_dir).delete(username)
             
 
             
@@ -0,0 +1,583 @@
+"""
+Vector Memory
+Offline semantic memory: pluggable embedders, float32 vectors in a memory-mapped
+matrix, batched dot-product top-k search and an IVF index for large corpora.
+
+Files in the store directory:
+- vectors.f32  - row-major float32 matrix (capacity x dim), memory-mapped
+- items.jsonl  - one record per row (written after the vector, so it acts as the commit marker)
+- meta.json    - embedder name and dimension (a mismatch triggers re-embedding)
+
+Dead rows (edited or removed records) are reclaimed by compaction: live rows are copied into
+*.compact files, compact.commit marks them complete and the files then replace the originals
+(an interrupted swap is finished on the next load).
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+MAX_EMBED_CHARS = 4000
+
+
+# ===== Embedders =====
+
+class Embedder(ABC):
+    """Text -> L2-normalized float32 vectors"""
+
+    name = "base"
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32 matrix"""
+
+
+class HashingEmbedder(Embedder):
+    """
+    Feature hashing of words and character n-grams (no model, no network).
+    Similar wording -> similar vectors; good enough for recalling past conversations.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512, ngram_range: tuple = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self._word_features = lru_cache(maxsize=100_000)(self._hash_word)
+
+    def _hash_word(self, word: str) -> tuple:
+        features = [zlib.crc32(word.encode("utf-8"))]
+        padded = f" {word} "
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                features.append(zlib.crc32(padded[i:i + n].encode("utf-8")) ^ 0x5BD1E995)
+        return tuple(features)
+
+    def _features(self, text: str) -> List[int]:
+        features: List[int] = []
+        for word in _WORD_RE.findall(text.lower()[:MAX_EMBED_CHARS]):
+            features.extend(self._word_features(word))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter(self._features(text or ""), dtype=np.uint32)
+            if hashes.size == 0:
+                continue
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            vector = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim).astype(np.float32)
+            # Sublinear term frequency: long texts are not dominated by repeated words
+            vector = np.sign(vector) * np.log1p(np.abs(vector))
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                matrix[row] = vector / norm
+        return matrix
+
+
+EMBEDDERS: Dict[str, Callable[[], Embedder]] = {
+    "hashing": HashingEmbedder,
+}
+
+
+def register_embedder(name: str, factory: Callable[[], Embedder]) -> None:
+    """Register an embedder factory (e.g. a local sentence-transformer) under VECTOR_EMBEDDER=<name>"""
+    EMBEDDERS[name] = factory
+
+
+def get_embedder(name: Optional[str] = None) -> Embedder:
+    name = name or os.getenv("VECTOR_EMBEDDER", "hashing")
+    factory = EMBEDDERS.get(name)
+    if factory is None:
+        logger.warning(f"⚠️ Unknown embedder '{name}', using hashing")
+        factory = HashingEmbedder
+    return factory()
+
+
+# ===== Store =====
+
+def _belongs_to(item: Dict[str, Any], user: str) -> bool:
+    """A message belongs to its author; an archive summary to every user of the archived period"""
+    meta = item.get("meta") or {}
+    return meta.get("user") == user or user in (meta.get("users") or ())
+
+
+def default_directory() -> str:
+    """
+    VECTOR_MEMORY_DIR or guardian_sandbox/vector_memory. The memory-mapped file cannot be
+    shared between processes, so with several web workers each one keeps its own copy
+    (filled from the shared history on attach and kept current by history sync events).
+    """
+    directory = os.getenv("VECTOR_MEMORY_DIR", "guardian_sandbox/vector_memory")
+    if int(os.getenv("WEB_CONCURRENCY", "1") or 1) > 1:
+        from ai_client.utils.workers import worker_path
+        directory = worker_path(directory)
+    return directory
+
+
+class VectorStore:
+    """Memory-mapped vector store with exact (batched) or IVF top-k search"""
+
+    INITIAL_CAPACITY = 1024
+    BATCH_ROWS = 65536
+
+    def __init__(self, directory: Optional[str] = None, embedder: Optional[Embedder] = None,
+                 ivf_threshold: Optional[int] = None, nprobe: int = 8, compact_min_dead: Optional[int] = None):
+        self.directory = directory or default_directory()
+        self.embedder = embedder or get_embedder()
+        self.dim = self.embedder.dim
+        self.ivf_threshold = ivf_threshold or int(os.getenv("VECTOR_IVF_THRESHOLD", "50000"))
+        self.nprobe = nprobe
+        # Compact once dead rows outnumber live ones (and there are at least this many)
+        self.compact_min_dead = compact_min_dead or int(os.getenv("VECTOR_COMPACT_MIN_DEAD", "1024"))
+
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._items_path = os.path.join(self.directory, "items.jsonl")
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._commit_path = os.path.join(self.directory, "compact.commit")
+
+        self._lock = threading.RLock()
+        self._matrix: Optional[np.memmap] = None
+        self._capacity = 0
+        self._count = 0
+        self._items: List[Optional[Dict[str, Any]]] = []
+        self._by_id: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+
+        # IVF: centroids + inverted lists of rows; rows added after training go to the nearest list
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._assigned = 0
+        self._trained_on = 0
+        self._training = False
+        self._loaded = False
+
+    # ===== Files =====
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._finish_compaction()
+            items = []
+            if os.path.exists(self._items_path):
+                with open(self._items_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            items.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            logger.warning(f"⚠️ Skipping corrupt vector record in {self._items_path}")
+            meta = {}
+            if os.path.exists(self._meta_path):
+                with open(self._meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+
+            reembed = bool(meta) and (meta.get("embedder") != self.embedder.name or meta.get("dim") != self.dim)
+            if reembed or not meta:
+                self._reset_files()
+            else:
+                self._open_matrix(max(self.INITIAL_CAPACITY, len(items)))
+
+            self._loaded = True
+            if reembed:
+                logger.info(f"🧠 Embedder changed ({meta.get('embedder')}/{meta.get('dim')} -> "
+                            f"{self.embedder.name}/{self.dim}), re-embedding {len(items)} records")
+                live = {}
+                for record in items:
+                    if record.get("op") == "del":
+                        live.pop(record["id"], None)
+                    else:
+                        live[record["id"]] = record
+                self.add_many(list(live.values()))
+                return
+
+            for record in items:
+                if record.get("op") == "del":
+                    row = self._by_id.pop(record["id"], None)
+                    if row is not None:
+                        self._alive[row] = False
+                        self._items[row] = None
+                    continue
+                row = record["row"]
+                if row >= self._capacity:
+                    # Vector write did not reach the disk - ignore the record
+                    continue
+                self._track(row, record)
+            logger.info(f"🧠 Vector memory loaded: {len(self._by_id)} vectors ({self.embedder.name}, dim {self.dim})")
+
+    def _reset_files(self) -> None:
+        for path in (self._vectors_path, self._items_path):
+            if os.path.exists(path):
+                os.remove(path)
+        with open(self._meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"embedder": self.embedder.name, "dim": self.dim}, f)
+        self._matrix = None
+        self._capacity = 0
+        self._count = 0
+        self._items = []
+        self._by_id = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._centroids = None
+        self._lists = []
+        self._assigned = 0
+        self._trained_on = 0
+        self._open_matrix(self.INITIAL_CAPACITY)
+
+    def _open_matrix(self, capacity: int) -> None:
+        """(Re)map the vectors file with at least `capacity` rows"""
+        row_bytes = self.dim * 4
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        capacity = max(capacity, size // row_bytes)
+        if size < capacity * row_bytes:
+            with open(self._vectors_path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        if self._matrix is not None:
+            self._matrix.flush()
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self._capacity = capacity
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive[:capacity]
+        self._alive = alive
+
+    def _track(self, row: int, record: Dict[str, Any]) -> None:
+        previous = self._by_id.get(record["id"])
+        if previous is not None and previous != row:
+            self._alive[previous] = False
+            self._items[previous] = None
+        while len(self._items) <= row:
+            self._items.append(None)
+        self._items[row] = record
+        self._by_id[record["id"]] = row
+        self._alive[row] = True
+        self._count = max(self._count, row + 1)
+
+    # ===== Writing =====
+
+    def add(self, text: str, label: str = "general", doc_id: Optional[str] = None,
+            meta: Optional[Dict[str, Any]] = None) -> str:
+        doc_id = doc_id or f"vec_{time.time_ns()}"
+        self.add_many([{"id": doc_id, "text": text, "label": label, "meta": meta or {}}])
+        return doc_id
+
+    def add_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Embed and store records {"id", "text", "label", "meta"}. Every record gets a fresh row, so it
+        is assigned to the IVF list of its new vector; the row of a previous version becomes dead
+        (reclaimed by compaction).
+        """
+        records = [r for r in records if r.get("text")]
+        if not records:
+            return 0
+        self._ensure_loaded()
+        vectors = self.embedder.embed([r["text"] for r in records])
+        with self._lock:
+            lines = []
+            for record, vector in zip(records, vectors):
+                row = self._count
+                if row >= self._capacity:
+                    self._open_matrix(self._capacity * 2)
+                self._matrix[row] = vector
+                stored = {
+                    "id": record["id"],
+                    "row": row,
+                    "text": record["text"],
+                    "label": record.get("label", "general"),
+                    "meta": record.get("meta") or {},
+                    "timestamp": record.get("timestamp") or time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                self._track(row, stored)
+                if self._centroids is not None and row >= self._assigned:
+                    self._lists[int(np.argmax(self._centroids @ vector))].append(row)
+                    self._assigned = row + 1
+                lines.append(json.dumps(stored, ensure_ascii=False) + "\n")
+            self._matrix.flush()
+            with open(self._items_path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+            self._maybe_compact()
+            self._maybe_train()
+        return len(records)
+
+    def remove(self, doc_id: str) -> bool:
+        self._ensure_loaded()
+        with self._lock:
+            row = self._by_id.pop(doc_id, None)
+            if row is None:
+                return False
+            self._alive[row] = False
+            self._items[row] = None
+            with open(self._items_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"op": "del", "id": doc_id}) + "\n")
+            self._maybe_compact()
+        return True
+
+    def clear(self) -> None:
+        self._ensure_loaded()
+        with self._lock:
+            self._matrix = None
+            self._reset_files()
+        logger.info("🧹 Vector memory cleared")
+
+    # ===== Compaction =====
+
+    def _finish_compaction(self) -> None:
+        """Complete a swap interrupted after the commit marker, or drop unfinished compacted files"""
+        pairs = [(path + ".compact", path) for path in (self._vectors_path, self._items_path)]
+        committed = os.path.exists(self._commit_path)
+        for compacted, path in pairs:
+            if os.path.exists(compacted):
+                if committed:
+                    os.replace(compacted, path)
+                else:
+                    os.remove(compacted)
+        if committed:
+            os.remove(self._commit_path)
+
+    def _maybe_compact(self) -> None:
+        dead = self._count - len(self._by_id)
+        if dead >= self.compact_min_dead and dead > len(self._by_id) and not self._training:
+            self.compact()
+
+    def compact(self) -> int:
+        """Rewrite the vectors and items files with live rows only; returns the number of rows reclaimed"""
+        self._ensure_loaded()
+        with self._lock:
+            if self._training:
+                return 0
+            started = time.perf_counter()
+            live = np.flatnonzero(self._alive[:self._count])
+            reclaimed = self._count - len(live)
+            if reclaimed == 0:
+                return 0
+
+            vectors_tmp, items_tmp = self._vectors_path + ".compact", self._items_path + ".compact"
+            items: List[Optional[Dict[str, Any]]] = []
+            with open(vectors_tmp, 'wb') as f:
+                for start in range(0, len(live), self.BATCH_ROWS):
+                    f.write(np.ascontiguousarray(self._matrix[live[start:start + self.BATCH_ROWS]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(items_tmp, 'w', encoding='utf-8') as f:
+                for new_row, row in enumerate(live):
+                    record = {**self._items[row], "row": new_row}
+                    items.append(record)
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._commit_path, 'w') as f:
+                f.write(str(len(live)))
+
+            self._matrix.flush()
+            self._matrix = None
+            self._finish_compaction()
+
+            remap = np.full(self._count, -1, dtype=np.int64)
+            remap[live] = np.arange(len(live))
+            self._items = items
+            self._by_id = {record["id"]: row for row, record in enumerate(items)}
+            self._count = len(live)
+            self._alive = np.ones(len(live), dtype=bool)
+            self._open_matrix(max(self.INITIAL_CAPACITY, len(live)))
+            if self._centroids is not None:
+                self._lists = [[int(remap[row]) for row in rows if remap[row] >= 0] for rows in self._lists]
+                self._assigned = self._count
+        logger.info(f"🧠 Vector memory compacted: {reclaimed} dead rows reclaimed, {len(live)} kept "
+                    f"in {time.perf_counter() - started:.1f}s")
+        return reclaimed
+
+    # ===== IVF index =====
+
+    def _maybe_train(self) -> None:
+        alive = len(self._by_id)
+        if self._training or alive < self.ivf_threshold or alive < 2 * self._trained_on:
+            return
+        self._training = True
+        threading.Thread(target=self._train_ivf, name="vector_ivf", daemon=True).start()
+
+    def _train_ivf(self, iterations: int = 8) -> None:
+        """Spherical k-means on a sample, then assign every row to its nearest centroid"""
+        try:
+            started = time.perf_counter()
+            with self._lock:
+                count = self._count
+                rows = np.flatnonzero(self._alive[:count])
+            nlist = max(1, int(np.sqrt(len(rows))))
+            rng = np.random.default_rng(0)
+            sample = np.asarray(self._matrix[np.sort(rng.choice(rows, size=min(len(rows), nlist * 40), replace=False))])
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+            lists: List[List[int]] = [[] for _ in range(nlist)]
+            for start in range(0, count, self.BATCH_ROWS):
+                block = np.asarray(self._matrix[start:min(start + self.BATCH_ROWS, count)])
+                for offset, centroid in enumerate(np.argmax(block @ centroids.T, axis=1)):
+                    lists[centroid].append(start + offset)
+
+            with self._lock:
+                # Rows added while training are assigned here
+                for row in range(count, self._count):
+                    lists[int(np.argmax(centroids @ self._matrix[row]))].append(row)
+                self._centroids = centroids.astype(np.float32)
+                self._lists = lists
+                self._assigned = self._count
+                self._trained_on = len(rows)
+            logger.info(f"🧠 IVF index built: {nlist} lists over {len(rows)} vectors "
+                        f"in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"❌ IVF training failed: {e}")
+        finally:
+            self._training = False
+
+    # ===== Search =====
+
+    def _candidate_rows(self, query_vector: np.ndarray) -> Optional[np.ndarray]:
+        if self._centroids is None:
+            return None
+        nearest = np.argsort(-(self._centroids @ query_vector))[:self.nprobe]
+        return np.fromiter((row for c in nearest for row in self._lists[c]), dtype=np.int64)
+
+    def search(self, query: str, top_k: int = 5, label: Optional[str] = None, user: Optional[str] = None,
+               min_score: float = 0.0, exclude_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Top-k records by cosine similarity, best first"""
+        self._ensure_loaded()
+        if not query or not self._by_id:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        exclude = set(exclude_ids or ())
+        # Over-fetch so that filtered-out rows do not starve the result
+        fetch = top_k + len(exclude) + (top_k * 4 if label or user else 0)
+
+        with self._lock:
+            count = self._count
+            candidates = self._candidate_rows(query_vector)
+            if candidates is not None:
+                blocks = [candidates[i:i + self.BATCH_ROWS] for i in range(0, len(candidates), self.BATCH_ROWS)]
+            else:
+                blocks = [np.arange(s, min(s + self.BATCH_ROWS, count)) for s in range(0, count, self.BATCH_ROWS)]
+
+            best_rows = np.zeros(0, dtype=np.int64)
+            best_scores = np.zeros(0, dtype=np.float32)
+            for rows in blocks:
+                if candidates is None:
+                    scores = self._matrix[rows[0]:rows[-1] + 1] @ query_vector
+                else:
+                    scores = self._matrix[rows] @ query_vector
+                scores = np.where(self._alive[rows], scores, -np.inf)
+                rows = np.concatenate([best_rows, rows])
+                scores = np.concatenate([best_scores, scores])
+                if len(scores) > fetch:
+                    keep = np.argpartition(-scores, fetch)[:fetch]
+                    rows, scores = rows[keep], scores[keep]
+                best_rows, best_scores = rows, scores
+
+            results = []
+            for i in np.argsort(-best_scores):
+                score = float(best_scores[i])
+                if score < min_score or score == -np.inf:
+                    break
+                item = self._items[int(best_rows[i])]
+                if item is None or item["id"] in exclude:
+                    continue
+                if label and item.get("label") != label:
+                    continue
+                if user and not _belongs_to(item, user):
+                    continue
+                results.append({**item, "score": round(score, 4)})
+                if len(results) >= top_k:
+                    break
+        return results
+
+    # ===== Conversation history =====
+
+    @staticmethod
+    def _message_record(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": entry['id'],
+            "text": f"{entry.get('user', '')}: {entry.get('message', '')}\nAI: {entry.get('ai_response', '')}",
+            "label": "conversation",
+            "meta": {"user": entry.get('user'), "timestamp": entry.get('timestamp')},
+            "timestamp": entry.get('timestamp'),
+        }
+
+    @staticmethod
+    def _archive_record(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": entry['id'],
+            "text": entry.get('summary', ''),
+            "label": "archive",
+            "meta": {"period_start": entry.get('period_start'), "period_end": entry.get('period_end'),
+                     "users": sorted(entry.get('user_activity') or {})},
+            "timestamp": entry.get('timestamp'),
+        }
+
+    def attach(self, history) -> None:
+        """Embed messages/archive summaries not stored yet, then follow history changes"""
+        self._ensure_loaded()
+        missing = [self._message_record(e) for e in history.get_full_history()
+                   if e.get('id') and e['id'] not in self._by_id]
+        missing += [self._archive_record(e) for e in history.archive
+                    if e.get('id') and e['id'] not in self._by_id]
+        if missing:
+            self.add_many(missing)
+            logger.info(f"🧠 Vector memory: embedded {len(missing)} history records")
+        history.add_listener(self._on_history_event)
+
+    def _on_history_event(self, event: str, entry: Optional[Dict[str, Any]] = None) -> None:
+        # Archived messages stay in vector memory - that is what makes them retrievable later
+        if entry is None or not entry.get('id'):
+            return
+        if event in ("message", "edit"):
+            self.add_many([self._message_record(entry)])
+        elif event == "delete":
+            self.remove(entry['id'])
+        elif event == "archive":
+            self.add_many([self._archive_record(entry)])
+        elif event == "archive_delete":
+            self.remove(entry['id'])
+
+    # ===== Stats =====
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._ensure_loaded()
+        with self._lock:
+            labels: Dict[str, int] = {}
+            for row in self._by_id.values():
+                label = self._items[row].get("label", "general")
+                labels[label] = labels.get(label, 0) + 1
+            return {
+                "vectors": len(self._by_id),
+                "rows": self._count,
+                "dead_rows": self._count - len(self._by_id),
+                "capacity": self._capacity,
+                "dim": self.dim,
+                "embedder": self.embedder.name,
+                "index": "ivf" if self._centroids is not None else "exact",
+                "ivf_lists": len(self._lists),
+                "file_bytes": os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0,
+                "labels": labels,
+            }
+
+
+# Global instance; the web app attaches it to the global conversation history at startup
+vector_memory = VectorStore()
@@ -298,29 +298,29 @@ async function sendStreamingMessage(message) {
             return;
         }
 
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
-
+        // SSE frames carry ids (<stream_id>:<n>); after a dropped connection the stream
+        // is resumed from the last received id instead of regenerating the answer
+        const state = { streamId: response.headers.get('X-Stream-Id'), lastEventId: null, completed: false };
+        let attempts = 0;
+        let currentResponse = response;
         while (true) {
-            const { done, value } = await reader.read();
-            
-            if (done) break;
-            
-            buffer += decoder.decode(value, { stream: true });
-            const lines = buffer.split('\n');
-            buffer = lines.pop() || '';
-            
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    try {
-                        const data = JSON.parse(line.slice(6));
-                        await handleStreamData(data);
-                    } catch (e) {
-                        console.log('Error parsing stream data:', e);
-                    }
-                }
+            try {
+                await readEventStream(currentResponse, state);
+            } catch (e) {
+                console.log('Stream interrupted:', e);
             }
+            if (state.completed || !state.streamId || attempts >= 5) break;
+            attempts += 1;
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempts));
+            try {
+                currentResponse = await fetch(`/api/chat/stream/${state.streamId}`, {
+                    headers: state.lastEventId ? { 'Last-Event-ID': state.lastEventId } : {},
+                    credentials: 'include'
+                });
+            } catch (e) {
+                continue;
+            }
+            if (!currentResponse.ok) break;
         }
         
         // Finalize the streaming message
@@ -342,6 +342,46 @@ async function sendStreamingMessage(message) {
     }
 }
 
+// Read one SSE response; tracks the last event id and whether the answer completed
+async function readEventStream(response, state) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() || '';
+        
+        for (const frame of frames) {
+            let eventId = null;
+            let payload = null;
+            for (const line of frame.split('\n')) {
+                if (line.startsWith('id: ')) {
+                    eventId = line.slice(4);
+                } else if (line.startsWith('data: ')) {
+                    payload = line.slice(6);
+                }
+                // Lines starting with ':' are heartbeats
+            }
+            if (payload === null) continue;
+            if (eventId) state.lastEventId = eventId;
+            try {
+                const data = JSON.parse(payload);
+                if (data.type === 'stream') state.streamId = data.stream_id;
+                if (data.type === 'complete' || data.type === 'error') state.completed = true;
+                await handleStreamData(data);
+            } catch (e) {
+                console.log('Error parsing stream data:', e);
+            }
+        }
+    }
+}
+
 // Handle streaming data
 async function handleStreamData(data) {
     switch (data.type) {
@@ -1979,9 +2019,12 @@ function connectTerminalWebSocket() {
     };
     
     terminalWebSocket.onmessage = function(event) {
-        const logLine = event.data;
-        console.log('WebSocket received:', logLine); // Debug
-        addTerminalLine(logLine);
+        // One frame carries a batch of log lines
+        event.data.split('\n').forEach(logLine => {
+            if (logLine.trim()) {
+                addTerminalLine(logLine);
+            }
+        });
     };
     
     terminalWebSocket.onclose = function() {
@@ -0,0 +1,113 @@
+import json
+import time
+
+import memory.conversation_history as conversation_history_module
+from memory.conversation_history import ConversationHistory
+
+
+class _SlowSummaryHistory(ConversationHistory):
+    summary_delay = 0.3
+
+    def _generate_archive_summary(self, messages):
+        time.sleep(self.summary_delay)
+        return f"summary of {len(messages)}"
+
+
+def _history(tmp_path, cls=_SlowSummaryHistory):
+    return cls(history_file=str(tmp_path / "history.json"), archive_file=str(tmp_path / "archive.json"))
+
+
+def test_archiving_runs_off_the_request_path(tmp_path):
+    history = _history(tmp_path)
+    slowest = 0.0
+    for i in range(60):
+        started = time.monotonic()
+        history.add_message("stepan", f"m{i}", f"r{i}")
+        slowest = max(slowest, time.monotonic() - started)
+
+    assert slowest < _SlowSummaryHistory.summary_delay
+    assert history.get_archive_queue_stats()["queue_depth"] >= 1
+    assert history.wait_for_archiving(timeout=10)
+
+    assert history.archive[-1]["summary"] == "summary of 31"
+    assert [m["message"] for m in history.history] == [f"m{i}" for i in range(31, 60)]
+    stats = history.get_archive_queue_stats()
+    assert stats["queue_depth"] == 0
+    assert stats["jobs_processed"] == 1
+    assert stats["last_latency_seconds"] >= _SlowSummaryHistory.summary_delay
+
+
+def test_backlog_is_resumed_after_restart(tmp_path):
+    messages = [{"id": f"msg_{i}", "timestamp": f"2025-08-01T10:00:{i:02d}", "user": "stepan",
+                 "message": f"m{i}", "ai_response": "r"} for i in range(5)]
+    job = {"id": "job_1", "created_at": time.time(), "attempts": 0, "messages": messages}
+    (tmp_path / "archive_jobs.jsonl").write_text(
+        json.dumps({"op": "put", "id": "job_1", "entry": job}) + "\n", encoding="utf-8"
+    )
+
+    history = _history(tmp_path)
+    assert history.wait_for_archiving(timeout=10)
+
+    assert history.archive[-1]["id"] == "archive_1"
+    assert history.archive[-1]["original_count"] == 5
+    assert _history(tmp_path).get_archive_queue_stats()["queue_depth"] == 0
+
+
+class _FailingSummaryHistory(ConversationHistory):
+    fail = True
+
+    def _generate_archive_summary(self, messages):
+        if self.fail:
+            raise RuntimeError("Gemini unavailable")
+        return f"summary of {len(messages)}"
+
+
+def test_exhausted_job_is_dead_lettered_and_can_be_requeued(tmp_path):
+    history = _history(tmp_path, cls=_FailingSummaryHistory)
+    history.archive_max_attempts = 2
+    history.archive_retry_seconds = 0.01
+    for i in range(60):
+        history.add_message("stepan", f"m{i}", f"r{i}")
+
+    deadline = time.time() + 5
+    while history.get_archive_queue_stats()["dead_jobs"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+
+    # A dead job no longer blocks the queue: stats drain and waiting returns at once
+    stats = history.get_archive_queue_stats()
+    assert stats["dead_jobs"] == 1 and stats["dead_messages"] == 31
+    assert stats["queue_depth"] == 0 and stats["jobs_failed"] == 2
+    assert history.wait_for_archiving(timeout=1)
+    assert len(history.history) == 60
+
+    # The dead letter survives a restart and is not retried on its own
+    restarted = _history(tmp_path, cls=_FailingSummaryHistory)
+    assert restarted.get_archive_queue_stats()["dead_jobs"] == 1
+
+    restarted.fail = False
+    assert restarted.requeue_dead_jobs() == 1
+    assert restarted.wait_for_archiving(timeout=10)
+    assert restarted.archive[-1]["summary"] == "summary of 31"
+    assert restarted.get_archive_queue_stats()["dead_jobs"] == 0
+
+
+class _ThrottledClient:
+    def chat(self, message, user_profile, conversation_context):
+        return "❌ Error: 429 all models throttled, retry in 30s."
+
+
+def test_error_reply_keeps_the_raw_messages(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversation_history_module, "_load_ai_client", lambda: _ThrottledClient)
+    history = _history(tmp_path, cls=ConversationHistory)
+    history.archive_max_attempts = 1
+    for i in range(60):
+        history.add_message("stepan", f"m{i}", f"r{i}")
+
+    deadline = time.time() + 5
+    while history.get_archive_queue_stats()["dead_jobs"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert history.get_archive_queue_stats()["dead_jobs"] == 1
+    assert history.archive == []
+    assert len(history.history) == 60
+    assert "429" in next(iter(history._jobs.values()))["last_error"]
@@ -0,0 +1,74 @@
+from memory.context_builder import ContextBuilder, estimate_tokens
+from memory.conversation_history import ConversationHistory
+
+
+def _history(tmp_path):
+    history = ConversationHistory(
+        history_file=str(tmp_path / "history.json"),
+        archive_file=str(tmp_path / "archive.json"),
+    )
+    history.max_history_entries = 10_000  # без архивации (она вызывает LLM)
+    return history
+
+
+def test_new_turn_is_appended_incrementally(tmp_path):
+    history = _history(tmp_path)
+    builder = ContextBuilder(history, budget_tokens=1000)
+
+    history.add_message("stepan", "привет", "здравствуй")
+    history.add_message("meranda", "как дела?", "хорошо")
+    built = builder.build(system_context="file changed")
+
+    assert built.text.startswith("Recent conversation:\n- User: привет\n- AI: здравствуй\n")
+    assert "- User: как дела?\n- AI: хорошо\n" in built.text
+    assert built.text.endswith("\n**SYSTEM CONTEXT:**\nfile changed\n")
+    assert built.turns_included == 2
+    assert set(built.sections) == {"archive", "recent", "system"}
+    assert built.total_tokens == sum(built.sections.values())
+
+
+def test_budget_drops_oldest_turns_and_falls_back_to_archive(tmp_path):
+    history = _history(tmp_path)
+    history.archive = [{"id": "a1", "summary": "Обсуждали планы на лето", "period_start": "2025-06-01", "period_end": "2025-06-30"}]
+    builder = ContextBuilder(history, budget_tokens=400)
+
+    for i in range(100):
+        history.add_message("stepan", f"message {i} " + "x" * 40, f"reply {i}")
+    built = builder.build()
+
+    assert built.sections["recent"] <= builder.history_budget + estimate_tokens("Recent conversation:\n")
+    assert "message 99" in built.text
+    assert "message 0 " not in built.text
+    assert built.archives_included == 1
+    assert built.text.startswith("Earlier conversation (archived summaries):\n- [2025-06-01..2025-06-30] Обсуждали планы на лето\n")
+
+
+def test_edit_triggers_rebuild(tmp_path):
+    history = _history(tmp_path)
+    builder = ContextBuilder(history, budget_tokens=1000)
+    history.add_message("stepan", "old text", "ok")
+
+    history.edit_message(history.history[-1]["id"], "new text")
+
+    assert "new text" in builder.build().text
+    assert "old text" not in builder.build().text
+
+
+def test_recent_turns_are_per_user(tmp_path):
+    history = _history(tmp_path)
+    builder = ContextBuilder(history, budget_tokens=1000)
+    history.add_message("stepan", "секрет степана", "ок")
+    assert "секрет степана" in builder.build(user="stepan").text
+
+    history.add_message("meranda", "вопрос меранды", "ответ")
+    history.add_message("stepan", "второй вопрос", "ок")
+
+    stepan = builder.build(user="stepan")
+    assert "секрет степана" in stepan.text and "второй вопрос" in stepan.text
+    assert "меранды" not in stepan.text and stepan.turns_included == 2
+    meranda = builder.build(user="meranda")
+    assert "степана" not in meranda.text and meranda.turns_included == 1
+    assert builder.build().turns_included == 3
+
+    history.edit_message(history.history[-1]["id"], "исправлено")
+    assert "исправлено" in builder.build(user="stepan").text
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ai_client.utils.executors import BlockingExecutors
+
+
+def test_pool_limit_and_queue_wait_metrics():
+    executors = BlockingExecutors({"vision": 2})
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def probe():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+
+    async def run():
+        await asyncio.gather(*(executors.run("vision", probe) for _ in range(6)))
+
+    asyncio.run(run())
+    stats = executors.snapshot()["vision"]
+    assert peak[0] == 2
+    assert stats["completed"] == 6 and stats["running"] == 0 and stats["queued"] == 0
+    # Четыре вызова ждали свободный поток
+    assert stats["queue_wait"]["sum_seconds"] >= 0.05 * 4 * 0.9
+    executors.shutdown()
+
+
+def test_slow_pool_does_not_stall_other_pools():
+    executors = BlockingExecutors({"vision": 1, "fs": 2})
+    release = threading.Event()
+
+    async def run():
+        stuck = asyncio.ensure_future(executors.run("vision", release.wait, 5))
+        await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        result = await executors.run("fs", lambda: "read")
+        elapsed = time.perf_counter() - started
+        assert executors.snapshot()["vision"]["running"] == 1
+        release.set()
+        await stuck
+        return result, elapsed
+
+    result, elapsed = asyncio.run(run())
+    assert result == "read" and elapsed < 0.5
+    executors.shutdown()
+
+
+def test_errors_propagate_and_are_counted():
+    executors = BlockingExecutors({})
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(executors.run("llm", fail))
+    assert executors.snapshot()["llm"]["failed"] == 1
+    assert 'guardian_executor_failures_total{pool="llm"} 1' in executors.to_prometheus()
+    executors.shutdown()
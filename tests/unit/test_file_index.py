@@ -0,0 +1,88 @@
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from ai_client.utils.file_index import FileChangeIndex
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_ignore_rules():
+    index = FileChangeIndex("/tmp/project")
+    assert index.is_ignored(".git/HEAD")
+    assert index.is_ignored("ai_client/__pycache__/x.cpython-311.pyc")
+    assert index.is_ignored("memory/captures/frame.jpg")
+    assert index.is_ignored("app.log")
+    assert index.is_ignored(".git", is_dir=True)
+    assert not index.is_ignored("memory/conversation_history.json")
+    assert not index.is_ignored("memory", is_dir=True)
+
+
+def test_initial_scan_orders_newest_first(tmp_path):
+    now = time.time()
+    for i, name in enumerate(["a.txt", "b.txt", "c.txt"]):
+        path = tmp_path / name
+        path.write_text(name)
+        os.utime(path, (now - 100 + i, now - 100 + i))
+    old = tmp_path / "old.txt"
+    old.write_text("old")
+    os.utime(old, (now - 3 * 86400, now - 3 * 86400))
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "index").write_text("x")
+
+    index = FileChangeIndex(str(tmp_path), use_inotify=False)
+    index._initial_scan()
+
+    assert [path for path, _ in index.recent()] == ["c.txt", "b.txt", "a.txt"]
+    assert [path for path, _ in index.recent(limit=1)] == ["c.txt"]
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_live_changes_are_indexed(tmp_path, use_inotify):
+    (tmp_path / "guardian_sandbox").mkdir()
+    index = FileChangeIndex(str(tmp_path), poll_interval=0.1, use_inotify=use_inotify)
+    index.start()
+    try:
+        assert index.ready.wait(5)
+        (tmp_path / "guardian_sandbox" / "new.py").write_text("print(1)")
+        (tmp_path / "notes.md").write_text("hi")
+        (tmp_path / "debug.log").write_text("ignored")
+
+        assert _wait_for(lambda: len(index.recent()) == 2)
+        assert {path for path, _ in index.recent()} == {"guardian_sandbox/new.py", "notes.md"}
+        assert "guardian_sandbox/new.py (created:" in index.render()
+
+        os.remove(tmp_path / "notes.md")
+        assert _wait_for(lambda: [p for p, _ in index.recent()] == ["guardian_sandbox/new.py"])
+    finally:
+        index.stop()
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_created_label_shows_creation_not_mtime(tmp_path, use_inotify):
+    (tmp_path / "guardian_sandbox").mkdir()
+    index = FileChangeIndex(str(tmp_path), poll_interval=0.1, use_inotify=use_inotify)
+    index.start()
+    try:
+        assert index.ready.wait(5)
+        copied = tmp_path / "guardian_sandbox" / "copied.txt"
+        copied.write_text("x")
+        old = time.time() - 7200
+        os.utime(copied, (old, old))  # e.g. copied with its original timestamps
+
+        assert _wait_for(lambda: index.recent(created=True))
+        (path, created_at), = index.recent(created=True)
+        assert path == "guardian_sandbox/copied.txt" and created_at > old + 3600
+        stamp = datetime.fromtimestamp(created_at).strftime('%H:%M:%S')
+        assert f"guardian_sandbox/copied.txt (created: {stamp})" in index.render()
+    finally:
+        index.stop()
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from ai_client.models.transport import ThreadedTransport
+
+
+def _slow_chunks(n: int, delay: float):
+    for i in range(n):
+        time.sleep(delay)
+        yield i
+
+
+def test_stream_yields_all_chunks_in_order():
+    transport = ThreadedTransport(max_workers=2)
+
+    async def consume():
+        return [c async for c in transport.stream(lambda: _slow_chunks(5, 0.0))]
+
+    assert asyncio.run(consume()) == [0, 1, 2, 3, 4]
+    transport.shutdown()
+
+
+def test_concurrent_streams_do_not_block_each_other():
+    transport = ThreadedTransport(max_workers=8)
+
+    async def consume():
+        return [c async for c in transport.stream(lambda: _slow_chunks(4, 0.05))]
+
+    async def run_all():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(consume() for _ in range(8)))
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(run_all())
+    assert all(r == [0, 1, 2, 3] for r in results)
+    # serial execution would take 8 * 0.2s
+    assert elapsed < 0.8
+    transport.shutdown()
+
+
+def test_stream_propagates_producer_errors():
+    transport = ThreadedTransport(max_workers=1)
+
+    def failing():
+        yield "first"
+        raise RuntimeError("429 quota")
+
+    async def consume():
+        got = []
+        async for chunk in transport.stream(failing):
+            got.append(chunk)
+        return got
+
+    with pytest.raises(RuntimeError, match="429"):
+        asyncio.run(consume())
+    transport.shutdown()
+
+
+def test_call_runs_off_loop():
+    transport = ThreadedTransport(max_workers=1)
+
+    async def run():
+        return await transport.call(lambda a, b=0: a + b, 2, b=3)
+
+    assert asyncio.run(run()) == 5
+    transport.shutdown()
@@ -0,0 +1,163 @@
+import json
+import time
+
+import pytest
+
+from memory.conversation_history import ConversationHistory
+from memory.history_storage import JsonlStore, RecordStore
+
+
+def _history(tmp_path, **kwargs):
+    history = ConversationHistory(
+        history_file=str(tmp_path / "history.json"),
+        archive_file=str(tmp_path / "archive.json"),
+        **kwargs,
+    )
+    history.max_history_entries = 10_000  # без архивации (она вызывает LLM)
+    return history
+
+
+def test_each_message_appends_one_line(tmp_path):
+    history = _history(tmp_path)
+    for i in range(3):
+        history.add_message("stepan", f"m{i}", f"r{i}")
+
+    lines = (tmp_path / "history.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[-1])["entry"]["message"] == "m2"
+
+
+def test_edits_and_deletes_survive_reload(tmp_path):
+    history = _history(tmp_path)
+    history.add_message("stepan", "first", "r1")
+    history.add_message("meranda", "second", "r2")
+    first_id, second_id = history.history[0]["id"], history.history[1]["id"]
+
+    history.edit_message(first_id, "edited")
+    history.delete_message(second_id)
+    history.flush()
+
+    reloaded = _history(tmp_path)
+    assert [m["message"] for m in reloaded.get_recent_history()] == ["edited"]
+    assert reloaded.get_statistics()["current_messages"] == 1
+
+
+def test_migrates_legacy_json_once(tmp_path):
+    legacy = [{"id": "msg_0", "user": "stepan", "message": "hi", "ai_response": "hello", "timestamp": "2025-08-01T10:00:00"}]
+    (tmp_path / "history.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+    history = _history(tmp_path)
+    assert history.get_recent_history() == legacy
+    assert (tmp_path / "history.jsonl").exists()
+
+    history.add_message("stepan", "new", "r")
+    assert len(_history(tmp_path).history) == 2
+
+
+def test_torn_tail_is_ignored(tmp_path):
+    path = tmp_path / "log.jsonl"
+    store = JsonlStore(str(path), fsync="never")
+    store.load()
+    store.put({"id": "a", "v": 1})
+    store.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "put", "id": "b", "entr')
+
+    recovered = JsonlStore(str(path), fsync="never")
+    assert recovered.load() == [{"id": "a", "v": 1}]
+
+    # The next append must not be glued onto the torn fragment
+    recovered.put({"id": "c", "v": 3})
+    recovered.close()
+    assert JsonlStore(str(path), fsync="never").load() == [{"id": "a", "v": 1}, {"id": "c", "v": 3}]
+
+
+def test_record_without_trailing_newline_is_kept(tmp_path):
+    path = tmp_path / "log.jsonl"
+    path.write_text('{"op": "put", "id": "a", "entry": {"id": "a"}}', encoding="utf-8")
+    store = JsonlStore(str(path), fsync="never")
+    assert store.load() == [{"id": "a"}]
+    store.put({"id": "b"})
+    store.close()
+    assert JsonlStore(str(path), fsync="never").load() == [{"id": "a"}, {"id": "b"}]
+
+
+def test_background_compaction_keeps_live_records(tmp_path):
+    path = tmp_path / "log.jsonl"
+    store = JsonlStore(str(path), fsync="never", compact_min_records=50)
+    store.load()
+    for i in range(200):
+        store.put({"id": "hot", "v": i})
+    store.put({"id": "other", "v": 0})
+
+    deadline = time.time() + 5
+    while store.stats["compactions"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    store.close()
+
+    assert store.stats["compactions"] >= 1
+    assert len(path.read_text(encoding="utf-8").splitlines()) < 200
+    assert JsonlStore(str(path), fsync="never").load() == [{"id": "hot", "v": 199}, {"id": "other", "v": 0}]
+
+
+def _seed(history):
+    for i in range(7):
+        history.add_message("stepan" if i % 2 == 0 else "meranda", f"m{i}", f"r{i}")
+
+
+def _walk_pages(history, user=None, limit=2):
+    pages, cursor = [], None
+    while True:
+        page, cursor = history.get_history_page(user, limit, cursor)
+        pages.append([m["message"] for m in page])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("storage", ["jsonl", "sqlite"])
+def test_cursor_pagination(tmp_path, storage):
+    history = _history(tmp_path, storage=storage)
+    _seed(history)
+
+    assert _walk_pages(history) == [["m5", "m6"], ["m3", "m4"], ["m1", "m2"], ["m0"]]
+    assert _walk_pages(history, user="stepan") == [["m4", "m6"], ["m0", "m2"]]
+    assert [m["message"] for m in history.get_user_history("meranda", limit=2)] == ["m3", "m5"]
+
+
+def test_sqlite_store_indexed_edit_delete_and_reload(tmp_path):
+    history = _history(tmp_path, storage="sqlite")
+    _seed(history)
+    first_id = history.history[0]["id"]
+
+    assert history.get_message_by_id(first_id)["message"] == "m0"
+    assert history.edit_message(first_id, "edited")
+    assert history.delete_message(history.history[1]["id"])
+
+    reloaded = _history(tmp_path, storage="sqlite")
+    assert [m["message"] for m in reloaded.history] == ["edited", "m2", "m3", "m4", "m5", "m6"]
+    assert [m["message"] for m in reloaded.get_user_history("meranda")] == ["m3", "m5"]
+    assert reloaded._history_store.get(first_id)["message"] == "edited"
+
+    plan = reloaded._history_store._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT entry FROM records WHERE collection = ? AND user = ? ORDER BY ts DESC, id DESC",
+        ("history", "stepan"),
+    ).fetchall()
+    assert "idx_records_user_ts" in " ".join(str(row) for row in plan)
+
+
+def test_sqlite_migrates_from_jsonl(tmp_path):
+    history = _history(tmp_path)
+    _seed(history)
+    history.flush()
+
+    migrated = _history(tmp_path, storage="sqlite")
+    assert [m["message"] for m in migrated.history] == [f"m{i}" for i in range(7)]
+
+
+def test_incomplete_store_fails_at_construction():
+    class LoadOnlyStore(RecordStore):
+        def load(self):
+            return []
+
+    with pytest.raises(TypeError):
+        LoadOnlyStore()
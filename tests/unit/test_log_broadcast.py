@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+from ai_client.utils.log_broadcast import LogBroadcastHub
+
+
+def test_late_joiner_gets_replay_then_batches():
+    hub = LogBroadcastHub(buffer_size=100, replay_size=3)
+    for i in range(5):
+        hub.publish(f"old {i}")
+
+    async def run():
+        subscriber = hub.subscribe()
+        replay = await subscriber.next_batch(linger=0)
+        hub.publish("new 1")
+        hub.publish("new 2")
+        return replay, await subscriber.next_batch(linger=0)
+
+    replay, batch = asyncio.run(run())
+    assert replay == (["old 2", "old 3", "old 4"], 0)
+    assert batch == (["new 1", "new 2"], 0)
+
+
+def test_slow_client_drops_oldest_and_reports_count():
+    hub = LogBroadcastHub(buffer_size=3, replay_size=0)
+
+    async def run():
+        subscriber = hub.subscribe()
+        for i in range(10):
+            hub.publish(f"line {i}")
+        first = await subscriber.next_batch(linger=0)
+        hub.publish("line 10")
+        return first, await subscriber.next_batch(linger=0), subscriber.dropped
+
+    first, second, dropped = asyncio.run(run())
+    assert first == (["line 7", "line 8", "line 9"], 7)
+    assert second == (["line 10"], 0)
+    assert dropped == 7
+
+
+def test_publish_from_other_threads_wakes_subscriber():
+    hub = LogBroadcastHub(buffer_size=1000, replay_size=0)
+
+    async def run():
+        subscriber = hub.subscribe()
+        threads = [threading.Thread(target=lambda n=n: [hub.publish(f"{n}:{i}") for i in range(50)])
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        received = []
+        while len(received) < 200:
+            lines, _ = await asyncio.wait_for(subscriber.next_batch(max_lines=64), timeout=2)
+            assert len(lines) <= 64
+            received += lines
+        for thread in threads:
+            thread.join()
+        hub.unsubscribe(subscriber)
+        return received
+
+    received = asyncio.run(run())
+    assert sorted(received) == sorted(f"{n}:{i}" for n in range(4) for i in range(50))
+    assert len(hub) == 0
@@ -0,0 +1,69 @@
+import gzip
+import json
+import logging
+import sys
+
+from ai_client.utils.log_pipeline import (JsonLinesFormatter, NoisyLogFilter, RotatingCompressedFileHandler,
+                                          setup_logging, shutdown_logging)
+
+
+def _record(msg, level=logging.INFO, lineno=10):
+    return logging.LogRecord("web_app", level, __file__, lineno, msg, None, None)
+
+
+def test_size_rotation_compresses_and_caps_backups(tmp_path):
+    path = tmp_path / "app.log"
+    handler = RotatingCompressedFileHandler(str(path), max_bytes=200, backup_count=2)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    for i in range(40):
+        handler.handle(_record(f"line {i:03d} " + "x" * 40))
+    handler.close()
+
+    backups = handler.backups()
+    assert len(backups) == 2 and all(name.endswith(".gz") for name in backups)
+    with gzip.open(backups[-1], "rt") as f:
+        assert f.read().startswith("line ")
+    assert path.stat().st_size < 200 + 60
+    assert path.read_text().splitlines()[-1].startswith("line 039")
+
+
+def test_noisy_info_is_rate_limited_per_call_site():
+    noisy = NoisyLogFilter(limit=2, window=60)
+    passed = [noisy.filter(_record("✅ Cache HIT")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert noisy.suppressed_total == 3
+
+    assert noisy.filter(_record("✅ other site", lineno=20))
+    assert noisy.filter(_record("plain info"))
+    assert noisy.filter(_record("❌ error", level=logging.ERROR))
+
+    noisy.window = 0
+    record = _record("✅ Cache HIT")
+    assert noisy.filter(record) and record.msg.endswith("(+3 similar suppressed)")
+
+
+def test_pipeline_writes_json_lines_from_background_thread(tmp_path):
+    path = tmp_path / "app.log"
+    setup_logging(str(path), fmt="json", console=False)
+    try:
+        logging.getLogger("web_app").info("hello %s", "guardian")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("web_app").exception("failed")
+    finally:
+        shutdown_logging()
+        logging.getLogger().handlers.clear()
+
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert entries[0]["message"] == "hello guardian" and entries[0]["level"] == "INFO"
+    assert entries[1]["level"] == "ERROR" and "ValueError: boom" in entries[1]["message"]
+
+
+def test_json_formatter_keeps_exception_separately():
+    try:
+        raise KeyError("k")
+    except KeyError:
+        record = logging.LogRecord("x", logging.ERROR, __file__, 1, "oops", None, sys.exc_info())
+    entry = json.loads(JsonLinesFormatter().format(record))
+    assert entry["message"] == "oops" and "KeyError" in entry["exc"]
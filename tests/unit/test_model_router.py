@@ -0,0 +1,76 @@
+from ai_client.models.router import CircuitBreaker, ModelRouter, TokenBucket
+
+
+MODELS = [
+    {'name': 'flash', 'quota': 100, 'rpm': 2, 'cost': 0.10},
+    {'name': 'lite', 'quota': 100, 'rpm': 2, 'cost': 0.05},
+    {'name': 'pro', 'quota': 100, 'rpm': 2, 'cost': 1.25},
+]
+
+
+def test_token_bucket_consume_and_refill():
+    bucket = TokenBucket(capacity=2, refill_per_second=1.0)
+    now = bucket.updated_at
+    assert bucket.try_consume(1, now)
+    assert bucket.try_consume(1, now)
+    assert not bucket.try_consume(1, now)
+    assert bucket.try_consume(1, now + 1.0)
+
+
+def test_circuit_breaker_half_open_probe():
+    breaker = CircuitBreaker(failure_threshold=2, base_cooldown=10)
+    breaker.on_failure(0.0, "boom")
+    assert breaker.allow(0.0)
+    breaker.on_failure(0.0, "boom")
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow(5.0)
+
+    # cooldown elapsed: exactly one probe goes through
+    assert breaker.allow(11.0)
+    breaker.on_dispatch(11.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow(11.5)
+
+    # failed probe re-opens with a doubled cooldown
+    breaker.on_failure(12.0, "still failing")
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_in(12.0) == 20
+
+    assert breaker.allow(33.0)
+    breaker.on_dispatch(33.0)
+    breaker.on_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_router_prefers_selected_model_then_cheapest_healthy():
+    router = ModelRouter(quota_scale=1.0)
+    router.register_models(MODELS)
+
+    assert router.select("flash") == "flash"
+    assert router.record_failure("flash", "429 Resource has been exhausted") is True
+
+    # flash is tripped: the cheapest healthy model is picked before the call
+    assert router.select("flash") == "lite"
+    status = router.get_status()
+    assert status["flash"]["breaker"]["state"] == CircuitBreaker.OPEN
+    assert status["flash"]["healthy"] is False
+    assert status["flash"]["quota_errors"] == 1
+
+
+def test_router_returns_none_when_every_bucket_is_empty():
+    router = ModelRouter(quota_scale=1.0)
+    router.register_models(MODELS)
+    picked = [router.select("flash") for _ in range(6)]
+    assert sorted(picked) == ["flash", "flash", "lite", "lite", "pro", "pro"]
+    assert router.select("flash") is None
+    assert router.retry_after() > 0
+
+
+def test_non_quota_errors_trip_after_threshold():
+    router = ModelRouter(quota_scale=1.0)
+    router.register_models([{'name': 'only', 'quota': 100, 'rpm': 100, 'cost': 1}])
+    for _ in range(2):
+        assert router.record_failure("only", "connection reset") is False
+    assert router.select("only") == "only"
+    router.record_failure("only", "connection reset")
+    assert router.select("only") is None
@@ -0,0 +1,63 @@
+import json
+import os
+import time
+
+from memory.user_profiles import ProfileRepository, SimpleUserProfile, get_profile_repository
+
+
+def _write(path, profile):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f)
+
+
+def test_hot_lookup_does_no_io(tmp_path, monkeypatch):
+    repository = ProfileRepository(str(tmp_path), revalidate_seconds=60)
+    repository.save("stepan", {"username": "stepan", "profile": "likes tea"})
+
+    def no_io(*args, **kwargs):
+        raise AssertionError("unexpected I/O")
+
+    monkeypatch.setattr("builtins.open", no_io)
+    monkeypatch.setattr(os, "stat", no_io)
+    for _ in range(100):
+        assert repository.get("stepan")["profile"] == "likes tea"
+    assert repository.stats["hits"] >= 100
+
+
+def test_external_change_is_picked_up_after_revalidation(tmp_path):
+    repository = ProfileRepository(str(tmp_path), revalidate_seconds=0)
+    repository.save("meranda", {"username": "meranda", "full_name": "Meranda", "last_updated": "t1"})
+    assert repository.multi_user_context() == "Multi-user context:\n👤 Meranda (meranda): updated t1"
+
+    _write(tmp_path / "meranda.json", {"username": "meranda", "full_name": "Meranda K", "last_updated": "t2 (edited)"})
+    _write(tmp_path / "stepan.json", {"username": "stepan", "last_updated": "t3"})
+    _write(tmp_path / "stepan_insights.json", {"insights": []})
+
+    assert repository.get("meranda")["full_name"] == "Meranda K"
+    assert repository.multi_user_context().splitlines()[1:] == [
+        "👤 Meranda K (meranda): updated t2 (edited)",
+        "👤 stepan (stepan): updated t3",
+    ]
+
+
+def test_returned_profile_is_a_copy_and_saves_invalidate(tmp_path):
+    profile = SimpleUserProfile("guest", tmp_path)
+    data = profile.get_profile()
+    data["profile"] = "mutated by caller"
+    assert profile.get_profile()["profile"] == "Tell me about yourself..."
+
+    profile.update_profile("new text")
+    repository = get_profile_repository(tmp_path)
+    assert repository.get("guest")["profile"] == "new text"
+    assert json.loads((tmp_path / "guest.json").read_text(encoding="utf-8"))["profile"] == "new text"
+
+
+def test_lookup_latency(tmp_path):
+    repository = ProfileRepository(str(tmp_path), revalidate_seconds=60)
+    repository.save("stepan", {"username": "stepan", "profile": "x" * 2000, "notes": ["a"] * 50})
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        repository.get("stepan")
+        repository.multi_user_context()
+    assert (time.perf_counter() - started) / 1000 < 0.001
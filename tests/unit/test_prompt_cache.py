@@ -0,0 +1,87 @@
+import types
+
+from ai_client.models import prompt_cache as prompt_cache_module
+from ai_client.models.prompt_cache import PromptPrefixCache
+
+
+def test_assemble_is_memoized():
+    cache = PromptPrefixCache(enable_remote=False)
+    first = cache.assemble("BASE", "extra")
+    second = cache.assemble("BASE", "extra")
+    assert first is second
+    assert first.text == "BASE\n\nextra"
+    assert first.encoded == first.text.encode("utf-8")
+    assert cache.assemble("BASE").text == "BASE"
+    assert cache.stats["local_hits"] >= 1
+
+
+def test_remote_disabled_returns_none():
+    cache = PromptPrefixCache(enable_remote=False)
+    assert cache.remote_model("gemini-2.0-flash", cache.prefix("BASE")) is None
+
+
+def _fake_genai(calls, fail=False, error=None):
+    class CachedContent:
+        @staticmethod
+        def create(**kwargs):
+            calls.append(kwargs)
+            if error is not None:
+                raise error
+            if fail:
+                raise ValueError("Cached content is too small")
+            return types.SimpleNamespace(name="cachedContents/1", **kwargs)
+
+    class GenerativeModel:
+        @staticmethod
+        def from_cached_content(cached_content):
+            return ("model", cached_content.name)
+
+    return types.SimpleNamespace(caching=types.SimpleNamespace(CachedContent=CachedContent), GenerativeModel=GenerativeModel)
+
+
+def test_remote_cache_created_once_and_reused(monkeypatch):
+    calls = []
+    monkeypatch.setattr(prompt_cache_module, "genai", _fake_genai(calls))
+    cache = PromptPrefixCache(ttl_seconds=600, enable_remote=True)
+    prefix = cache.prefix("STATIC SYSTEM PROMPT")
+
+    assert cache.remote_model("gemini-2.5-flash", prefix) == ("model", "cachedContents/1")
+    assert cache.remote_model("gemini-2.5-flash", prefix) == ("model", "cachedContents/1")
+    assert len(calls) == 1
+    assert calls[0]["system_instruction"] == "STATIC SYSTEM PROMPT"
+    assert cache.get_stats()["bytes_saved"] == len(prefix.encoded)
+
+    cache.invalidate("gemini-2.5-flash", prefix)
+    cache.remote_model("gemini-2.5-flash", prefix)
+    assert len(calls) == 2
+
+
+def test_remote_failure_falls_back_without_retrying(monkeypatch):
+    calls = []
+    monkeypatch.setattr(prompt_cache_module, "genai", _fake_genai(calls, fail=True))
+    cache = PromptPrefixCache(ttl_seconds=600, enable_remote=True)
+    prefix = cache.prefix("SMALL")
+
+    assert cache.remote_model("gemini-2.0-flash", prefix) is None
+    assert cache.remote_model("gemini-2.0-flash", prefix) is None
+    assert len(calls) == 1
+    assert cache.get_stats()["remote_failures"] == 1
+
+
+def test_transient_failure_retries_after_short_backoff(monkeypatch):
+    calls = []
+    monkeypatch.setattr(prompt_cache_module, "genai", _fake_genai(calls, error=TimeoutError("503 Service Unavailable")))
+    cache = PromptPrefixCache(ttl_seconds=600, enable_remote=True)
+    cache.retry_base_seconds = 5
+    prefix = cache.prefix("STATIC SYSTEM PROMPT")
+
+    now = [1000.0]
+    monkeypatch.setattr(prompt_cache_module.time, "time", lambda: now[0])
+    assert cache.remote_model("gemini-2.5-flash", prefix) is None
+    assert cache.remote_model("gemini-2.5-flash", prefix) is None
+    assert len(calls) == 1
+
+    now[0] += 6  # backoff истёк задолго до TTL
+    monkeypatch.setattr(prompt_cache_module, "genai", _fake_genai(calls))
+    assert cache.remote_model("gemini-2.5-flash", prefix) == ("model", "cachedContents/1")
+    assert len(calls) == 2
@@ -0,0 +1,92 @@
+import time
+
+from memory.conversation_history import ConversationHistory
+from memory.search_index import SearchIndex, build_match_query
+
+
+def _entry(i, user, message, response="ok"):
+    return {"id": f"msg_{i}", "timestamp": f"2025-08-01T10:{i // 60:02d}:{i % 60:02d}",
+            "user": user, "message": message, "ai_response": response}
+
+
+def test_match_query_is_quoted_and_prefixed():
+    assert build_match_query('кот" OR "x') == '"кот"* "or" "x"'
+    assert build_match_query("  ") == ""
+
+
+def test_ranking_snippets_and_user_filter(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    index.index_messages([
+        _entry(1, "stepan", "we planned the garden yesterday"),
+        _entry(2, "meranda", "garden garden garden: tomatoes and the garden fence"),
+        _entry(3, "stepan", "nothing relevant here"),
+    ])
+    index.index_profile("meranda", {"username": "meranda", "profile": "Loves the garden and painting"})
+
+    found = index.search("garden")
+    assert [r["id"] for r in found["results"]][0] == "msg_2"
+    assert {r["kind"] for r in found["results"]} == {"message", "profile"}
+    assert "[garden]" in found["results"][0]["snippet"]
+
+    only_stepan = index.search("gard", user="stepan")
+    assert [r["id"] for r in only_stepan["results"]] == ["msg_1"]
+    assert [r["id"] for r in index.search("garden", kinds=["profile"])["results"]] == ["meranda"]
+
+
+def test_index_follows_history_changes(tmp_path):
+    history = ConversationHistory(history_file=str(tmp_path / "history.json"),
+                                  archive_file=str(tmp_path / "archive.json"))
+    index = SearchIndex(str(tmp_path / "search.db"))
+    index.attach(history)
+
+    history.add_message("stepan", "remind me about the violin lesson", "sure")
+    message_id = history.history[-1]["id"]
+    assert [r["id"] for r in index.search("violin")["results"]] == [message_id]
+
+    history.edit_message(message_id, "remind me about the piano lesson")
+    assert index.search("violin")["results"] == []
+    assert len(index.search("piano")["results"]) == 1
+
+    history.delete_message(message_id)
+    assert index.search("piano")["results"] == []
+
+
+def test_search_latency_on_large_index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    index.index_messages(_entry(i, "stepan" if i % 2 else "meranda", f"note {i} about topic{i % 500}")
+                         for i in range(20000))
+
+    started = time.perf_counter()
+    found = index.search("topic42", user="stepan", limit=10)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    assert found["results"]
+    assert all(r["user"] == "stepan" for r in found["results"])
+    assert elapsed_ms < 100
+
+
+def test_reattach_only_reindexes_changed_records(tmp_path):
+    history = ConversationHistory(history_file=str(tmp_path / "history.json"),
+                                  archive_file=str(tmp_path / "archive.json"))
+    for i in range(5):
+        history.add_message("stepan", f"note {i}", "ok")
+    (tmp_path / "profiles").mkdir()
+    (tmp_path / "profiles" / "meranda.json").write_text('{"profile": "likes tulips"}', encoding="utf-8")
+
+    first = SearchIndex(str(tmp_path / "search.db"))
+    assert first.index_messages(history.get_full_history(), only_changed=True) == 5
+    assert first.index_profile_dir(str(tmp_path / "profiles")) == 1
+
+    # Next process start: nothing changed, nothing is rewritten
+    history.edit_message(history.history[0]["id"], "edited note")
+    restarted = SearchIndex(str(tmp_path / "search.db"))
+    assert restarted.index_messages(history.get_full_history(), only_changed=True) == 1
+    assert restarted.index_profile_dir(str(tmp_path / "profiles")) == 0
+    assert len(restarted.search("edited")["results"]) == 1
+
+
+def test_database_is_created_on_first_use(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    assert not (tmp_path / "search.db").exists()
+    assert index.search("anything")["results"] == []
+    assert (tmp_path / "search.db").exists()
@@ -0,0 +1,114 @@
+import json
+import multiprocessing
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from ai_client.utils.session_store import SessionStore, SqliteSessionStore
+
+
+def _create_sessions(db_path, username, count, queue):
+    store = SqliteSessionStore(db_path)
+    queue.put([store.create(username) for _ in range(count)])
+    store.close()
+
+
+def test_create_get_delete(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+    session_id = store.create("stepan")
+
+    session = store.get(session_id)
+    assert session["username"] == "stepan"
+    assert session["expires_at"] - session["created_at"] == timedelta(days=30)
+    assert store.get("missing") is None
+
+    store.delete(session_id)
+    assert store.get(session_id) is None
+
+
+def test_expired_sessions_are_hidden_and_swept(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"), cache_seconds=0)
+    short = store.create("guest", ttl_seconds=0.05)
+    long = store.create("stepan")
+    time.sleep(0.1)
+
+    assert store.get(short) is None
+    assert len(store) == 2  # lookups do not write
+    assert store.sweep() == 1
+    assert len(store) == 1 and store.get(long)["username"] == "stepan"
+
+
+def test_legacy_json_is_imported_once(tmp_path):
+    now = datetime.now()
+    legacy = {
+        "alive": {"username": "meranda", "created_at": now.isoformat(),
+                  "expires_at": (now + timedelta(days=1)).isoformat()},
+        "dead": {"username": "stepan", "created_at": (now - timedelta(days=40)).isoformat(),
+                 "expires_at": (now - timedelta(days=10)).isoformat()},
+    }
+    (tmp_path / "sessions.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"), legacy_path=str(tmp_path / "sessions.json"))
+    assert store.get("alive")["username"] == "meranda" and store.get("dead") is None
+    store.delete("alive")
+    store.close()
+
+    reopened = SqliteSessionStore(str(tmp_path / "sessions.db"), legacy_path=str(tmp_path / "sessions.json"))
+    assert reopened.get("alive") is None
+
+
+def test_sessions_are_shared_between_processes(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    store = SqliteSessionStore(db_path, cache_seconds=0)
+    queue = multiprocessing.get_context("spawn").Queue()
+    workers = [multiprocessing.get_context("spawn").Process(target=_create_sessions, args=(db_path, f"u{i}", 50, queue))
+               for i in range(3)]
+    for worker in workers:
+        worker.start()
+    created = [queue.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=60)
+
+    assert len(store) == 150
+    assert all(store.get(session_id)["username"] == f"u{i}"
+               for i, ids in enumerate(sorted(created, key=lambda ids: store.get(ids[0])["username"]))
+               for session_id in ids)
+    store.delete(created[0][0])
+    assert SqliteSessionStore(db_path).get(created[0][0]) is None
+
+
+def test_logout_in_another_worker_bypasses_the_cache(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    first, second = SqliteSessionStore(db_path, cache_seconds=30), SqliteSessionStore(db_path, cache_seconds=30)
+    session_id = first.create("stepan")
+    guest_id = first.create("guest")
+    assert second.get(session_id)["username"] == "stepan"
+    assert second.get(guest_id)["username"] == "guest"
+
+    reads = second.stats["db_reads"]
+    first.create("meranda")  # other writes keep the cache
+    assert second.get(session_id) is not None and second.stats["db_reads"] == reads
+
+    first.delete(session_id)  # logout handled by the other worker
+    assert second.get(session_id) is None
+    first.delete_user("guest")
+    assert second.get(guest_id) is None
+
+
+def test_incomplete_store_fails_at_construction():
+    class NoSweep(SessionStore):
+        def create(self, username, ttl_seconds=None):
+            return "id"
+
+        def get(self, session_id):
+            return None
+
+        def delete(self, session_id):
+            pass
+
+        def delete_user(self, username):
+            return 0
+
+    with pytest.raises(TypeError):
+        NoSweep()
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from ai_client.utils.single_flight import SingleFlight, make_key
+
+
+def test_make_key_normalizes_whitespace_and_dict_order():
+    assert make_key("chat", " hi ", {"a": 1, "b": 2}) == make_key("chat", "hi", {"b": 2, "a": 1})
+    assert make_key("chat", "hi") != make_key("chat", "hello")
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert results == ["answer"] * 10
+    assert len(calls) == 1
+    stats = flight.get_stats()
+    assert stats["executed"] == 1
+    assert stats["coalesced"] == 9
+    assert stats["in_flight"] == 0
+
+
+def test_errors_propagate_to_all_waiters_and_key_is_released():
+    flight = SingleFlight("test")
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("quota")
+
+    async def ok():
+        return "fine"
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("k", boom) for _ in range(3)), return_exceptions=True)
+        again = await flight.do("k", ok)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert again == "fine"
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == 42
@@ -0,0 +1,142 @@
+import asyncio
+import json
+
+import pytest
+
+from ai_client.utils.sse import SSEStreamRegistry, TooManyStreams, parse_last_event_id
+
+
+async def _chunks(parts, delay=0.0):
+    for part in parts:
+        if delay:
+            await asyncio.sleep(delay)
+        yield {"type": "chunk", "content": part}
+    yield {"type": "complete"}
+
+
+def _parse(frames):
+    events = []
+    for frame in frames:
+        if frame.startswith(":"):
+            events.append(("heartbeat", None))
+            continue
+        lines = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+        events.append((lines["id"], json.loads(lines["data"])))
+    return events
+
+
+async def _collect(registry, stream, after_seq=0, limit=None):
+    frames = []
+    async for frame in registry.subscribe(stream, after_seq):
+        frames.append(frame)
+        if limit and len(frames) >= limit:
+            break
+    return _parse(frames)
+
+
+def test_small_chunks_are_coalesced_by_size_and_window():
+    registry = SSEStreamRegistry(coalesce_ms=20, coalesce_bytes=6)
+
+    async def run():
+        stream = registry.start(_chunks(["ab", "cd", "ef", "g"]), owner="stepan")
+        return stream, await _collect(registry, stream)
+
+    stream, events = asyncio.run(run())
+    payloads = [data for _, data in events]
+    assert payloads[0] == {"type": "stream", "stream_id": stream.id}
+    assert payloads[1:] == [{"type": "chunk", "content": "abcdef"}, {"type": "chunk", "content": "g"},
+                            {"type": "complete"}]
+    assert [event_id for event_id, _ in events] == [f"{stream.id}:{i}" for i in range(1, 5)]
+
+
+def test_resume_after_disconnect_replays_without_regenerating():
+    registry = SSEStreamRegistry(coalesce_ms=0)
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        async for event in _chunks(["one ", "two ", "three"], delay=0.01):
+            yield event
+
+    async def run():
+        stream = registry.start(answer(), owner="stepan")
+        first = await _collect(registry, stream, limit=2)  # клиент отвалился после первого чанка
+        await stream.task  # генерация продолжилась без клиента
+        stream_id, seq = parse_last_event_id(first[-1][0])
+        assert registry.get(stream_id) is stream
+        return first, await _collect(registry, stream, after_seq=seq)
+
+    first, rest = asyncio.run(run())
+    assert calls == [1]
+    assert first[1][1]["content"] == "one "
+    assert [data.get("content") for _, data in rest] == ["two ", "three", None]
+    assert rest[-1][1] == {"type": "complete"}
+
+
+def test_heartbeat_while_waiting_and_expiry():
+    registry = SSEStreamRegistry(heartbeat_seconds=0.02, retain_seconds=0)
+
+    async def run():
+        stream = registry.start(_chunks(["late"], delay=0.1))
+        events = await _collect(registry, stream)
+        return stream, events
+
+    stream, events = asyncio.run(run())
+    assert ("heartbeat", None) in events
+    assert events[-1][1] == {"type": "complete"}
+    assert registry.get(stream.id) is None and len(registry) == 0
+
+
+def test_errors_end_the_stream():
+    registry = SSEStreamRegistry()
+
+    async def broken():
+        yield {"type": "chunk", "content": "partial"}
+        raise RuntimeError("model failed")
+
+    async def run():
+        stream = registry.start(broken())
+        return await _collect(registry, stream)
+
+    events = asyncio.run(run())
+    assert events[-1][1] == {"type": "error", "message": "model failed"}
+    assert parse_last_event_id("garbage") == (None, 0)
+
+
+def test_resume_in_another_worker_reads_the_shared_log(tmp_path):
+    db_path = str(tmp_path / "sse_streams.db")
+    owner_worker = SSEStreamRegistry(coalesce_ms=0, db_path=db_path)
+    other_worker = SSEStreamRegistry(coalesce_ms=0, db_path=db_path, poll_ms=5)
+
+    async def run():
+        stream = owner_worker.start(_chunks(["one ", "two ", "three"], delay=0.03), owner="stepan")
+        first = await _collect(owner_worker, stream, limit=2)
+        stream_id, seq = parse_last_event_id(first[-1][0])
+        # The reconnect lands on a worker that never saw the stream, while it is still generating
+        shared = other_worker.get(stream_id)
+        assert shared is not None and shared.owner == "stepan" and not shared.done
+        return first, await _collect(other_worker, shared, after_seq=seq)
+
+    first, rest = asyncio.run(run())
+    assert first[1][1]["content"] == "one "
+    assert [data.get("content") for _, data in rest] == ["two ", "three", None]
+    assert rest[-1][1] == {"type": "complete"}
+    assert other_worker.get("unknown") is None
+
+
+def test_start_refuses_streams_over_the_limit():
+    registry = SSEStreamRegistry(coalesce_ms=0, max_streams=2)
+
+    async def run():
+        running = [registry.start(_chunks(["slow"], delay=0.05)) for _ in range(2)]
+        with pytest.raises(TooManyStreams):
+            registry.start(_chunks(["one too many"]))
+        await asyncio.gather(*(stream.task for stream in running))
+        # Finished streams make room for new ones (oldest evicted first)
+        newest = registry.start(_chunks(["fits"]))
+        await newest.task
+        return running, newest
+
+    running, newest = asyncio.run(run())
+    assert len(registry) == 2
+    assert registry.get(running[0].id) is None and registry.get(newest.id) is newest
@@ -0,0 +1,355 @@
+import asyncio
+import time
+from datetime import datetime
+
+from ai_client.utils.cache import BoundedMemoryCache, DiskCacheTier, SystemCache
+
+
+def _entry(value, ttl=600):
+    return {"data": value, "timestamp": time.time(), "ttl_seconds": ttl}
+
+
+def test_lru_eviction_by_count():
+    cache = BoundedMemoryCache(max_entries=3, sweep_interval=3600)
+    for key in ("a", "b", "c"):
+        cache[key] = _entry(key)
+    cache.lookup("a")  # a becomes most recently used
+    cache["d"] = _entry("d")
+
+    assert cache.keys() == ["c", "a", "d"]
+    assert cache.get_stats()["evictions_lru"] == 1
+
+
+def test_eviction_by_bytes():
+    cache = BoundedMemoryCache(max_entries=1000, max_bytes=20_000, sweep_interval=3600)
+    for i in range(50):
+        cache[f"k{i}"] = _entry("x" * 1000)
+
+    stats = cache.get_stats()
+    assert stats["bytes"] <= 20_000
+    assert stats["evictions_size"] > 0
+    assert "k49" in cache and "k0" not in cache
+
+    cache["huge"] = _entry("x" * 50_000)
+    assert "huge" not in cache
+    assert cache.get_stats()["rejected_oversize"] == 1
+
+
+def test_expired_entries_are_swept_without_reads():
+    cache = BoundedMemoryCache(max_entries=100, sweep_interval=0.05)
+    cache["short"] = _entry("s", ttl=0.1)
+    cache["long"] = _entry("l", ttl=60)
+
+    deadline = time.time() + 5
+    while "short" in cache and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert "short" not in cache
+    assert "long" in cache
+    assert cache.get_stats()["expirations"] == 1
+    cache.stop()
+
+
+def test_system_cache_uses_bounded_memory_tier(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = SystemCache(max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.set("c", {"v": 3})
+
+    assert len(cache.memory_cache) == 2
+    # Evicted from memory but still served by the file tier
+    assert cache.get("a") == {"v": 1}
+    assert cache.get_stats()["memory"]["evictions_lru"] >= 1
+
+
+def test_disk_tier_hashes_keys_into_shards(tmp_path):
+    disk = DiskCacheTier(str(tmp_path), async_writes=False)
+    key = "conversation_history_user=../../etc/passwd"
+    disk.write(key, _entry({"big": "x" * 5000}))
+
+    files = [p for p in tmp_path.rglob("*.bin")]
+    assert len(files) == 1
+    assert files[0].parent.parent == tmp_path and len(files[0].parent.name) == 2
+    assert "passwd" not in str(files[0])
+    assert files[0].stat().st_size < 1000  # compact + zlib
+    assert disk.read(key, ttl_seconds=60)["data"] == {"big": "x" * 5000}
+    disk.stop()
+
+
+def test_expiry_is_decided_from_the_header(tmp_path):
+    disk = DiskCacheTier(str(tmp_path), async_writes=False)
+    old = {"data": {"v": 1}, "timestamp": time.time() - 120, "ttl_seconds": 60}
+    disk.write("old", old)
+    path = next(tmp_path.rglob("*.bin"))
+    # Corrupt the payload: an expired entry must not even be parsed
+    path.write_bytes(path.read_bytes()[:DiskCacheTier.HEADER.size + 3] + b"\xff\xfe garbage")
+
+    assert disk.read("old", ttl_seconds=60) is None
+    assert disk.stats["corrupted"] == 0
+    assert disk.read("old", ttl_seconds=3600) is None
+    assert disk.stats["corrupted"] == 1
+    disk.stop()
+
+
+def test_async_writes_are_visible_and_index_survives_restart(tmp_path):
+    disk = DiskCacheTier(str(tmp_path), async_writes=True, flush_interval=3600)
+    for i in range(20):
+        disk.write(f"k{i}", _entry(i))
+    assert disk.read("k7", ttl_seconds=60)["data"] == 7
+    disk.flush()
+    disk.stop()
+
+    reopened = DiskCacheTier(str(tmp_path), async_writes=False)
+    assert len(reopened) == 20
+    assert reopened.read("k7", ttl_seconds=60)["data"] == 7
+    reopened.clear()
+    assert len(reopened) == 0 and not list(tmp_path.rglob("*.bin"))
+    reopened.stop()
+
+    writer = DiskCacheTier(str(tmp_path), async_writes=False)
+    writer.write("x", _entry(1))
+    writer.stop()
+    (tmp_path / DiskCacheTier.INDEX_FILE).unlink()
+    assert len(DiskCacheTier(str(tmp_path), async_writes=False)) == 1  # rebuilt from file headers
+
+
+def test_async_api_is_coherent_with_sync_api(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=True)
+
+    async def scenario():
+        await cache.aset("sensor", {"t": 21.5}, {"sensor_id": "s1"}, ttl_seconds=60)
+        assert cache.get("sensor", {"sensor_id": "s1"}) == {"t": 21.5}
+        cache.set("model_status", {"ok": True})
+        cache.memory_cache.clear()
+        assert await cache.aget("model_status") == {"ok": True}
+        await cache.ainvalidate("sensor", {"sensor_id": "s1"})
+        return await cache.aget("sensor", {"sensor_id": "s1"})
+
+    assert asyncio.run(scenario()) is None
+    cache.flush()
+    assert cache.get_stats()["file_entries"] == 1
+
+
+def test_high_rate_sensor_updates_are_batched(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=True)
+
+    async def ingest():
+        started = time.perf_counter()
+        for i in range(5000):
+            await cache.aset("smart_home_sensor", {"value": i}, {"sensor_id": f"s{i % 10}"})
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(ingest())
+    cache.flush()
+    disk = cache.get_stats()["disk"]
+
+    assert elapsed < 2.0
+    assert disk["writes"] < 5000 and disk["coalesced"] > 0
+    assert cache.get("smart_home_sensor", {"sensor_id": "s9"}) == {"value": 4999}
+
+
+def test_smart_home_sensor_caching_does_not_raise(tmp_path):
+    from ai_client.smart_home import core
+
+    controller = core.SmartHomeController()
+    controller.cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=True)
+    reading = core.SensorData("t1", "temperature", 22.0, datetime.now(), "kitchen", "home")
+
+    asyncio.run(controller._cache_sensor_data(reading))
+
+    cached = controller.cache.get("smart_home_sensor", {"sensor_id": "t1"})
+    assert cached["value"] == 22.0 and cached["timestamp"] == reading.timestamp.isoformat()
+
+
+def test_stale_while_revalidate_states(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=False)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    def age(seconds):
+        key = cache.get_cache_key("status")
+        cache.memory_cache[key]["timestamp"] = time.time() - seconds
+
+    async def scenario():
+        states = []
+        for seconds in (None, 10, 85, 130):
+            if seconds is not None:
+                age(seconds)
+            value, state = await cache.get_or_refresh("status", loader, ttl_seconds=100, stale_ttl_seconds=300)
+            states.append((state, value["n"]))
+            await asyncio.sleep(0.01)  # дать фоновому обновлению завершиться
+        age(400)
+        states.append((await cache.get_or_refresh("status", loader, ttl_seconds=100, stale_ttl_seconds=300))[1])
+        return states
+
+    states = asyncio.run(scenario())
+    assert states == [("miss", 1), ("fresh", 1), ("refresh_ahead", 1), ("stale", 2), "miss"]
+    assert len(calls) == 4
+
+
+def test_concurrent_callers_share_one_refresh(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=False)
+    calls = []
+
+    async def slow_loader():
+        calls.append(1)
+        await asyncio.sleep(0.3)
+        return {"n": len(calls)}
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_refresh("analysis", slow_loader, ttl_seconds=100)
+                                         for _ in range(50)))
+        assert {state for _, state in results} == {"miss"} and len(calls) == 1
+
+        cache.memory_cache[cache.get_cache_key("analysis")]["timestamp"] = time.time() - 200
+        started = time.perf_counter()
+        results = await asyncio.gather(*(cache.get_or_refresh("analysis", slow_loader, ttl_seconds=100)
+                                         for _ in range(50)))
+        elapsed = time.perf_counter() - started
+        assert {state for _, state in results} == {"stale"}
+        assert elapsed < 0.2  # stale value is served without waiting for the loader
+        await asyncio.sleep(0.4)
+        return (await cache.get_or_refresh("analysis", slow_loader, ttl_seconds=100))[0]
+
+    assert asyncio.run(scenario()) == {"n": 2}
+    assert len(calls) == 2
+    assert cache.swr_stats["deduplicated"] >= 98
+
+
+def test_cache_if_skips_error_results(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=False)
+
+    async def failing_llm():
+        return {"system_status": "❌ Error: 429"}
+
+    async def scenario():
+        for _ in range(2):
+            value, state = await cache.get_or_refresh(
+                "analysis", failing_llm, ttl_seconds=100,
+                cache_if=lambda d: "❌ Error:" not in str(d))
+            assert state == "miss"
+        return value
+
+    assert asyncio.run(scenario())["system_status"].startswith("❌")
+    assert cache.get("analysis") is None
+
+
+def test_invalidate_tag_drops_dependents_in_both_tiers(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=True)
+    for limit in (5, 20, 37):
+        for user in ("stepan", "meranda"):
+            cache.set(f"conversation_history_{user}_{limit}", [limit], tags=["conversation", f"user:{user}"])
+    cache.set("system_analysis", {"ok": 1}, {"username": "stepan"}, tags=["user:stepan", "profile:stepan"])
+    cache.flush()
+    cache.memory_cache.clear()  # only the disk tier holds the entries now
+
+    assert cache.invalidate_tag("profile:stepan") == 1
+    assert cache.get("system_analysis", {"username": "stepan"}) is None
+    assert cache.invalidate_tag("conversation") == 6
+    assert all(cache.get(f"conversation_history_{u}_{n}") is None
+               for n in (5, 20, 37) for u in ("stepan", "meranda"))
+    assert cache.invalidate_tag("user:stepan") == 0
+    cache.flush()
+    assert cache.get_stats()["file_entries"] == 0
+
+
+def test_tags_survive_restart(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=False)
+    cache.set("history_a", [1], tags=["conversation"])
+    cache.set("history_b", [2], tags=["conversation"])
+    cache.set("untagged", [3])
+    cache.flush()
+    (tmp_path / "cache" / DiskCacheTier.INDEX_FILE).unlink()  # tags are rebuilt from file headers
+
+    reopened = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=False)
+    assert reopened.invalidate_tag("conversation") == 2
+    assert reopened.get("history_a") is None and reopened.get("untagged") == [3]
+
+
+def test_invalidation_during_refresh_is_not_overwritten(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=False)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return ["old history"]
+
+        pending = asyncio.ensure_future(cache.get_or_refresh("history", loader, ttl_seconds=60,
+                                                             tags=["conversation"]))
+        await asyncio.sleep(0.01)
+        cache.invalidate_tag("conversation")  # e.g. a new message arrived mid-load
+        release.set()
+        return await pending
+
+    assert asyncio.run(scenario()) == (["old history"], "miss")
+    assert cache.get("history") is None
+
+
+def test_metrics_per_operation(tmp_path):
+    cache = SystemCache(max_entries=2, cache_dir=str(tmp_path / "cache"), async_writes=False)
+    cache.set("model_status", {"ok": True})
+    cache.get("model_status")  # memory hit
+    cache.memory_cache.clear()
+    cache.get("model_status")  # disk hit
+    cache.get("system_analysis", {"username": "stepan"})  # miss
+    for i in range(3):
+        cache.set("smart_home_sensor", {"value": i}, {"sensor_id": f"s{i}"})  # evicts by LRU
+
+    ops = cache.get_metrics()["operations"]
+    assert ops["model_status"]["hits_memory"] == 1 and ops["model_status"]["hits_disk"] == 1
+    assert ops["model_status"]["hit_ratio"] == 1.0
+    assert ops["model_status"]["latency"]["get"]["count"] == 2
+    assert ops["model_status"]["bytes_written"] > 0
+    assert ops["system_analysis"]["misses"] == 1 and ops["system_analysis"]["hit_ratio"] == 0.0
+    assert ops["smart_home_sensor"]["sets"] == 3 and ops["smart_home_sensor"]["memory_entries"] == 2
+    assert ops["model_status"]["evictions_lru"] + ops["smart_home_sensor"]["evictions_lru"] >= 1
+
+    text = cache.prometheus_metrics()
+    assert 'guardian_cache_hits_total{operation="model_status",tier="disk"} 1' in text
+    assert 'guardian_cache_latency_seconds_count{operation="model_status",kind="get"} 2' in text
+    assert 'guardian_cache_latency_seconds_bucket{operation="model_status",kind="get",le="+Inf"} 2' in text
+    assert "# TYPE guardian_cache_latency_seconds histogram" in text
+
+
+def test_expirations_on_read_are_counted_per_operation(tmp_path):
+    cache = SystemCache(cache_dir=str(tmp_path / "cache"), async_writes=False)
+    cache.set("model_status", {"ok": True}, ttl_seconds=600)
+    time.sleep(0.01)
+    cache.get("model_status", ttl_seconds=0.001)  # older than the caller's TTL: dropped from memory
+
+    async def scenario():
+        async def loader():
+            return "fresh"
+
+        await cache.get_or_refresh("weather", loader, ttl_seconds=60)
+        cache.memory_cache["weather"]["timestamp"] -= 3600  # past the stale window
+        return await cache.get_or_refresh("weather", loader, ttl_seconds=60)
+
+    assert asyncio.run(scenario()) == ("fresh", "miss")
+    ops = cache.get_metrics()["operations"]
+    assert ops["model_status"]["expirations"] == 1
+    assert ops["weather"]["expirations"] == 1
+    assert cache.memory_cache.get_stats()["expirations"] == 2
+
+
+def test_worker_indexes_are_merged_not_overwritten(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = DiskCacheTier(cache_dir, async_writes=False, index_file="index.worker-0.json")
+    second = DiskCacheTier(cache_dir, async_writes=False, index_file="index.worker-1.json")
+    first.write("history_stepan", _entry(["a"]))
+    second.write("history_meranda", _entry(["b"]))
+    first.flush()
+    second.flush()  # does not drop the first worker's entry
+
+    restarted = DiskCacheTier(cache_dir, async_writes=False, index_file="index.worker-0.json")
+    assert len(restarted) == 2
+    restarted.clear()
+    assert first.read("history_stepan", 60) is None and second.read("history_meranda", 60) is None
+    for tier in (first, second, restarted):
+        tier.stop()
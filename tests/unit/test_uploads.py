@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+
+from ai_client.utils.uploads import UploadStore, UploadTooLarge, safe_filename
+
+
+def _store(tmp_path, **kwargs):
+    return UploadStore(blob_dir=str(tmp_path / "blobs"), chunk_bytes=4, **kwargs)
+
+
+def test_identical_uploads_share_one_blob(tmp_path):
+    store = _store(tmp_path)
+    data = b"same image bytes"
+    first = store.store_stream(io.BytesIO(data), str(tmp_path / "images"), "a.png")
+    second = store.store_stream(io.BytesIO(data), str(tmp_path / "uploads"), "b.png")
+
+    assert first.sha256 == second.sha256 == hashlib.sha256(data).hexdigest()
+    assert not first.deduplicated and second.deduplicated
+    blob = store.blob_path(first.sha256)
+    assert os.path.samefile(blob, first.path) and os.path.samefile(blob, second.path)
+    assert os.stat(blob).st_nlink == 3
+
+    store.release(first.path)
+    assert os.path.exists(blob)
+    store.release(second.path)
+    assert not os.path.exists(blob)
+
+
+def test_overwriting_a_name_releases_the_old_blob(tmp_path):
+    store = _store(tmp_path)
+    old = store.store_stream(io.BytesIO(b"old avatar"), str(tmp_path / "avatars"), "stepan_avatar.jpg")
+    new = store.store_stream(io.BytesIO(b"new avatar"), str(tmp_path / "avatars"), "stepan_avatar.jpg")
+
+    assert open(new.path, "rb").read() == b"new avatar"
+    assert not os.path.exists(store.blob_path(old.sha256))
+    assert os.listdir(tmp_path / "avatars") == ["stepan_avatar.jpg"]
+
+
+def test_size_limit_is_enforced_while_copying(tmp_path):
+    store = _store(tmp_path, max_bytes=10)
+    with pytest.raises(UploadTooLarge):
+        store.store_stream(io.BytesIO(b"x" * 11), str(tmp_path / "uploads"), "big.bin")
+    assert not os.path.exists(tmp_path / "uploads" / "big.bin")
+    assert [name for _, _, files in os.walk(tmp_path / "blobs") for name in files] == []
+
+    with pytest.raises(UploadTooLarge):
+        store.check_length("11")
+    store.check_length("10")
+
+
+def test_client_filename_cannot_escape_the_directory(tmp_path):
+    assert safe_filename("../../web_app.py") == "web_app.py"
+    assert safe_filename("C:\\temp\\photo.jpg") == "photo.jpg"
+    with pytest.raises(ValueError):
+        safe_filename("..")
+
+
+def test_hooks_run_in_background_after_save(tmp_path):
+    store = _store(tmp_path)
+    seen = []
+
+    async def async_hook(stored):
+        await asyncio.sleep(0.01)
+        seen.append(("async", stored.sha256[:8]))
+
+    store.add_hook(async_hook, "image/")
+    store.add_hook(lambda stored: seen.append(("sync", stored.size)))
+
+    async def run():
+        stored = await store.save(io.BytesIO(b"text"), str(tmp_path / "uploads"), "notes.txt", "text/plain")
+        assert seen == []  # ответ не ждёт хуков
+        await store.drain_hooks()
+        return stored
+
+    stored = asyncio.run(run())
+    assert seen == [("sync", stored.size)]
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_editing_one_link_leaves_other_uploads_and_the_blob_intact(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    from ai_client.tools.file_tools import FileTools
+
+    store = _store(tmp_path)
+    monkeypatch.setattr("ai_client.tools.file_tools.upload_store", store)
+    tools = FileTools()
+    tools.project_root = str(tmp_path)
+
+    uploads = str(tmp_path / "uploads")
+    a = store.store_stream(io.BytesIO(b"hello"), uploads, "a.txt")
+    b = store.store_stream(io.BytesIO(b"hello"), uploads, "b.txt")
+    assert tools.append_to_file(a.path, " world")
+
+    assert _read(a.path) == b"hello world"
+    assert _read(b.path) == b"hello"
+    again = store.store_stream(io.BytesIO(b"hello"), uploads, "c.txt")
+    assert again.deduplicated and _read(again.path) == b"hello"
+    assert os.path.samefile(again.path, b.path)
+
+    # The last link rewritten: its blob is collected
+    single = store.store_stream(io.BytesIO(b"only once"), uploads, "single.txt")
+    assert tools.edit_file(single.path, "changed")
+    assert not os.path.exists(store.blob_path(single.sha256))
+
+
+def test_blob_modified_in_place_is_not_reused(tmp_path):
+    store = _store(tmp_path)
+    uploads = str(tmp_path / "uploads")
+    a = store.store_stream(io.BytesIO(b"hello"), uploads, "a.txt")
+    os.chmod(a.path, 0o644)
+    with open(a.path, "ab") as f:  # a writer that bypasses write_text()
+        f.write(b" world")
+
+    again = store.store_stream(io.BytesIO(b"hello"), uploads, "b.txt")
+    assert not again.deduplicated
+    assert _read(again.path) == b"hello" and _read(a.path) == b"hello world"
+    assert os.path.samefile(store.blob_path(again.sha256), again.path)
+    assert not os.path.samefile(again.path, a.path)
+
+
+def test_file_tools_release_blobs_and_cannot_touch_them(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    from ai_client.tools.file_tools import FileTools
+
+    store = _store(tmp_path)
+    monkeypatch.setattr("ai_client.tools.file_tools.upload_store", store)
+    tools = FileTools()
+    tools.project_root = str(tmp_path)
+
+    uploads = str(tmp_path / "uploads")
+    a = store.store_stream(io.BytesIO(b"hello"), uploads, "a.txt")
+    b = store.store_stream(io.BytesIO(b"hello"), uploads, "b.txt")
+    blob = store.blob_path(a.sha256)
+
+    assert not tools.write_file(blob, "overwritten")
+    assert not tools.delete_file(blob)
+    # read_file / list_files take paths relative to the project root
+    assert tools.read_file(os.path.relpath(blob, tmp_path)).startswith("❌ Access denied")
+    assert tools.list_files("blobs").startswith("❌ Access denied")
+    assert "📁 blobs/" not in tools.list_files()
+    assert _read(blob) == b"hello"
+
+    assert tools.delete_file(a.path)
+    assert os.path.exists(blob)
+    assert tools.delete_file(b.path)
+    assert not os.path.exists(blob)
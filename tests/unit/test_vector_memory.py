@@ -0,0 +1,168 @@
+import time
+
+import numpy as np
+import pytest
+
+from memory.context_builder import ContextBuilder
+from memory.conversation_history import ConversationHistory
+from memory.vector_memory import Embedder, HashingEmbedder, VectorStore
+
+
+def test_similar_text_ranks_first_and_survives_reload(tmp_path):
+    store = VectorStore(str(tmp_path / "vectors"))
+    store.add("мы обсуждали поездку на море летом", doc_id="sea", meta={"user": "stepan"})
+    store.add("ремонт кухни и новая плита", doc_id="kitchen", meta={"user": "meranda"})
+    store.add("meranda planned a garden with tomatoes", doc_id="garden", meta={"user": "meranda"})
+
+    assert store.search("поездка на море")[0]["id"] == "sea"
+    assert store.search("garden tomato")[0]["id"] == "garden"
+    assert [r["id"] for r in store.search("море", user="meranda", min_score=0.2)] == []
+
+    store.remove("kitchen")
+    reloaded = VectorStore(str(tmp_path / "vectors"))
+    assert reloaded.get_stats()["vectors"] == 2
+    assert reloaded.search("поездка на море")[0]["id"] == "sea"
+    assert all(r["id"] != "kitchen" for r in reloaded.search("кухня плита"))
+
+
+def test_changed_embedder_reembeds(tmp_path):
+    VectorStore(str(tmp_path / "vectors")).add("violin lesson on friday", doc_id="v")
+
+    store = VectorStore(str(tmp_path / "vectors"), embedder=HashingEmbedder(dim=128))
+
+    assert store.get_stats()["dim"] == 128
+    assert store.search("violin lesson")[0]["id"] == "v"
+
+
+def test_ivf_index_matches_exact_search(tmp_path):
+    rnd = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(3000)]
+    texts = [" ".join(rnd.choice(words, 15)) for i in range(3000)]
+    store = VectorStore(str(tmp_path / "vectors"), ivf_threshold=2000, nprobe=16)
+    store.add_many({"id": f"d{i}", "text": text} for i, text in enumerate(texts))
+
+    deadline = time.time() + 30
+    while store.get_stats()["index"] != "ivf" and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert store.get_stats()["index"] == "ivf"
+    hits = sum(store.search(texts[i], top_k=1)[0]["id"] == f"d{i}" for i in range(0, 3000, 100))
+    assert hits >= 27
+
+
+def test_context_builder_recalls_relevant_old_turns(tmp_path):
+    history = ConversationHistory(history_file=str(tmp_path / "history.json"),
+                                  archive_file=str(tmp_path / "archive.json"))
+    history.max_history_entries = 10_000
+    store = VectorStore(str(tmp_path / "vectors"))
+    store.attach(history)
+    builder = ContextBuilder(history, budget_tokens=600, retriever=store)
+
+    history.add_message("stepan", "my passport number expires in march", "noted")
+    for i in range(60):
+        history.add_message("stepan", f"small talk {i} " + "x" * 40, f"reply {i}")
+    built = builder.build(query="when does my passport expire?")
+
+    assert "passport number expires" in built.text
+    assert built.relevant_included >= 1
+    assert set(built.sections) == {"archive", "relevant", "recent", "system"}
+    assert built.text.index("Relevant earlier context:") < built.text.index("Recent conversation:")
+
+
+def test_embedder_without_embed_fails_at_construction():
+    class NamedOnly(Embedder):
+        name = "named"
+
+    with pytest.raises(TypeError):
+        NamedOnly()
+
+
+def test_relevant_context_is_limited_to_the_requesting_user(tmp_path):
+    history = ConversationHistory(history_file=str(tmp_path / "history.json"),
+                                  archive_file=str(tmp_path / "archive.json"))
+    history.max_history_entries = 10_000
+    store = VectorStore(str(tmp_path / "vectors"))
+    store.attach(history)
+    builder = ContextBuilder(history, budget_tokens=600, retriever=store)
+
+    history.add_message("meranda", "my passport number expires in march", "noted")
+    history.add_message("stepan", "my passport number expires in june", "noted")
+    for i in range(60):
+        history.add_message("stepan", f"small talk {i} " + "x" * 40, f"reply {i}")
+        history.add_message("meranda", f"small talk {i} " + "x" * 40, f"reply {i}")
+    store.add("the passport number expires soon for the family trip", doc_id="archive_1", label="archive",
+              meta={"users": ["meranda", "stepan"]})
+
+    built = builder.build(query="when does my passport expire?", user="stepan")
+
+    assert "expires in june" in built.text and "family trip" in built.text
+    assert "expires in march" not in built.text
+
+
+def test_edited_record_moves_to_the_list_of_its_new_vector(tmp_path):
+    rnd = np.random.default_rng(1)
+    words = [f"w{i}" for i in range(3000)]
+    texts = [" ".join(rnd.choice(words, 15)) for i in range(2500)]
+    store = VectorStore(str(tmp_path / "vectors"), ivf_threshold=2000, nprobe=2)
+    store.add_many({"id": f"d{i}", "text": text} for i, text in enumerate(texts))
+    deadline = time.time() + 30
+    while store.get_stats()["index"] != "ivf" and time.time() < deadline:
+        time.sleep(0.05)
+
+    edited = "violin lesson moved to friday evening at the music school"
+    store.add(edited, doc_id="d7")
+
+    assert store.search(edited, top_k=1)[0]["id"] == "d7"
+    assert store.search(edited, top_k=1)[0]["text"] == edited
+    assert store.get_stats()["vectors"] == 2500
+    reloaded = VectorStore(str(tmp_path / "vectors"))
+    assert reloaded.search(edited, top_k=1)[0]["text"] == edited
+
+
+def test_dead_rows_are_compacted(tmp_path):
+    directory = tmp_path / "vectors"
+    store = VectorStore(str(directory), compact_min_dead=50)
+    store.add_many({"id": f"d{i}", "text": f"note {i} about topic{i}"} for i in range(40))
+    for round_ in range(3):
+        store.add_many({"id": f"d{i}", "text": f"edit {round_} of note {i} about topic{i}"} for i in range(20))
+    for i in range(20, 30):
+        store.remove(f"d{i}")
+
+    stats = store.get_stats()
+    assert stats["vectors"] == 30
+    assert stats["dead_rows"] < 30  # 70 dead rows were reclaimed on the way
+    assert store.search("edit 2 of note 5 about topic5", top_k=1)[0]["id"] == "d5"
+    assert store.search("note 35 about topic35", top_k=1)[0]["id"] == "d35"
+    assert not store.search("note 25 about topic25", min_score=0.9)
+
+    store.compact()
+    assert store.get_stats()["dead_rows"] == 0
+    assert sum(1 for _ in open(directory / "items.jsonl", encoding="utf-8")) == 30
+    reloaded = VectorStore(str(directory))
+    assert reloaded.get_stats()["vectors"] == 30
+    assert reloaded.search("edit 2 of note 5 about topic5", top_k=1)[0]["text"] == "edit 2 of note 5 about topic5"
+
+
+def test_interrupted_compaction_is_finished_or_dropped_on_load(tmp_path, monkeypatch):
+    directory = tmp_path / "vectors"
+    store = VectorStore(str(directory))
+    store.add("first version", doc_id="a")
+    store.add("second version", doc_id="a")
+    store.add("another record", doc_id="b")
+
+    # Compacted files written, but the process died before the commit marker
+    (directory / "items.jsonl.compact").write_text("garbage", encoding="utf-8")
+    (directory / "vectors.f32.compact").write_bytes(b"garbage")
+    reloaded = VectorStore(str(directory))
+    assert reloaded.search("second version", top_k=1)[0]["text"] == "second version"
+    assert not (directory / "items.jsonl.compact").exists()
+
+    # Died after the commit marker, before the swap: the next load completes it
+    monkeypatch.setattr(VectorStore, "_finish_compaction", lambda self: None)
+    reloaded.compact()
+    monkeypatch.undo()
+    assert (directory / "compact.commit").exists()
+    recovered = VectorStore(str(directory))
+    assert recovered.get_stats()["rows"] == 2
+    assert recovered.search("second version", top_k=1)[0]["text"] == "second version"
+    assert not (directory / "compact.commit").exists()
@@ -0,0 +1,65 @@
+import time
+
+from ai_client.utils.cache import SystemCache
+from ai_client.utils.workers import FileLease, LeaderElection
+from memory.conversation_history import ConversationHistory
+
+
+def _worker_history(tmp_path):
+    # Отдельный ConversationHistory на своём соединении - как в другом воркере
+    history = ConversationHistory(history_file=str(tmp_path / "history.json"),
+                                  archive_file=str(tmp_path / "archive.json"), storage="sqlite")
+    history.max_history_entries = 10_000  # без архивации (она вызывает LLM)
+    return history
+
+
+def test_lease_is_exclusive_until_released(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    first, second = LeaderElection(path, retry_seconds=0.1), LeaderElection(path, retry_seconds=0.1)
+
+    assert first.try_acquire() and first.is_leader
+    assert not second.try_acquire() and not second.is_leader
+    assert first.try_acquire()  # повторный вызов лидера - no-op
+
+    first.release()
+    assert second.try_acquire() and not FileLease(path).acquire()
+
+
+def test_sync_replays_other_workers_writes(tmp_path):
+    worker_a, worker_b = _worker_history(tmp_path), _worker_history(tmp_path)
+    events = []
+    worker_b.add_listener(lambda event, entry=None: events.append((event, entry and entry.get("message"))))
+    assert worker_a.shared_storage and not worker_b.sync()
+
+    worker_a.add_message("stepan", "first", "r1")
+    worker_a.add_message("meranda", "second", "r2")
+    assert worker_b.sync()
+    assert [m["message"] for m in worker_b.history] == ["first", "second"]
+    assert events == [("message", "first"), ("message", "second")]
+
+    events.clear()
+    first_id, second_id = worker_a.history[0]["id"], worker_a.history[1]["id"]
+    worker_a.edit_message(first_id, "edited")
+    worker_a.delete_message(second_id)
+    worker_b.sync()
+    assert events == [("edit", "edited"), ("delete", "second")]
+    assert not worker_b.sync()
+
+    # Позиции выделяются в транзакции: записи обоих воркеров не перемешиваются и не теряются
+    worker_b.add_message("meranda", "third", "r3")
+    worker_a.sync()
+    assert [m["message"] for m in worker_a.history] == ["edited", "third"]
+
+
+def test_tag_invalidation_reaches_other_processes(tmp_path):
+    worker_a = SystemCache(cache_dir=str(tmp_path / "cache"))
+    worker_b = SystemCache(cache_dir=str(tmp_path / "cache"))
+    worker_b.disk_cache.tag_sync_seconds = 0
+    worker_b.set("conversation_history", ["cached"], tags=["conversation"])
+    assert worker_b.get("conversation_history") == ["cached"]
+
+    time.sleep(0.01)
+    worker_a.invalidate_tag("conversation")
+    assert worker_b.get("conversation_history") is None
+    worker_b.set("conversation_history", ["fresh"], tags=["conversation"])
+    assert worker_b.get("conversation_history") == ["fresh"]
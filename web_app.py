@@ -8,12 +8,13 @@ import json
 import asyncio
 import logging
 import secrets
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, status, Response, UploadFile, File, BackgroundTasks, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse, RedirectResponse, FileResponse
+from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse, RedirectResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
@@ -21,6 +22,14 @@ import uvicorn
 
 # Импортируем кэш
 from ai_client.utils.cache import system_cache
+from ai_client.utils.session_store import create_session_store
+from ai_client.utils.file_index import file_change_index
+from ai_client.utils.executors import executors, run_blocking
+from ai_client.utils.sse import SSEStreamRegistry, TooManyStreams, parse_last_event_id
+from ai_client.utils.uploads import UploadTooLarge, upload_store
+from ai_client.utils.log_pipeline import DEFAULT_FORMAT, setup_logging
+from ai_client.utils.log_broadcast import BroadcastLogHandler, log_hub
+from ai_client.utils.workers import LeaderElection, is_multi_worker, worker_count
 
 # Load environment variables
 load_dotenv()
@@ -31,48 +40,24 @@ from ai_client.tools.vision_service import vision_service
 from ai_client.tools.vision_tools import vision_tools
 from ai_client.core.response_processor import ResponseProcessor
 from ai_client.tools.chat_summary_tools import ChatSummaryTools
-from memory.user_profiles import UserProfile
+from memory.user_profiles import UserProfile, get_profile_repository
 from memory.conversation_history import conversation_history
+from memory.history_storage import encode_cursor
+from memory.context_builder import context_builder
+from memory.search_index import search_index
+from memory.vector_memory import vector_memory
 from bridge.mqtt_bridge import MqttBridge
 from bridge.topics import SIM_STEP, ACTUATOR_CMD
 
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: records go through a queue to a background thread that writes
+# app.log (rotated and gzipped) and the console; LOG_FORMAT=json for JSON lines.
+# The same thread feeds the /ws/logs broadcast hub
+log_stream_handler = BroadcastLogHandler(log_hub)
+log_stream_handler.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+log_pipeline = setup_logging('app.log', extra_handlers=[log_stream_handler])
 logger = logging.getLogger(__name__)
 
-# WebSocket connections list
-websocket_connections = []
-
-class WebSocketLogHandler(logging.Handler):
-    """Handler для отправки логов через WebSocket"""
-    def emit(self, record):
-        try:
-            log_entry = self.format(record)
-            # Отправляем всем подключенным WebSocket клиентам
-            for websocket in websocket_connections[:]:  # Копируем список для безопасной итерации
-                try:
-                    asyncio.create_task(websocket.send_text(log_entry))
-                except Exception as e:
-                    # Удаляем отключенные WebSocket
-                    websocket_connections.remove(websocket)
-        except Exception as e:
-            pass  # Игнорируем ошибки WebSocket
-
-# Создаем WebSocket handler
-websocket_handler = WebSocketLogHandler()
-websocket_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-
-# Добавляем WebSocket handler только к основному логгеру
-logger.addHandler(websocket_handler)
-
 app = FastAPI(title="ΔΣ Guardian - Superintelligent Family Architect", version="1.0.0")
 
 # Mount static files
@@ -84,10 +69,15 @@ templates = Jinja2Templates(directory="templates")
 # Security
 security = HTTPBasic()
 
-# Session management
-SESSIONS = {}  # In production, use Redis or database
+# Session management: SQLite store shared by all uvicorn workers (sessions.json is imported once)
+session_store = create_session_store(os.path.dirname(os.path.abspath(__file__)))
 SESSION_SECRET = secrets.token_urlsafe(32)
 
+# Streamed chat answers, buffered for SSE_RETAIN_SECONDS so a dropped client can resume; with
+# several workers the events are also kept in a shared SQLite log, so the reconnect may land on any worker
+chat_streams = SSEStreamRegistry(db_path=os.getenv("SSE_DB_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "memory", "sse_streams.db")) if is_multi_worker() else None)
+
 # Initialize components
 ai_client = AIClient()
 response_processor = ResponseProcessor(ai_client)
@@ -98,159 +88,178 @@ system_agent = SystemAnalysisAgent(ai_client)
 guardian_policy = GuardianPolicy()
 autonomous_supervisor = AutonomousSupervisor(integration_hub, system_agent, interval_seconds=180, policy=guardian_policy)
 
-# MQTT bridge for simulator controls
-mqtt_bridge = MqttBridge(host=os.getenv("MQTT_HOST", "localhost"), port=int(os.getenv("MQTT_PORT", "1883")), client_id="web_app")
+# Cache dependencies: any history change (new message, edit, delete, archive) invalidates
+# every cached history view; profile writes invalidate entries built from that profile
+conversation_history.add_listener(lambda event, entry=None: system_cache.invalidate_tag("conversation"))
+get_profile_repository().add_listener(lambda event, username: system_cache.invalidate_tag(f"profile:{username}"))
+
+# MQTT bridge for simulator controls. Deliberately not a leader service: the simulator endpoints
+# publish from whichever worker serves the request, so every worker keeps its own publish-only
+# connection (the broker requires distinct client ids). Subscriptions, if ever added, belong
+# in _start_leader_services so each message is handled once
+mqtt_bridge = MqttBridge(host=os.getenv("MQTT_HOST", "localhost"), port=int(os.getenv("MQTT_PORT", "1883")),
+                         client_id=f"web_app-{os.getpid()}" if is_multi_worker() else "web_app")
+
+# Multi-worker mode (uvicorn --workers N with WEB_CONCURRENCY=N): one elected leader runs the
+# singleton background work (autonomous loop, session sweep, archive summarization);
+# every worker serves requests and picks up the others' writes from the shared SQLite stores
+leader = LeaderElection(os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory", "leader.lock"))
+_leader_task: Optional[asyncio.Task] = None
+
+
+async def _start_leader_services():
+    await integration_hub.start()
+    await autonomous_supervisor.start()
+    # Expired sessions are removed in the background, not on the auth path
+    session_store.start()
+    conversation_history.enable_archiving()
+
+
+async def _leader_loop():
+    """Try to become leader; the leader also syncs history so archive thresholds are checked"""
+    while True:
+        try:
+            if leader.is_leader:
+                await _sync_history()
+            elif leader.try_acquire():
+                await _start_leader_services()
+        except Exception as e:
+            logger.warning(f"Leader loop warning: {e}")
+        await asyncio.sleep(leader.retry_seconds)
+
+
+_memory_indexes_attached = False
+
+
+def _attach_memory_indexes():
+    """Catch the search index and vector memory up with history written since the last run, then follow it"""
+    global _memory_indexes_attached
+    if _memory_indexes_attached:
+        return
+    _memory_indexes_attached = True
+    search_index.attach(conversation_history)
+    search_index.index_profile_dir()
+    vector_memory.attach(conversation_history)
 
 
 @app.on_event("startup")
 async def _startup_autonomous():
+    global _leader_task
+    try:
+        await run_blocking("fs", _attach_memory_indexes)
+    except Exception as e:
+        logger.error(f"❌ Memory index startup failed: {e}")
+    # Index of recent file changes (inotify / polling in a background thread); every context
+    # depends on it, so it starts on its own before the optional services
+    try:
+        file_change_index.start()
+    except Exception as e:
+        logger.error(f"❌ File change index failed to start: {e}")
+    try:
+        if is_multi_worker():
+            if not conversation_history.shared_storage:
+                logger.warning(f"⚠️ {worker_count()} workers without shared history storage: "
+                               f"set CONVERSATION_STORAGE=sqlite")
+            _leader_task = asyncio.create_task(_leader_loop())
+        elif leader.try_acquire():
+            await _start_leader_services()
+        else:
+            logger.warning("⚠️ Another web_app process holds the leader lease: background services not started")
+    except Exception as e:
+        logger.warning(f"Autonomous startup warning: {e}")
     try:
-        await integration_hub.start()
-        await autonomous_supervisor.start()
         # Connect MQTT bridge (non-blocking, tolerate absence)
         mqtt_bridge.connect()
     except Exception as e:
-        logger.warning(f"Autonomous startup warning: {e}")
+        logger.warning(f"MQTT bridge startup warning: {e}")
 
 
 @app.on_event("shutdown")
 async def _shutdown_autonomous():
     try:
-        await autonomous_supervisor.stop()
-        await integration_hub.stop()
+        if _leader_task:
+            _leader_task.cancel()
+        if leader.is_leader:
+            await autonomous_supervisor.stop()
+            await integration_hub.stop()
+            session_store.stop()
+            leader.release()
     except Exception as e:
         logger.warning(f"Autonomous shutdown warning: {e}")
+    try:
+        file_change_index.stop()
+    except Exception as e:
+        logger.warning(f"File change index shutdown warning: {e}")
+
+
+# History sync in multi-worker mode: at most one run at a time, in the fs pool (a reload after a
+# peer write and the listeners - search index, embeddings, cache tags - must not block the loop),
+# and not more often than HISTORY_SYNC_INTERVAL_MS per worker
+HISTORY_SYNC_INTERVAL = float(os.getenv("HISTORY_SYNC_INTERVAL_MS", "500")) / 1000
+_history_sync: Optional[asyncio.Future] = None
+_history_synced_at = 0.0
+
+
+async def _sync_history():
+    """Pick up other workers' history writes; concurrent callers share one run"""
+    global _history_sync
+    if _history_sync is None:
+        if time.monotonic() - _history_synced_at < HISTORY_SYNC_INTERVAL:
+            return
+        _history_sync = asyncio.ensure_future(run_blocking("fs", conversation_history.sync))
+
+        def _done(_):
+            global _history_sync, _history_synced_at
+            _history_sync = None
+            _history_synced_at = time.monotonic()
+
+        _history_sync.add_done_callback(_done)
+    await asyncio.shield(_history_sync)
+
+
+@app.middleware("http")
+async def _sync_shared_state(request: Request, call_next):
+    """Other workers' history writes become visible (within HISTORY_SYNC_INTERVAL) before an API call is answered"""
+    if is_multi_worker() and request.url.path.startswith("/api/"):
+        try:
+            await _sync_history()
+        except Exception as e:
+            logger.warning(f"History sync warning: {e}")
+    return await call_next(request)
+
+UPLOAD_PATHS = ("/api/upload-file", "/api/profile/avatar")
+
+
+@app.middleware("http")
+async def _limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads from Content-Length before the multipart body is read"""
+    if request.method == "POST" and request.url.path in UPLOAD_PATHS:
+        try:
+            upload_store.check_length(request.headers.get("content-length"))
+        except UploadTooLarge as e:
+            return JSONResponse({"success": False, "error": str(e)}, status_code=413)
+    return await call_next(request)
 # conversation_history = ConversationHistory() # This line is removed
 
+def load_profile(username: str) -> Dict[str, Any]:
+    """Profile dict for user (creates the default profile on first access); blocking - use run_blocking("fs", ...)"""
+    return UserProfile(username).get_profile()
+
 def get_recent_file_changes() -> str:
-    """Get recent file changes for system analysis"""
+    """Get recent file changes for system analysis (from the event-driven file index)"""
     try:
-        import os
-        from datetime import datetime, timedelta
-        
-        changes = []
-        changes.append("## RECENT FILE CHANGES")
-        
-        # Check for recently modified files
-        current_time = datetime.now()
-        recent_files = []
-        
-        # Key directories to monitor
-        key_dirs = ["", "ai_client.py", "web_app.py", "memory", "templates", "static", "guardian_sandbox"]
-        
-        for item in key_dirs:
-            if os.path.exists(item):
-                if os.path.isfile(item):
-                    # Single file
-                    mtime = datetime.fromtimestamp(os.path.getmtime(item))
-                    if current_time - mtime < timedelta(hours=24):
-                        recent_files.append((item, mtime))
-                else:
-                    # Directory
-                    for root, dirs, files in os.walk(item):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            try:
-                                mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-                                if current_time - mtime < timedelta(hours=24):
-                                    recent_files.append((file_path, mtime))
-                            except:
-                                continue
-        
-        # Sort by modification time
-        recent_files.sort(key=lambda x: x[1], reverse=True)
-        
-        if recent_files:
-            changes.append("Recently modified files (last 24 hours):")
-            for file_path, mtime in recent_files[:10]:  # Show top 10
-                changes.append(f"- {file_path} (modified: {mtime.strftime('%H:%M:%S')})")
-        else:
-            changes.append("No recent file changes detected.")
-        
-        # Check for new files in sandbox
-        sandbox_path = "guardian_sandbox"
-        if os.path.exists(sandbox_path):
-            sandbox_files = []
-            for root, dirs, files in os.walk(sandbox_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        ctime = datetime.fromtimestamp(os.path.getctime(file_path))
-                        if current_time - ctime < timedelta(hours=24):
-                            sandbox_files.append((file_path, ctime))
-                    except:
-                        continue
-            
-            if sandbox_files:
-                changes.append("\nNew files in sandbox (last 24 hours):")
-                for file_path, ctime in sandbox_files[:5]:
-                    changes.append(f"- {file_path} (created: {ctime.strftime('%H:%M:%S')})")
-        
-        return "\n".join(changes)
-        
+        return file_change_index.render()
     except Exception as e:
         logger.error(f"Error getting recent file changes: {e}")
         return "Error retrieving recent file changes"
 
 def create_session(username: str) -> str:
-    """Create a new session for user"""
-    session_id = secrets.token_urlsafe(32)
-    SESSIONS[session_id] = {
-        "username": username,
-        "created_at": datetime.now(),
-        "expires_at": datetime.now() + timedelta(days=30)  # 30 дней вместо 24 часов
-    }
-    # Сохраняем сессии в файл
-    _save_sessions()
-    return session_id
-
-def _save_sessions():
-    """Сохранить сессии в файл"""
-    try:
-        sessions_file = os.path.join(os.path.dirname(__file__), 'sessions.json')
-        sessions_data = {}
-        for session_id, session in SESSIONS.items():
-            sessions_data[session_id] = {
-                "username": session["username"],
-                "created_at": session["created_at"].isoformat(),
-                "expires_at": session["expires_at"].isoformat()
-            }
-        with open(sessions_file, 'w', encoding='utf-8') as f:
-            json.dump(sessions_data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Error saving sessions: {e}")
-
-def _load_sessions():
-    """Загрузить сессии из файла"""
-    try:
-        sessions_file = os.path.join(os.path.dirname(__file__), 'sessions.json')
-        if os.path.exists(sessions_file):
-            with open(sessions_file, 'r', encoding='utf-8') as f:
-                sessions_data = json.load(f)
-            for session_id, session in sessions_data.items():
-                SESSIONS[session_id] = {
-                    "username": session["username"],
-                    "created_at": datetime.fromisoformat(session["created_at"]),
-                    "expires_at": datetime.fromisoformat(session["expires_at"])
-                }
-    except Exception as e:
-        logger.error(f"Error loading sessions: {e}")
-
-# Загружаем сессии при запуске
-_load_sessions()
+    """Create a new session for user (30 days)"""
+    return session_store.create(username)
 
 def get_session(session_id: str) -> Optional[Dict]:
     """Get session data"""
-    if session_id not in SESSIONS:
-        return None
-    
-    session = SESSIONS[session_id]
-    if datetime.now() > session["expires_at"]:
-        del SESSIONS[session_id]
-        _save_sessions() # Сохраняем после удаления
-        return None
-    
-    return session
+    return session_store.get(session_id)
 
 def verify_session(request: Request) -> Optional[str]:
     """Verify session and return username"""
@@ -413,12 +422,68 @@ async def chat_page(request: Request):
         "moment_time": datetime.now().strftime("%I:%M %p")
     })
 
+async def _chat_stream_events(username: str, message: str):
+    """Events of one streamed answer; runs in the background, independent of the client connection"""
+    try:
+        # Get user profile
+        user_profile_dict = await run_blocking("fs", load_profile, username)
+        user_profile_dict['username'] = username  # Add username to profile
+        
+        # Build token-budgeted context (recent turns + archive summaries + recalled relevant turns + recent file changes)
+        built_context = await run_blocking("fs", context_builder.build, system_context=get_recent_file_changes(), query=message, user=username)
+        full_context = built_context.text
+        logger.info(f"🧮 STREAMING CHAT: Context {built_context.total_tokens}/{built_context.budget_tokens} tokens {built_context.sections}")
+        
+        # Track the complete response
+        full_response = ""
+        
+        # Получаем поток от модели
+        model_stream = ai_client.generate_streaming_response(
+            user_message=message,
+            context=full_context,
+            user_profile=user_profile_dict
+        )
+        
+        # Обрабатываем поток через ResponseProcessor (мелкие чанки склеивает SSE-слой)
+        async for chunk in response_processor.process_streaming_response(model_stream):
+            if chunk:
+                full_response += chunk
+                yield {'type': 'chunk', 'content': chunk}
+        
+        logger.info(f"🔧 STREAMING CHAT: Response processing completed")
+        
+        # Send final completion signal
+        yield {'type': 'message_complete'}
+        
+        # Add to conversation history
+        await run_blocking("fs", conversation_history.add_message, username, message, full_response)
+        
+        # Кэш истории сбрасывается слушателем conversation_history (тег "conversation")
+        
+        # Send final completion signal
+        yield {'type': 'complete', 'timestamp': datetime.now().isoformat()}
+        
+    except Exception as e:
+        logger.error(f"Error in streaming chat: {e}")
+        yield {'type': 'error', 'message': str(e)}
+
+def _sse_response(stream, after_seq: int = 0) -> StreamingResponse:
+    return StreamingResponse(
+        chat_streams.subscribe(stream, after_seq),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Stream-Id": stream.id,
+        }
+    )
+
 @app.post("/api/chat/stream")
 async def chat_stream_endpoint(
     request: Request,
     message: str = Form(...)
 ):
-    """Handle chat messages with streaming response"""
+    """Handle chat messages with a resumable SSE stream (event ids, heartbeats, batched chunks)"""
     username = get_current_user(request)
     if not username:
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -428,76 +493,25 @@ async def chat_stream_endpoint(
         session_id = create_session(username)
         # Note: Can't set cookie in streaming response, but session is created
     
-    async def generate_stream():
-        try:
-            # Get user profile
-            user_profile = UserProfile(username)
-            user_profile_dict = user_profile.get_profile()
-            user_profile_dict['username'] = username  # Add username to profile
-            
-            # Get conversation context
-            recent_messages = conversation_history.get_recent_history(limit=666)
-            
-            # Build full context
-            full_context = ""
-            if recent_messages:
-                full_context += "Recent conversation:\n"
-                for msg in recent_messages:
-                    full_context += f"- User: {msg.get('message', '')}\n"
-                    full_context += f"- AI: {msg.get('ai_response', '')}\n"
-            
-            # Add system context (recent file changes)
-            recent_changes = get_recent_file_changes()
-            if recent_changes:
-                full_context += f"\n**SYSTEM CONTEXT:**\n{recent_changes}\n"
-            
-            # Track the complete response
-            full_response = ""
-            
-            # Получаем поток от модели
-            model_stream = ai_client.generate_streaming_response(
-                user_message=message,
-                context=full_context,
-                user_profile=user_profile_dict
-            )
-            
-            # Обрабатываем поток через ResponseProcessor
-            async for chunk in response_processor.process_streaming_response(model_stream):
-                if chunk:
-                    full_response += chunk
-                    yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
-            
-            logger.info(f"🔧 STREAMING CHAT: Response processing completed")
-            
-            # Send final completion signal
-            yield f"data: {json.dumps({'type': 'message_complete'})}\n\n"
-            
-            # Add to conversation history
-            conversation_history.add_message(username, message, full_response)
-            
-            # Clear conversation history cache to force refresh
-            cache_key = f"conversation_history_{username}_20"
-            system_cache.delete(cache_key)
-            cache_key_5 = f"conversation_history_{username}_5"
-            system_cache.delete(cache_key_5)
-            logger.info(f"🗑️ CONVERSATION CACHE: Cleared cache for {username} after new message")
-            
-            # Send final completion signal
-            yield f"data: {json.dumps({'type': 'complete', 'timestamp': datetime.now().isoformat()})}\n\n"
-            
-        except Exception as e:
-            logger.error(f"Error in streaming chat: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+    try:
+        stream = chat_streams.start(_chat_stream_events(username, message), owner=username)
+    except TooManyStreams as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return _sse_response(stream)
+
+@app.get("/api/chat/stream/{stream_id}")
+async def resume_chat_stream(request: Request, stream_id: str, last_event_id: Optional[str] = None):
+    """Resume a stream after a dropped connection: replays events after Last-Event-ID, no regeneration"""
+    username = get_current_user(request)
+    if not username:
+        raise HTTPException(status_code=401, detail="Not authenticated")
     
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream",
-        }
-    )
+    stream = chat_streams.get(stream_id)
+    if stream is None or stream.owner != username:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    
+    event_stream_id, after_seq = parse_last_event_id(request.headers.get("last-event-id") or last_event_id)
+    return _sse_response(stream, after_seq if event_stream_id == stream_id else 0)
 
 @app.post("/api/chat")
 async def chat_endpoint(
@@ -511,28 +525,16 @@ async def chat_endpoint(
     
     try:
         # Get user profile
-        user_profile = UserProfile(username)
-        user_profile_dict = user_profile.get_profile()
+        user_profile_dict = await run_blocking("fs", load_profile, username)
         user_profile_dict['username'] = username
         
-        # Get conversation context
-        recent_messages = conversation_history.get_recent_history(limit=666)
-        
-        # Build full context
-        full_context = ""
-        if recent_messages:
-            full_context += "Recent conversation:\n"
-            for msg in recent_messages:
-                full_context += f"- User: {msg.get('message', '')}\n"
-                full_context += f"- AI: {msg.get('ai_response', '')}\n"
-        
-        # Add system context (recent file changes)
-        recent_changes = get_recent_file_changes()
-        if recent_changes:
-            full_context += f"\n**SYSTEM CONTEXT:**\n{recent_changes}\n"
+        # Build token-budgeted context (recent turns + archive summaries + recalled relevant turns + recent file changes)
+        built_context = await run_blocking("fs", context_builder.build, system_context=get_recent_file_changes(), query=message, user=username)
+        full_context = built_context.text
+        logger.info(f"🧮 CHAT: Context {built_context.total_tokens}/{built_context.budget_tokens} tokens {built_context.sections}")
         
         # Generate AI response
-        ai_response = ai_client.chat(
+        ai_response = await ai_client.chat_async(
             message=message,
             user_profile=user_profile_dict,
             conversation_context=full_context
@@ -551,14 +553,9 @@ async def chat_endpoint(
         logger.info(f"🔧 CHAT: Response processing completed")
         
         # Save to conversation history
-        conversation_history.add_message(username, message, ai_response)
+        await run_blocking("fs", conversation_history.add_message, username, message, ai_response)
         
-        # Clear conversation history cache to force refresh
-        cache_key = f"conversation_history_{username}_20"
-        system_cache.delete(cache_key)
-        cache_key_5 = f"conversation_history_{username}_5"
-        system_cache.delete(cache_key_5)
-        logger.info(f"🗑️ CONVERSATION CACHE: Cleared cache for {username} after new message")
+        # Кэш истории сбрасывается слушателем conversation_history (тег "conversation")
         
         return JSONResponse({
             "success": True,
@@ -581,8 +578,7 @@ async def get_profile(request: Request):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
-        user_profile = UserProfile(username)
-        profile_data = user_profile.get_profile()
+        profile_data = await run_blocking("fs", load_profile, username)
         profile_data['username'] = username  # Add username to profile data
         
         return JSONResponse({
@@ -605,8 +601,7 @@ async def get_profile_by_username(request: Request, username: str):
         raise HTTPException(status_code=403, detail="Access denied")
     
     try:
-        user_profile = UserProfile(username)
-        profile_data = user_profile.get_profile()
+        profile_data = await run_blocking("fs", load_profile, username)
         
         return JSONResponse({
             "success": True,
@@ -628,8 +623,7 @@ async def get_user_avatar(request: Request, username: str):
         raise HTTPException(status_code=403, detail="Access denied")
     
     try:
-        user_profile = UserProfile(username)
-        profile_data = user_profile.get_profile()
+        profile_data = await run_blocking("fs", load_profile, username)
         
         return JSONResponse({
             "success": True,
@@ -655,8 +649,8 @@ async def update_profile_full(request: Request):
         form_data = await request.form()
         
         # Get current profile to preserve existing data
-        user_profile = UserProfile(username)
-        current_profile = user_profile.get_profile()
+        user_profile = await run_blocking("fs", UserProfile, username)
+        current_profile = await run_blocking("fs", user_profile.get_profile)
         
         # Extract profile data from form, preserving existing data
         profile_data = {
@@ -697,7 +691,7 @@ async def update_profile_full(request: Request):
                 }, status_code=400)
         
         # Update profile
-        user_profile._save_profile(profile_data)
+        await run_blocking("fs", user_profile._save_profile, profile_data)
         
         return JSONResponse({
             "success": True,
@@ -743,9 +737,11 @@ async def update_feeling(
 @app.get("/api/conversation-history")
 async def get_conversation_history(
     request: Request,
-    limit: int = 20
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    user: Optional[str] = None
 ):
-    """Get conversation history - optimized for speed"""
+    """Get conversation history - optimized for speed (cursor pagination, optional per-user filter)"""
     username = get_current_user(request)
     if not username:
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -771,8 +767,13 @@ async def get_conversation_history(
     try:
         # Проверяем кэш для истории чата (только если нет принудительного обновления)
         force_refresh = request.query_params.get("_t") is not None
-        cache_key = f"conversation_history_{username}_{limit}"
-        cached_history = system_cache.get(cache_key) if not force_refresh else None
+        # Кэшируется только первая страница общей истории; страницы по курсору - индексный запрос
+        paged = bool(cursor or user)
+        # Имя операции без параметров - метрики кэша агрегируются по нему
+        cache_params = {"username": username, "limit": limit}
+        # История общая для всех пользователей: любое изменение сбрасывает все представления
+        history_tags = ["conversation", f"user:{username}"]
+        cached_history = system_cache.get("conversation_history", cache_params) if not force_refresh and not paged else None
         
         if cached_history and not force_refresh:
             logger.info(f"✅ CONVERSATION HISTORY: Returning cached result for {username}")
@@ -780,6 +781,7 @@ async def get_conversation_history(
                 "success": True,
                 "history": cached_history,
                 "count": len(cached_history),
+                "next_cursor": encode_cursor(cached_history[0]) if len(cached_history) >= min(limit, 50) else None,
                 "cached": True
             })
         
@@ -789,7 +791,7 @@ async def get_conversation_history(
                 with open("memory/guest_conversation_history.json", "r", encoding="utf-8") as f:
                     guest_history = json.load(f)
                 logger.info(f"👤 GUEST HISTORY: Loaded {len(guest_history)} messages for guest")
-                system_cache.set(cache_key, guest_history, ttl_seconds=120)
+                system_cache.set("conversation_history", guest_history, cache_params, ttl_seconds=120, tags=history_tags)
                 return JSONResponse({
                     "success": True,
                     "history": guest_history,
@@ -798,7 +800,7 @@ async def get_conversation_history(
                 })
             except FileNotFoundError:
                 logger.info("👤 GUEST HISTORY: No guest history file found, returning empty")
-                system_cache.set(cache_key, [], ttl_seconds=300)
+                system_cache.set("conversation_history", [], cache_params, ttl_seconds=300, tags=history_tags)
                 return JSONResponse({
                     "success": True,
                     "history": [],
@@ -810,7 +812,7 @@ async def get_conversation_history(
         if not conversation_history.history:
             logger.info(f"⚡ CONVERSATION HISTORY: Empty history - fast return for {username}")
             # Кэшируем пустой результат на 5 минут
-            system_cache.set(cache_key, [], ttl_seconds=300)
+            system_cache.set("conversation_history", [], cache_params, ttl_seconds=300, tags=history_tags)
             return JSONResponse({
                 "success": True,
                 "history": [],
@@ -821,10 +823,11 @@ async def get_conversation_history(
         # Optimize limit for faster loading
         optimized_limit = min(limit, 50)
         logger.info(f"🔄 CONVERSATION HISTORY: Fetching fresh data for {username}")
-        history = conversation_history.get_recent_history(limit=optimized_limit)
+        history, next_cursor = await run_blocking("fs", conversation_history.get_history_page, user, optimized_limit, cursor)
         
-        # Кэшируем результат на 10 секунд для мгновенного обновления
-        system_cache.set(cache_key, history, ttl_seconds=10)
+        # Первая страница; свежесть обеспечивает инвалидация по тегу, TTL - страховка
+        if not paged:
+            system_cache.set("conversation_history", history, cache_params, ttl_seconds=60, tags=history_tags)
         
         logger.info(f"✅ CONVERSATION HISTORY: Loaded {len(history)} messages for {username}")
         
@@ -832,6 +835,7 @@ async def get_conversation_history(
             "success": True,
             "history": history,
             "count": len(history),
+            "next_cursor": next_cursor,
             "cached": False
         })
         
@@ -852,7 +856,7 @@ async def clear_conversation_history(request: Request):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
-        conversation_history.clear_history()
+        await run_blocking("fs", conversation_history.clear_history)
         
         return JSONResponse({
             "success": True,
@@ -919,7 +923,7 @@ async def edit_conversation_archive(
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
-        success = conversation_history.edit_archive_entry(archive_id, summary)
+        success = await run_blocking("fs", conversation_history.edit_archive_entry, archive_id, summary)
         
         if success:
             return JSONResponse({
@@ -1062,7 +1066,7 @@ async def profile_page(request: Request):
         response = templates.TemplateResponse("profile.html", {
             "request": request, 
             "username": username,
-            "profile": get_profile_data(username)
+            "profile": await run_blocking("fs", get_profile_data, username)
         })
         response.set_cookie(
             key="session_id",
@@ -1075,7 +1079,7 @@ async def profile_page(request: Request):
         return response
     
     try:
-        profile_data = get_profile_data(username)
+        profile_data = await run_blocking("fs", get_profile_data, username)
         return templates.TemplateResponse("profile.html", {
             "request": request, 
             "username": username,
@@ -1119,19 +1123,14 @@ async def upload_avatar(request: Request):
         avatar_dir = "static/avatars"
         os.makedirs(avatar_dir, exist_ok=True)
         
-        # Save avatar file
-        avatar_path = f"{avatar_dir}/{username}_avatar.jpg"
-        
-        # Read file content properly
-        file_content = await avatar_file.read()
-        with open(avatar_path, "wb") as f:
-            f.write(file_content)
+        # Save avatar file (streamed and size-capped like other uploads)
+        await upload_store.save(avatar_file.file, avatar_dir, f"{username}_avatar.jpg", avatar_file.content_type)
         
         # Update profile with avatar path
-        user_profile = UserProfile(username)
-        profile_data = user_profile.get_profile()
+        user_profile = await run_blocking("fs", UserProfile, username)
+        profile_data = await run_blocking("fs", user_profile.get_profile)
         profile_data['avatar_url'] = f"/static/avatars/{username}_avatar.jpg"
-        user_profile._save_profile(profile_data)
+        await run_blocking("fs", user_profile._save_profile, profile_data)
         
         return JSONResponse({
             "success": True, 
@@ -1160,8 +1159,11 @@ async def delete_account(request: Request):
         return JSONResponse({"success": False, "error": str(e)})
 
 @app.post("/logout")
-async def logout(response: Response):
+async def logout(request: Request):
     """Handle logout and clear session"""
+    session_id = request.cookies.get("session_id")
+    if session_id:
+        session_store.delete(session_id)
     response = RedirectResponse(url="/", status_code=302)
     response.delete_cookie("session_id")
     return response
@@ -1171,29 +1173,25 @@ async def get_model_status(request: Request):
     """Get AI model status and quota information - internal agent endpoint, no auth required"""
     
     try:
-        # Проверяем кэш
-        cached_status = system_cache.get("model_status")
-        if cached_status:
-            logger.info("✅ MODEL STATUS: Returning cached result")
-            return JSONResponse({
-                "success": True,
-                "status": cached_status,
-                "timestamp": datetime.now().isoformat(),
-                "cached": True
-            })
-        
-        # Получаем свежие данные
-        logger.info("🔄 MODEL STATUS: Fetching fresh data")
-        status = ai_client.get_model_status()
-        
-        # Кэшируем результат на 5 минут
-        system_cache.set("model_status", status, ttl_seconds=300)
+        async def load_model_status():
+            logger.info("🔄 MODEL STATUS: Fetching fresh data")
+            return await run_blocking("llm", ai_client.get_model_status)
+        
+        # Кэш на 5 минут; устаревшее значение отдаём сразу и обновляем в фоне
+        status, cache_state = await system_cache.get_or_refresh("model_status", load_model_status, ttl_seconds=300)
+        # Состояние квот и breaker'ов всегда живое - это дешёвый снимок из памяти
+        status = {
+            **status,
+            "router": ai_client.get_router_status(),
+            "single_flight": ai_client.single_flight.get_stats(),
+        }
         
         return JSONResponse({
             "success": True,
             "status": status,
             "timestamp": datetime.now().isoformat(),
-            "cached": False
+            "cached": cache_state != "miss",
+            "cache_state": cache_state
         })
     except Exception as e:
         logger.error(f"Error getting model status: {e}")
@@ -1202,6 +1200,37 @@ async def get_model_status(request: Request):
             "error": str(e)
         }, status_code=500)
 
+@app.get("/api/cache/metrics")
+async def get_cache_metrics():
+    """Cache metrics per operation (hit ratio by tier, latency, evictions, bytes) - JSON"""
+    try:
+        return JSONResponse({
+            "success": True,
+            "metrics": system_cache.get_metrics(),
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"❌ Cache metrics error: {e}")
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=500)
+
+@app.get("/api/executors/metrics")
+async def get_executor_metrics():
+    """Blocking-work pools (llm, fs, vision): queue wait, run time, running/queued calls - JSON"""
+    return JSONResponse({
+        "success": True,
+        "executors": executors.snapshot(),
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Cache and executor pool metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(system_cache.prometheus_metrics() + executors.to_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
 @app.post("/api/system-analysis/clear-cache")
 async def clear_system_analysis_cache(request: Request):
     """Clear system analysis cache"""
@@ -1250,12 +1279,11 @@ async def login_greeting(request: Request):
     
     try:
         # Get user profile
-        user_profile = UserProfile(username)
-        user_profile_dict = user_profile.get_profile()
+        user_profile_dict = await run_blocking("fs", load_profile, username)
         user_profile_dict['username'] = username
         
         # Get conversation context
-        recent_messages = conversation_history.get_recent_history(limit=5)
+        recent_messages = await run_blocking("fs", conversation_history.get_recent_history, limit=5)
         
         # Build context for greeting
         greeting_context = f"""
@@ -1265,7 +1293,7 @@ async def login_greeting(request: Request):
         """
         
         # Generate greeting
-        greeting_response = ai_client.chat(
+        greeting_response = await ai_client.chat_async(
             message="Generate a brief, personalized greeting for the user login. Keep it under 100 words.",
             conversation_context=greeting_context,
             user_profile=user_profile_dict,
@@ -1285,41 +1313,24 @@ async def login_greeting(request: Request):
             "error": str(e)
         }, status_code=500)
 
-@app.get("/api/system-analysis")
-async def get_system_analysis(request: Request):
-    """Get system analysis - internal agent endpoint, no auth required"""
+def _is_cacheable_analysis(analysis_data: Dict[str, Any]) -> bool:
+    """Не кэшируем ответы LLM с ошибкой (429 и т.п.)"""
+    return "❌ Error:" not in json.dumps(analysis_data, ensure_ascii=False)
+
+async def _compute_system_analysis(username: Optional[str]) -> Dict[str, Any]:
+    """Full LLM system analysis (slow: LLM round trip + health + vision status)"""
+    logger.info("🔧 SYSTEM ANALYSIS: Starting fresh analysis...")
     
-    try:
-        # Get current user if available, but don't require it
-        username = get_current_user(request)
-        
-        # Проверяем кэш (но с более коротким TTL для тестирования)
-        cache_params = {"username": username, "has_user": bool(username)}
-        cached_result = system_cache.get("system_analysis", cache_params, ttl_seconds=60)  # 1 минута для тестирования
-        
-        if cached_result:
-            logger.info("✅ SYSTEM ANALYSIS: Returning cached result")
-            return JSONResponse(content=cached_result)
+    if username:
+        # If user is authenticated, get their profile and context
+        profile_data = await run_blocking("fs", load_profile, username)
         
-        # Если кэша нет, начинаем анализ
-        logger.info("🔧 SYSTEM ANALYSIS: Starting fresh analysis...")
+        # Get conversation history within the token budget
+        built_context = await run_blocking("fs", context_builder.build, user=username)
+        logger.info(f"🧮 SYSTEM ANALYSIS: Context {built_context.total_tokens}/{built_context.budget_tokens} tokens {built_context.sections}")
         
-        if username:
-            # If user is authenticated, get their profile and context
-            user_profile = UserProfile(username)
-            profile_data = user_profile.get_profile()
-            
-            # Get conversation history
-            recent_messages = conversation_history.get_recent_history(limit=666)
-            
-
-            
-
-            
-
-            
-            # Build context for LLM - ПОЛНЫЕ ДАННЫЕ ДЛЯ АНАЛИЗА
-            context = f"""
+        # Build context for LLM - ПОЛНЫЕ ДАННЫЕ ДЛЯ АНАЛИЗА
+        context = f"""
 User Profile:
 - Name: {profile_data.get('full_name', username)}
 
@@ -1327,16 +1338,16 @@ User Profile:
 
 
 
-Recent Conversation ({len(recent_messages)} messages):
-{chr(10).join([f"- {msg.get('message', 'N/A')}" for msg in recent_messages]) if recent_messages else "No recent messages"}
+Recent Conversation ({built_context.turns_included} messages):
+{built_context.text or "No recent messages"}
 
 
 
 
 """
-        else:
-            # If no user authenticated, provide basic system analysis
-            context = """
+    else:
+        # If no user authenticated, provide basic system analysis
+        context = """
 System Status:
 - No authenticated user
 - Basic system analysis mode
@@ -1344,14 +1355,17 @@ System Status:
 - All core functions available
 """
 
-        
-        # Get recent file changes and system status + vision status
-        recent_changes = get_recent_file_changes()
-        system_health = ai_client.system.diagnose_system_health()
-        vision_status = vision_tools.get_camera_status("default")
-        
-        # Generate system analysis using AI с дополнительным промптом
-        additional_prompt = """Это мини модуль системного анализатора - как общее положение из контекста датчиков (если подключены) и памяти?
+    
+    # Get recent file changes and system status + vision status
+    recent_changes = get_recent_file_changes()
+    # Filesystem scan and webcam probe run in their own pools, concurrently
+    system_health, vision_status = await asyncio.gather(
+        run_blocking("fs", ai_client.system.diagnose_system_health),
+        run_blocking("vision", vision_tools.get_camera_status, "default"),
+    )
+    
+    # Generate system analysis using AI с дополнительным промптом
+    additional_prompt = """Это мини модуль системного анализатора - как общее положение из контекста датчиков (если подключены) и памяти?
 
 **YOUR MISSION:**
 1. **ANALYZE** the conversation history and user context
@@ -1375,98 +1389,120 @@ Provide your response in this JSON format:
   "notes_added": ["System notes you created"]
 }}"""
 
-        # Log system analysis start
-        logger.info("🔧 SYSTEM ANALYSIS: Starting autonomous analysis...")
-        logger.info(f"🔧 SYSTEM ANALYSIS: User context available: {bool(username)}")
-        logger.info(f"🔧 SYSTEM ANALYSIS: Recent changes: {len(recent_changes.split())} words")
-        logger.info(f"🔧 SYSTEM ANALYSIS: System health: {len(system_health.split())} words")
-        
-        # Детальное логирование для отладки
-        try:
-            if username:
-                logger.info(f"🔧 SYSTEM ANALYSIS: recent_messages type: {type(recent_messages)}")
+    # Log system analysis start
+    logger.info("🔧 SYSTEM ANALYSIS: Starting autonomous analysis...")
+    logger.info(f"🔧 SYSTEM ANALYSIS: User context available: {bool(username)}")
+    logger.info(f"🔧 SYSTEM ANALYSIS: Recent changes: {len(recent_changes.split())} words")
+    logger.info(f"🔧 SYSTEM ANALYSIS: System health: {len(system_health.split())} words")
+    
+    # Детальное логирование для отладки
+    try:
+        if username:
+            logger.info(f"🔧 SYSTEM ANALYSIS: context sections: {built_context.sections}")
 
-            else:
-                logger.info("🔧 SYSTEM ANALYSIS: No user context available")
-        except NameError:
-            logger.info("🔧 SYSTEM ANALYSIS: Variables not initialized (no user context)")
-        except Exception as e:
-            logger.error(f"🔧 SYSTEM ANALYSIS: Error in debug logging: {e}")
+        else:
+            logger.info("🔧 SYSTEM ANALYSIS: No user context available")
+    except NameError:
+        logger.info("🔧 SYSTEM ANALYSIS: Variables not initialized (no user context)")
+    except Exception as e:
+        logger.error(f"🔧 SYSTEM ANALYSIS: Error in debug logging: {e}")
 
-        # Generate analysis
-        analysis_message = f"""Analyze the system and take autonomous actions based on this context:
+    # Generate analysis
+    analysis_message = f"""Analyze the system and take autonomous actions based on this context:
 
 User Context: {context}
 Recent Changes: {recent_changes[:500]}
 System Health: {system_health[:500]}
 Vision Status: {vision_status[:500]}"""
 
-        analysis_response = ai_client.chat(
-            message=analysis_message,
-            user_profile=profile_data if username else {},
-            conversation_context=context,
-            additional_prompt=additional_prompt
-        )
+    analysis_response = await ai_client.chat_async(
+        message=analysis_message,
+        user_profile=profile_data if username else {},
+        conversation_context=context,
+        additional_prompt=additional_prompt
+    )
 
-        # Log system analysis completion
-        logger.info(f"✅ SYSTEM ANALYSIS: Completed - {len(analysis_response.split())} words generated")
-        logger.info(f"✅ SYSTEM ANALYSIS: Response preview: {analysis_response[:100]}...")
-        
-        # Try to parse JSON response - УЛУЧШЕННАЯ ОБРАБОТКА
-        try:
-            import re
-            # Extract JSON from response - более точный поиск
-            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', analysis_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                # Очищаем JSON от лишних символов
-                json_str = re.sub(r'[^\x20-\x7E]', '', json_str)  # Убираем непечатаемые символы
-                analysis_data = json.loads(json_str)
-                logger.info("✅ SYSTEM ANALYSIS: JSON parsed successfully")
-            else:
-                # Fallback if no JSON found
-                logger.warning("⚠️ SYSTEM ANALYSIS: No JSON found in response")
-                analysis_data = {
-                    "system_status": analysis_response,
-                    "status": analysis_response,
-                    "capabilities": "System is operational"
-                }
-        except json.JSONDecodeError as e:
-            # Fallback if JSON parsing fails
-            logger.error(f"❌ SYSTEM ANALYSIS: JSON parsing failed: {e}")
+    # Log system analysis completion
+    logger.info(f"✅ SYSTEM ANALYSIS: Completed - {len(analysis_response.split())} words generated")
+    logger.info(f"✅ SYSTEM ANALYSIS: Response preview: {analysis_response[:100]}...")
+    
+    # Try to parse JSON response - УЛУЧШЕННАЯ ОБРАБОТКА
+    try:
+        import re
+        # Extract JSON from response - более точный поиск
+        json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', analysis_response, re.DOTALL)
+        if json_match:
+            json_str = json_match.group()
+            # Очищаем JSON от лишних символов
+            json_str = re.sub(r'[^\x20-\x7E]', '', json_str)  # Убираем непечатаемые символы
+            analysis_data = json.loads(json_str)
+            logger.info("✅ SYSTEM ANALYSIS: JSON parsed successfully")
+        else:
+            # Fallback if no JSON found
+            logger.warning("⚠️ SYSTEM ANALYSIS: No JSON found in response")
             analysis_data = {
                 "system_status": analysis_response,
                 "status": analysis_response,
                 "capabilities": "System is operational"
             }
-        except Exception as e:
-            # General fallback
-            logger.error(f"❌ SYSTEM ANALYSIS: General parsing error: {e}")
-            analysis_data = {
-                "system_status": "System analysis completed",
-                "status": "System analysis completed",
-                "capabilities": "System is operational"
-            }
+    except json.JSONDecodeError as e:
+        # Fallback if JSON parsing fails
+        logger.error(f"❌ SYSTEM ANALYSIS: JSON parsing failed: {e}")
+        analysis_data = {
+            "system_status": analysis_response,
+            "status": analysis_response,
+            "capabilities": "System is operational"
+        }
+    except Exception as e:
+        # General fallback
+        logger.error(f"❌ SYSTEM ANALYSIS: General parsing error: {e}")
+        analysis_data = {
+            "system_status": "System analysis completed",
+            "status": "System analysis completed",
+            "capabilities": "System is operational"
+        }
+    
+    if not _is_cacheable_analysis(analysis_data):
+        logger.warning("⚠️ SYSTEM ANALYSIS: Not caching error response")
+    return analysis_data
+
+def _merge_live_analysis(analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge on-demand LLM analysis with live background snapshot"""
+    try:
+        # use already initialized system_agent if available
+        live = globals().get("system_agent").get_last() if globals().get("system_agent") else None
+    except Exception:
+        live = None
+    return {"llm_analysis": analysis_data, "live_analysis": live or {}}
+
+@app.get("/api/system-analysis")
+async def get_system_analysis(request: Request):
+    """Get system analysis - internal agent endpoint, no auth required"""
+    
+    try:
+        # Get current user if available, but don't require it
+        username = get_current_user(request)
+        cache_params = {"username": username, "has_user": bool(username)}
         
-        # Сохраняем в кэш только если нет ошибок
-        if "❌ Error: 429" not in analysis_response and "❌ Error:" not in analysis_response:
-            system_cache.set("system_analysis", analysis_data, cache_params, ttl_seconds=600)
-            logger.info("💾 SYSTEM ANALYSIS: Result cached for 10 minutes")
-        else:
-            logger.warning("⚠️ SYSTEM ANALYSIS: Not caching error response")
-            # Инвалидируем кэш при ошибках
-            system_cache.invalidate("system_analysis", cache_params)
+        # Свежий результат 10 минут; после 80% TTL - обновление в фоне,
+        # устаревший (до часа) отдаётся сразу, пока идёт пересчёт
+        analysis_data, cache_state = await system_cache.get_or_refresh(
+            "system_analysis",
+            lambda: _compute_system_analysis(username),
+            cache_params,
+            ttl_seconds=600,
+            stale_ttl_seconds=3600,
+            cache_if=_is_cacheable_analysis,
+            tags=[f"user:{username}", f"profile:{username}"] if username else None,
+        )
+        logger.info(f"✅ SYSTEM ANALYSIS: {cache_state}")
         
-        # Merge on-demand LLM analysis with live background snapshot
-        try:
-            from ai_client.autonomous import SystemAnalysisAgent  # local import to avoid top-cycle
-            # use already initialized system_agent if available
-            live = globals().get("system_agent").get_last() if globals().get("system_agent") else None
-        except Exception:
-            live = None
-
-        merged = {"llm_analysis": analysis_data, "live_analysis": live or {}}
-        return JSONResponse({"success": True, "analysis": merged, "timestamp": datetime.now().isoformat()})
+        return JSONResponse({
+            "success": True,
+            "analysis": _merge_live_analysis(analysis_data),
+            "timestamp": datetime.now().isoformat(),
+            "cache_state": cache_state
+        })
         
     except Exception as e:
         logger.error(f"❌ System analysis error: {e}")
@@ -1476,7 +1512,12 @@ Vision Status: {vision_status[:500]}"""
             cached_result = system_cache.get("system_analysis", cache_params, ttl_seconds=3600)  # 1 час для fallback
             if cached_result:
                 logger.info("✅ SYSTEM ANALYSIS: Returning cached fallback result")
-                return JSONResponse(content=cached_result)
+                return JSONResponse({
+                    "success": True,
+                    "analysis": _merge_live_analysis(cached_result),
+                    "timestamp": datetime.now().isoformat(),
+                    "cache_state": "fallback"
+                })
         except:
             pass
         
@@ -1509,29 +1550,33 @@ async def upload_file(
         if file.content_type and file.content_type.startswith('image/'):
             # Images go to static/images for analysis
             upload_dir = "static/images"
-            file_path = f"/static/images/{file.filename}"
         else:
             # Other files go to sandbox
             upload_dir = "guardian_sandbox/uploads"
-            file_path = f"/guardian_sandbox/uploads/{file.filename}"
-        
-        # Create directory if it doesn't exist
-        os.makedirs(upload_dir, exist_ok=True)
         
-        # Save file
-        file_location = os.path.join(upload_dir, file.filename)
-        with open(file_location, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Copied in chunks off the event loop, hashed and deduplicated (identical uploads share one blob)
+        stored = await upload_store.save(file.file, upload_dir, file.filename, file.content_type)
         
         return JSONResponse({
             "success": True,
-            "file_path": file_path,
-            "file_name": file.filename,
+            "file_path": "/" + stored.path,
+            "file_name": os.path.basename(stored.path),
             "file_type": file.content_type,
-            "file_size": len(content)
+            "file_size": stored.size,
+            "sha256": stored.sha256,
+            "deduplicated": stored.deduplicated
         })
         
+    except UploadTooLarge as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=413)
+    except ValueError as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=400)
     except Exception as e:
         logger.error(f"File upload error: {e}")
         return JSONResponse({
@@ -1568,7 +1613,7 @@ async def analyze_image(request: Request):
             })
         
         # Use the new integrated image analysis
-        analysis = ai_client.system.analyze_image(fs_path, user_context)
+        analysis = await run_blocking("llm", ai_client.system.analyze_image, fs_path, user_context)
         
         return JSONResponse({
             "success": True,
@@ -1610,8 +1655,8 @@ async def delete_file(request: Request):
                 "error": "File not found"
             })
         
-        # Delete file
-        os.remove(fs_path)
+        # Delete file (the stored blob goes away with its last link)
+        await run_blocking("fs", upload_store.release, fs_path)
         
         return JSONResponse({
             "success": True,
@@ -1635,11 +1680,10 @@ async def analyze_frame(request: Request):
     try:
         # Simple rate limit: per-IP allow at most 1 request every 3s
         ip = request.client.host if request.client else "unknown"
-        key = f"vision_rl_{ip}"
-        last = system_cache.get(key, ttl_seconds=3)
+        last = system_cache.get("vision_rate_limit", {"ip": ip}, ttl_seconds=3)
         if last is not None:
             return JSONResponse({"success": False, "error": "Too many requests"}, status_code=429)
-        system_cache.set(key, {"ip": ip, "ts": datetime.now().isoformat()}, ttl_seconds=3)
+        system_cache.set("vision_rate_limit", {"ip": ip, "ts": datetime.now().isoformat()}, {"ip": ip}, ttl_seconds=3)
 
         body = await request.body()
         content_type = request.headers.get("content-type", "")
@@ -1652,7 +1696,7 @@ async def analyze_frame(request: Request):
             image_bytes = base64.b64decode(b64)
         else:
             image_bytes = body
-        result = vision_service.analyze_frame(image_bytes, use_google=use_google)
+        result = await run_blocking("vision", vision_service.analyze_frame, image_bytes, use_google=use_google)
         return JSONResponse({"success": True, "result": result})
     except Exception as e:
         logger.error(f"Vision analyze error: {e}")
@@ -1703,7 +1747,7 @@ async def edit_message(request: Request):
             })
         
         # Edit message in conversation history
-        success = conversation_history.edit_message(message_id, new_content)
+        success = await run_blocking("fs", conversation_history.edit_message, message_id, new_content)
         
         if success:
             return JSONResponse({
@@ -1741,7 +1785,7 @@ async def delete_message(request: Request):
             })
         
         # Delete message from conversation history
-        success = conversation_history.delete_message(message_id)
+        success = await run_blocking("fs", conversation_history.delete_message, message_id)
         
         if success:
             return JSONResponse({
@@ -1761,6 +1805,51 @@ async def delete_message(request: Request):
             "error": str(e)
         }, status_code=500)
 
+@app.get("/api/conversation/archive-queue")
+async def archive_queue_status(request: Request):
+    """Archive queue depth and summarization latency"""
+    username = get_current_user(request)
+    if not username:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    return JSONResponse({
+        "success": True,
+        "archive_queue": conversation_history.get_archive_queue_stats()
+    })
+
+@app.post("/api/conversation/archive-queue/requeue")
+async def requeue_dead_archive_jobs(request: Request):
+    """Retry archive jobs that ran out of attempts (dead letters)"""
+    username = get_current_user(request)
+    if not username:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    requeued = await run_blocking("fs", conversation_history.requeue_dead_jobs)
+    return JSONResponse({
+        "success": True,
+        "requeued": requeued,
+        "archive_queue": conversation_history.get_archive_queue_stats()
+    })
+
+@app.get("/api/search")
+async def search_memory(request: Request, q: str = "", user: Optional[str] = None,
+                        kind: Optional[str] = None, limit: int = 20):
+    """Full-text search over conversation history, archive summaries and profiles"""
+    username = get_current_user(request)
+    if not username:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    try:
+        kinds = [k.strip() for k in kind.split(",") if k.strip()] if kind else None
+        found = await run_blocking("fs", search_index.search, q, user, kinds, max(1, min(limit, 100)))
+        return JSONResponse({"success": True, **found})
+    except Exception as e:
+        logger.error(f"Error searching memory: {e}")
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=500)
+
 @app.post("/api/conversation/archive")
 async def archive_conversation(request: Request):
     """Manually archive current conversation"""
@@ -1769,12 +1858,14 @@ async def archive_conversation(request: Request):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
-        # Archive current conversation
-        conversation_history._archive_old_messages()
+        # Queue current conversation for archiving (summarized in the background)
+        job_id = conversation_history._archive_old_messages()
         
         return JSONResponse({
             "success": True,
-            "message": "Conversation archived successfully"
+            "message": "Conversation queued for archiving" if job_id else "Nothing to archive yet",
+            "job_id": job_id,
+            "archive_queue": conversation_history.get_archive_queue_stats()
         })
         
     except Exception as e:
@@ -1789,7 +1880,7 @@ async def get_image_analyzer_status(request: Request):
     """Get image analyzer status"""
     try:
         # Image analysis is now integrated into ai_client
-        status = ai_client.get_model_status()
+        status = await run_blocking("llm", ai_client.get_model_status)
         return {"success": True, "status": status}
     except Exception as e:
         logger.error(f"Error getting image analyzer status: {e}")
@@ -1809,7 +1900,7 @@ async def switch_model(request: Request):
         success = ai_client.switch_to_model(model_name)
         
         if success:
-            current_model = ai_client.get_model_status()
+            current_model = await run_blocking("llm", ai_client.get_model_status)
             return {
                 "success": True, 
                 "message": f"Switched to {model_name}",
@@ -1890,7 +1981,7 @@ async def list_cameras(request: Request):
     """Get list of available cameras"""
     try:
         from ai_client.tools.vision_tools import vision_tools
-        result = vision_tools.list_cameras()
+        result = await run_blocking("vision", vision_tools.list_cameras)
         return {"success": True, "result": result}
     except Exception as e:
         logger.error(f"Error listing cameras: {e}")
@@ -1901,7 +1992,7 @@ async def get_camera_status(request: Request, camera_id: str):
     """Get status of specific camera"""
     try:
         from ai_client.tools.vision_tools import vision_tools
-        result = vision_tools.get_camera_status(camera_id)
+        result = await run_blocking("vision", vision_tools.get_camera_status, camera_id)
         return {"success": True, "result": result}
     except Exception as e:
         logger.error(f"Error getting camera status: {e}")
@@ -1915,7 +2006,7 @@ async def capture_image(request: Request):
         camera_id = data.get('camera_id', 'default')
         
         from ai_client.tools.vision_tools import vision_tools
-        result = vision_tools.capture_image(camera_id)
+        result = await run_blocking("vision", vision_tools.capture_image, camera_id)
         return {"success": True, "result": result}
     except Exception as e:
         logger.error(f"Error capturing image: {e}")
@@ -1932,7 +2023,7 @@ async def analyze_image(request: Request):
             return {"success": False, "error": "Image path is required"}
         
         from ai_client.tools.vision_tools import vision_tools
-        result = vision_tools.analyze_image(image_path)
+        result = await run_blocking("vision", vision_tools.analyze_image, image_path)
         return {"success": True, "result": result}
     except Exception as e:
         logger.error(f"Error analyzing image: {e}")
@@ -1947,7 +2038,7 @@ async def detect_motion(request: Request):
         threshold = data.get('threshold', 25.0)
         
         from ai_client.tools.vision_tools import vision_tools
-        result = vision_tools.detect_motion(camera_id, threshold)
+        result = await run_blocking("vision", vision_tools.detect_motion, camera_id, threshold)
         return {"success": True, "result": result}
     except Exception as e:
         logger.error(f"Error detecting motion: {e}")
@@ -1960,51 +2051,46 @@ async def generate_chat_title(request: Request):
         data = await request.json()
         messages = data.get("messages", [])
         
-        title = chat_summary_tools.generate_chat_title(messages)
+        title = await run_blocking("llm", chat_summary_tools.generate_chat_title, messages)
         return {"success": True, "title": title}
     except Exception as e:
         logger.error(f"Error generating chat title: {e}")
         return {"success": False, "error": str(e)}
 
-# WebSocket endpoint для real-time логов
+# WebSocket endpoint для real-time логов: последние строки при подключении, затем пачки
+# новых строк одним кадром (строки разделены \n); медленный клиент теряет самые старые строки
+async def _send_log_batches(websocket: WebSocket, subscriber):
+    try:
+        while True:
+            lines, dropped = await subscriber.next_batch()
+            if dropped:
+                lines.insert(0, f"⚠️ {dropped} log lines dropped (slow connection)")
+            await websocket.send_text("\n".join(lines))
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # сокет закрыт
+
+
 @app.websocket("/ws/logs")
 async def websocket_logs(websocket: WebSocket):
     await websocket.accept()
-    
+    subscriber = log_hub.subscribe()
+    sender = asyncio.create_task(_send_log_batches(websocket, subscriber))
     try:
-        # Простой стриминг логов
-        last_position = 0
-        
-        while True:
-            try:
-                # Читаем лог файл
-                with open('app.log', 'r', encoding='utf-8') as f:
-                    f.seek(last_position)
-                    new_lines = f.readlines()
-                    
-                    if new_lines:
-                        # Отправляем только новые строки
-                        for line in new_lines:
-                            if line.strip():
-                                await websocket.send_text(line.strip())
-                        
-                        # Обновляем позицию
-                        last_position = f.tell()
-                
-                # Ждем 1 секунду
-                await asyncio.sleep(1)
-                
-            except FileNotFoundError:
-                await websocket.send_text("Log file not found")
-                break
-            except Exception as e:
-                await websocket.send_text(f"Log error: {e}")
-                break
-            
+        # Клиент ничего не шлёт: ждём закрытия сокета (или ошибки отправителя)
+        receiver = asyncio.create_task(websocket.receive_text())
+        while not sender.done():
+            done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                receiver.result()
+                receiver = asyncio.create_task(websocket.receive_text())
+        receiver.cancel()
     except WebSocketDisconnect:
         pass
     except Exception as e:
-        pass
+        logger.debug(f"Log stream closed: {e}")
+    finally:
+        sender.cancel()
+        log_hub.unsubscribe(subscriber)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file